@@ -8,18 +8,19 @@ import logging
 import os
 import sys
 import time as timemod
-from glob import iglob
+from collections import deque
 from threading import Event, enumerate as enumerate_threads
 from traceback import print_exc
 
 from twisted.internet import reactor
-from twisted.internet.defer import Deferred, inlineCallbacks, DeferredList
+from twisted.internet.defer import Deferred, inlineCallbacks, DeferredList, succeed
 from twisted.internet.task import LoopingCall
 from twisted.internet.threads import deferToThread
 from twisted.python.threadable import isInIOThread
 
 from Tribler.Core.CacheDB.sqlitecachedb import forceDBThread
 from Tribler.Core.DownloadConfig import DownloadStartupConfig, DefaultDownloadStartupConfig
+from Tribler.Core.Modules.metrics_collector import SessionMetricsCollector
 from Tribler.Core.Modules.search_manager import SearchManager
 from Tribler.Core.Modules.versioncheck_manager import VersionCheckManager
 from Tribler.Core.Modules.watch_folder import WatchFolder
@@ -28,11 +29,13 @@ from Tribler.Core.TorrentChecker.torrent_checker import TorrentChecker
 from Tribler.Core.TorrentDef import TorrentDef, TorrentDefNoMetainfo
 from Tribler.Core.Utilities.configparser import CallbackConfigParser
 from Tribler.Core.Utilities.install_dir import get_lib_path
+from Tribler.Core.Utilities.instrumentation import ReactorLagMonitor
+from Tribler.Core.Utilities.metrics import registry
 from Tribler.Core.Video.VideoServer import VideoServer
 from Tribler.Core.exceptions import DuplicateDownloadException
 from Tribler.Core.simpledefs import (NTFY_DISPERSY, NTFY_STARTED, NTFY_TORRENTS, NTFY_UPDATE, NTFY_TRIBLER,
                                      NTFY_FINISHED, DLSTATUS_DOWNLOADING, DLSTATUS_STOPPED_ON_ERROR, NTFY_ERROR,
-                                     DLSTATUS_SEEDING, NTFY_TORRENT, NTFY_MARKET_IOM_INPUT_REQUIRED)
+                                     DLSTATUS_SEEDING, NTFY_TORRENT, NTFY_MARKET_IOM_INPUT_REQUIRED, NTFY_STARTUP_TICK)
 from Tribler.community.market.wallet.btc_wallet import BitcoinWallet
 from Tribler.community.market.wallet.dummy_wallet import DummyWallet1, DummyWallet2
 from Tribler.community.market.wallet.tc_wallet import TrustchainWallet
@@ -41,6 +44,29 @@ from Tribler.community.tunnel.tunnel_community import TunnelSettings
 from Tribler.dispersy.taskmanager import TaskManager
 from Tribler.dispersy.util import blockingCallFromThread, blocking_call_on_reactor_thread
 
+RESUME_BATCH_SIZE = 100     # The maximum number of downloads that are added to libtorrent at once during startup
+RESUME_BATCH_TIMEOUT = 5    # Seconds to wait for a batch before resuming the next one (e.g. when waiting for circuits)
+
+
+def get_resume_priority(pstate):
+    """
+    Returns a sort key for a download checkpoint, given its pstate or the summary of it. Unfinished downloads are
+    resumed first, followed by seeding downloads, credit mining downloads and stopped downloads. Within each group, the
+    most recently added downloads go first.
+    """
+    if pstate is None:
+        return 4, 0
+
+    time_added = pstate.get('download_defaults', 'time_added') or 0
+    if pstate.get('download_defaults', 'user_stopped'):
+        return 3, -time_added
+    if pstate.get('state', 'share_mode'):
+        return 2, -time_added
+
+    dlstate = pstate.get('state', 'dlstate')
+    progress = dlstate.get('progress', 0.0) if isinstance(dlstate, dict) else 0.0
+    return 0 if progress < 1.0 else 1, -time_added
+
 
 class TriblerLaunchMany(TaskManager):
 
@@ -70,11 +96,14 @@ class TriblerLaunchMany(TaskManager):
         # modules
         self.torrent_store = None
         self.metadata_store = None
+        self.checkpoint_manager = None
         self.rtorrent_handler = None
         self.tftp_handler = None
         self.api_manager = None
         self.watch_folder = None
         self.version_check_manager = None
+        self.metrics_collector = None
+        self.lag_monitor = None
 
         self.category = None
         self.peer_db = None
@@ -96,6 +125,9 @@ class TriblerLaunchMany(TaskManager):
 
         self.startup_deferred = Deferred()
 
+        self.resume_queue = deque()
+        self.resume_total = 0
+
         self.boosting_manager = None
         self.market_community = None
 
@@ -112,6 +144,14 @@ class TriblerLaunchMany(TaskManager):
             if sys.platform == 'darwin':
                 os.environ['SSL_CERT_FILE'] = os.path.join(get_lib_path(), 'root_certs_mac.pem')
 
+            # The metrics of the session are exported by the /metrics endpoint of the REST API
+            if self.session.config.get_http_api_enabled():
+                self.metrics_collector = SessionMetricsCollector(self.session)
+                registry.register_collector(self.metrics_collector)
+                # Sampling the stack of the reactor thread costs a thread that wakes up every few milliseconds
+                self.lag_monitor = ReactorLagMonitor(profile=self.session.config.get_http_api_profile_reactor())
+                self.lag_monitor.start()
+
             if self.session.config.get_torrent_store_enabled():
                 from Tribler.Core.leveldbstore import LevelDbStore
                 self.torrent_store = LevelDbStore(self.session.config.get_torrent_store_dir())
@@ -120,6 +160,11 @@ class TriblerLaunchMany(TaskManager):
                 from Tribler.Core.leveldbstore import LevelDbStore
                 self.metadata_store = LevelDbStore(self.session.config.get_metadata_store_dir())
 
+            if self.session.config.get_libtorrent_enabled():
+                from Tribler.Core.Modules.checkpoint_manager import CheckpointManager
+                self.checkpoint_manager = CheckpointManager(self.session)
+                self.checkpoint_manager.initialize()
+
             # torrent collecting: RemoteTorrentHandler
             if self.session.config.get_torrent_collecting_enabled():
                 from Tribler.Core.RemoteTorrentHandler import RemoteTorrentHandler
@@ -427,8 +472,11 @@ class TriblerLaunchMany(TaskManager):
     def on_download_handle_created(self, download):
         """
         This method is called when the download handle has been created.
-        Immediately checkpoint the download and write the resume data.
+        Immediately checkpoint the download and write the resume data, unless the download already has a checkpoint.
+        In that case, the download will be checkpointed once its state changes.
         """
+        if self.checkpoint_manager and self.checkpoint_manager.has_pstate(download.get_def().get_infohash()):
+            return succeed(None)
         return download.checkpoint()
 
     def remove(self, d, removecontent=False, removestate=True, hidden=False):
@@ -575,7 +623,6 @@ class TriblerLaunchMany(TaskManager):
 
         # Check to see if a download has finished
         new_active_downloads = []
-        do_checkpoint = False
         seeding_download_list = []
 
         for ds in states_list:
@@ -596,7 +643,8 @@ class TriblerLaunchMany(TaskManager):
 
                 if safename in self.previous_active_downloads:
                     self.session.notifier.notify(NTFY_TORRENT, NTFY_FINISHED, tdef.get_infohash(), safename)
-                    do_checkpoint = True
+                    if self.checkpoint_manager:
+                        self.checkpoint_manager.mark_dirty(tdef.get_infohash())
 
                 elif download.get_hops() == 0 and download.get_safe_seeding():
                     hops = self.session.config.get_default_number_hops()
@@ -613,8 +661,6 @@ class TriblerLaunchMany(TaskManager):
                                        reactor.callLater(5, self.session.start_download_from_tdef, tdef, dscfg))
 
         self.previous_active_downloads = new_active_downloads
-        if do_checkpoint:
-            self.session.checkpoint_downloads()
 
         if self.state_cb_count % 4 == 0 and self.tunnel_community:
             self.tunnel_community.monitor_downloads(states_list)
@@ -628,40 +674,80 @@ class TriblerLaunchMany(TaskManager):
         """ Called by any thread """
 
         def do_load_checkpoint():
+            # Only the options that decide the order are parsed here, each pstate is parsed once it is resumed
             with self.session_lock:
-                for i, filename in enumerate(iglob(os.path.join(self.session.get_downloads_pstate_dir(), '*.state'))):
-                    self.resume_download(filename, setupDelay=i * 0.1)
+                checkpoints = list(self.checkpoint_manager.get_pstate_summaries())
+
+            checkpoints.sort(key=lambda checkpoint: get_resume_priority(checkpoint[1]))
+            self.resume_queue = deque(infohash for infohash, _ in checkpoints)
+            self.resume_total = len(checkpoints)
+            self._logger.info("tlm: resuming %d downloads", self.resume_total)
+            self.resume_next_batch()
 
         if self.initComplete:
             do_load_checkpoint()
         else:
             self.register_task("load_checkpoint", reactor.callLater(1, do_load_checkpoint))
 
+    def resume_next_batch(self):
+        """
+        Resume the next batch of checkpointed downloads. The next batch is started as soon as libtorrent has added all
+        downloads of this batch, or after RESUME_BATCH_TIMEOUT seconds when some of them are still waiting for
+        circuits or the DHT.
+        """
+        if not self.resume_queue:
+            return
+
+        deferreds = []
+        with self.session_lock:
+            for _ in xrange(min(RESUME_BATCH_SIZE, len(self.resume_queue))):
+                infohash = self.resume_queue.popleft()
+                deferreds.append(self.resume_download(infohash, self.load_download_pstate_noexc(infohash)))
+
+        resumed = self.resume_total - len(self.resume_queue)
+        self._logger.debug("tlm: resumed %d/%d downloads", resumed, self.resume_total)
+        self.session.notifier.notify(NTFY_STARTUP_TICK, NTFY_UPDATE, None,
+                                     {u"resumed": resumed, u"total": self.resume_total})
+
+        batch_deferred = Deferred()
+
+        def on_batch_done(_):
+            if not batch_deferred.called:
+                batch_deferred.callback(None)
+
+        self.register_task("resume_batch_timeout", reactor.callLater(RESUME_BATCH_TIMEOUT, on_batch_done, None))
+        DeferredList(deferreds, consumeErrors=True).addCallback(on_batch_done)
+
+        batch_deferred.addCallback(lambda _: self.cancel_pending_task("resume_batch_timeout"))
+        batch_deferred.addCallback(lambda _: self.resume_next_batch())
+
     def load_download_pstate_noexc(self, infohash):
         """ Called by any thread, assume session_lock already held """
         try:
-            basename = binascii.hexlify(infohash) + '.state'
-            filename = os.path.join(self.session.get_downloads_pstate_dir(), basename)
-            if os.path.exists(filename):
-                return self.load_download_pstate(filename)
-            else:
-                self._logger.info("%s not found", basename)
+            if self.checkpoint_manager:
+                pstate = self.checkpoint_manager.load_pstate(infohash)
+                if pstate is not None:
+                    return pstate
+            self._logger.info("pstate of %s not found", binascii.hexlify(infohash))
 
         except Exception:
             self._logger.exception("Exception while loading pstate: %s", infohash)
 
-    def resume_download(self, filename, setupDelay=0):
-        tdef = dscfg = pstate = None
+    def resume_download(self, infohash, pstate, setupDelay=0):
+        """
+        Resume a download from its checkpoint. The TorrentDef is only created at this point, so it is not parsed
+        until the download is actually resumed.
+        Returns a deferred that fires when libtorrent has added the download.
+        """
+        tdef = dscfg = None
 
         try:
-            pstate = self.load_download_pstate(filename)
-
             # SWIFTPROC
             metainfo = pstate.get('state', 'metainfo')
             if 'infohash' in metainfo:
                 tdef = TorrentDefNoMetainfo(metainfo['infohash'], metainfo['name'], metainfo.get('url', None))
             else:
-                tdef = TorrentDef.load_from_dict(metainfo)
+                tdef = TorrentDef.load_from_dict(metainfo, infohash=infohash)
 
             if pstate.has_option('download_defaults', 'saveas') and \
                     isinstance(pstate.get('download_defaults', 'saveas'), tuple):
@@ -671,10 +757,6 @@ class TriblerLaunchMany(TaskManager):
 
         except:
             # pstate is invalid or non-existing
-            _, file = os.path.split(filename)
-
-            infohash = binascii.unhexlify(file[:-6])
-
             torrent_data = self.torrent_store.get(infohash)
             if torrent_data:
                 try:
@@ -698,25 +780,32 @@ class TriblerLaunchMany(TaskManager):
             if dscfg.get_dest_dir() != '':  # removed torrent ignoring
                 try:
                     if not self.download_exists(tdef.get_infohash()):
-                        self.add(tdef, dscfg, pstate, setupDelay=setupDelay)
+                        return self.add(tdef, dscfg, pstate, setupDelay=setupDelay).get_handle()
                     else:
                         self._logger.info("tlm: not resuming checkpoint because download has already been added")
 
                 except Exception as e:
                     self._logger.exception("tlm: load check_point: exception while adding download %s", tdef)
             else:
-                self._logger.info("tlm: removing checkpoint %s destdir is %s", filename, dscfg.get_dest_dir())
-                os.remove(filename)
+                self._logger.info("tlm: removing checkpoint %s destdir is %s",
+                                  binascii.hexlify(infohash), dscfg.get_dest_dir())
+                if self.checkpoint_manager:
+                    self.checkpoint_manager.remove_pstate(infohash)
         else:
-            self._logger.info("tlm: could not resume checkpoint %s %s %s", filename, tdef, dscfg)
+            self._logger.info("tlm: could not resume checkpoint %s %s %s", binascii.hexlify(infohash), tdef, dscfg)
+
+        return succeed(None)
 
     def checkpoint_downloads(self):
         """
-        Checkpoints all running downloads in Tribler.
+        Checkpoints the running downloads in Tribler of which the state changed since their last checkpoint.
         Even if the list of Downloads changes in the mean time this is no problem.
         For removals, dllist will still hold a pointer to the download, and additions are no problem
         (just won't be included in list of states returned via callback).
         """
+        if self.checkpoint_manager:
+            return self.checkpoint_manager.checkpoint_all_dirty()
+
         downloads = self.downloads.values()
         deferred_list = []
         self._logger.debug("tlm: checkpointing %s downloads", len(downloads))
@@ -735,16 +824,11 @@ class TriblerLaunchMany(TaskManager):
     def remove_pstate(self, infohash):
         def do_remove():
             if not self.download_exists(infohash):
-                dlpstatedir = self.session.get_downloads_pstate_dir()
-
                 # Remove checkpoint
-                hexinfohash = binascii.hexlify(infohash)
                 try:
-                    basename = hexinfohash + '.state'
-                    filename = os.path.join(dlpstatedir, basename)
-                    self._logger.debug("remove pstate: removing dlcheckpoint entry %s", filename)
-                    if os.access(filename, os.F_OK):
-                        os.remove(filename)
+                    self._logger.debug("remove pstate: removing dlcheckpoint entry %s", binascii.hexlify(infohash))
+                    if self.checkpoint_manager:
+                        self.checkpoint_manager.remove_pstate(infohash)
                 except:
                     # Show must go on
                     self._logger.exception("Could not remove state")
@@ -766,6 +850,14 @@ class TriblerLaunchMany(TaskManager):
 
         # Note: session_lock not held
         self.shutdownstarttime = timemod.time()
+        if self.metrics_collector:
+            registry.unregister_collector(self.metrics_collector)
+        self.metrics_collector = None
+
+        if self.lag_monitor:
+            self.lag_monitor.stop()
+        self.lag_monitor = None
+
         if self.boosting_manager:
             yield self.boosting_manager.shutdown()
         self.boosting_manager = None
@@ -872,18 +964,21 @@ class TriblerLaunchMany(TaskManager):
         # Stop network thread
         self.sessdoneflag.set()
 
+        if self.checkpoint_manager is not None:
+            self.checkpoint_manager.shutdown()
+        self.checkpoint_manager = None
+
         # Shutdown libtorrent session after checkpoints have been made
         if self.ltmgr is not None:
             self.ltmgr.shutdown()
             self.ltmgr = None
 
     def save_download_pstate(self, infohash, pstate):
-        """ Called by network thread """
-
-        self.downloads[infohash].pstate_for_restart = pstate
-
-        self.register_task("save_pstate %f" % timemod.clock(),
-                           self.downloads[infohash].save_resume_data())
+        """
+        Stage the pstate of a download in the checkpoint store. Called by network thread.
+        """
+        if self.checkpoint_manager:
+            self.checkpoint_manager.save_pstate(infohash, pstate)
 
     def load_download_pstate(self, filename):
         """ Called by any thread """
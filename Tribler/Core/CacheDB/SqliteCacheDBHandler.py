@@ -871,29 +871,46 @@ class TorrentDBHandler(BasicDBHandler):
         """
         Search in the local database for torrents matching a specific query. This method also assigns a relevance
         score to each torrent, based on the name, files and file extensions.
-        The algorithm is based on BM25. The document length factor is regarded since our "documents" are very small
-        (often a few keywords).
-        See https://en.wikipedia.org/wiki/Okapi_BM25 for more information about BM25.
         """
-        search_results = []
+        return self.score_local_torrents(self.get_local_torrent_matches(query, keys), keys)
+
+    def get_local_torrent_matches(self, query, keys):
+        """
+        Return the torrents in the local database that match a specific query. The matchinfo of the full text index is
+        added as the last element of every result, so that the results can be scored with score_local_torrents.
+        This can be called from a worker thread, since the torrents are read with fetchall_in_thread.
+        """
         keys_str = ", ".join(keys)
         keywords = split_into_keywords(query, to_filter_stopwords=True)
-        infohash_index = keys.index('infohash')
 
         # This query gets torrents matching speciifc keywords. The matchinfo object is also returned. For more
         # information about the returned matchinfo parameters, see https://www.sqlite.org/fts3.html#matchinfo.
-        results = self._db.fetchall("SELECT DISTINCT %s, Matchinfo(FullTextIndex, 'pcnalx') "
-                                    "FROM Torrent T, FullTextIndex "
-                                    "LEFT OUTER JOIN _ChannelTorrents C ON T.torrent_id = C.torrent_id "
-                                    "WHERE t.name IS NOT NULL AND t.torrent_id = FullTextIndex.rowid "
-                                    "AND C.deleted_at IS NULL AND FullTextIndex MATCH ?"
-                                    % keys_str, (" OR ".join(keywords),))
+        results = self._db.fetchall_in_thread("SELECT DISTINCT %s, Matchinfo(FullTextIndex, 'pcnalx') "
+                                              "FROM Torrent T, FullTextIndex "
+                                              "LEFT OUTER JOIN _ChannelTorrents C ON T.torrent_id = C.torrent_id "
+                                              "WHERE t.name IS NOT NULL AND t.torrent_id = FullTextIndex.rowid "
+                                              "AND C.deleted_at IS NULL AND FullTextIndex MATCH ?"
+                                              % keys_str, (" OR ".join(keywords),))
+        if results:
+            self.latest_matchinfo_torrent = results[-1][len(keys)], keywords
+        return results
+
+    @staticmethod
+    def score_local_torrents(results, keys):
+        """
+        Assign a relevance score to the results of get_local_torrent_matches. This does not use the database, so it
+        can be done outside of the reactor thread.
+        The algorithm is based on BM25. The document length factor is regarded since our "documents" are very small
+        (often a few keywords).
+        See https://en.wikipedia.org/wiki/Okapi_BM25 for more information about BM25.
+        """
+        search_results = []
+        infohash_index = keys.index('infohash')
 
         for result in results:
             result = list(result)  # We convert the result to a mutable list since we have to decode the infohash
             result[infohash_index] = str2bin(result[infohash_index])
             matchinfo = result[len(keys)]  # The matchinfo is the last element in the results tuple
-            self.latest_matchinfo_torrent = matchinfo, keywords
             num_phrases, num_cols, num_rows = unpack_from('III', matchinfo)
 
             unpack_str = 'I' * (3 * num_cols * num_phrases)
@@ -2355,10 +2372,13 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
             ")"
         return self._getChannels(sql, channel_cids)
 
-    def getAllChannels(self):
-        """ Returns all the channels """
+    def getAllChannels(self, in_thread=False):
+        """
+        Returns all the channels. If in_thread is set, the channels are read with fetchall_in_thread, so that this can
+        be called from a worker thread.
+        """
         sql = "Select id, name, description, dispersy_cid, modified, nr_torrents, nr_favorite, nr_spam FROM Channels"
-        return self._getChannels(sql)
+        return self._getChannels(sql, in_thread=in_thread)
 
     def getNewChannels(self, updated_since=0):
         """ Returns all newest unsubscribed channels, ie the ones with no votes (positive or negative)"""
@@ -2400,16 +2420,20 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
 
         return self._getChannels(sql)
 
-    def _getChannels(self, sql, args=None, cmpF=None, includeSpam=True):
+    def _getChannels(self, sql, args=None, cmpF=None, includeSpam=True, in_thread=False):
         """Returns the channels based on the input sql, if the number of positive votes
         is less than maxvotes and the number of torrent > 0"""
         if self.votecast_db is None:
             return []
 
         channels = []
-        results = self._db.fetchall(sql, args)
-
-        my_votes = self.votecast_db.getMyVotes()
+        if in_thread:
+            results = self._db.fetchall_in_thread(sql, args)
+            # The reactor might add votes while we are iterating over them
+            my_votes = dict(self.votecast_db.getMyVotes())
+        else:
+            results = self._db.fetchall(sql, args)
+            my_votes = self.votecast_db.getMyVotes()
         for id, name, description, dispersy_cid, modified, nr_torrents, nr_favorites, nr_spam in results:
             my_vote = my_votes.get(id, 0)
             if not includeSpam and my_vote < 0:
@@ -8,6 +8,7 @@ import os
 from apsw import CantOpenError, SQLError
 from base64 import encodestring, decodestring
 from threading import currentThread, RLock
+from time import time
 from twisted.python.threadable import isInIOThread
 
 import apsw
@@ -16,6 +17,7 @@ from Tribler.dispersy.taskmanager import TaskManager
 from Tribler.dispersy.util import blocking_call_on_reactor_thread, call_on_reactor_thread
 
 from Tribler.Core.CacheDB.db_versions import LATEST_DB_VERSION
+from Tribler.Core.Utilities.metrics import registry
 
 
 DB_SCRIPT_NAME = "schema_sdb_v%s.sql" % str(LATEST_DB_VERSION)
@@ -30,6 +32,19 @@ DEFAULT_BUSY_TIMEOUT = 10000
 forceDBThread = call_on_reactor_thread
 forceAndReturnDBThread = blocking_call_on_reactor_thread
 
+# Statements that return rows are only run while their cursor is iterated, so fetchone and fetchall time those
+DB_STATEMENT_SECONDS = registry.histogram("tribler_db_statement_seconds",
+                                          "Duration of the SQLite statements, including the reading of their rows",
+                                          labelnames=("statement",))
+
+
+def get_statement_type(sql):
+    """
+    Return the first keyword of an SQL statement, like SELECT or INSERT, to label its latency with.
+    """
+    words = sql.split(None, 1)
+    return words[0].upper() if words else u""
+
 
 class CorruptedDatabaseError(Exception):
     pass
@@ -52,6 +67,7 @@ class SQLiteCacheDB(TaskManager):
 
         self._cursor_lock = RLock()
         self._cursor_table = {}
+        self._read_connections = {}
 
         self._connection = None
         self.sqlite_db_path = db_path
@@ -95,6 +111,9 @@ class SQLiteCacheDB(TaskManager):
             for cursor in self._cursor_table.itervalues():
                 cursor.close()
             self._cursor_table = {}
+            for connection in self._read_connections.itervalues():
+                connection.close()
+            self._read_connections = {}
             self._connection.close()
             self._connection = None
 
@@ -195,6 +214,22 @@ class SQLiteCacheDB(TaskManager):
                 self._cursor_table[thread_name] = self._connection.cursor()
             return self._cursor_table[thread_name]
 
+    def get_read_cursor(self):
+        """
+        Return a cursor of a read-only connection that belongs to the current thread. Since the database is in WAL mode,
+        these connections can read while the reactor thread writes, but they only see committed changes.
+        """
+        thread_name = currentThread().getName()
+
+        with self._cursor_lock:
+            if self._connection is None:
+                raise apsw.ConnectionClosedError(u"The database has been closed")
+            if thread_name not in self._read_connections:
+                connection = apsw.Connection(self.sqlite_db_path, flags=apsw.SQLITE_OPEN_READONLY)
+                connection.setbusytimeout(self._busytimeout)
+                self._read_connections[thread_name] = connection
+            return self._read_connections[thread_name].cursor()
+
     @blocking_call_on_reactor_thread
     def initial_begin(self):
         try:
@@ -259,12 +294,17 @@ class SQLiteCacheDB(TaskManager):
 
     @blocking_call_on_reactor_thread
     def execute(self, sql, args=None):
+        """
+        Execute a statement and return its cursor. apsw only runs a SELECT statement while its cursor is iterated, so
+        the duration of SELECT statements is measured by fetchone and fetchall instead.
+        """
         cur = self.get_cursor()
 
         if self._show_execute:
             thread_name = currentThread().getName()
             self._logger.info(u"===%s===\n%s\n-----\n%s\n======\n", thread_name, sql, args)
 
+        start_time = time()
         try:
             if args is None:
                 return cur.execute(sql)
@@ -282,6 +322,11 @@ class SQLiteCacheDB(TaskManager):
 
             raise msg
 
+        finally:
+            statement_type = get_statement_type(sql)
+            if statement_type != u"SELECT":
+                DB_STATEMENT_SECONDS.labels(statement_type).observe(time() - start_time)
+
     @blocking_call_on_reactor_thread
     def executemany(self, sql, args=None):
         self._should_commit = True
@@ -291,6 +336,7 @@ class SQLiteCacheDB(TaskManager):
             thread_name = currentThread().getName()
             self._logger.info(u"===%s===\n%s\n-----\n%s\n======\n", thread_name, sql, args)
 
+        start_time = time()
         try:
             if args is None:
                 result = cur.executemany(sql)
@@ -305,6 +351,9 @@ class SQLiteCacheDB(TaskManager):
                                    thread_name, type(sql), sql, args)
             raise msg
 
+        finally:
+            DB_STATEMENT_SECONDS.labels(get_statement_type(sql)).observe(time() - start_time)
+
     def execute_read(self, sql, args=None):
         return self.execute(sql, args)
 
@@ -376,13 +425,23 @@ class SQLiteCacheDB(TaskManager):
         result = self.fetchone(num_rec_sql)
         return result
 
+    def fetch_rows(self, sql, args=None):
+        """
+        Execute a statement and read all of its rows. Returns None if the statement has no cursor.
+        """
+        start_time = time()
+        try:
+            cursor = self.execute_read(sql, args)
+            return list(cursor) if cursor else None
+        finally:
+            DB_STATEMENT_SECONDS.labels(get_statement_type(sql)).observe(time() - start_time)
+
     @blocking_call_on_reactor_thread
     def fetchone(self, sql, args=None):
-        find = self.execute_read(sql, args)
+        find = self.fetch_rows(sql, args)
         if not find:
             return
         else:
-            find = list(find)
             if len(find) > 0:
                 if len(find) > 1:
                     self._logger.debug(
@@ -397,13 +456,31 @@ class SQLiteCacheDB(TaskManager):
 
     @blocking_call_on_reactor_thread
     def fetchall(self, sql, args=None):
-        res = self.execute_read(sql, args)
-        if res is not None:
-            find = list(res)
+        find = self.fetch_rows(sql, args)
+        if find is not None:
             return find
         else:
             return []  # should it return None?
 
+    def fetchall_in_thread(self, sql, args=None):
+        """
+        Like fetchall, but this can be called from any thread. Outside of the reactor thread the statement is executed
+        on a read-only connection of that thread, so it does not wait for the reactor. An in-memory database cannot be
+        opened twice, so its statements are always executed on the reactor thread.
+        """
+        if isInIOThread() or self.sqlite_db_path == u":memory:":
+            return self.fetchall(sql, args)
+
+        start_time = time()
+        cursor = self.get_read_cursor()
+        try:
+            if args is None:
+                return list(cursor.execute(sql))
+            return list(cursor.execute(sql, args))
+        finally:
+            cursor.close()
+            DB_STATEMENT_SECONDS.labels(get_statement_type(sql)).observe(time() - start_time)
+
     def getOne(self, table_name, value_name, where=None, conj=u"AND", **kw):
         """ value_name could be a string, a tuple of strings, or '*'
         """
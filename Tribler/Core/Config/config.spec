@@ -21,6 +21,7 @@ enabled = boolean(default=True)
 enabled = boolean(default=True)
 socks5_listen_ports = string_list(default=list('-1', '-1', '-1', '-1', '-1'))
 exitnode_enabled = boolean(default=False)
+warm_pool_size = integer(min=0, default=4)
 
 [market_community]
 enabled = boolean(default=True)
@@ -101,6 +102,9 @@ directory = string(default='')
 [http_api]
 enabled = boolean(default=False)
 port = integer(min=-1, max=65536, default=-1)
+events_queue_size = integer(min=1, default=1000)
+events_overflow_policy = option('drop_oldest', 'drop_newest', default='drop_oldest')
+profile_reactor = boolean(default=False)
 
 [credit_mining]
 enabled = boolean(default=False)
@@ -247,6 +247,24 @@ class TriblerConfig(object):
     def get_http_api_port(self):
         return self._obtain_port('http_api', 'port')
 
+    def set_http_api_events_queue_size(self, queue_size):
+        self.config['http_api']['events_queue_size'] = queue_size
+
+    def get_http_api_events_queue_size(self):
+        return self.config['http_api']['events_queue_size']
+
+    def set_http_api_events_overflow_policy(self, policy):
+        self.config['http_api']['events_overflow_policy'] = policy
+
+    def get_http_api_events_overflow_policy(self):
+        return self.config['http_api']['events_overflow_policy']
+
+    def set_http_api_profile_reactor(self, value):
+        self.config['http_api']['profile_reactor'] = value
+
+    def get_http_api_profile_reactor(self):
+        return self.config['http_api']['profile_reactor']
+
     # Dispersy
 
     def set_dispersy_enabled(self, value):
@@ -446,6 +464,12 @@ class TriblerConfig(object):
     def get_tunnel_community_exitnode_enabled(self):
         return self.config['tunnel_community']['exitnode_enabled']
 
+    def set_tunnel_community_warm_pool_size(self, value):
+        self.config['tunnel_community']['warm_pool_size'] = value
+
+    def get_tunnel_community_warm_pool_size(self):
+        return self.config['tunnel_community']['warm_pool_size']
+
     def set_default_number_hops(self, value):
         self.config['download_defaults']['number_hops'] = value
 
@@ -4,11 +4,23 @@ Contains a snapshot of the state of the Download at a specific point in time.
 Author(s): Arno Bakker
 """
 import logging
+from itertools import izip
 
+from Tribler.Core.Utilities.bitfield import PieceBitfield
 from Tribler.Core.simpledefs import (DLSTATUS_DOWNLOADING, DLSTATUS_SEEDING, DLSTATUS_STOPPED,
                                      DLSTATUS_STOPPED_ON_ERROR, DLSTATUS_WAITING4HASHCHECK, UPLOAD)
 
 
+def as_lookup_set(files):
+    """
+    Return the given files as a set for fast membership tests, unless the file entries are not hashable.
+    """
+    try:
+        return set(files)
+    except TypeError:
+        return files
+
+
 class DownloadState(object):
     """
     Contains a snapshot of the state of the Download at a specific
@@ -39,6 +51,7 @@ class DownloadState(object):
         self.seeding_stats = seeding_stats
 
         self.haveslice = None
+        self.haveslice_total = None
         self.stats = None
         self.length = None
 
@@ -94,27 +107,17 @@ class DownloadState(object):
                 self.haveslice = stats['stats'].have  # is copy of network engine list
             else:
                 # For get_files_completion()
-                self.haveslice_total = stats['stats'].have
+                have_all = stats['stats'].have
+                self.haveslice_total = PieceBitfield(have_all)
 
-                selected_files = self.download.get_selected_files()
+                selected_files = as_lookup_set(self.download.get_selected_files())
                 # Show only pieces complete for the selected ranges of files
-                totalpieces = 0
-                for t, tl, o, f in self.filepieceranges:
-                    if f in selected_files or not selected_files:
-                        diff = tl - t
-                        totalpieces += diff
-
-                haveslice = [False] * totalpieces
+                haveslice = []
                 have = 0
-                index = 0
                 for t, tl, o, f in self.filepieceranges:
                     if f in selected_files or not selected_files:
-                        for piece in range(t, tl):
-                            haveslice[index] = stats['stats'].have[piece]
-                            if haveslice[index]:
-                                have += 1
-
-                            index += 1
+                        haveslice += have_all[t:tl]
+                        have += self.haveslice_total.count(t, tl)
                 self.haveslice = haveslice
                 if have == len(haveslice) and self.status == DLSTATUS_DOWNLOADING:
                     # we have all pieces of the selected files
@@ -289,20 +292,15 @@ class DownloadState(object):
 
         completion = []
         if self.filepieceranges:
+            files_set = as_lookup_set(files)
             for t, tl, o, f in self.filepieceranges:
-                if f in files and self.progress == 1.0:
+                if f in files_set and self.progress == 1.0:
                     completion.append((f, 1.0))
                 else:
                     # niels: ranges are from-to (inclusive ie if a file consists one piece t and tl will be the same)
-                    total_pieces = tl - t
-                    if total_pieces and getattr(self, 'haveslice_total', False):
-                        completed = 0
-                        for index in range(t, tl):
-                            if self.haveslice_total[index]:
-                                completed += 1
-
-                        completion.append((f, completed / (total_pieces * 1.0)))
-                    elif f in files:
+                    if tl > t and self.haveslice_total:
+                        completion.append((f, self.haveslice_total.fraction(t, tl)))
+                    elif f in files_set:
                         completion.append((f, 0.0))
         elif files:
             # Single file
@@ -345,16 +343,14 @@ class DownloadState(object):
                 if merged_bitfields is None:
                     merged_bitfields = [0] * len(have)
 
-                for i in range(len(have)):
-                    if have[i]:
-                        merged_bitfields[i] += 1
+                merged_bitfields = [count + bool(bit) for count, bit in izip(merged_bitfields, have)]
 
         if merged_bitfields:
             # count the number of complete copies due to overlapping leecher bitfields
             nr_leechers_complete = min(merged_bitfields)
 
             # detect remainder of bitfields which are > 0
-            nr_more_than_min = len([x for x in merged_bitfields if x > nr_leechers_complete])
+            nr_more_than_min = len(merged_bitfields) - merged_bitfields.count(nr_leechers_complete)
             fraction_additonal = float(nr_more_than_min) / len(merged_bitfields)
 
             return nr_seeders_complete + nr_leechers_complete + fraction_additonal
@@ -3,13 +3,12 @@ A wrapper around a libtorrent download.
 
 Author(s): Arno Bakker, Egbert Bouman
 """
-import base64
 import logging
 import os
 import random
 import sys
-import time
 from binascii import hexlify
+from threading import Condition
 from traceback import print_exc
 from twisted.internet import defer, reactor
 from twisted.internet.defer import Deferred, CancelledError, succeed
@@ -20,9 +19,11 @@ import libtorrent as lt
 from Tribler.Core import NoDispersyRLock
 from Tribler.Core.DownloadConfig import DownloadStartupConfig, DownloadConfigInterface
 from Tribler.Core.DownloadState import DownloadState
-from Tribler.Core.Libtorrent import checkHandleAndSynchronize
+from Tribler.Core.Libtorrent import checkHandleAndSynchronize, PIECES_WAIT_TIMEOUT
+from Tribler.Core.Libtorrent.StreamingScheduler import StreamingScheduler
 from Tribler.Core.TorrentDef import TorrentDefNoMetainfo, TorrentDef
 from Tribler.Core.Utilities import maketorrent
+from Tribler.Core.Utilities.bitfield import PieceBitfield
 from Tribler.Core.Utilities.torrent_utils import get_info_from_handle
 from Tribler.Core.exceptions import SaveResumeDataError
 from Tribler.Core.osutils import fix_filebasename
@@ -61,8 +62,24 @@ class VODFile(object):
 
         self._logger.debug('VODFile: get bytes %s - %s', oldpos, oldpos + args[0])
 
-        while not self._file.closed and self._download.get_byte_progress([(self._download.get_vod_fileindex(), oldpos, oldpos + args[0])]) < 1 and self._download.vod_seekpos is not None:
-            time.sleep(1)
+        scheduler = self._download.vod_scheduler
+        while True:
+            # Get the generation before checking the pieces, so we cannot miss a piece that finishes in between
+            generation = self._download.get_pieces_generation()
+            if self._download.is_stopped():
+                self._logger.debug('VODFile: got no bytes, the download has stopped')
+                return ''
+            if self._file.closed or self._download.vod_seekpos is None or self._download.get_byte_progress(
+                    [(self._download.get_vod_fileindex(), oldpos, oldpos + args[0])]) >= 1:
+                break
+
+            if scheduler:
+                scheduler.request_range(oldpos, args[0])
+                scheduler.on_stall()
+            self._download.wait_for_pieces_change(generation)
+
+        if scheduler:
+            scheduler.on_resume()
 
         if self._file.closed:
             self._logger.debug('VODFile: got no bytes, file is closed')
@@ -73,6 +90,8 @@ class VODFile(object):
         newpos = self._file.tell()
         if self._download.vod_seekpos == oldpos:
             self._download.vod_seekpos = newpos
+        if scheduler:
+            scheduler.set_position(newpos)
 
         self._logger.debug('VODFile: got bytes %s - %s', oldpos, newpos)
 
@@ -86,15 +105,17 @@ class VODFile(object):
 
         if self._download.vod_seekpos is None or abs(newpos - self._download.vod_seekpos) < 1024 * 1024:
             self._download.vod_seekpos = newpos
-        self._download.set_byte_priority([(self._download.get_vod_fileindex(), 0, newpos)], 0)
-        self._download.set_byte_priority([(self._download.get_vod_fileindex(), newpos, -1)], 1)
 
-        self._logger.debug('VODFile: seek, get pieces %s', self._download.handle.piece_priorities())
-        self._logger.debug('VODFile: seek, got pieces %s', [
-                           int(piece) for piece in self._download.handle.status().pieces])
+        if self._download.vod_scheduler:
+            self._download.vod_scheduler.seek(newpos)
+        else:
+            self._download.set_byte_priority([(self._download.get_vod_fileindex(), 0, newpos)], 0)
+            self._download.set_byte_priority([(self._download.get_vod_fileindex(), newpos, -1)], 1)
 
     def close(self, *args):
         self._file.close(*args)
+        # Wake up any reader that is waiting for pieces of this file
+        self._download.notify_pieces_changed()
 
     @property
     def closed(self):
@@ -146,6 +167,13 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
         self.prebuffsize = 5 * 1024 * 1024
         self.endbuffsize = 0
         self.vod_seekpos = 0
+        self.vod_scheduler = None
+
+        # Readers of a VOD stream wait on this condition until the generation changes, which happens whenever a piece
+        # finishes or the state of the stream changes.
+        self.pieces_condition = Condition()
+        self.pieces_generation = 0
+        self.pieces_changed_deferreds = []
 
         self.max_prebuffsize = 5 * 1024 * 1024
 
@@ -156,6 +184,8 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
 
         self.correctedinfoname = u""
         self._checkpoint_disabled = False
+        # Whether the persistent state of this download changed since the last checkpoint
+        self._checkpoint_dirty = False
 
         self.deferreds_resume = []
         self.deferreds_handle = []
@@ -178,14 +208,34 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
     def get_checkpoint_disabled(self):
         return self._checkpoint_disabled
 
+    def set_checkpoint_dirty(self, dirty=True):
+        self._checkpoint_dirty = dirty
+
+    def can_checkpoint(self):
+        """
+        Returns whether checkpointing is enabled and the download has a handle to save the resume data of.
+        """
+        return not self._checkpoint_disabled and bool(self.handle and self.handle.is_valid())
+
+    def needs_checkpoint(self):
+        """
+        Returns whether the pstate or the resume data of this download changed since the last checkpoint, and it can
+        be checkpointed.
+        """
+        if not self.can_checkpoint():
+            return False
+        return self._checkpoint_dirty or self.handle.need_save_resume_data()
+
     def check_handle(self):
         """
         Check whether the handle exists and is valid. If so, stop the looping call and fire the deferreds waiting
         for the handle.
         """
         if self.handle and self.handle.is_valid():
-            self.handle_check_lc.stop()
-            for deferred in self.deferreds_handle:
+            if self.handle_check_lc.running:
+                self.handle_check_lc.stop()
+            deferreds, self.deferreds_handle = self.deferreds_handle, []
+            for deferred in deferreds:
                 deferred.callback(self.handle)
 
     def get_handle(self):
@@ -336,7 +386,16 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
                 atp["url"] = self.tdef.get_url() or "magnet:?xt=urn:btih:" + hexlify(self.tdef.get_infohash())
                 atp["name"] = self.tdef.get_name_as_unicode()
 
-            self.handle = self.ltmgr.add_torrent(self, atp)
+            return self.ltmgr.add_torrent(self, atp).addCallbacks(self.on_handle_added, self.on_handle_add_failed,
+                                                                  callbackArgs=(pstate,))
+
+    def on_handle_added(self, handle, pstate):
+        """
+        Called when libtorrent has added the torrent of this download to its session.
+        """
+        with self.dllock:
+            self.handle = handle
+            resume_data = pstate.get('state', 'engineresumedata') if pstate else None
             # assert self.handle.status().share_mode == share_mode
             if self.handle.is_valid():
 
@@ -371,8 +430,18 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
 
             self.cew_scheduled = False
 
-            # Return a deferred with the callback already being called
-            return defer.succeed(self)
+        # Fire the deferreds waiting for the handle right away instead of waiting for the next check
+        self.check_handle()
+        return self
+
+    def on_handle_add_failed(self, failure):
+        if failure.check(CancelledError):
+            self._logger.info("Stopped adding torrent to LibtorrentManager: %s", failure.getErrorMessage())
+        else:
+            self._logger.error("Could not add torrent to LibtorrentManager: %s", failure.getErrorMessage())
+        with self.dllock:
+            self.cew_scheduled = False
+        return failure
 
     def get_anon_mode(self):
         return self.get_hops() > 0
@@ -391,18 +460,84 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
 
             self.handle.set_sequential_download(True)
             self.handle.set_priority(255)
-            self.set_byte_priority([(self.get_vod_fileindex(), self.prebuffsize, -self.endbuffsize)], 0)
-            self.set_byte_priority([(self.get_vod_fileindex(), 0, self.prebuffsize)], 1)
-            self.set_byte_priority([(self.get_vod_fileindex(), -self.endbuffsize, -1)], 1)
+
+            # The pieces around the read position are requested with deadlines, instead of changing priorities
+            self.stop_vod_scheduler()
+            self.vod_scheduler = StreamingScheduler(self, self.get_vod_fileindex(), self.get_vod_filesize(),
+                                                    tail_size=self.endbuffsize)
+            self.vod_scheduler.start(self.vod_seekpos)
 
             self.progress = self.get_byte_progress([(self.get_vod_fileindex(), 0, -1)])
             self._logger.debug("LibtorrentDownloadImpl: going into VOD mode %s", filename)
         else:
+            self.stop_vod_scheduler()
             self.handle.set_sequential_download(False)
             self.handle.set_priority(0)
             if self.get_vod_fileindex() >= 0:
                 self.set_byte_priority([(self.get_vod_fileindex(), 0, -1)], 1)
 
+    def stop_vod_scheduler(self):
+        if self.vod_scheduler:
+            self.vod_scheduler.stop()
+            self.vod_scheduler = None
+        self.notify_pieces_changed()
+
+    def get_pieces_generation(self):
+        with self.pieces_condition:
+            return self.pieces_generation
+
+    def wait_for_pieces_change(self, generation, timeout=PIECES_WAIT_TIMEOUT):
+        """
+        Block until a piece has finished or the state of the VOD stream has changed since the given generation. The
+        download is checked for having stopped every timeout seconds, in case it stopped without a notification.
+        :return: False if the download stopped while waiting, True otherwise.
+        """
+        while True:
+            with self.pieces_condition:
+                if self.pieces_generation != generation:
+                    return True
+                self.pieces_condition.wait(timeout)
+                if self.pieces_generation != generation:
+                    return True
+            # The download lock may be held while notifying, so we do not check the download with the condition held
+            if self.is_stopped():
+                return False
+
+    def is_stopped(self):
+        handle = self.handle
+        return handle is None or not handle.is_valid() or self.dlstate in (DLSTATUS_STOPPED, DLSTATUS_STOPPED_ON_ERROR)
+
+    def get_pieces_changed_deferred(self):
+        """
+        Return a deferred that fires on the reactor thread when a piece has finished or the state of the VOD stream
+        has changed. This is the non-blocking counterpart of wait_for_pieces_change. Cancelling the deferred stops
+        waiting.
+        """
+        deferred = Deferred(self.cancel_pieces_changed_deferred)
+        with self.pieces_condition:
+            self.pieces_changed_deferreds.append(deferred)
+        return deferred
+
+    def cancel_pieces_changed_deferred(self, deferred):
+        with self.pieces_condition:
+            if deferred in self.pieces_changed_deferreds:
+                self.pieces_changed_deferreds.remove(deferred)
+
+    def notify_pieces_changed(self):
+        with self.pieces_condition:
+            self.pieces_generation += 1
+            self.pieces_condition.notify_all()
+            deferreds, self.pieces_changed_deferreds = self.pieces_changed_deferreds, []
+
+        for deferred in deferreds:
+            reactor.callFromThread(self.fire_pieces_changed_deferred, deferred)
+
+    @staticmethod
+    def fire_pieces_changed_deferred(deferred):
+        # The deferred may have been cancelled before the reactor got to it
+        if not deferred.called:
+            deferred.callback(None)
+
     def get_vod_fileindex(self):
         if self.vod_index is not None:
             return self.vod_index
@@ -425,15 +560,8 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
 
         status = self.handle.status()
         if status:
-            pieces_have = 0
-            pieces_all = len(pieces)
-            bitfield = status.pieces
-            for pieceindex in pieces:
-                if pieceindex < len(bitfield) and bitfield[pieceindex]:
-                    pieces_have += 1
-                elif consecutive:
-                    break
-            return float(pieces_have) / pieces_all
+            return PieceBitfield(status.pieces).get_ranges_progress([(piece, piece + 1) for piece in pieces],
+                                                                    consecutive)
         return 0.0
 
     @checkHandleAndSynchronize('')
@@ -441,14 +569,7 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
         """
         Returns a base64 encoded bitmask of the pieces that we have.
         """
-        bitstr = ""
-        for bit in self.handle.status().pieces:
-            bitstr += '1' if bit else '0'
-
-        encoded_str = ""
-        for i in range(0, len(bitstr), 8):
-            encoded_str += chr(int(bitstr[i:i+8].ljust(8, '0'), 2))
-        return base64.b64encode(encoded_str)
+        return PieceBitfield(self.handle.status().pieces).to_base64()
 
     @checkHandleAndSynchronize(0)
     def get_num_pieces(self):
@@ -460,7 +581,7 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
 
     @checkHandleAndSynchronize(0.0)
     def get_byte_progress(self, byteranges, consecutive=False):
-        pieces = []
+        piece_ranges = []
         for fileindex, bytes_begin, bytes_end in byteranges:
             if fileindex >= 0:
                 # Ensure the we remain within the file's boundaries
@@ -474,12 +595,17 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
                 startpiece = max(startpiece, 0)
                 endpiece = min(endpiece, get_info_from_handle(self.handle).num_pieces())
 
-                pieces += range(startpiece, endpiece)
+                piece_ranges.append((startpiece, endpiece))
             else:
                 self._logger.info("LibtorrentDownloadImpl: could not get progress for incorrect fileindex")
 
-        pieces = list(set(pieces))
-        return self.get_piece_progress(pieces, consecutive)
+        if not piece_ranges:
+            return 1.0
+
+        status = self.handle.status()
+        if status:
+            return PieceBitfield(status.pieces).get_ranges_progress(piece_ranges, consecutive)
+        return 0.0
 
     @checkHandleAndSynchronize()
     def set_piece_priority(self, pieces_need, priority):
@@ -530,7 +656,7 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
 
         alert_types = ('tracker_reply_alert', 'tracker_error_alert', 'tracker_warning_alert', 'metadata_received_alert',
                        'file_renamed_alert', 'performance_alert', 'torrent_checked_alert', 'torrent_finished_alert',
-                       'save_resume_data_alert', 'save_resume_data_failed_alert')
+                       'save_resume_data_alert', 'save_resume_data_failed_alert', 'piece_finished_alert')
 
         if alert_type in alert_types:
             getattr(self, 'on_' + alert_type)(alert)
@@ -540,7 +666,7 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
     def on_save_resume_data_alert(self, alert):
         """
         Callback for the alert that contains the resume data of a specific download.
-        This resume data will be written to a file on disk.
+        This resume data will be staged in the checkpoint store.
         """
         resume_data = alert.resume_data
 
@@ -548,13 +674,10 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
         self.pstate_for_restart.set('state', 'engineresumedata', resume_data)
         self._logger.debug("%s get resume data %s", hexlify(resume_data['info-hash']), resume_data)
 
-        # save it to file
-        basename = hexlify(resume_data['info-hash']) + '.state'
-        filename = os.path.join(self.session.get_downloads_pstate_dir(), basename)
-
-        self._logger.debug("tlm: network checkpointing: to file %s", filename)
+        self._logger.debug("tlm: network checkpointing: %s", hexlify(resume_data['info-hash']))
 
-        self.pstate_for_restart.write_file(filename)
+        self.set_checkpoint_dirty(False)
+        self.session.lm.save_download_pstate(resume_data['info-hash'], self.pstate_for_restart)
 
         # fire callback for all deferreds_resume
         for deferred_r in self.deferreds_resume:
@@ -648,7 +771,13 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
                 settings['max_queued_disk_bytes'] *= 2
                 self.ltmgr.get_session().set_settings(settings)
 
+    def on_piece_finished_alert(self, alert):
+        if self.vod_scheduler:
+            self.vod_scheduler.on_piece_finished(alert.piece_index)
+        self.notify_pieces_changed()
+
     def on_torrent_checked_alert(self, alert):
+        self.notify_pieces_changed()
         if self.pause_after_next_hashcheck:
             self.pause_after_next_hashcheck = False
             self.handle.pause()
@@ -658,9 +787,12 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
 
     @checkHandleAndSynchronize()
     def on_torrent_finished_alert(self, alert):
+        self.set_checkpoint_dirty()
         self.update_lt_stats()
+        self.notify_pieces_changed()
         if self.get_mode() == DLMODE_VOD:
             if self.progress == 1.0:
+                self.stop_vod_scheduler()
                 self.handle.set_sequential_download(False)
                 self.handle.set_priority(0)
                 if self.get_vod_fileindex() >= 0:
@@ -877,6 +1009,7 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
         stats['vod_prebuf_frac'] = self.network_calc_prebuf_frac()
         stats['vod_prebuf_frac_consec'] = self.network_calc_prebuf_frac(consecutive=True)
         stats['vod'] = self.get_mode()
+        stats['vod_streaming'] = self.vod_scheduler.get_stats() if self.vod_scheduler else None
         stats['spew'] = self.network_create_spew_from_peerlist() if getpeerlist or self.askmoreinfo else None
         stats['tracker_status'] = self.network_tracker_status() if getpeerlist or self.askmoreinfo else None
 
@@ -1061,6 +1194,7 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
         with self.dllock:
             self._logger.debug("LibtorrentDownloadImpl: network_stop %s", self.tdef.get_name())
             self.cancel_all_pending_tasks()
+            self.stop_vod_scheduler()
 
             pstate = self.get_persistent_download_config()
             if self.handle is not None:
@@ -1072,7 +1206,8 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
                 else:
                     self.set_vod_mode(False)
                     self.handle.pause()
-                    self.save_resume_data()
+                    if self.needs_checkpoint():
+                        self.save_resume_data()
             else:
                 # This method is also called at Session shutdown, where one may
                 # choose to checkpoint its Download. If the Download was
@@ -1083,6 +1218,10 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
                 if self.dlstate == DLSTATUS_CIRCUITS:
                     self.dlstate = DLSTATUS_STOPPED
 
+                # Libtorrent may still be adding the torrent of this download
+                if removestate and self.ltmgr:
+                    self.ltmgr.remove_pending_torrent(self, removecontent)
+
                 if self.pstate_for_restart is not None:
                     self._logger.debug(
                         "LibtorrentDownloadImpl: network_stop: Reusing previously saved engineresume data for checkpoint")
@@ -1193,6 +1332,7 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
     def set_def(self, tdef):
         with self.dllock:
             self.tdef = tdef
+            self.set_checkpoint_dirty()
 
     @checkHandleAndSynchronize()
     def add_trackers(self, trackers):
@@ -1223,6 +1363,7 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
             self.get_handle().addCallback(lambda handle: handle.set_download_limit(int(new_value * 1024)))
         elif section == 'download_defaults' and name in ['correctedfilename', 'super_seeder']:
             return False
+        self.set_checkpoint_dirty()
         return True
 
     @checkHandleAndSynchronize()
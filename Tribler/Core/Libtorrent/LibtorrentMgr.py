@@ -17,11 +17,12 @@ from urllib import url2pathname
 
 import libtorrent as lt
 from twisted.internet import reactor, threads
-from twisted.internet.defer import succeed, fail
+from twisted.internet.defer import CancelledError, Deferred, succeed, fail
 from twisted.python.failure import Failure
 
 from Tribler.Core.DownloadConfig import DefaultDownloadStartupConfig
 from Tribler.Core.TorrentDef import TorrentDef, TorrentDefNoMetainfo
+from Tribler.Core.Utilities.memory import cache_registry
 from Tribler.Core.Utilities.torrent_utils import get_info_from_handle
 from Tribler.Core.Utilities.utilities import parse_magnetlink, fix_torrent
 from Tribler.Core.exceptions import DuplicateDownloadException, TorrentFileException
@@ -51,6 +52,10 @@ class LibtorrentMgr(TaskManager):
         self.set_download_rate_limit(0)
 
         self.torrents = {}
+        # Torrents that have been handed to async_add_torrent, but for which no add_torrent_alert has arrived yet
+        self.pending_torrents = {}
+        # Torrents of which the download was removed while they were being added, with the remove_torrent flags
+        self.removed_torrents = {}
 
         self.upnp_mapping_dict = {}
 
@@ -60,6 +65,8 @@ class LibtorrentMgr(TaskManager):
         self.metainfo_requests = {}
         self.metainfo_lock = threading.RLock()
         self.metainfo_cache = {}
+        cache_registry.register("libtorrent.metainfo_cache", self, "metainfo_cache")
+        cache_registry.register("libtorrent.metainfo_requests", self, "metainfo_requests")
 
         self.process_alerts_lc = self.register_task("process_alerts", LoopingCall(self._task_process_alerts))
         self.check_reachability_lc = self.register_task("check_reachability", LoopingCall(self._check_reachability))
@@ -84,6 +91,13 @@ class LibtorrentMgr(TaskManager):
     def shutdown(self):
         self.cancel_all_pending_tasks()
 
+        # The torrents that are still being added will never get their add_torrent_alert processed
+        with self.metainfo_lock:
+            pending_torrents, self.pending_torrents = self.pending_torrents, {}
+            self.removed_torrents = {}
+        for _, _, add_deferred in pending_torrents.itervalues():
+            add_deferred.errback(CancelledError("libtorrent is shutting down"))
+
         # remove all upnp mapping
         for upnp_handle in self.upnp_mapping_dict.itervalues():
             self.get_session().delete_port_mapping(upnp_handle)
@@ -140,12 +154,17 @@ class LibtorrentMgr(TaskManager):
             ltsession.add_extension(lt.create_smart_ban_plugin)
 
         ltsession.set_settings(settings)
+        # We use piece_finished_alerts to wake up VOD readers. Older libtorrent versions only provide them as part of
+        # the progress notifications, which include an alert for every block. We do not enable those, the VOD readers
+        # check the download every PIECES_WAIT_TIMEOUT seconds instead.
+        piece_notification = getattr(lt.alert.category_t, 'piece_progress_notification', 0)
         ltsession.set_alert_mask(lt.alert.category_t.stats_notification |
                                  lt.alert.category_t.error_notification |
                                  lt.alert.category_t.status_notification |
                                  lt.alert.category_t.storage_notification |
                                  lt.alert.category_t.performance_warning |
-                                 lt.alert.category_t.tracker_notification)
+                                 lt.alert.category_t.tracker_notification |
+                                 piece_notification)
 
         # Load proxy settings
         if hops == 0:
@@ -260,6 +279,11 @@ class LibtorrentMgr(TaskManager):
         return self.dht_ready
 
     def add_torrent(self, torrentdl, atp):
+        """
+        Add a torrent to the libtorrent session. Returns a deferred that fires with the torrent handle.
+        If the libtorrent bindings support it, the torrent is added asynchronously and the deferred fires once the
+        corresponding add_torrent_alert has been processed, so adding many torrents does not block the reactor.
+        """
         # If we are collecting the torrent for this infohash, abort this first.
         with self.metainfo_lock:
             ltsession = self.get_session(atp.pop('hops', 0))
@@ -271,21 +295,71 @@ class LibtorrentMgr(TaskManager):
             else:
                 raise ValueError('No ti or url key in add_torrent_params')
 
+            if infohash in self.torrents or infohash in self.pending_torrents or infohash in self.removed_torrents:
+                raise DuplicateDownloadException("This download already exists.")
+
             if infohash in self.metainfo_requests:
                 self._logger.info("killing get_metainfo request for %s", infohash)
                 request_handle = self.metainfo_requests.pop(infohash)['handle']
                 if request_handle:
                     ltsession.remove_torrent(request_handle, 0)
 
-            torrent_handle = ltsession.add_torrent(encode_atp(atp))
-            infohash = str(torrent_handle.info_hash())
-            if infohash in self.torrents:
-                raise DuplicateDownloadException("This download already exists.")
-            self.torrents[infohash] = (torrentdl, ltsession)
+            if not hasattr(ltsession, 'async_add_torrent'):
+                torrent_handle = ltsession.add_torrent(encode_atp(atp))
+                infohash = str(torrent_handle.info_hash())
+                self.torrents[infohash] = (torrentdl, ltsession)
+
+                self._logger.debug("added torrent %s", infohash)
+
+                return succeed(torrent_handle)
+
+            add_deferred = Deferred()
+            self.pending_torrents[infohash] = (torrentdl, ltsession, add_deferred)
+            ltsession.async_add_torrent(encode_atp(atp))
+
+            self._logger.debug("adding torrent %s", infohash)
+
+            return add_deferred
+
+    def on_add_torrent_alert(self, alert):
+        """
+        Called when libtorrent finished adding a torrent that has been passed to async_add_torrent.
+        """
+        handle = alert.handle
+        if handle.is_valid():
+            infohash = str(handle.info_hash())
+        else:
+            params = alert.params
+            get_param = params.get if isinstance(params, dict) else lambda key: getattr(params, key, None)
+            if get_param('ti'):
+                infohash = str(get_param('ti').info_hash())
+            elif get_param('url'):
+                infohash = binascii.hexlify(parse_magnetlink(get_param('url'))[1])
+            else:
+                self._logger.warning("Failed to add torrent: %s", alert.message())
+                return
 
-            self._logger.debug("added torrent %s", infohash)
+        with self.metainfo_lock:
+            if infohash in self.removed_torrents:
+                ltsession, flags = self.removed_torrents.pop(infohash)
+                if handle.is_valid():
+                    ltsession.remove_torrent(handle, flags)
+                self._logger.debug("removed torrent %s after it was added", infohash)
+                return
+
+            if infohash not in self.pending_torrents:
+                return
+
+            torrentdl, ltsession, add_deferred = self.pending_torrents.pop(infohash)
+            if alert.error.value():
+                self._logger.error("Failed to add torrent %s: %s", infohash, alert.error.message())
+                add_deferred.errback(RuntimeError(alert.error.message()))
+                return
+
+            self.torrents[infohash] = (torrentdl, ltsession)
 
-            return torrent_handle
+        self._logger.debug("added torrent %s", infohash)
+        add_deferred.callback(handle)
 
     def remove_torrent(self, torrentdl, removecontent=False):
         handle = torrentdl.handle
@@ -297,9 +371,27 @@ class LibtorrentMgr(TaskManager):
                 self._logger.debug("remove torrent %s", infohash)
             else:
                 self._logger.debug("cannot remove torrent %s because it does not exists", infohash)
-        else:
+        elif not self.remove_pending_torrent(torrentdl, removecontent):
             self._logger.debug("cannot remove invalid torrent")
 
+    def remove_pending_torrent(self, torrentdl, removecontent=False):
+        """
+        Remove a torrent that is still being added. Libtorrent adds it anyway, so it is removed from the session once
+        its add_torrent_alert arrives. Returns whether the torrent was pending.
+        """
+        with self.metainfo_lock:
+            for infohash, (pending_dl, ltsession, add_deferred) in self.pending_torrents.items():
+                if pending_dl is torrentdl:
+                    del self.pending_torrents[infohash]
+                    self.removed_torrents[infohash] = (ltsession, int(removecontent))
+                    break
+            else:
+                return False
+
+        self._logger.debug("remove torrent %s while it is being added", infohash)
+        add_deferred.errback(CancelledError("the download was removed"))
+        return True
+
     def add_upnp_mapping(self, port, protocol='TCP'):
         # TODO martijn: this check should be removed once we do not support libtorrent versions that do not have the
         # add_port_mapping method exposed in the Python bindings
@@ -318,6 +410,10 @@ class LibtorrentMgr(TaskManager):
 
     def process_alert(self, alert):
         alert_type = str(type(alert)).split("'")[1].split(".")[-1]
+        if alert_type == 'add_torrent_alert' and (self.pending_torrents or self.removed_torrents):
+            self.on_add_torrent_alert(alert)
+            return
+
         handle = getattr(alert, 'handle', None)
         if handle:
             if handle.is_valid():
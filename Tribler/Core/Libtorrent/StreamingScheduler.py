@@ -0,0 +1,261 @@
+"""
+Deadline-based piece scheduling for video-on-demand downloads.
+
+Instead of rewriting the priorities of every piece in the torrent whenever the player moves, the scheduler asks
+libtorrent to download the pieces in a sliding window ahead of the read position before a deadline. The size of the
+window follows the measured download rate, so a fast download buffers further ahead than a slow one.
+"""
+import logging
+import time
+from threading import RLock
+
+from twisted.internet.task import LoopingCall
+
+from Tribler.Core.Utilities.torrent_utils import get_info_from_handle
+from Tribler.dispersy.taskmanager import TaskManager
+
+STREAMING_UPDATE_INTERVAL = 1     # Seconds between two updates of the window
+STREAMING_BUFFER_TIME = 10        # Seconds of download time the window should cover
+STREAMING_MIN_WINDOW = 4          # The minimum size of the window, in pieces
+STREAMING_MAX_WINDOW = 128        # The maximum size of the window, in pieces
+STREAMING_FIRST_DEADLINE = 500    # The deadline of the piece at the read position, in milliseconds
+STREAMING_INITIAL_RATE = 256 * 1024    # The download rate that is assumed before we measured it, in bytes/s
+STREAMING_RATE_SMOOTHING = 0.3    # The weight of a new download rate sample
+
+
+class StreamingScheduler(TaskManager):
+    """
+    Schedules piece deadlines for the file of a download that is being streamed.
+    """
+
+    def __init__(self, download, fileindex, filesize, tail_size=0):
+        super(StreamingScheduler, self).__init__()
+
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self.lock = RLock()
+
+        self.download = download
+        self.fileindex = fileindex
+        self.filesize = filesize
+        self.tail_size = tail_size
+        self.piece_length = get_info_from_handle(download.handle).piece_length()
+
+        self.position = self.offset_to_piece(0)
+        self.first_piece = self.position
+        self.last_piece = self.offset_to_piece(max(filesize - 1, 0))
+
+        # The pieces for which we set a deadline, mapped to the time at which that deadline expires
+        self.deadlines = {}
+        # The pieces the player is currently waiting for
+        self.urgent = set()
+        self.download_rate = float(STREAMING_INITIAL_RATE)
+
+        self.deadline_misses = 0
+        self.rebuffer_count = 0
+        self.rebuffer_time = 0.0
+        self.seek_count = 0
+        self.seek_latency = None
+        self.stall_started = None
+        self.seek_started = None
+
+    def offset_to_piece(self, offset):
+        """
+        Return the index of the piece that contains the given byte offset of the streamed file.
+        """
+        offset = min(max(offset, 0), max(self.filesize - 1, 0))
+        return get_info_from_handle(self.download.handle).map_file(self.fileindex, offset, 0).piece
+
+    def get_window_size(self):
+        """
+        Return the number of pieces ahead of the read position that should have a deadline.
+        """
+        window = int(self.download_rate * STREAMING_BUFFER_TIME / self.piece_length) + 1
+        return min(max(window, STREAMING_MIN_WINDOW), STREAMING_MAX_WINDOW)
+
+    def get_piece_time(self):
+        """
+        Return the expected time it takes to download a single piece, in milliseconds.
+        """
+        return int(self.piece_length * 1000 / max(self.download_rate, 1.0))
+
+    def start(self, offset=0):
+        with self.lock:
+            self.position = self.offset_to_piece(offset)
+            self.schedule_tail()
+            self.schedule()
+        self.register_task("update streaming window", LoopingCall(self.update))\
+            .start(STREAMING_UPDATE_INTERVAL, now=False)
+
+    def stop(self):
+        self.cancel_all_pending_tasks()
+        with self.lock:
+            self.deadlines = {}
+            self.urgent = set()
+            handle = self.download.handle
+            if handle and handle.is_valid():
+                handle.clear_piece_deadlines()
+
+    def get_pieces_have(self):
+        handle = self.download.handle
+        if handle and handle.is_valid():
+            return handle.status().pieces
+        return None
+
+    def set_deadline(self, piece, deadline):
+        self.download.handle.set_piece_deadline(piece, deadline)
+        self.deadlines[piece] = time.time() + deadline / 1000.0
+
+    def schedule(self):
+        """
+        Set a deadline for the missing pieces in the window ahead of the read position. The deadlines are spaced by
+        the expected download time of a piece.
+        """
+        pieces_have = self.get_pieces_have()
+        if pieces_have is None:
+            return
+
+        piece_time = self.get_piece_time()
+        window_end = min(self.position + self.get_window_size(), self.last_piece + 1)
+        for index, piece in enumerate(xrange(self.position, window_end)):
+            if piece < len(pieces_have) and not pieces_have[piece] and piece not in self.deadlines:
+                self.set_deadline(piece, STREAMING_FIRST_DEADLINE + index * piece_time)
+
+    def schedule_tail(self):
+        """
+        Most players read the end of a video file when they start playing, so we request those pieces early as well.
+        """
+        if not self.tail_size:
+            return
+
+        pieces_have = self.get_pieces_have()
+        if pieces_have is None:
+            return
+
+        deadline = STREAMING_FIRST_DEADLINE + self.get_window_size() * self.get_piece_time()
+        for piece in xrange(self.offset_to_piece(self.filesize - self.tail_size), self.last_piece + 1):
+            if piece < len(pieces_have) and not pieces_have[piece] and piece not in self.deadlines:
+                self.set_deadline(piece, deadline)
+
+    def seek(self, offset):
+        """
+        Move the read position to a random offset. If the new position is outside of the current window, the
+        outstanding deadlines are cleared so libtorrent can focus on the new position.
+        """
+        with self.lock:
+            piece = self.offset_to_piece(offset)
+            if not self.position <= piece < self.position + self.get_window_size():
+                self.seek_count += 1
+                self.seek_started = time.time()
+                self.deadlines = {}
+                self.urgent = set()
+                handle = self.download.handle
+                if handle and handle.is_valid():
+                    handle.clear_piece_deadlines()
+            self.position = piece
+            self.schedule()
+
+    def set_position(self, offset):
+        """
+        Called when the player has read up to the given offset. The window slides forward accordingly.
+        """
+        with self.lock:
+            piece = self.offset_to_piece(offset)
+            if piece <= self.position:
+                return
+
+            handle = self.download.handle
+            for passed_piece in [p for p in self.deadlines if p < piece]:
+                del self.deadlines[passed_piece]
+                if handle and handle.is_valid():
+                    handle.reset_piece_deadline(passed_piece)
+            self.position = piece
+            self.schedule()
+
+    def request_range(self, offset, length):
+        """
+        Called when the player is waiting for the given byte range. The missing pieces in this range are requested
+        with the shortest possible deadline.
+        """
+        with self.lock:
+            pieces_have = self.get_pieces_have()
+            if pieces_have is None:
+                return
+
+            for piece in xrange(self.offset_to_piece(offset), self.offset_to_piece(offset + length - 1) + 1):
+                if piece < len(pieces_have) and not pieces_have[piece] and piece not in self.urgent:
+                    self.download.handle.set_piece_deadline(piece, 0)
+                    self.urgent.add(piece)
+                    # The piece keeps its original expiry time, so a miss is still counted against that
+                    self.deadlines.setdefault(piece, time.time())
+
+    def on_piece_finished(self, piece):
+        """
+        Called when libtorrent finished downloading a piece. If it is one of our pieces, the window is refilled
+        right away instead of waiting for the next update.
+        """
+        with self.lock:
+            self.urgent.discard(piece)
+            if self.deadlines.pop(piece, None) is None:
+                return
+            if self.seek_started is not None and piece == self.position:
+                self.seek_latency = time.time() - self.seek_started
+                self.seek_started = None
+            self.schedule()
+
+    def update(self):
+        """
+        Measure the download rate, keep track of the deadlines we missed and refill the window.
+        """
+        with self.lock:
+            pieces_have = self.get_pieces_have()
+            if pieces_have is None:
+                return
+
+            rate = self.download.handle.status().download_payload_rate
+            self.download_rate = (1 - STREAMING_RATE_SMOOTHING) * self.download_rate + STREAMING_RATE_SMOOTHING * rate
+
+            now = time.time()
+            for piece, expires in self.deadlines.items():
+                if piece < len(pieces_have) and pieces_have[piece]:
+                    del self.deadlines[piece]
+                elif expires < now:
+                    # libtorrent keeps requesting this piece, but we do not count it again
+                    self.deadline_misses += 1
+                    self.deadlines[piece] = float('inf')
+
+            self.urgent &= set(self.deadlines)
+
+            if self.seek_started is not None and self.position < len(pieces_have) and pieces_have[self.position]:
+                self.seek_latency = now - self.seek_started
+                self.seek_started = None
+
+            self.schedule()
+
+    def on_stall(self):
+        """
+        Called when the player has to wait for data that is not available yet.
+        """
+        with self.lock:
+            if self.stall_started is None:
+                self.stall_started = time.time()
+                self.rebuffer_count += 1
+
+    def on_resume(self):
+        """
+        Called when the data the player was waiting for has become available.
+        """
+        with self.lock:
+            if self.stall_started is not None:
+                self.rebuffer_time += time.time() - self.stall_started
+                self.stall_started = None
+
+    def get_stats(self):
+        with self.lock:
+            return {'window': self.get_window_size(),
+                    'position': self.position,
+                    'deadlines': len(self.deadlines),
+                    'deadline_misses': self.deadline_misses,
+                    'rebuffer_count': self.rebuffer_count,
+                    'rebuffer_time': self.rebuffer_time,
+                    'seek_count': self.seek_count,
+                    'seek_latency': self.seek_latency}
@@ -4,6 +4,9 @@ The Libtorrent package contains code to manage the torrent library.
 Author(s): Egbert Bouman
 """
 
+# Seconds between the checks whether a download has stopped or has new pieces, while a VOD reader is waiting for pieces
+PIECES_WAIT_TIMEOUT = 1.0
+
 
 def checkHandleAndSynchronize(default=None):
     """
@@ -0,0 +1,244 @@
+"""
+Incremental checkpointing of downloads into a single resume-data store.
+
+Instead of writing one .state file per download for every download at once, downloads are marked dirty whenever
+their persistent state changes. A rolling background task only asks the dirty downloads for their resume data and
+writes the collected states to the store in one atomic batch.
+"""
+import binascii
+import codecs
+import logging
+import os
+from collections import OrderedDict
+from glob import iglob
+from itertools import count
+from StringIO import StringIO
+
+from twisted.internet.defer import DeferredList, succeed
+from twisted.internet.task import LoopingCall
+
+from Tribler.Core.Utilities.configparser import CallbackConfigParser
+from Tribler.Core.simpledefs import STATEDIR_CHECKPOINT_STORE_DIR
+from Tribler.dispersy.taskmanager import TaskManager
+
+CHECKPOINT_INTERVAL = 5           # Seconds between two rolling checkpoint rounds
+CHECKPOINT_BATCH_SIZE = 50        # The maximum number of downloads that are checkpointed in one round
+
+# The options of a pstate that are needed to decide in which order downloads are resumed
+SUMMARY_OPTIONS = frozenset(['time_added', 'user_stopped', 'share_mode', 'dlstate'])
+
+
+def pstate_to_string(pstate):
+    """
+    Serialize a pstate to the same ini format that is used by the legacy .state files.
+    """
+    output = StringIO()
+    pstate.write(output)
+    return output.getvalue().encode('utf-8')
+
+
+def pstate_from_string(data):
+    """
+    Parse a pstate that has been serialized with pstate_to_string.
+    """
+    pstate = CallbackConfigParser()
+    pstate.readfp(StringIO(data.decode('utf-8')))
+    return pstate
+
+
+def pstate_summary_from_string(data):
+    """
+    Parse only the SUMMARY_OPTIONS of a pstate that has been serialized with pstate_to_string. This skips the
+    metainfo and the resume data, which make up most of a pstate.
+    """
+    lines = []
+    keep = False
+    for line in data.decode('utf-8').splitlines(True):
+        if line.startswith(u'['):
+            keep = True
+        elif not line[:1].isspace():
+            keep = line.split(u'=', 1)[0].strip() in SUMMARY_OPTIONS
+        if keep:
+            lines.append(line)
+
+    pstate = CallbackConfigParser()
+    pstate.readfp(StringIO(u''.join(lines)))
+    return pstate
+
+
+class CheckpointManager(TaskManager):
+    """
+    Keeps track of dirty downloads and persists their pstate and resume data in a LevelDB store.
+    """
+
+    def __init__(self, session):
+        super(CheckpointManager, self).__init__()
+
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self.session = session
+        self.store = None
+
+        # Infohashes of the downloads that have to be checkpointed, in the order they became dirty. Every time a
+        # download becomes dirty it gets a new number, so a checkpoint only clears the changes it has seen.
+        self.dirty = OrderedDict()
+        self.dirty_counter = count()
+
+        self.checkpoint_interval = CHECKPOINT_INTERVAL
+        self.batch_size = CHECKPOINT_BATCH_SIZE
+
+    def initialize(self):
+        from Tribler.Core.leveldbstore import LevelDbStore
+        self.store = LevelDbStore(os.path.join(self.session.config.get_state_dir(), STATEDIR_CHECKPOINT_STORE_DIR))
+        self.migrate_state_files()
+
+        self.register_task("checkpoint dirty downloads", LoopingCall(self.checkpoint_dirty))\
+            .start(self.checkpoint_interval, now=False)
+
+    def shutdown(self):
+        self.cancel_all_pending_tasks()
+        if self.store is not None:
+            self.store.close()
+        self.store = None
+
+    def migrate_state_files(self):
+        """
+        Move the legacy .state files from the checkpoint directory into the store. The states are written in a
+        single batch, the files are only removed after that batch has been written.
+        """
+        filenames = list(iglob(os.path.join(self.session.get_downloads_pstate_dir(), '*.state')))
+        if not filenames:
+            return
+
+        self._logger.info("Migrating %d download checkpoints to the checkpoint store", len(filenames))
+        migrated = []
+        for filename in filenames:
+            try:
+                infohash = binascii.unhexlify(os.path.basename(filename)[:-6])
+                with codecs.open(filename, 'rb', 'utf-8') as state_file:
+                    data = state_file.read()
+            except (TypeError, IOError, UnicodeDecodeError):
+                self._logger.warning("Skipping invalid checkpoint file %s", filename)
+                continue
+
+            self.store[infohash] = data.encode('utf-8')
+            migrated.append(filename)
+
+        self.store.flush()
+
+        for filename in migrated:
+            os.remove(filename)
+
+    def mark_dirty(self, infohash):
+        self.dirty[infohash] = next(self.dirty_counter)
+
+    def is_dirty(self, infohash):
+        return infohash in self.dirty
+
+    def collect_dirty(self):
+        """
+        Add the downloads of which the persistent state changed since the last checkpoint to the dirty list.
+        """
+        for infohash, download in self.session.lm.downloads.items():
+            if infohash not in self.dirty and download.needs_checkpoint():
+                self.mark_dirty(infohash)
+
+    def checkpoint_dirty(self, max_downloads=None):
+        """
+        Checkpoint (at most max_downloads of) the dirty downloads and write the results to the store in one batch.
+        Returns a deferred that fires when the batch has been written.
+        """
+        self.collect_dirty()
+
+        if max_downloads is None:
+            max_downloads = self.batch_size
+
+        deferreds = []
+        for infohash, number in self.dirty.items():
+            if max_downloads and len(deferreds) >= max_downloads:
+                break
+
+            download = self.session.lm.downloads.get(infohash)
+            if download is None:
+                del self.dirty[infohash]
+            elif download.can_checkpoint():
+                # Downloads without a handle stay dirty until they can be checkpointed
+                deferreds.append(download.checkpoint().addCallbacks(self.on_checkpoint, self.on_checkpoint_error,
+                                                                    callbackArgs=(infohash, number),
+                                                                    errbackArgs=(infohash,)))
+
+        if not deferreds:
+            return succeed(None)
+
+        self._logger.debug("Checkpointing %d dirty downloads, %d dirty in total", len(deferreds), len(self.dirty))
+        return DeferredList(deferreds).addCallback(lambda _: self.flush())
+
+    def on_checkpoint(self, _, infohash, number):
+        # The download stays dirty if it changed again while it was being checkpointed
+        if self.dirty.get(infohash) == number:
+            del self.dirty[infohash]
+
+    def on_checkpoint_error(self, failure, infohash):
+        self._logger.warning("Failed to checkpoint %s, retrying in the next round: %s", binascii.hexlify(infohash),
+                             failure.getErrorMessage())
+
+    def checkpoint_all_dirty(self):
+        """
+        Checkpoint every dirty download at once, this is used during shutdown.
+        """
+        return self.checkpoint_dirty(max_downloads=0)
+
+    def flush(self):
+        if self.store is not None:
+            self.store.flush()
+
+    def save_pstate(self, infohash, pstate):
+        """
+        Stage the pstate of a download. Staged states are written to the store in a batch on the next flush.
+        """
+        if self.store is None:
+            self._logger.debug("Not saving pstate of %s, the checkpoint store is closed", binascii.hexlify(infohash))
+            return
+        self.store[infohash] = pstate_to_string(pstate)
+
+    def load_pstate(self, infohash):
+        """
+        Return the pstate of the download with the given infohash or None if it is not in the store.
+        """
+        data = self.store.get(infohash) if self.store is not None else None
+        return pstate_from_string(data) if data else None
+
+    def has_pstate(self, infohash):
+        return self.store is not None and infohash in self.store
+
+    def get_pstates(self):
+        """
+        Return (infohash, pstate) tuples of all checkpointed downloads. If a pstate cannot be parsed, None is
+        returned instead.
+        """
+        self.flush()
+        for infohash, data in list(self.store.rangescan()):
+            try:
+                pstate = pstate_from_string(data)
+            except Exception:
+                self._logger.exception("Could not parse pstate of %s", binascii.hexlify(infohash))
+                pstate = None
+            yield infohash, pstate
+
+    def get_pstate_summaries(self):
+        """
+        Return (infohash, summary) tuples of all checkpointed downloads, where a summary is a pstate that only holds
+        the SUMMARY_OPTIONS. If a pstate cannot be parsed, None is returned instead.
+        """
+        self.flush()
+        for infohash, data in list(self.store.rangescan()):
+            try:
+                summary = pstate_summary_from_string(data)
+            except Exception:
+                self._logger.exception("Could not parse pstate of %s", binascii.hexlify(infohash))
+                summary = None
+            yield infohash, summary
+
+    def remove_pstate(self, infohash):
+        self.dirty.pop(infohash, None)
+        if self.store is not None and infohash in self.store:
+            del self.store[infohash]
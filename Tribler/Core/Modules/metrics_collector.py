@@ -0,0 +1,158 @@
+"""
+Exports the state of the core subsystems of a Tribler session as metrics.
+
+The subsystems already keep their own counters and data structures. Instead of updating metrics on every change, the
+collector reads that state whenever the metrics are scraped.
+"""
+from collections import defaultdict
+
+from Tribler.Core.Utilities.metrics import Gauge, Counter
+
+LIBTORRENT_COUNTERS = ("total_upload", "total_download", "total_payload_upload", "total_payload_download")
+LIBTORRENT_GAUGES = ("upload_rate", "download_rate", "payload_upload_rate", "payload_download_rate", "num_peers",
+                     "dht_nodes")
+TUNNEL_BYTE_COUNTERS = ("bytes_up", "bytes_down", "bytes_relay_up", "bytes_relay_down", "bytes_exit", "bytes_enter")
+
+
+class SessionMetricsCollector(object):
+    """
+    Collects the metrics of the LevelDB stores, libtorrent, the tunnel community, the market community and the
+    trustchain community of a session. Register an instance with a MetricsRegistry to export them.
+    """
+
+    def __init__(self, session):
+        self.session = session
+
+    def __call__(self):
+        metrics = []
+        metrics.extend(self.collect_leveldb())
+        metrics.extend(self.collect_libtorrent())
+        if self.session.get_dispersy_instance():
+            metrics.extend(self.collect_tunnel())
+            metrics.extend(self.collect_market())
+            metrics.extend(self.collect_trustchain())
+        return metrics
+
+    def get_community(self, community_cls):
+        for community in self.session.get_dispersy_instance().get_communities():
+            if isinstance(community, community_cls):
+                return community
+        return None
+
+    def collect_leveldb(self):
+        size = Gauge("tribler_leveldb_size_bytes", "Size of the LevelDB stores on disk", ["store"])
+        stores = {"torrents": self.session.lm.torrent_store, "metadata": self.session.lm.metadata_store}
+        checkpoint_manager = self.session.lm.checkpoint_manager
+        if checkpoint_manager:
+            stores["checkpoints"] = checkpoint_manager.store
+
+        for name, store in stores.iteritems():
+            if store is not None:
+                size.labels(name).set(store.get_disk_usage())
+        return [size]
+
+    def collect_libtorrent(self):
+        ltmgr = self.session.lm.ltmgr
+        if not ltmgr or not ltmgr.ltsessions:
+            return []
+
+        counters = [Counter("tribler_libtorrent_%s_bytes" % name, "libtorrent session status field %s" % name,
+                            ["hops"]) for name in LIBTORRENT_COUNTERS]
+        gauges = [Gauge("tribler_libtorrent_%s" % name, "libtorrent session status field %s" % name, ["hops"])
+                  for name in LIBTORRENT_GAUGES]
+
+        for hops, ltsession in ltmgr.ltsessions.items():
+            status = ltsession.status()
+            for name, counter in zip(LIBTORRENT_COUNTERS, counters):
+                counter.labels(hops).inc(getattr(status, name))
+            for name, gauge in zip(LIBTORRENT_GAUGES, gauges):
+                gauge.labels(hops).set(getattr(status, name))
+        return counters + gauges
+
+    def collect_tunnel(self):
+        from Tribler.community.tunnel.tunnel_community import TunnelCommunity
+        tunnel_community = self.get_community(TunnelCommunity)
+        if not tunnel_community:
+            return []
+
+        byte_counter = Counter("tribler_tunnel_bytes", "Bytes sent and received by the tunnel community", ["type"])
+        for name in TUNNEL_BYTE_COUNTERS:
+            byte_counter.labels(name).inc(tunnel_community.stats[name])
+
+        circuit_counts = defaultdict(int)
+        for circuit in tunnel_community.circuits.values():
+            circuit_counts[(circuit.goal_hops, str(circuit.state))] += 1
+        circuits = Gauge("tribler_tunnel_circuits", "Circuits by number of hops and state", ["hops", "state"])
+        for (hops, state), count in circuit_counts.iteritems():
+            circuits.labels(hops, state).set(count)
+
+        relays = Gauge("tribler_tunnel_relays", "Circuits that we relay for others")
+        relays.set(len(tunnel_community.relay_from_to))
+        exit_sockets = Gauge("tribler_tunnel_exit_sockets", "Circuits for which we are the exit node")
+        exit_sockets.set(len(tunnel_community.exit_sockets))
+
+        dns_stats = tunnel_community.dns_cache.get_stats()
+        dns_lookups = Counter("tribler_tunnel_dns_lookups", "Hostname lookups of the exit sockets by outcome",
+                              ["result"])
+        for name in ("hits", "negative_hits", "misses", "coalesced", "literals"):
+            dns_lookups.labels(name).inc(dns_stats[name])
+        dns_entries = Gauge("tribler_tunnel_dns_cache_entries", "Hostnames in the DNS cache of the exit sockets")
+        dns_entries.set(dns_stats["entries"])
+
+        warm_pool = Gauge("tribler_tunnel_warm_pool_circuits", "Circuits that are kept ready ahead of demand", ["hops"])
+        for hops, num_circuits in tunnel_community.warm_pool.get_targets().iteritems():
+            warm_pool.labels(hops).set(num_circuits)
+
+        scheduler_stats = tunnel_community.scheduler.get_stats()
+        forwarded = Counter("tribler_tunnel_forwarded_packets", "Relayed and exited data packets by outcome",
+                            ["result"])
+        for name in ("sent", "queued", "dropped"):
+            forwarded.labels(name).inc(scheduler_stats[name])
+        queued_bytes = Gauge("tribler_tunnel_queued_bytes", "Bytes of relayed and exited data held back by rate limits")
+        queued_bytes.set(scheduler_stats["queued_bytes"])
+
+        exit_pool_stats = tunnel_community.exit_pool.get_stats()
+        exit_pool = Gauge("tribler_tunnel_exit_pool", "Shared exit sockets and their mappings to circuits", ["type"])
+        for name in ("sockets", "mappings"):
+            exit_pool.labels(name).set(exit_pool_stats[name])
+        metrics = [byte_counter, circuits, relays, exit_sockets, dns_lookups, dns_entries, warm_pool, forwarded,
+                   queued_bytes, exit_pool]
+
+        from Tribler.community.tunnel.hidden_community import HiddenTunnelCommunity
+        if isinstance(tunnel_community, HiddenTunnelCommunity):
+            intro_point_stats = tunnel_community.intro_point_cache.get_stats()
+            intro_point_lookups = Counter("tribler_tunnel_intro_point_lookups",
+                                          "Lookups of the introduction points of hidden services by outcome",
+                                          ["result"])
+            for name in ("hits", "misses", "coalesced", "failures"):
+                intro_point_lookups.labels(name).inc(intro_point_stats[name])
+            intro_point_hit_rate = Gauge("tribler_tunnel_intro_point_cache_hit_rate",
+                                         "Share of the introduction point lookups that did not ask the DHT")
+            intro_point_hit_rate.set(intro_point_stats["hit_rate"])
+            metrics.extend([intro_point_lookups, intro_point_hit_rate])
+        return metrics
+
+    def collect_market(self):
+        from Tribler.community.market.community import MarketCommunity
+        market_community = self.get_community(MarketCommunity)
+        if not market_community:
+            return []
+
+        ticks = Gauge("tribler_market_ticks", "Ticks in the order book", ["side"])
+        depth = Gauge("tribler_market_depth", "Price levels in the order book", ["side", "price_type",
+                                                                                  "quantity_type"])
+        for side_name, side in (("ask", market_community.order_book.asks),
+                                ("bid", market_community.order_book.bids)):
+            ticks.labels(side_name).set(len(side))
+            for (price_type, quantity_type), price_levels in side.get_depth().iteritems():
+                depth.labels(side_name, price_type, quantity_type).set(price_levels)
+        return [ticks, depth]
+
+    def collect_trustchain(self):
+        from Tribler.community.trustchain.community import TrustChainCommunity
+        blocks = Gauge("tribler_trustchain_blocks", "Blocks in the database of the trustchain communities",
+                       ["community"])
+        for community in self.session.get_dispersy_instance().get_communities():
+            if isinstance(community, TrustChainCommunity):
+                blocks.labels(community.__class__.__name__).set(community.persistence.get_number_of_blocks())
+        return [blocks]
@@ -6,18 +6,19 @@ from Tribler.Core.Modules.restapi.channels.channels_playlists_endpoint import Ch
 from Tribler.Core.Modules.restapi.channels.channels_rss_endpoint import ChannelsRssFeedsEndpoint, \
     ChannelsRecheckFeedsEndpoint
 from Tribler.Core.Modules.restapi.channels.channels_torrents_endpoint import ChannelsTorrentsEndpoint
+from Tribler.Core.Modules.restapi.heavy_resource import HeavyResource
 from Tribler.Core.Modules.restapi.util import convert_db_channel_to_json
 from Tribler.Core.exceptions import DuplicateChannelNameError
 
 
-class ChannelsDiscoveredEndpoint(BaseChannelsEndpoint):
+class ChannelsDiscoveredEndpoint(HeavyResource, BaseChannelsEndpoint):
     """
     This class is responsible for requests regarding the discovered channels.
     """
     def getChild(self, path, request):
         return ChannelsDiscoveredSpecificEndpoint(self.session, path)
 
-    def render_GET(self, _):
+    def render_GET(self, request):
         """
         .. http:get:: /channels/discovered
 
@@ -48,12 +49,16 @@ class ChannelsDiscoveredEndpoint(BaseChannelsEndpoint):
                     }, ...]
                 }
         """
-        all_channels_db = self.channel_db_handler.getAllChannels()
+        xxx_filter = self.session.lm.category.xxx_filter if self.session.config.get_family_filter_enabled() else None
+        return self.render_in_worker(request, self.encode_channels, self.channel_db_handler, xxx_filter)
+
+    @staticmethod
+    def encode_channels(channel_db_handler, xxx_filter):
+        all_channels_db = channel_db_handler.getAllChannels(in_thread=True)
         results_json = []
         for channel in all_channels_db:
             channel_json = convert_db_channel_to_json(channel)
-            if self.session.config.get_family_filter_enabled() and \
-                    self.session.lm.category.xxx_filter.isXXX(channel_json['name']):
+            if xxx_filter and xxx_filter.isXXX(channel_json['name']):
                 continue
 
             results_json.append(channel_json)
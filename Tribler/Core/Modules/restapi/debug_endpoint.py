@@ -1,6 +1,8 @@
 import json
 from twisted.web import http, resource
 
+from Tribler.Core.Modules.restapi.heavy_resource import HeavyResource
+from Tribler.Core.Utilities.memory import cache_registry, get_object_counts, MemorySnapshots
 from Tribler.community.tunnel.tunnel_community import TunnelCommunity
 
 
@@ -12,7 +14,9 @@ class DebugEndpoint(resource.Resource):
     def __init__(self, session):
         resource.Resource.__init__(self)
 
-        child_handler_dict = {"circuits": DebugCircuitsEndpoint}
+        child_handler_dict = {"circuits": DebugCircuitsEndpoint, "videoserver": DebugVideoServerEndpoint,
+                              "events": DebugEventsEndpoint, "rest": DebugRESTEndpoint,
+                              "reactor": DebugReactorEndpoint, "memory": DebugMemoryEndpoint}
 
         for path, child_cls in child_handler_dict.iteritems():
             self.putChild(path, child_cls(session))
@@ -74,6 +78,7 @@ class DebugCircuitsEndpoint(resource.Resource):
             request.setResponseCode(http.NOT_FOUND)
             return json.dumps({"error": "tunnel community not found"})
 
+        # The circuits change on the reactor thread, so they are walked and encoded there as well
         circuits_json = []
         for circuit_id, circuit in tunnel_community.circuits.iteritems():
             item = {'id': circuit_id, 'state': str(circuit.state), 'goal_hops': circuit.goal_hops,
@@ -86,3 +91,378 @@ class DebugCircuitsEndpoint(resource.Resource):
             circuits_json.append(item)
 
         return json.dumps({'circuits': circuits_json})
+
+
+class DebugVideoServerEndpoint(resource.Resource):
+    """
+    This class handles requests regarding the statistics of the video server.
+    """
+
+    def __init__(self, session):
+        resource.Resource.__init__(self)
+        self.session = session
+
+    def render_GET(self, request):
+        """
+        .. http:get:: /debug/videoserver
+
+        A GET request to this endpoint returns the number of streams and the throughput of the video server.
+
+            **Example request**:
+
+            .. sourcecode:: none
+
+                curl -X GET http://localhost:8085/debug/videoserver
+
+            **Example response**:
+
+            .. sourcecode:: javascript
+
+                {
+                    "videoserver": {
+                        "active_sessions": 1,
+                        "total_sessions": 3,
+                        "bytes_sent": 52428800,
+                        "throughput": 1048576.0
+                    }
+                }
+        """
+        video_server = self.session.lm.video_server
+        if not video_server:
+            request.setResponseCode(http.NOT_FOUND)
+            return json.dumps({"error": "video server not enabled"})
+
+        return json.dumps({'videoserver': video_server.get_stats()})
+
+
+class DebugEventsEndpoint(resource.Resource):
+    """
+    This class handles requests regarding the statistics of the events endpoint.
+    """
+
+    def __init__(self, session):
+        resource.Resource.__init__(self)
+        self.session = session
+
+    def render_GET(self, request):
+        """
+        .. http:get:: /debug/events
+
+        A GET request to this endpoint returns the number of events that have been sent, batched, coalesced and
+        dropped over the events endpoint, together with the depth of the queues of the connected clients.
+
+            **Example request**:
+
+            .. sourcecode:: none
+
+                curl -X GET http://localhost:8085/debug/events
+
+            **Example response**:
+
+            .. sourcecode:: javascript
+
+                {
+                    "events": {
+                        "clients": 1,
+                        "queue_depth": 0,
+                        "max_queue_depth": 0,
+                        "pending_batch": 3,
+                        "events_encoded": 1200,
+                        "events_sent": 1197,
+                        "events_coalesced": 0,
+                        "events_dropped": {"search_result_torrent": 12},
+                        "batches_sent": 40
+                    }
+                }
+        """
+        return json.dumps({'events': self.session.lm.api_manager.root_endpoint.events_endpoint.get_stats()})
+
+
+class DebugRESTEndpoint(resource.Resource):
+    """
+    This class handles requests regarding the statistics of the heavy REST endpoints.
+    """
+
+    def __init__(self, session):
+        resource.Resource.__init__(self)
+        self.session = session
+
+    def render_GET(self, request):
+        """
+        .. http:get:: /debug/rest
+
+        A GET request to this endpoint returns, for every endpoint that is rendered in the REST worker pool, the
+        number of pending and rejected requests and a histogram of the latencies of the requests in seconds. The
+        histograms are also exported as tribler_rest_request_seconds by the metrics endpoint.
+
+            **Example request**:
+
+            .. sourcecode:: none
+
+                curl -X GET http://localhost:8085/debug/rest
+
+            **Example response**:
+
+            .. sourcecode:: javascript
+
+                {
+                    "rest": {
+                        "SearchEndpoint": {
+                            "pending": 1,
+                            "rejected": 0,
+                            "latency": {
+                                "buckets": [["0.001", 0], ["0.005", 2], ..., ["+Inf", 14]],
+                                "count": 14,
+                                "sum": 1.73
+                            }
+                        }
+                    }
+                }
+        """
+        return json.dumps({'rest': self.session.lm.api_manager.worker_pool.get_stats()})
+
+
+class DebugReactorEndpoint(resource.Resource):
+    """
+    This class handles requests regarding the lag of the reactor and the callables that stall it.
+    """
+
+    def __init__(self, session):
+        resource.Resource.__init__(self)
+        self.session = session
+
+    def render_GET(self, request):
+        """
+        .. http:get:: /debug/reactor
+
+        A GET request to this endpoint returns how late the heartbeat of the reactor fires and, for every time the lag
+        exceeded the threshold, the callables that kept the reactor busy. The stack of the reactor thread is sampled
+        during such stalls; the callables are sorted by the number of samples in which they were responsible.
+
+            **Example request**:
+
+            .. sourcecode:: none
+
+                curl -X GET http://localhost:8085/debug/reactor
+
+            **Example response**:
+
+            .. sourcecode:: javascript
+
+                {
+                    "reactor": {
+                        "lag": 0.002,
+                        "max_lag": 1.43,
+                        "threshold": 0.25,
+                        "num_stalls": 2,
+                        "recent_stalls": [{
+                            "time": 1500000000.0,
+                            "lag": 1.43,
+                            "callables": ["Tribler/Core/Modules/search_manager.py:search_for_torrents:70"]
+                        }, ...],
+                        "callables": [{
+                            "callable": "Tribler/Core/Modules/search_manager.py:search_for_torrents:70",
+                            "samples": 118,
+                            "time": 1.18
+                        }, ...]
+                    }
+                }
+        """
+        lag_monitor = self.session.lm.lag_monitor
+        if not lag_monitor:
+            request.setResponseCode(http.NOT_FOUND)
+            return json.dumps({"error": "reactor lag monitor not enabled"})
+
+        return json.dumps({'reactor': lag_monitor.get_report()})
+
+
+class DebugMemoryEndpoint(HeavyResource, resource.Resource):
+    """
+    This class handles requests regarding the memory usage of Tribler.
+    """
+
+    def __init__(self, session):
+        resource.Resource.__init__(self)
+        self.session = session
+        self.putChild("snapshots", DebugMemorySnapshotsEndpoint(session))
+
+    def render_GET(self, request):
+        """
+        .. http:get:: /debug/memory
+
+        A GET request to this endpoint returns the number of objects of the most common types and the sizes of the
+        caches that the subsystems of Tribler have registered. Both keep growing when there is a leak.
+
+            **Example request**:
+
+            .. sourcecode:: none
+
+                curl -X GET http://localhost:8085/debug/memory
+
+            **Example response**:
+
+            .. sourcecode:: javascript
+
+                {
+                    "memory": {
+                        "objects": [["__builtin__.dict", 123456], ["__builtin__.tuple", 65432], ...],
+                        "caches": {
+                            "tunnel.circuits": 8,
+                            "libtorrent.metainfo_cache": 12,
+                            ...
+                        },
+                        "tracemalloc": false
+                    }
+                }
+        """
+        # The caches are measured on the reactor thread, counting the objects of the garbage collector does not need it
+        caches = cache_registry.get_sizes()
+        return self.render_in_worker(request, lambda: json.dumps({'memory': {
+            'objects': get_object_counts(), 'caches': caches, 'tracemalloc': MemorySnapshots.has_tracemalloc()}}))
+
+
+class DebugMemorySnapshotsEndpoint(resource.Resource):
+    """
+    This class handles requests regarding the snapshots of the memory usage.
+    """
+
+    def __init__(self, session):
+        resource.Resource.__init__(self)
+        self.session = session
+        self.snapshots = MemorySnapshots()
+
+    def getChild(self, path, request):
+        return DebugMemorySnapshotEndpoint(self.session, self.snapshots, path)
+
+    def render_GET(self, request):
+        """
+        .. http:get:: /debug/memory/snapshots
+
+        A GET request to this endpoint returns the identifiers of the snapshots that have been taken.
+
+            **Example request**:
+
+            .. sourcecode:: none
+
+                curl -X GET http://localhost:8085/debug/memory/snapshots
+
+            **Example response**:
+
+            .. sourcecode:: javascript
+
+                {
+                    "snapshots": [{"id": 1, "time": 1500000000.0}, {"id": 2, "time": 1500000600.0}]
+                }
+        """
+        return json.dumps({'snapshots': self.snapshots.get_snapshot_list()})
+
+    def render_PUT(self, request):
+        """
+        .. http:put:: /debug/memory/snapshots
+
+        A PUT request to this endpoint takes a snapshot of the number of objects by type and the sizes of the caches.
+        If tracemalloc is available, the memory allocations are traced from the first snapshot onwards and included
+        in the snapshots, which slows down Tribler until the snapshots are deleted.
+
+            **Example request**:
+
+            .. sourcecode:: none
+
+                curl -X PUT http://localhost:8085/debug/memory/snapshots
+
+            **Example response**:
+
+            .. sourcecode:: javascript
+
+                {
+                    "snapshot_id": 2
+                }
+        """
+        return json.dumps({'snapshot_id': self.snapshots.take_snapshot(cache_registry.get_sizes())})
+
+    def render_DELETE(self, request):
+        """
+        .. http:delete:: /debug/memory/snapshots
+
+        A DELETE request to this endpoint removes all snapshots and stops tracing the memory allocations, if traced.
+
+            **Example request**:
+
+            .. sourcecode:: none
+
+                curl -X DELETE http://localhost:8085/debug/memory/snapshots
+
+            **Example response**:
+
+            .. sourcecode:: javascript
+
+                {
+                    "removed": true
+                }
+        """
+        self.snapshots.clear()
+        return json.dumps({'removed': True})
+
+
+class DebugMemorySnapshotEndpoint(HeavyResource, resource.Resource):
+    """
+    This class handles requests regarding a single snapshot of the memory usage.
+    """
+
+    def __init__(self, session, snapshots, snapshot_id):
+        resource.Resource.__init__(self)
+        self.session = session
+        self.snapshots = snapshots
+        self.snapshot_id = snapshot_id
+
+    def render_GET(self, request):
+        """
+        .. http:get:: /debug/memory/snapshots/(int:snapshot_id)
+
+        A GET request to this endpoint returns the most common types of objects and the sizes of the caches in a
+        snapshot. If the identifier of an earlier snapshot is passed as compare_to, the types whose number of objects
+        grew most since that snapshot are returned instead, and the growth of the caches. Snapshots that traced the
+        memory allocations also contain the source lines that allocated most memory, or whose allocations grew most.
+        The number of types and source lines is limited by the limit parameter.
+
+            **Example request**:
+
+            .. sourcecode:: none
+
+                curl -X GET http://localhost:8085/debug/memory/snapshots/2?compare_to=1&limit=10
+
+            **Example response**:
+
+            .. sourcecode:: javascript
+
+                {
+                    "statistics": {
+                        "objects": [{"type": "__builtin__.dict", "count": 123456, "count_diff": 2048}, ...],
+                        "caches": {"tunnel.circuits": {"size": 8, "size_diff": 2}, ...},
+                        "allocations": [{
+                            "traceback": "Tribler/community/tunnel/tunnel_community.py:512",
+                            "size": 1048576,
+                            "size_diff": 524288,
+                            "count": 2048,
+                            "count_diff": 1024
+                        }, ...]
+                    }
+                }
+        """
+        try:
+            snapshot_id = int(self.snapshot_id)
+            compare_to = int(request.args['compare_to'][0]) if 'compare_to' in request.args else None
+            limit = int(request.args['limit'][0]) if 'limit' in request.args else 20
+        except ValueError:
+            request.setResponseCode(http.BAD_REQUEST)
+            return json.dumps({"error": "snapshot identifiers and limit should be integers"})
+
+        snapshot = self.snapshots.snapshots.get(snapshot_id)
+        base = self.snapshots.snapshots.get(compare_to) if compare_to is not None else None
+        if snapshot is None or (compare_to is not None and base is None):
+            request.setResponseCode(http.NOT_FOUND)
+            return json.dumps({"error": "snapshot not found"})
+
+        # Snapshots are never changed once they have been taken, so they can be compared in a worker
+        return self.render_in_worker(request, lambda: json.dumps(
+            {'statistics': snapshot.get_statistics(base, limit)}))
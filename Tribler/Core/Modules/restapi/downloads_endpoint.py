@@ -1,5 +1,6 @@
 import json
 import logging
+import time
 from twisted.web import http, resource
 from twisted.web.server import NOT_DONE_YET
 
@@ -7,6 +8,18 @@ from Tribler.Core.DownloadConfig import DownloadStartupConfig
 from Tribler.Core.Libtorrent.LibtorrentDownloadImpl import LibtorrentStatisticsResponse
 from Tribler.Core.simpledefs import DOWNLOAD, UPLOAD, dlstatus_strings, DLMODE_VOD
 
+MAX_REMOVED_VERSIONS = 1000  # The number of removed downloads that is remembered for clients asking for changes
+SUMMARY_REFRESH_INTERVAL = 10  # Seconds after which the summary of a download that looks unchanged is rebuilt
+
+# The fields of a download that can be sorted on, and all fields that can be requested
+SORTABLE_DOWNLOAD_FIELDS = frozenset(["name", "progress", "infohash", "speed_down", "speed_up", "status", "size",
+                                      "eta", "num_peers", "num_seeds", "total_up", "total_down", "ratio", "hops",
+                                      "anon_download", "safe_seeding", "destination", "availability", "total_pieces",
+                                      "vod_mode", "error", "time_added"])
+DOWNLOAD_FIELDS = SORTABLE_DOWNLOAD_FIELDS | frozenset(["files", "selected_files", "trackers", "max_upload_speed",
+                                                        "max_download_speed", "vod_prebuffering_progress",
+                                                        "vod_prebuffering_progress_consec", "peers", "pieces"])
+
 
 class DownloadBaseEndpoint(resource.Resource):
     """
@@ -70,11 +83,121 @@ class DownloadsEndpoint(DownloadBaseEndpoint):
     """
     This endpoint is responsible for all requests regarding downloads. Examples include getting all downloads,
     starting, pausing and stopping downloads.
+
+    Every download has a state version. Whenever the state of a download differs from the state that was returned
+    previously, the download gets a new version from a counter that only increases. Clients can pass the last
+    version they have seen to only receive the downloads that changed since then.
     """
 
+    def __init__(self, session):
+        DownloadBaseEndpoint.__init__(self, session)
+        self.version = 0
+        self.download_versions = {}  # key: infohash, value: (summary of the state, version)
+        self.download_keys = {}  # key: infohash, value: (cheap key of the state, time at which the summary was built)
+        self.removed_versions = {}  # key: infohash, value: version at which the download was removed
+        self.removed_pruned_version = 0
+
     def getChild(self, path, request):
         return DownloadSpecificEndpoint(self.session, path)
 
+    @staticmethod
+    def get_flag_parameter(request, name):
+        return name in request.args and len(request.args[name]) > 0 and request.args[name][0] == "1"
+
+    @staticmethod
+    def get_int_parameter(request, name):
+        """
+        Return the value of a non-negative integer parameter, or None if the parameter is absent.
+        Raises a ValueError if the parameter is invalid.
+        """
+        if name not in request.args or len(request.args[name]) == 0:
+            return None
+        if not request.args[name][0].isdigit():
+            raise ValueError("%s parameter must be a non-negative integer" % name)
+        return int(request.args[name][0])
+
+    @staticmethod
+    def get_download_key(download):
+        """
+        Return the values of a download that are cheap to get and change while a download is active. As long as they
+        stay the same, the summary of the download is only rebuilt every SUMMARY_REFRESH_INTERVAL seconds.
+        """
+        return (download.get_status(), download.get_progress(), download.get_current_speed(DOWNLOAD),
+                download.get_current_speed(UPLOAD), download.get_hops(), download.get_safe_seeding(),
+                download.get_mode(), download.get_dest_dir(), tuple(download.get_selected_files()))
+
+    def get_download_summary(self, download, state):
+        """
+        Return the fields of a download that are cheap to compute. A download gets a new version when its summary
+        changes.
+        """
+        stats = download.network_create_statistics_reponse() or LibtorrentStatisticsResponse(0, 0, 0, 0, 0, 0, 0)
+
+        # Create tracker information of the download
+        tracker_info = []
+        for url, url_info in download.network_tracker_status().iteritems():
+            tracker_info.append({"url": url, "peers": url_info[0], "status": url_info[1]})
+
+        ratio = 0.0
+        if stats.downTotal > 0:
+            ratio = stats.upTotal / float(stats.downTotal)
+
+        return {"name": download.get_def().get_name(), "progress": download.get_progress(),
+                "infohash": download.get_def().get_infohash().encode('hex'),
+                "speed_down": download.get_current_speed(DOWNLOAD),
+                "speed_up": download.get_current_speed(UPLOAD),
+                "status": dlstatus_strings[download.get_status()],
+                "size": download.get_def().get_length(), "eta": download.network_calc_eta(),
+                "num_peers": stats.numPeers, "num_seeds": stats.numSeeds, "total_up": stats.upTotal,
+                "total_down": stats.downTotal, "ratio": ratio,
+                "trackers": tracker_info, "hops": download.get_hops(),
+                "anon_download": download.get_anon_mode(), "safe_seeding": download.get_safe_seeding(),
+                # Maximum upload/download rates are set for entire sessions
+                "max_upload_speed": self.session.config.get_libtorrent_max_upload_rate(),
+                "max_download_speed": self.session.config.get_libtorrent_max_download_rate(),
+                "destination": download.get_dest_dir(), "availability": state.get_availability(),
+                "total_pieces": download.get_num_pieces(), "vod_mode": download.get_mode() == DLMODE_VOD,
+                "vod_prebuffering_progress": state.get_vod_prebuffering_progress(),
+                "vod_prebuffering_progress_consec": state.get_vod_prebuffering_progress_consec(),
+                "error": repr(state.get_error()) if state.get_error() else "",
+                "time_added": download.get_time_added(),
+                "selected_files": download.get_selected_files()}
+
+    @staticmethod
+    def get_files_json(download, state):
+        files_completion = dict((name, progress) for name, progress in state.get_files_completion())
+        selected_files = download.get_selected_files()
+        files_array = []
+        for file_index, (file, size) in enumerate(download.get_def().get_files_with_length()):
+            files_array.append({"index": file_index, "name": file, "size": size,
+                                "included": (file in selected_files or not selected_files),
+                                "progress": files_completion.get(file, 0.0)})
+        return files_array
+
+    def update_versions(self, summaries):
+        """
+        Give every download whose summary changed a new version and remember which downloads have been removed.
+        """
+        for infohash, summary in summaries.iteritems():
+            current = self.download_versions.get(infohash)
+            if current is None or current[0] != summary:
+                self.version += 1
+                self.download_versions[infohash] = (summary, self.version)
+                self.removed_versions.pop(infohash, None)
+
+        for infohash in [infohash for infohash in self.download_versions if infohash not in summaries]:
+            self.version += 1
+            del self.download_versions[infohash]
+            self.download_keys.pop(infohash, None)
+            self.removed_versions[infohash] = self.version
+
+        # Clients that are older than the removals we forgot about get the full list of downloads instead
+        if len(self.removed_versions) > MAX_REMOVED_VERSIONS:
+            pruned = sorted(self.removed_versions.iteritems(), key=lambda item: item[1])
+            for infohash, version in pruned[:len(pruned) - MAX_REMOVED_VERSIONS]:
+                del self.removed_versions[infohash]
+                self.removed_pruned_version = max(self.removed_pruned_version, version)
+
     def render_GET(self, request):
         """
         .. http:get:: /downloads?get_peers=(boolean: get_peers)&get_pieces=(boolean: get_pieces)
@@ -88,6 +211,17 @@ class DownloadsEndpoint(DownloadBaseEndpoint):
         Note that setting this flag has a negative impact on performance and should only be used in situations
         where this data is required.
 
+        The following optional parameters reduce the amount of work per request:
+        - since: only return the downloads whose version is newer than the given version. The response then also
+          contains the current version, the infohashes of the downloads that have been removed since the given
+          version and whether the response is a full list (in which case the client should drop all other downloads).
+        - fields: a comma-separated list of the fields to return, for instance name,progress,speed_down. The
+          infohash is always returned.
+        - sort_by and sort_asc: sort the downloads on a field, in ascending (sort_asc=1, the default) or
+          descending (sort_asc=0) order.
+        - offset and limit: only return a page of the (sorted) downloads. The response then contains the total
+          number of downloads as well.
+
             **Example request**:
 
             .. sourcecode:: none
@@ -119,6 +253,7 @@ class DownloadsEndpoint(DownloadBaseEndpoint):
                             "size": 89432483,
                             "included": True
                         }, ...],
+                        "selected_files": [],
                         "trackers": [{
                             "url": "http://ipv6.torrent.ubuntu.com:6969/announce",
                             "status": "Working",
@@ -148,62 +283,95 @@ class DownloadsEndpoint(DownloadBaseEndpoint):
                         "time_added": 1484819242,
                     }
                 }, ...]
+
+            **Example request**:
+
+            .. sourcecode:: none
+
+                curl -X GET http://localhost:8085/downloads?since=42&fields=name,progress,speed_down
+
+            **Example response**:
+
+            .. sourcecode:: javascript
+
+                {
+                    "version": 45,
+                    "full": False,
+                    "downloads": [{
+                        "infohash": "4344503b7e797ebf31582327a5baae35b11bda01",
+                        "version": 44,
+                        "name": "Ubuntu-16.04-desktop-amd64",
+                        "progress": 0.31459265,
+                        "speed_down": 4938.83
+                    }],
+                    "removed": ["97d2d8f5d37e56cfaeaae151d55f05b077074779"]
+                }
         """
-        get_peers = False
-        if 'get_peers' in request.args and len(request.args['get_peers']) > 0 \
-                and request.args['get_peers'][0] == "1":
-            get_peers = True
+        fields = None
+        if 'fields' in request.args and len(request.args['fields']) > 0:
+            fields = set(field for field in request.args['fields'][0].split(',') if field)
+            unknown_fields = fields - DOWNLOAD_FIELDS
+            if unknown_fields:
+                request.setResponseCode(http.BAD_REQUEST)
+                return json.dumps({"error": "unknown fields: %s" % ", ".join(sorted(unknown_fields))})
+            fields.add("infohash")
+
+        get_peers = self.get_flag_parameter(request, 'get_peers') or (fields is not None and "peers" in fields)
+        get_pieces = self.get_flag_parameter(request, 'get_pieces') or (fields is not None and "pieces" in fields)
+        get_files = fields is None or "files" in fields
+
+        try:
+            since = self.get_int_parameter(request, 'since')
+            offset = self.get_int_parameter(request, 'offset') or 0
+            limit = self.get_int_parameter(request, 'limit')
+        except ValueError as error:
+            request.setResponseCode(http.BAD_REQUEST)
+            return json.dumps({"error": str(error)})
+
+        sort_by = request.args['sort_by'][0] if 'sort_by' in request.args and request.args['sort_by'] else None
+        if sort_by is not None and sort_by not in SORTABLE_DOWNLOAD_FIELDS:
+            request.setResponseCode(http.BAD_REQUEST)
+            return json.dumps({"error": "cannot sort on field %s" % sort_by})
+        sort_asc = not ('sort_asc' in request.args and request.args['sort_asc'] and request.args['sort_asc'][0] == "0")
+
+        now = time.time()
+        entries = []
+        summaries = {}
+        for download in self.session.get_downloads():
+            infohash = download.get_def().get_infohash().encode('hex')
+            key = self.get_download_key(download)
+            last_key, last_update = self.download_keys.get(infohash, (None, 0))
+            if infohash in self.download_versions and key == last_key and now - last_update < SUMMARY_REFRESH_INTERVAL:
+                # The download looks unchanged, so we do not get its state, trackers and availability again
+                state, summary = None, self.download_versions[infohash][0]
+            else:
+                state = download.network_get_state(None, get_peers)
+                summary = self.get_download_summary(download, state)
+                self.download_keys[infohash] = (key, now)
+            summaries[infohash] = summary
+            entries.append((download, state, summary))
+        self.update_versions(summaries)
+
+        # If we cannot tell the client what has been removed since its version, it gets all downloads
+        full = not since or since < self.removed_pruned_version or since > self.version
+        if not full:
+            entries = [entry for entry in entries if self.download_versions[entry[2]["infohash"]][1] > since]
+
+        if sort_by is not None:
+            entries.sort(key=lambda entry: entry[2][sort_by], reverse=not sort_asc)
 
-        get_pieces = False
-        if 'get_pieces' in request.args and len(request.args['get_pieces']) > 0 \
-                and request.args['get_pieces'][0] == "1":
-            get_pieces = True
+        total = len(entries)
+        entries = entries[offset:offset + limit if limit is not None else None]
 
         downloads_json = []
-        downloads = self.session.get_downloads()
-        for download in downloads:
-            stats = download.network_create_statistics_reponse() or LibtorrentStatisticsResponse(0, 0, 0, 0, 0, 0, 0)
-            state = download.network_get_state(None, get_peers)
-
-            # Create files information of the download
-            files_completion = dict((name, progress) for name, progress in state.get_files_completion())
-            selected_files = download.get_selected_files()
-            files_array = []
-            file_index = 0
-            for file, size in download.get_def().get_files_with_length():
-                files_array.append({"index": file_index, "name": file, "size": size,
-                                    "included": (file in selected_files or not selected_files),
-                                    "progress": files_completion.get(file, 0.0)})
-                file_index += 1
-
-            # Create tracker information of the download
-            tracker_info = []
-            for url, url_info in download.network_tracker_status().iteritems():
-                tracker_info.append({"url": url, "peers": url_info[0], "status": url_info[1]})
-
-            ratio = 0.0
-            if stats.downTotal > 0:
-                ratio = stats.upTotal / float(stats.downTotal)
-
-            download_json = {"name": download.get_def().get_name(), "progress": download.get_progress(),
-                             "infohash": download.get_def().get_infohash().encode('hex'),
-                             "speed_down": download.get_current_speed(DOWNLOAD),
-                             "speed_up": download.get_current_speed(UPLOAD),
-                             "status": dlstatus_strings[download.get_status()],
-                             "size": download.get_def().get_length(), "eta": download.network_calc_eta(),
-                             "num_peers": stats.numPeers, "num_seeds": stats.numSeeds, "total_up": stats.upTotal,
-                             "total_down": stats.downTotal, "ratio": ratio,
-                             "files": files_array, "trackers": tracker_info, "hops": download.get_hops(),
-                             "anon_download": download.get_anon_mode(), "safe_seeding": download.get_safe_seeding(),
-                             # Maximum upload/download rates are set for entire sessions
-                             "max_upload_speed": self.session.config.get_libtorrent_max_upload_rate(),
-                             "max_download_speed": self.session.config.get_libtorrent_max_download_rate(),
-                             "destination": download.get_dest_dir(), "availability": state.get_availability(),
-                             "total_pieces": download.get_num_pieces(), "vod_mode": download.get_mode() == DLMODE_VOD,
-                             "vod_prebuffering_progress": state.get_vod_prebuffering_progress(),
-                             "vod_prebuffering_progress_consec": state.get_vod_prebuffering_progress_consec(),
-                             "error": repr(state.get_error()) if state.get_error() else "",
-                             "time_added": download.get_time_added()}
+        for download, state, summary in entries:
+            download_json = dict(summary)
+
+            if state is None and (get_files or get_peers):
+                state = download.network_get_state(None, get_peers)
+
+            if get_files:
+                download_json["files"] = self.get_files_json(download, state)
 
             # Add peers information if requested
             if get_peers:
@@ -218,8 +386,24 @@ class DownloadsEndpoint(DownloadBaseEndpoint):
             if get_pieces:
                 download_json["pieces"] = download.get_pieces_base64()
 
+            if fields is not None:
+                download_json = dict((key, value) for key, value in download_json.iteritems() if key in fields)
+
+            if since is not None:
+                download_json["version"] = self.download_versions[summary["infohash"]][1]
+
             downloads_json.append(download_json)
-        return json.dumps({"downloads": downloads_json})
+
+        response = {"downloads": downloads_json}
+        if since is not None:
+            response["version"] = self.version
+            response["full"] = full
+            response["removed"] = [] if full else [infohash for infohash, version
+                                                   in self.removed_versions.iteritems() if version > since]
+        if limit is not None or offset:
+            response["total"] = total
+
+        return json.dumps(response)
 
     def render_PUT(self, request):
         """
@@ -1,5 +1,12 @@
 import json
+import logging
+from collections import defaultdict, deque
+
+from twisted.internet import reactor
+from twisted.internet.interfaces import IPushProducer
+from twisted.python.threadable import isInIOThread
 from twisted.web import server, resource
+from zope.interface import implementer
 
 from Tribler.Core.Modules.restapi.util import convert_db_channel_to_json, convert_search_torrent_to_json, \
     fix_unicode_dict
@@ -9,9 +16,98 @@ from Tribler.Core.simpledefs import (NTFY_CHANNELCAST, SIGNAL_CHANNEL, SIGNAL_ON
                                      NTFY_DISCOVERED, NTFY_TORRENT, NTFY_ERROR, NTFY_DELETE, NTFY_MARKET_ON_ASK,
                                      NTFY_UPDATE, NTFY_MARKET_ON_BID, NTFY_MARKET_ON_TRANSACTION_COMPLETE,
                                      NTFY_MARKET_ON_ASK_TIMEOUT, NTFY_MARKET_ON_BID_TIMEOUT,
-                                     NTFY_MARKET_ON_PAYMENT_RECEIVED, NTFY_MARKET_ON_PAYMENT_SENT)
+                                     NTFY_MARKET_ON_PAYMENT_RECEIVED, NTFY_MARKET_ON_PAYMENT_SENT, NTFY_STARTUP_TICK)
 from Tribler.Core.version import version_id
 
+EVENTS_BATCH_INTERVAL = 0.2  # Seconds during which events of a high-rate type are collected before they are sent
+# Event types that are emitted at a high rate and are therefore sent in batches
+BATCHED_EVENT_TYPES = frozenset(["search_result_channel", "search_result_torrent", "channel_discovered",
+                                 "torrent_discovered"])
+# Event types of which only the most recent one matters to a client that cannot keep up
+COALESCED_EVENT_TYPES = frozenset(["upgrader_tick", "downloads_resume_progress"])
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_DROP_NEWEST = "drop_newest"
+
+
+@implementer(IPushProducer)
+class EventsClient(object):
+    """
+    The connection of a single client to the events endpoint. Encoded events are written right away, unless the
+    transport asks us to pause. In that case the events are queued until the transport has drained. The number of
+    queued high-rate events is bounded; when the bound is reached, high-rate events are dropped according to the
+    overflow policy. Other events, like tribler_started or torrent_finished, are always queued.
+    """
+
+    def __init__(self, endpoint, request, max_queue_size, overflow_policy):
+        self.endpoint = endpoint
+        self.request = request
+        self.max_queue_size = max_queue_size
+        self.overflow_policy = overflow_policy
+        self.queue = deque()  # Items are (event type, encoded event)
+        self.num_batched = 0  # The number of queued events of a high-rate type
+        self.paused = False
+        self.closed = False
+
+    def pauseProducing(self):
+        self.paused = True
+
+    def resumeProducing(self):
+        self.paused = False
+        self.flush()
+
+    def stopProducing(self):
+        self.closed = True
+        self.queue.clear()
+        self.num_batched = 0
+
+    def enqueue(self, events):
+        """
+        Queue a list of (event type, encoded event) tuples and write them if the client can keep up.
+        """
+        for event_type, message_str in events:
+            if event_type in COALESCED_EVENT_TYPES and self.coalesce(event_type, message_str):
+                continue
+
+            if event_type in BATCHED_EVENT_TYPES:
+                if self.num_batched >= self.max_queue_size:
+                    if self.overflow_policy == OVERFLOW_DROP_NEWEST:
+                        self.endpoint.on_event_dropped(event_type)
+                        continue
+                    self.drop_oldest_batched()
+                self.num_batched += 1
+            self.queue.append((event_type, message_str))
+
+        self.flush()
+
+    def drop_oldest_batched(self):
+        for index, (queued_type, _) in enumerate(self.queue):
+            if queued_type in BATCHED_EVENT_TYPES:
+                del self.queue[index]
+                self.num_batched -= 1
+                self.endpoint.on_event_dropped(queued_type)
+                return
+
+    def coalesce(self, event_type, message_str):
+        """
+        Replace a queued event of the same type by the new event. Returns whether such an event was queued.
+        """
+        for index, (queued_type, _) in enumerate(self.queue):
+            if queued_type == event_type:
+                self.queue[index] = (event_type, message_str)
+                self.endpoint.events_coalesced += 1
+                return True
+        return False
+
+    def flush(self):
+        if self.paused or self.closed or not self.queue:
+            return
+
+        messages = [message_str for _, message_str in self.queue]
+        self.queue.clear()
+        self.num_batched = 0
+        self.endpoint.events_sent += len(messages)
+        self.request.write(''.join(messages))
+
 
 class EventsEndpoint(resource.Resource):
     """
@@ -33,6 +129,8 @@ class EventsEndpoint(resource.Resource):
       The dictionary contains the name of the corrupt torrent file.
     - new_version_available: This event is emitted when a new version of Tribler is available.
     - tribler_started: An indicator that Tribler has completed the startup procedure and is ready to use.
+    - downloads_resume_progress: An indication of how many of the checkpointed downloads have been resumed during
+      startup. The event contains the number of resumed downloads and the total number of downloads.
     - channel_discovered: An indicator that Tribler has discovered a new channel. The event contains the name,
       description and dispersy community id of the discovered channel.
     - torrent_discovered: An indicator that Tribler has discovered a new torrent. The event contains the infohash, name,
@@ -54,13 +152,32 @@ class EventsEndpoint(resource.Resource):
     - market_payment_sent: We sent a payment in the market. The events contains the payment information.
     - market_iom_input_required: The Internet-of-Money modules requires user input (like a password or challenge
       response).
+
+    Every event is encoded once, regardless of the number of clients. Events of a high-rate type (search results and
+    discovered channels and torrents) are collected for a short while and written to the clients in a single batch.
+    Each client has a queue for the events that could not be written yet because the client is slow. When it holds
+    too many high-rate events, either the oldest or the newest of those are dropped, depending on the configured
+    policy. Progress events of the same type are coalesced in the queue. Other events are never dropped.
     """
 
     def __init__(self, session):
         resource.Resource.__init__(self)
         self.session = session
         self.channel_db_handler = self.session.open_dbhandler(NTFY_CHANNELCAST)
+        self._logger = logging.getLogger(self.__class__.__name__)
         self.events_requests = []
+        self.clients = {}  # key: request, value: EventsClient
+
+        self.max_queue_size = self.session.config.get_http_api_events_queue_size()
+        self.overflow_policy = self.session.config.get_http_api_events_overflow_policy()
+        self.pending_batch = []
+        self.batch_call = None
+
+        self.events_encoded = 0
+        self.events_sent = 0
+        self.events_coalesced = 0
+        self.batches_sent = 0
+        self.events_dropped = defaultdict(int)
 
         self.infohashes_sent = set()
         self.channel_cids_sent = set()
@@ -74,6 +191,7 @@ class EventsEndpoint(resource.Resource):
                                   NTFY_WATCH_FOLDER_CORRUPT_TORRENT, [NTFY_INSERT])
         self.session.add_observer(self.on_new_version_available, NTFY_NEW_VERSION, [NTFY_INSERT])
         self.session.add_observer(self.on_tribler_started, NTFY_TRIBLER, [NTFY_STARTED])
+        self.session.add_observer(self.on_downloads_resume_progress, NTFY_STARTUP_TICK, [NTFY_UPDATE])
         self.session.add_observer(self.on_channel_discovered, NTFY_CHANNEL, [NTFY_DISCOVERED])
         self.session.add_observer(self.on_torrent_discovered, NTFY_TORRENT, [NTFY_DISCOVERED])
         self.session.add_observer(self.on_torrent_removed_from_channel, NTFY_TORRENT, [NTFY_DELETE])
@@ -90,18 +208,74 @@ class EventsEndpoint(resource.Resource):
 
     def write_data(self, message):
         """
-        Write data over the event socket if it's open.
+        Write data over the event socket if it's open. The message is encoded once for all clients.
         """
+        if len(self.events_requests) == 0:
+            return
+
         try:
             message_str = json.dumps(message)
         except UnicodeDecodeError:
             # The message contains invalid characters; fix them
             message_str = json.dumps(fix_unicode_dict(message))
+        self.events_encoded += 1
 
-        if len(self.events_requests) == 0:
-            return
+        if isInIOThread():
+            self.dispatch(message["type"], message_str + '\n')
         else:
-            [request.write(message_str + '\n') for request in self.events_requests]
+            reactor.callFromThread(self.dispatch, message["type"], message_str + '\n')
+
+    def dispatch(self, event_type, message_str):
+        """
+        Send an encoded event to all clients, or add it to the pending batch if it is of a high-rate type.
+        """
+        if event_type in BATCHED_EVENT_TYPES:
+            self.pending_batch.append((event_type, message_str))
+            if not self.batch_call:
+                self.batch_call = reactor.callLater(EVENTS_BATCH_INTERVAL, self.flush_batch)
+            return
+
+        # Events are delivered in the order in which they were emitted
+        self.flush_batch()
+        for client in self.clients.values():
+            client.enqueue([(event_type, message_str)])
+
+    def flush_batch(self):
+        if self.batch_call and self.batch_call.active():
+            self.batch_call.cancel()
+        self.batch_call = None
+
+        if not self.pending_batch:
+            return
+
+        batch, self.pending_batch = self.pending_batch, []
+        self.batches_sent += 1
+        for client in self.clients.values():
+            client.enqueue(batch)
+
+    def on_event_dropped(self, event_type):
+        self.events_dropped[event_type] += 1
+
+    def get_stats(self):
+        """
+        Return statistics about the events that have been sent and the queues of the clients.
+        """
+        queue_depths = [len(client.queue) for client in self.clients.values()]
+        return {"clients": len(self.clients),
+                "queue_depth": sum(queue_depths),
+                "max_queue_depth": max(queue_depths) if queue_depths else 0,
+                "pending_batch": len(self.pending_batch),
+                "events_encoded": self.events_encoded,
+                "events_sent": self.events_sent,
+                "events_coalesced": self.events_coalesced,
+                "events_dropped": dict(self.events_dropped),
+                "batches_sent": self.batches_sent}
+
+    def shutdown(self):
+        if self.batch_call and self.batch_call.active():
+            self.batch_call.cancel()
+        self.batch_call = None
+        self.pending_batch = []
 
     def start_new_query(self):
         self.infohashes_sent = set()
@@ -158,6 +332,9 @@ class EventsEndpoint(resource.Resource):
     def on_tribler_started(self, subject, changetype, objectID, *args):
         self.write_data({"type": "tribler_started"})
 
+    def on_downloads_resume_progress(self, subject, changetype, objectID, *args):
+        self.write_data({"type": "downloads_resume_progress", "event": args[0]})
+
     def on_channel_discovered(self, subject, changetype, objectID, *args):
         self.write_data({"type": "channel_discovered", "event": args[0]})
 
@@ -211,9 +388,13 @@ class EventsEndpoint(resource.Resource):
         """
         def on_request_finished(_):
             self.events_requests.remove(request)
+            self.clients.pop(request).stopProducing()
 
+        client = EventsClient(self, request, self.max_queue_size, self.overflow_policy)
         self.events_requests.append(request)
+        self.clients[request] = client
         request.notifyFinish().addCallbacks(on_request_finished, on_request_finished)
+        request.registerProducer(client, True)
 
         request.write(json.dumps({"type": "events_start", "event": {
             "tribler_started": self.session.lm.initComplete, "version": version_id}}) + '\n')
@@ -0,0 +1,155 @@
+"""
+Execution of expensive REST requests outside of the reactor thread.
+
+A resource that does a lot of synchronous work when rendering a request can mix in HeavyResource. It then renders the
+response in a bounded pool of worker threads, so the reactor keeps handling network traffic in the meantime. The workers
+never use the request: the body they return is written with RESTRequest.write_body on the reactor thread, so it is
+compressed and tagged like any other response.
+
+Workers can only read the Tribler database with SQLiteCacheDB.fetchall_in_thread, which uses a read-only connection per
+thread. The search and discovered channels endpoints query the database in a worker this way. The trustchain and
+circuits endpoints are not offloaded, since the trustchain persistence and the circuits can only be used on the reactor
+thread.
+"""
+import json
+import logging
+import time
+from collections import defaultdict
+
+from twisted.internet import reactor
+from twisted.internet.defer import DeferredSemaphore, maybeDeferred, succeed
+from twisted.internet.threads import deferToThread, deferToThreadPool
+from twisted.python.threadpool import ThreadPool
+from twisted.web import http
+from twisted.web.server import NOT_DONE_YET
+
+from Tribler.Core.Utilities.metrics import registry
+
+REST_WORKER_THREADS = 4            # The number of threads that render heavy requests
+HEAVY_MAX_CONCURRENCY = 2          # The default number of requests to a single endpoint that are rendered at once
+HEAVY_MAX_PENDING = 16             # The default number of requests to a single endpoint that may wait for a worker
+
+REST_REQUEST_SECONDS = registry.histogram("tribler_rest_request_seconds",
+                                          "Duration of the REST requests that are rendered in the worker pool",
+                                          labelnames=("endpoint",))
+
+
+class RESTWorkerPool(object):
+    """
+    A bounded pool of threads that render heavy requests. Every endpoint has its own concurrency limit, the latencies
+    of its requests are observed in the tribler_rest_request_seconds histogram.
+    """
+
+    def __init__(self, num_threads=REST_WORKER_THREADS):
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self.pool = ThreadPool(minthreads=0, maxthreads=num_threads, name="RESTWorkerPool")
+        self.semaphores = {}
+        self.pending = defaultdict(int)
+        self.rejected = defaultdict(int)
+
+    def start(self):
+        self.pool.start()
+
+    def stop(self):
+        """
+        Stop the worker threads. Running requests might still need the reactor, so we wait for them outside of the
+        reactor thread. Returns a deferred that fires when all workers have stopped.
+        """
+        if not self.pool.started:
+            return succeed(None)
+        return deferToThread(self.pool.stop)
+
+    def get_semaphore(self, name, max_concurrency):
+        if name not in self.semaphores:
+            self.semaphores[name] = DeferredSemaphore(max_concurrency)
+        return self.semaphores[name]
+
+    def run(self, name, max_concurrency, max_pending, func, *args, **kwargs):
+        """
+        Call func in a worker thread once fewer than max_concurrency calls for the named endpoint are running.
+        Returns a deferred that fires with the result, or None if too many calls are waiting already.
+        """
+        semaphore = self.get_semaphore(name, max_concurrency)
+        if len(semaphore.waiting) >= max_pending:
+            self.rejected[name] += 1
+            return None
+
+        start_time = time.time()
+
+        def on_done(result):
+            self.pending[name] -= 1
+            REST_REQUEST_SECONDS.labels(name).observe(time.time() - start_time)
+            return result
+
+        self.pending[name] += 1
+        return semaphore.run(deferToThreadPool, reactor, self.pool, func, *args, **kwargs).addBoth(on_done)
+
+    @staticmethod
+    def get_latency(name):
+        """
+        Return the cumulative buckets, the count and the sum of the latency histogram of an endpoint.
+        """
+        latency = {"buckets": []}
+        for suffix, labels, value in REST_REQUEST_SECONDS.labels(name).samples():
+            if suffix == "_bucket":
+                latency["buckets"].append((labels[0][1], value))
+            else:
+                latency[suffix[1:]] = value
+        return latency
+
+    def get_stats(self):
+        return dict((name, {"pending": self.pending[name],
+                            "rejected": self.rejected[name],
+                            "latency": self.get_latency(name)})
+                    for name in set(self.pending) | set(self.rejected))
+
+
+class HeavyResource(object):
+    """
+    Mixin for resources that do expensive processing when rendering a request. Their render methods run on the reactor
+    thread as usual and pass the expensive part, such as querying the database with fetchall_in_thread and encoding the
+    results, to the REST worker pool with render_in_worker. Subclasses can set the concurrency limits of the endpoint.
+    """
+    max_concurrency = HEAVY_MAX_CONCURRENCY
+    max_pending = HEAVY_MAX_PENDING
+
+    def get_worker_pool(self):
+        api_manager = getattr(self.session.lm, 'api_manager', None)
+        return getattr(api_manager, 'worker_pool', None)
+
+    def run_in_worker(self, func, *args, **kwargs):
+        """
+        Call func in the REST worker pool. Returns a deferred that fires with the result on the reactor thread, or None
+        if too many calls for this endpoint are waiting already. If there is no worker pool, func is called right away.
+        """
+        worker_pool = self.get_worker_pool()
+        if worker_pool is None:
+            return maybeDeferred(func, *args, **kwargs)
+        return worker_pool.run(self.__class__.__name__, self.max_concurrency, self.max_pending, func, *args, **kwargs)
+
+    def render_in_worker(self, request, func, *args, **kwargs):
+        """
+        Call func in the REST worker pool and write the body that it returns to the request. func runs in a worker
+        thread, so it should only use its arguments and never the request or state that the reactor might change.
+        The request is only written to from the reactor thread, once func has returned.
+        :return: the value that the render method should return.
+        """
+        finished = []
+        request.notifyFinish().addBoth(finished.append)
+
+        def on_rendered(body):
+            # Do not bother writing a response to a client that has gone away
+            if not finished:
+                request.write_body(body)
+
+        def on_error(failure):
+            if not finished:
+                request.processingFailed(failure)
+
+        rendered = self.run_in_worker(func, *args, **kwargs)
+        if rendered is None:
+            request.setResponseCode(http.SERVICE_UNAVAILABLE)
+            return json.dumps({"error": "too many pending requests"})
+
+        rendered.addCallbacks(on_rendered, on_error)
+        return NOT_DONE_YET
@@ -11,6 +11,12 @@ class BaseAsksBidsEndpoint(BaseMarketEndpoint):
     This class acts as the base class for the asks/bids endpoint.
     """
 
+    def get_etag(self, _):
+        """
+        The ticks only change together with the version of the order book.
+        """
+        return self.get_market_community().order_book.version
+
     @staticmethod
     def create_ask_bid_from_params(parameters):
         """
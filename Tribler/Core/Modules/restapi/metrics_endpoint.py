@@ -0,0 +1,43 @@
+from twisted.web import resource
+
+from Tribler.Core.Utilities.metrics import CONTENT_TYPE, registry
+
+
+class MetricsEndpoint(resource.Resource):
+    """
+    This endpoint exports the metrics of Tribler in the Prometheus text exposition format.
+    """
+
+    def __init__(self, session):
+        resource.Resource.__init__(self)
+        self.session = session
+        self.registry = registry
+
+    def render_GET(self, request):
+        """
+        .. http:get:: /metrics
+
+        A GET request to this endpoint returns the metrics of all subsystems of Tribler, like the lag of the reactor,
+        the latency of database statements, the sizes of the LevelDB stores, the libtorrent session counters, the
+        tunnel circuits, the depth of the order book of the market and the number of trustchain blocks.
+
+            **Example request**:
+
+            .. sourcecode:: none
+
+                curl -X GET http://localhost:8085/metrics
+
+            **Example response**:
+
+            .. sourcecode:: none
+
+                # HELP tribler_reactor_lag_seconds How late the last heartbeat of the reactor fired
+                # TYPE tribler_reactor_lag_seconds gauge
+                tribler_reactor_lag_seconds 0.0012
+                # HELP tribler_tunnel_circuits Circuits by number of hops and state
+                # TYPE tribler_tunnel_circuits gauge
+                tribler_tunnel_circuits{hops="1",state="READY"} 4
+                ...
+        """
+        request.setHeader(b'Content-Type', CONTENT_TYPE)
+        return self.registry.to_text()
@@ -1,14 +1,24 @@
 import json
 import logging
+import os
+import zlib
+from hashlib import sha1
 from traceback import format_tb
 from twisted.internet import reactor
 from twisted.internet.defer import maybeDeferred
 from twisted.python.compat import intToBytes
 from twisted.web import server, http
+from twisted.web.error import UnsupportedMethod
 
+from Tribler.Core.Modules.restapi.heavy_resource import RESTWorkerPool
 from Tribler.Core.Modules.restapi.root_endpoint import RootEndpoint
 from Tribler.dispersy.taskmanager import TaskManager
 
+GZIP_MIN_SIZE = 1024        # Bodies smaller than this number of bytes are sent uncompressed
+GZIP_LEVEL = 6
+# Version counters restart at zero, so the entity tags of different runs of Tribler should never collide
+ETAG_SALT = os.urandom(8)
+
 
 class RESTManager(TaskManager):
     """
@@ -21,11 +31,13 @@ class RESTManager(TaskManager):
         self.session = session
         self.site = None
         self.root_endpoint = None
+        self.worker_pool = RESTWorkerPool()
 
     def start(self):
         """
         Starts the HTTP API with the listen port as specified in the session configuration.
         """
+        self.worker_pool.start()
         self.root_endpoint = RootEndpoint(self.session)
         site = server.Site(resource=self.root_endpoint)
         site.requestFactory = RESTRequest
@@ -35,18 +47,103 @@ class RESTManager(TaskManager):
         """
         Stop the HTTP API and return a deferred that fires when the server has shut down.
         """
-        return maybeDeferred(self.site.stopListening)
+        self.root_endpoint.events_endpoint.shutdown()
+        return maybeDeferred(self.site.stopListening).addCallback(lambda _: self.worker_pool.stop())
 
 
 class RESTRequest(server.Request):
     """
     This class gracefully takes care of unhandled exceptions raised during the processing of any request.
+
+    It also compresses large responses for clients that accept gzip and adds an entity tag to successful GET responses.
+    A resource can provide a cheap version of its content with a get_etag(request) method. In that case, a conditional
+    request for an unchanged resource is answered with 304 Not Modified without rendering the resource. Otherwise, the
+    entity tag is a hash of the response body.
     """
     defaultContentType = b"text/json"
 
     def __init__(self, *args, **kw):
         server.Request.__init__(self, *args, **kw)
         self._logger = logging.getLogger(self.__class__.__name__)
+        self.etag_tag = None
+
+    def accepts_gzip(self):
+        for coding in (self.getHeader(b'accept-encoding') or b'').split(b','):
+            name, _, params = coding.partition(b';')
+            if name.strip().lower() == b'gzip':
+                return params.replace(b' ', b'') not in (b'q=0', b'q=0.0', b'q=0.00', b'q=0.000')
+        return False
+
+    def get_etags(self, tag):
+        """
+        Return the entity tags of the uncompressed and the compressed representation of a response.
+        """
+        return b'"%s"' % tag, b'"%s-gzip"' % tag
+
+    def is_not_modified(self, tag):
+        """
+        Check whether the client already has one of the representations with the given tag.
+        """
+        tags = [etag.strip() for etag in (self.getHeader(b'if-none-match') or b'').split(b',')]
+        return b'*' in tags or any(etag in tags for etag in self.get_etags(tag))
+
+    def set_not_modified(self, tag, compressed):
+        self.setResponseCode(http.NOT_MODIFIED)
+        self.setHeader(b'ETag', self.get_etags(tag)[compressed])
+        self.setHeader(b'Vary', b'Accept-Encoding')
+
+    def render(self, resrc):
+        """
+        Answer conditional requests for unchanged resources before rendering them.
+        """
+        get_etag = getattr(resrc, 'get_etag', None)
+        if self.method == b'GET' and get_etag:
+            version = get_etag(self)
+            if version is not None:
+                self.etag_tag = sha1(b'%s:%s:%s' % (ETAG_SALT, self.uri, version)).hexdigest()
+                if self.is_not_modified(self.etag_tag):
+                    self.set_not_modified(self.etag_tag, self.accepts_gzip())
+                    self.finish()
+                    return
+
+        try:
+            body = resrc.render(self)
+        except UnsupportedMethod:
+            # Let Twisted answer requests for methods the resource does not support
+            server.Request.render(self, resrc)
+            return
+
+        if body is server.NOT_DONE_YET:
+            return
+        if not isinstance(body, bytes):
+            raise TypeError("Resource %r did not return bytes" % resrc)
+        self.write_body(body)
+
+    def write_body(self, body):
+        """
+        Write the body of the response and finish the request. The body is compressed if it is large and the client
+        accepts gzip.
+        """
+        compressed = len(body) >= GZIP_MIN_SIZE and self.accepts_gzip()
+        if self.method == b'GET' and self.code == http.OK:
+            tag = self.etag_tag or sha1(body).hexdigest()
+            if self.is_not_modified(tag):
+                self.set_not_modified(tag, compressed)
+                self.finish()
+                return
+            self.setHeader(b'ETag', self.get_etags(tag)[compressed])
+
+        if len(body) >= GZIP_MIN_SIZE:
+            self.setHeader(b'Vary', b'Accept-Encoding')
+        if compressed:
+            compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            body = compressor.compress(body) + compressor.flush()
+            self.setHeader(b'Content-Encoding', b'gzip')
+
+        self.setHeader(b'content-length', intToBytes(len(body)))
+        if self.method != b'HEAD':
+            self.write(body)
+        self.finish()
 
     def processingFailed(self, failure):
         self._logger.exception(failure)
@@ -7,6 +7,7 @@ from Tribler.Core.Modules.restapi.debug_endpoint import DebugEndpoint
 from Tribler.Core.Modules.restapi.downloads_endpoint import DownloadsEndpoint
 from Tribler.Core.Modules.restapi.events_endpoint import EventsEndpoint
 from Tribler.Core.Modules.restapi.market_endpoint import MarketEndpoint
+from Tribler.Core.Modules.restapi.metrics_endpoint import MetricsEndpoint
 from Tribler.Core.Modules.restapi.search_endpoint import SearchEndpoint
 from Tribler.Core.Modules.restapi.settings_endpoint import SettingsEndpoint
 from Tribler.Core.Modules.restapi.shutdown_endpoint import ShutdownEndpoint
@@ -48,7 +49,7 @@ class RootEndpoint(resource.Resource):
                               "createtorrent": CreateTorrentEndpoint, "torrents": TorrentsEndpoint,
                               "debug": DebugEndpoint, "shutdown": ShutdownEndpoint, "trustchain": TrustchainEndpoint,
                               "statistics": StatisticsEndpoint, "torrentinfo": TorrentInfoEndpoint,
-                              "market": MarketEndpoint, "wallets": WalletsEndpoint}
+                              "market": MarketEndpoint, "wallets": WalletsEndpoint, "metrics": MetricsEndpoint}
 
         for path, child_cls in child_handler_dict.iteritems():
             self.putChild(path, child_cls(self.session))
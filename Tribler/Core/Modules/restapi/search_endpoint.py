@@ -2,13 +2,14 @@ import json
 import logging
 from twisted.web import http, resource
 
+from Tribler.Core.Modules.restapi.heavy_resource import HeavyResource
 from Tribler.Core.Utilities.search_utils import split_into_keywords
 from Tribler.Core.exceptions import OperationNotEnabledByConfigurationException
 from Tribler.Core.simpledefs import NTFY_CHANNELCAST, NTFY_TORRENTS, SIGNAL_TORRENT, SIGNAL_ON_SEARCH_RESULTS, \
     SIGNAL_CHANNEL
 
 
-class SearchEndpoint(resource.Resource):
+class SearchEndpoint(HeavyResource, resource.Resource):
     """
     This endpoint is responsible for searching in channels and torrents present in the local Tribler database. It also
     fires a remote search in the Dispersy communities.
@@ -24,6 +25,13 @@ class SearchEndpoint(resource.Resource):
 
         self.putChild("completions", SearchCompletionsEndpoint(session))
 
+    def on_local_torrents_scored(self, results_local_torrents, keywords):
+        results_dict = {"keywords": keywords, "result_list": results_local_torrents}
+        self.session.notifier.notify(SIGNAL_TORRENT, SIGNAL_ON_SEARCH_RESULTS, None, results_dict)
+
+    def on_local_torrents_error(self, failure):
+        self._logger.error("Could not score the local torrents: %s", failure.getErrorMessage())
+
     def render_GET(self, request):
         """
         .. http:get:: /search?q=(string:query)
@@ -75,9 +83,12 @@ class SearchEndpoint(resource.Resource):
 
         torrent_db_columns = ['T.torrent_id', 'infohash', 'T.name', 'length', 'category',
                               'num_seeders', 'num_leechers', 'last_tracker_check']
-        results_local_torrents = self.torrent_db_handler.search_in_local_torrents_db(query, keys=torrent_db_columns)
-        results_dict = {"keywords": keywords, "result_list": results_local_torrents}
-        self.session.notifier.notify(SIGNAL_TORRENT, SIGNAL_ON_SEARCH_RESULTS, None, results_dict)
+        # Both the full text search and the scoring of the matching torrents take place in a worker
+        scored = self.run_in_worker(self.torrent_db_handler.search_in_local_torrents_db, query, torrent_db_columns)
+        if scored is None:
+            request.setResponseCode(http.SERVICE_UNAVAILABLE)
+            return json.dumps({"error": "too many pending requests"})
+        scored.addCallbacks(self.on_local_torrents_scored, self.on_local_torrents_error, callbackArgs=(keywords,))
 
         # Create remote searches
         try:
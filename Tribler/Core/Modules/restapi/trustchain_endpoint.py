@@ -37,6 +37,13 @@ class TrustchainBaseEndpoint(resource.Resource):
                 return community
         return None
 
+    def get_etag(self, _):
+        """
+        The statistics and blocks only change when a block is added to the database of the community.
+        """
+        mc_community = self.get_trustchain_community()
+        return mc_community.persistence.version if mc_community else None
+
 
 class TrustchainStatsEndpoint(TrustchainBaseEndpoint):
     """
@@ -89,6 +96,8 @@ class TrustchainStatsEndpoint(TrustchainBaseEndpoint):
             request.setResponseCode(http.NOT_FOUND)
             return json.dumps({"error": "trustchain community not found"})
 
+        # The persistence of the community can only be used on the reactor thread, so this request is not rendered in
+        # the REST worker pool. Conditional requests for unchanged statistics are answered without rendering them.
         return json.dumps({'statistics': mc_community.get_statistics()})
 
 
@@ -159,5 +168,6 @@ class TrustchainBlocksIdentityEndpoint(TrustchainBaseEndpoint):
             request.setResponseCode(http.BAD_REQUEST)
             return json.dumps({"error": "limit parameter out of range"})
 
+        # Like the statistics, the blocks are read and encoded on the reactor thread
         blocks = mc_community.persistence.get_latest_blocks(self.identity.decode("HEX"), limit_blocks)
         return json.dumps({"blocks": [dict(block) for block in blocks]})
@@ -27,7 +27,7 @@ class TrackerManager(object):
     def initialize(self):
         # load all tracker information into the memory
         sql_stmt = u"SELECT tracker_id, tracker, last_check, failures, is_alive FROM TrackerInfo"
-        result_list = self._session.sqlite_db.execute(sql_stmt)
+        result_list = self._session.sqlite_db.fetchall(sql_stmt)
         for tracker_id, tracker_url, last_check, failures, is_alive in result_list:
             self._tracker_dict[tracker_url] = {u'id': tracker_id,
                                                u'last_check': last_check,
@@ -16,6 +16,7 @@ from twisted.internet.task import LoopingCall
 
 from Tribler.Core.TFTP.handler import METADATA_PREFIX
 from Tribler.Core.TorrentDef import TorrentDef
+from Tribler.Core.Utilities.memory import cache_registry
 from Tribler.Core.simpledefs import INFOHASH_LENGTH, NTFY_TORRENTS
 from Tribler.dispersy.taskmanager import TaskManager
 from Tribler.dispersy.util import call_on_reactor_thread
@@ -55,6 +56,9 @@ class RemoteTorrentHandler(TaskManager):
         self.tor_col_dir = None
         self.torrent_db = None
 
+        cache_registry.register("remote_torrent_handler.pending_requests", self, "get_pending_request_count")
+        cache_registry.register("remote_torrent_handler.torrent_callbacks", self, "torrent_callbacks")
+
     def initialize(self):
         self.dispersy = self.session.get_dispersy_instance()
         self.max_num_torrents = self.session.config.get_torrent_collecting_max_torrents()
@@ -231,6 +235,11 @@ class RemoteTorrentHandler(TaskManager):
 
         del self.torrent_callbacks[infohash]
 
+    def get_pending_request_count(self):
+        return sum(requester.pending_request_queue_size
+                   for requesters in (self.torrent_requesters, self.magnet_requesters, self.torrent_message_requesters)
+                   for requester in requesters.itervalues())
+
     def get_queue_size_stats(self):
         def get_queue_size_stats(qname, requesters):
             qsize = {}
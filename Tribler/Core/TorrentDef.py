@@ -116,7 +116,7 @@ class TorrentDef(object):
         return TorrentDef._create(data)
     _read = staticmethod(_read)
 
-    def _create(metainfo):  # TODO: replace with constructor
+    def _create(metainfo, infohash=None):  # TODO: replace with constructor
         # raises ValueErrors if not good
         metainfo_fixed = create_valid_metainfo(metainfo)
 
@@ -128,7 +128,7 @@ class TorrentDef(object):
 
         # Two places where infohash calculated, here and in maketorrent.py
         # Elsewhere: must use TorrentDef.get_infohash() to allow P2PURLs.
-        t.infohash = sha1(bencode(metainfo['info'])).digest()
+        t.infohash = infohash or sha1(bencode(metainfo['info'])).digest()
 
         assert isinstance(t.infohash, str), "INFOHASH has invalid type: %s" % type(t.infohash)
         assert len(t.infohash) == INFOHASH_LENGTH, "INFOHASH has invalid length: %d" % len(t.infohash)
@@ -156,16 +156,18 @@ class TorrentDef(object):
         return deferred
 
     @staticmethod
-    def load_from_dict(metainfo):
+    def load_from_dict(metainfo, infohash=None):
         """
         Load a BT .torrent or Tribler .tribe file from the metainfo dictionary
         it into a TorrentDef
 
         @param metainfo A dictionary following the BT torrent file spec.
+        @param infohash The infohash of the metainfo if it is already known (e.g. from a checkpoint), this
+        avoids bencoding and hashing the info dictionary again.
         @return TorrentDef.
         """
         # Class method, no locking required
-        return TorrentDef._create(metainfo)
+        return TorrentDef._create(metainfo, infohash)
 
     #
     # Convenience instance methods for publishing new content
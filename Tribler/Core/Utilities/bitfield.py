@@ -0,0 +1,135 @@
+"""
+A compact representation of the pieces of a torrent that we have.
+
+The bitfield stores one byte per piece and keeps prefix sums over the completed pieces of fixed-size blocks, so the
+number of completed pieces in any range can be determined in constant time. This keeps the per-file completion and
+byte-range progress cheap for torrents with many pieces and files.
+"""
+import binascii
+from array import array
+from itertools import imap
+
+BLOCK_SIZE = 64  # The number of pieces covered by a single prefix sum entry
+
+# Translation table that maps every non-zero byte to 1
+_NORMALIZE_TABLE = '\x00' + '\x01' * 255
+
+
+def merge_piece_ranges(ranges):
+    """
+    Merge overlapping (start, end) piece ranges, where end is exclusive. Returns the merged ranges in sorted order.
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if end <= start:
+            continue
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class PieceBitfield(object):
+    """
+    Immutable snapshot of the pieces we have.
+    """
+
+    def __init__(self, pieces):
+        """
+        Create a bitfield from a sequence of booleans, like the pieces list of a libtorrent torrent_status.
+        """
+        try:
+            self.have = bytearray(pieces).translate(_NORMALIZE_TABLE)
+        except (TypeError, ValueError):
+            self.have = bytearray(imap(bool, pieces))
+        self._prefix = None
+
+    def __len__(self):
+        return len(self.have)
+
+    def __getitem__(self, index):
+        return bool(self.have[index])
+
+    @property
+    def prefix(self):
+        """
+        The prefix sums over the completed pieces, prefix[i] is the number of completed pieces before piece
+        i * BLOCK_SIZE. The prefix sums are only calculated when they are needed for the first time.
+        """
+        if self._prefix is None:
+            prefix = array('l', [0])
+            total = 0
+            for block_start in xrange(0, len(self.have) - BLOCK_SIZE + 1, BLOCK_SIZE):
+                total += self.have.count('\x01', block_start, block_start + BLOCK_SIZE)
+                prefix.append(total)
+            self._prefix = prefix
+        return self._prefix
+
+    def count(self, start=0, end=None):
+        """
+        Return the number of completed pieces in the range [start, end).
+        """
+        start = max(start, 0)
+        end = len(self.have) if end is None else min(end, len(self.have))
+        if end - start < 2 * BLOCK_SIZE:
+            # Counting short ranges directly is cheaper than looking up the prefix sums
+            return self.have.count('\x01', start, end) if end > start else 0
+
+        first_block = -(-start // BLOCK_SIZE)
+        last_block = end // BLOCK_SIZE
+
+        # Only the pieces in the partial blocks at both ends of the range have to be counted
+        return self.prefix[last_block] - self.prefix[first_block] + \
+            self.have.count('\x01', start, first_block * BLOCK_SIZE) + \
+            self.have.count('\x01', last_block * BLOCK_SIZE, end)
+
+    def count_consecutive(self, start, end):
+        """
+        Return the number of completed pieces in the range [start, end) before the first missing piece.
+        """
+        start = max(start, 0)
+        end = max(start, min(end, len(self.have)))
+        missing = self.have.find('\x00', start, end)
+        return (end if missing == -1 else missing) - start
+
+    def fraction(self, start=0, end=None):
+        """
+        Return the fraction of completed pieces in the range [start, end), or 0.0 for an empty range.
+        """
+        end = len(self.have) if end is None else end
+        return float(self.count(start, end)) / (end - start) if end > start else 0.0
+
+    def get_ranges_progress(self, ranges, consecutive=False):
+        """
+        Return the fraction of completed pieces in the union of the (start, end) piece ranges. If consecutive is True,
+        only the pieces before the first missing piece are counted. Pieces outside of the bitfield count as missing.
+        """
+        ranges = merge_piece_ranges(ranges)
+        total = sum(end - start for start, end in ranges)
+        if not total:
+            return 1.0
+
+        completed = 0
+        for start, end in ranges:
+            if consecutive:
+                have = self.count_consecutive(start, end)
+                completed += have
+                if have < end - start:
+                    break
+            else:
+                completed += self.count(start, end)
+        return float(completed) / total
+
+    def to_bytes(self):
+        """
+        Return the bitfield packed into bytes, with the first piece in the most significant bit of the first byte.
+        """
+        if not self.have:
+            return ''
+        padded_length = (len(self.have) + 7) // 8 * 8
+        bits = str(self.have).replace('\x00', '0').replace('\x01', '1').ljust(padded_length, '0')
+        return binascii.unhexlify('%0*x' % (padded_length // 4, int(bits, 2)))
+
+    def to_base64(self):
+        return binascii.b2a_base64(self.to_bytes()).rstrip('\n')
@@ -3,13 +3,35 @@ instrumentation.
 
 Author(s): Elric Milon
 """
+import os
 import threading
+from collections import defaultdict, deque
 from decorator import decorator
 from os import sys
-from threading import Lock, RLock, Thread
+from threading import Event, Lock, RLock, Thread
 from time import sleep, time
 
+from twisted.internet import reactor
+from twisted.internet.task import LoopingCall
+
+from Tribler.Core.Utilities.metrics import registry
+from Tribler.dispersy.taskmanager import TaskManager
+
 MAX_SAME_STACK_TIME = 60
+HEARTBEAT_INTERVAL = 0.1    # Seconds between two heartbeats of the reactor lag monitor
+LAG_THRESHOLD = 0.25        # The lag in seconds after which the stack of the reactor thread is sampled
+SAMPLE_INTERVAL = 0.01      # Seconds between two samples of the stack of a stalled reactor thread
+MAX_RECENT_STALLS = 50      # The number of stalls that is kept for the report
+MAX_REPORTED_CALLABLES = 50
+
+TRIBLER_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DISPERSY_DIR = os.path.join(TRIBLER_DIR, "dispersy")
+# The modules of the decorators like blocking_call_on_reactor_thread, whose frames do not dispatch anything
+DECORATOR_MODULES = (os.path.join(DISPERSY_DIR, "util"),)
+
+REACTOR_LAG = registry.gauge("tribler_reactor_lag_seconds", "How late the last heartbeat of the reactor fired")
+REACTOR_LAG_HISTOGRAM = registry.histogram("tribler_reactor_lag_histogram_seconds",
+                                           "How late the heartbeats of the reactor fired")
 
 
 @decorator
@@ -169,3 +191,159 @@ class WatchDog(Thread):
                 self.stacks.pop(thread_id)
                 self.times.pop(thread_id)
                 self.print_all_stacks()
+
+
+def is_tribler_frame(frame):
+    filename = os.path.abspath(frame.f_code.co_filename)
+    return filename.startswith(TRIBLER_DIR) and not filename.startswith(DISPERSY_DIR)
+
+
+def is_decorator_frame(frame):
+    filename = frame.f_code.co_filename
+    # The decorator package compiles its wrappers from strings, like <decorator-gen-42>
+    if filename.startswith("<"):
+        return True
+    return os.path.splitext(os.path.abspath(filename))[0] in DECORATOR_MODULES
+
+
+def describe_frame(frame):
+    filename = os.path.abspath(frame.f_code.co_filename)
+    if filename.startswith(TRIBLER_DIR):
+        filename = os.path.relpath(filename, os.path.dirname(TRIBLER_DIR))
+    return "%s:%s:%d" % (filename, frame.f_code.co_name, frame.f_code.co_firstlineno)
+
+
+def get_responsible_callable(frame):
+    """
+    Return a description of the callable that is responsible for the given stack. Starting from the innermost frame,
+    we walk outwards through the Tribler frames until we reach the Twisted or Dispersy frame that dispatched them. The
+    outermost of those Tribler frames is responsible, like the function of a registered task or the handler of a
+    Dispersy message. Decorators like blocking_call_on_reactor_thread do not end the walk. If the stack contains no
+    Tribler code, the innermost function is returned.
+    """
+    innermost = frame
+    responsible = None
+    while frame is not None:
+        if is_tribler_frame(frame):
+            responsible = frame
+        elif responsible is not None and not is_decorator_frame(frame):
+            break
+        frame = frame.f_back
+
+    if responsible is None:
+        responsible = innermost
+    return describe_frame(responsible) if responsible is not None else "unknown"
+
+
+class SlowCallbackProfiler(Thread):
+    """
+    Samples the stack of the reactor thread while the heartbeat of the lag monitor is overdue, and attributes the
+    sampled time to the callable that keeps the reactor busy.
+    """
+
+    def __init__(self, monitor, reactor_thread_id, threshold=LAG_THRESHOLD, sample_interval=SAMPLE_INTERVAL):
+        super(SlowCallbackProfiler, self).__init__(name=self.__class__.__name__)
+        self.setDaemon(True)
+        self.monitor = monitor
+        self.reactor_thread_id = reactor_thread_id
+        self.threshold = threshold
+        self.sample_interval = sample_interval
+
+        self.lock = Lock()
+        self.samples = defaultdict(int)
+        self.stall_samples = defaultdict(int)
+        self.should_stop = Event()
+
+    def run(self):
+        while not self.should_stop.wait(self.sample_interval):
+            if time() - self.monitor.last_beat > self.monitor.interval + self.threshold:
+                frame = sys._current_frames().get(self.reactor_thread_id)
+                if frame is not None:
+                    self.add_sample(get_responsible_callable(frame))
+
+    def stop(self):
+        self.should_stop.set()
+
+    def add_sample(self, name):
+        with self.lock:
+            self.samples[name] += 1
+            self.stall_samples[name] += 1
+
+    def pop_stall_samples(self):
+        """
+        Return the callables that have been sampled since the last call, most sampled first.
+        """
+        with self.lock:
+            stall_samples, self.stall_samples = self.stall_samples, defaultdict(int)
+        return sorted(stall_samples.iteritems(), key=lambda item: item[1], reverse=True)
+
+    def get_callables(self):
+        with self.lock:
+            samples = sorted(self.samples.iteritems(), key=lambda item: item[1], reverse=True)
+        return [{"callable": name, "samples": count, "time": count * self.sample_interval}
+                for name, count in samples[:MAX_REPORTED_CALLABLES]]
+
+
+class ReactorLagMonitor(TaskManager):
+    """
+    Measures how late a frequent heartbeat fires on the reactor thread. Any delay means that other callbacks kept the
+    reactor busy for that long. Optionally, a profiler samples the stack of the reactor thread while the lag exceeds a
+    threshold, so stalls can be attributed to the callables that caused them.
+    """
+
+    def __init__(self, interval=HEARTBEAT_INTERVAL, clock=reactor, threshold=LAG_THRESHOLD, profile=False):
+        super(ReactorLagMonitor, self).__init__()
+        self.interval = interval
+        self.clock = clock
+        self.threshold = threshold
+        self.profile = profile
+        self.profiler = None
+        self.last_beat = None
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.num_stalls = 0
+        self.recent_stalls = deque(maxlen=MAX_RECENT_STALLS)
+
+    def start(self):
+        self.last_beat = self.clock.seconds()
+        heartbeat = LoopingCall(self.on_heartbeat)
+        heartbeat.clock = self.clock
+        self.register_task("heartbeat", heartbeat).start(self.interval, now=False)
+
+        if self.profile:
+            # We are called on the reactor thread
+            self.profiler = SlowCallbackProfiler(self, threading.current_thread().ident, threshold=self.threshold)
+            self.profiler.start()
+
+    def stop(self):
+        self.cancel_all_pending_tasks()
+        if self.profiler:
+            self.profiler.stop()
+            self.profiler = None
+
+    def on_heartbeat(self):
+        now = self.clock.seconds()
+        lag = max(now - self.last_beat - self.interval, 0.0)
+        self.last_beat = now
+        self.lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        REACTOR_LAG.set(lag)
+        REACTOR_LAG_HISTOGRAM.observe(lag)
+
+        if lag > self.threshold:
+            self.num_stalls += 1
+            callables = self.profiler.pop_stall_samples() if self.profiler else []
+            self.recent_stalls.append({"time": now, "lag": lag,
+                                       "callables": [name for name, _ in callables[:3]]})
+        return lag
+
+    def get_report(self):
+        """
+        Return the lag of the reactor, the most recent stalls and the callables that were sampled during the stalls.
+        """
+        return {"lag": self.lag,
+                "max_lag": self.max_lag,
+                "threshold": self.threshold,
+                "num_stalls": self.num_stalls,
+                "recent_stalls": list(self.recent_stalls),
+                "callables": self.profiler.get_callables() if self.profiler else []}
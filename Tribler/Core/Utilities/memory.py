@@ -0,0 +1,168 @@
+"""
+Runtime memory introspection.
+
+Subsystems register their large, long-lived data structures in the cache registry, so their sizes can be inspected
+without a debugger. Snapshots of the object counts by type and the cache sizes, and of the traced allocations if
+tracemalloc is available, help to find the structures that keep growing.
+"""
+import gc
+import time
+import weakref
+from collections import defaultdict
+
+try:
+    import tracemalloc
+except ImportError:
+    # tracemalloc is part of the standard library from Python 3.4 onwards, Python 2.7 needs the pytracemalloc backport
+    tracemalloc = None
+
+MAX_SNAPSHOTS = 10          # The number of memory snapshots that is kept
+TRACEMALLOC_FRAMES = 5      # The number of frames that is stored for every traced allocation
+
+
+class CacheRegistry(object):
+    """
+    Keeps track of named caches. A cache is an attribute of an owner object, which is referenced weakly so that
+    registering a cache never keeps its owner alive. The size of a cache is the length of the attribute, or its
+    return value if the attribute is a method.
+    """
+
+    def __init__(self):
+        self.caches = {}
+
+    def register(self, name, owner, attribute):
+        self.caches[name] = (weakref.ref(owner), attribute)
+
+    def unregister(self, name):
+        self.caches.pop(name, None)
+
+    def get_sizes(self):
+        sizes = {}
+        for name, (owner_ref, attribute) in self.caches.items():
+            owner = owner_ref()
+            if owner is None:
+                self.unregister(name)
+                continue
+            value = getattr(owner, attribute)
+            sizes[name] = value() if callable(value) else len(value)
+        return sizes
+
+
+def count_objects():
+    """
+    Return the number of objects tracked by the garbage collector by type.
+    """
+    counts = defaultdict(int)
+    for obj in gc.get_objects():
+        obj_type = type(obj)
+        counts["%s.%s" % (obj_type.__module__, obj_type.__name__)] += 1
+    return counts
+
+
+def get_object_counts(limit=50):
+    """
+    Return the number of objects tracked by the garbage collector for the most common types.
+    """
+    return sorted(count_objects().iteritems(), key=lambda item: item[1], reverse=True)[:limit]
+
+
+class MemorySnapshot(object):
+    """
+    The object counts by type and the sizes of the registered caches at some point in time. If tracemalloc is
+    available, the snapshot also contains the traced memory allocations.
+    """
+
+    def __init__(self, timestamp, objects, caches, allocations=None):
+        self.timestamp = timestamp
+        self.objects = objects
+        self.caches = caches
+        self.allocations = allocations
+
+    def get_statistics(self, base=None, limit=20):
+        """
+        Return the most common types of objects, the sizes of the caches and, if traced, the source lines that
+        allocated most memory. If an earlier snapshot is given as base, the types and source lines that grew most
+        since that snapshot are returned instead, together with their growth.
+        """
+        if base is None:
+            objects = [{"type": name, "count": count} for name, count in
+                       sorted(self.objects.iteritems(), key=lambda item: item[1], reverse=True)[:limit]]
+            caches = dict((name, {"size": size}) for name, size in self.caches.iteritems())
+        else:
+            objects = [{"type": name, "count": count, "count_diff": count - base.objects.get(name, 0)}
+                       for name, count in self.objects.iteritems()]
+            # Types that disappeared entirely shrank as well
+            objects.extend({"type": name, "count": 0, "count_diff": -count}
+                           for name, count in base.objects.iteritems() if name not in self.objects)
+            objects = sorted(objects, key=lambda item: item["count_diff"], reverse=True)[:limit]
+            caches = dict((name, {"size": size, "size_diff": size - base.caches.get(name, 0)})
+                          for name, size in self.caches.iteritems())
+
+        statistics = {"objects": objects, "caches": caches}
+        if self.allocations is not None:
+            if base is None or base.allocations is None:
+                statistics["allocations"] = [{"traceback": str(stat.traceback), "size": stat.size,
+                                              "count": stat.count}
+                                             for stat in self.allocations.statistics('lineno')[:limit]]
+            else:
+                statistics["allocations"] = [{"traceback": str(stat.traceback), "size": stat.size,
+                                              "size_diff": stat.size_diff, "count": stat.count,
+                                              "count_diff": stat.count_diff}
+                                             for stat in self.allocations.compare_to(base.allocations,
+                                                                                     'lineno')[:limit]]
+        return statistics
+
+
+class MemorySnapshots(object):
+    """
+    Takes memory snapshots on demand and compares them. Object counts and cache sizes work on any Python version. If
+    tracemalloc is available (Python 3.4+ or the pytracemalloc backport), the allocations are traced as well. Tracing
+    starts with the first snapshot, since it slows down every allocation.
+    """
+
+    def __init__(self):
+        self.snapshots = {}
+        self.next_snapshot_id = 1
+
+    @staticmethod
+    def has_tracemalloc():
+        return tracemalloc is not None
+
+    def take_snapshot(self, caches):
+        """
+        Take a snapshot of the objects and allocations, together with the given sizes of the caches.
+        :return: the identifier of the snapshot.
+        """
+        allocations = None
+        if tracemalloc is not None:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+            allocations = tracemalloc.take_snapshot()
+
+        snapshot_id = self.next_snapshot_id
+        self.next_snapshot_id += 1
+        self.snapshots[snapshot_id] = MemorySnapshot(time.time(), dict(count_objects()), caches, allocations)
+
+        for old_snapshot_id in sorted(self.snapshots)[:-MAX_SNAPSHOTS]:
+            self.snapshots.pop(old_snapshot_id)
+        return snapshot_id
+
+    def clear(self):
+        self.snapshots.clear()
+        if tracemalloc is not None and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def get_snapshot_list(self):
+        return [{"id": snapshot_id, "time": self.snapshots[snapshot_id].timestamp}
+                for snapshot_id in sorted(self.snapshots)]
+
+    def get_statistics(self, snapshot_id, compare_to=None, limit=20):
+        """
+        Return the statistics of a snapshot, or its growth since the snapshot with identifier compare_to.
+        """
+        base = self.snapshots[compare_to] if compare_to is not None else None
+        return self.snapshots[snapshot_id].get_statistics(base, limit)
+
+
+# The caches of the subsystems of Tribler, exported by the /debug/memory endpoint of the REST API
+cache_registry = CacheRegistry()
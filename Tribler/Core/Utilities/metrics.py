@@ -0,0 +1,280 @@
+"""
+A lightweight registry of counters, gauges and histograms that can be exported in the Prometheus text format.
+
+Any module can create metrics in the default registry and update them where things happen:
+
+    DB_STATEMENT_SECONDS = registry.histogram("tribler_db_statement_seconds", "Duration of SQLite statements")
+    DB_STATEMENT_SECONDS.observe(duration)
+
+State that is already kept elsewhere, like the counters of libtorrent, is exported with a collector instead. A
+collector is a function that is called on every scrape and returns a list of metrics describing the current state.
+"""
+import logging
+from bisect import bisect_left
+from threading import Lock
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    if value == float('-inf'):
+        return "-Inf"
+    if value != value:
+        return "NaN"
+    if isinstance(value, (int, long)):
+        return str(value)
+    return repr(float(value))
+
+
+def escape_label_value(value):
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (name, escape_label_value(value)) for name, value in labels)
+
+
+class Metric(object):
+    """
+    Base class of the metrics. A metric with label names keeps a child for every combination of label values; use
+    labels() to get one. A metric without label names can be updated directly.
+    """
+    metric_type = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = Lock()
+        if not self.labelnames:
+            # Metrics without labels are exported even before they are updated for the first time
+            self._children[()] = self.create_child()
+
+    def labels(self, *labelvalues):
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError("metric %s expects the labels %s" % (self.name, self.labelnames))
+        labelvalues = tuple(labelvalues)
+        with self._lock:
+            if labelvalues not in self._children:
+                self._children[labelvalues] = self.create_child()
+            return self._children[labelvalues]
+
+    def create_child(self):
+        raise NotImplementedError()
+
+    def samples(self):
+        """
+        Return a list of (sample name, labels, value) tuples, where labels is a sequence of (name, value) pairs.
+        """
+        with self._lock:
+            children = sorted(self._children.items())
+        samples = []
+        for labelvalues, child in children:
+            labels = zip(self.labelnames, labelvalues)
+            for suffix, extra_labels, value in child.samples():
+                samples.append((self.name + suffix, labels + extra_labels, value))
+        return samples
+
+    def to_text(self):
+        lines = ["# HELP %s %s" % (self.name, self.documentation.replace('\\', r'\\').replace('\n', r'\n')),
+                 "# TYPE %s %s" % (self.name, self.metric_type)]
+        for name, labels, value in self.samples():
+            lines.append("%s%s %s" % (name, format_labels(labels), format_value(value)))
+        return "\n".join(lines) + "\n"
+
+
+class CounterChild(object):
+
+    def __init__(self):
+        self.value = 0
+        self._lock = Lock()
+
+    def inc(self, amount=1):
+        if amount < 0:
+            raise ValueError("counters can only be increased")
+        with self._lock:
+            self.value += amount
+
+    def samples(self):
+        return [("", [], self.value)]
+
+
+class GaugeChild(object):
+
+    def __init__(self):
+        self.value = 0
+        self._lock = Lock()
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def samples(self):
+        return [("", [], self.value)]
+
+
+class HistogramChild(object):
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+
+    def samples(self):
+        with self._lock:
+            counts, count, total = list(self.counts), self.count, self.sum
+        samples = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            samples.append(("_bucket", [("le", format_value(float(bound)))], cumulative))
+        samples.append(("_sum", [], total))
+        samples.append(("_count", [], count))
+        return samples
+
+
+class UnlabeledMetric(Metric):
+    """
+    Base class of the metric types, which forwards updates to the only child if there are no label names.
+    """
+
+    def get_child(self):
+        if self.labelnames:
+            raise ValueError("metric %s has labels, use labels() to update it" % self.name)
+        return self.labels()
+
+
+class Counter(UnlabeledMetric):
+    metric_type = "counter"
+
+    def create_child(self):
+        return CounterChild()
+
+    def inc(self, amount=1):
+        self.get_child().inc(amount)
+
+
+class Gauge(UnlabeledMetric):
+    metric_type = "gauge"
+
+    def create_child(self):
+        return GaugeChild()
+
+    def set(self, value):
+        self.get_child().set(value)
+
+    def inc(self, amount=1):
+        self.get_child().inc(amount)
+
+    def dec(self, amount=1):
+        self.get_child().dec(amount)
+
+
+class Histogram(UnlabeledMetric):
+    metric_type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        buckets = tuple(sorted(buckets))
+        if buckets[-1] != float('inf'):
+            buckets += (float('inf'),)
+        self.buckets = buckets
+        super(Histogram, self).__init__(name, documentation, labelnames)
+
+    def create_child(self):
+        return HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.get_child().observe(value)
+
+
+class MetricsRegistry(object):
+    """
+    Keeps the metrics and collectors of Tribler and renders them in the text exposition format.
+    """
+
+    def __init__(self):
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self._metrics = {}
+        self._collectors = []
+        self._lock = Lock()
+
+    def register(self, metric):
+        """
+        Register a metric. If a metric with the same name and type exists already, that metric is returned instead,
+        so modules can safely create their metrics at import time.
+        """
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) != type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError("metric %s is already registered with another type or labels" % metric.name)
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def unregister(self, name):
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def unregister_collector(self, collector):
+        with self._lock:
+            if collector in self._collectors:
+                self._collectors.remove(collector)
+
+    def collect(self):
+        """
+        Return all registered metrics together with the metrics of the collectors. A failing collector is logged and
+        skipped, so that a single subsystem cannot break the whole scrape.
+        """
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+            collectors = list(self._collectors)
+
+        for collector in collectors:
+            try:
+                metrics.extend(collector())
+            except Exception:
+                self._logger.exception("Metrics collector %r failed", collector)
+        return metrics
+
+    def to_text(self):
+        return "".join(metric.to_text() for metric in self.collect())
+
+
+# The registry that is exported by the /metrics endpoint of the REST API
+registry = MetricsRegistry()
@@ -6,23 +6,73 @@ Author(s): Jan David Mol, Arno Bakker, Egbert Bouman
 import logging
 import mimetypes
 import os
-import socket
 import time
-from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
-from SocketServer import ThreadingMixIn
+import uuid
 from binascii import unhexlify
-from cherrypy.lib.httputil import get_ranges
 from collections import defaultdict
-from threading import Event, Thread, RLock
-from traceback import print_exc
 
-from Tribler.Core.Libtorrent.LibtorrentDownloadImpl import VODFile
+from twisted.internet import reactor
+from twisted.internet.defer import CancelledError, maybeDeferred, succeed
+from twisted.internet.interfaces import IPushProducer
+from twisted.web import http, resource, server
+from zope.interface import implementer
+
+from Tribler.Core.Libtorrent import PIECES_WAIT_TIMEOUT
 from Tribler.Core.simpledefs import DLMODE_VOD, DLMODE_NORMAL
+from Tribler.dispersy.taskmanager import TaskManager
+
+CHUNK_SIZE = 256 * 1024          # The maximum number of bytes that is read from disk and written at once
+THROUGHPUT_SMOOTHING = 0.3       # The weight of a new sample of the throughput
+
+
+def parse_range_header(header, length):
+    """
+    Parse the value of an HTTP Range header for a resource of the given length.
+    Returns None if the header is absent or cannot be parsed, in which case the whole resource should be sent.
+    Otherwise returns a list of (start, stop) tuples, where stop is exclusive. An empty list means that none of the
+    ranges can be satisfied.
+    """
+    if not header:
+        return None
+
+    unit, _, byteranges = header.partition('=')
+    if unit.strip().lower() != 'bytes':
+        return None
+
+    ranges = []
+    for byterange in byteranges.split(','):
+        start, sep, stop = byterange.strip().partition('-')
+        if not sep:
+            return None
+        try:
+            if not start:
+                # Suffix range, the last bytes of the resource
+                suffix_length = int(stop)
+                if suffix_length > 0:
+                    ranges.append((max(length - suffix_length, 0), length))
+                continue
+
+            start = int(start)
+            stop = int(stop) + 1 if stop else None
+        except ValueError:
+            return None
+
+        if stop is not None and stop <= start:
+            return None
+        if start < length:
+            ranges.append((start, min(stop or length, length)))
 
+    return ranges
 
-class VideoServer(ThreadingMixIn, HTTPServer):
+
+class VideoServer(TaskManager):
+    """
+    Streams the files of downloads over HTTP. A request for /<infohash>/<fileindex> puts the download in VOD mode and
+    streams the requested byte ranges as soon as the pieces containing them have been downloaded.
+    """
 
     def __init__(self, port, session):
+        super(VideoServer, self).__init__()
         self._logger = logging.getLogger(self.__class__.__name__)
 
         self.port = port
@@ -31,12 +81,15 @@ class VideoServer(ThreadingMixIn, HTTPServer):
         self.vod_download = None
         self.vod_info = defaultdict(dict)  # A dictionary containing info about the requested VOD streams.
 
-        HTTPServer.__init__(self, ("127.0.0.1", self.port), VideoRequestHandler)
-
-        self.server_thread = None
+        self.listening_port = None
+        # The active streams, in the order in which they started. The last one is the primary stream.
+        self.producers = []
 
-        self.daemon_threads = True
-        self.allow_reuse_address = True
+        self.total_sessions = 0
+        self.bytes_sent = 0
+        self.throughput = 0.0
+        self.last_bytes_sent = 0
+        self.last_throughput_update = time.time()
 
     def get_vod_download(self):
         """
@@ -46,28 +99,35 @@ class VideoServer(ThreadingMixIn, HTTPServer):
 
     def set_vod_download(self, new_download):
         """
-        Set a new Video-On-Demand download. Set the mode of old download to normal and close the file stream of
-        the old download.
+        Set a new Video-On-Demand download. Set the mode of old download to normal and stop the streams of the
+        old download.
         """
         if self.vod_download:
             self.vod_download.set_mode(DLMODE_NORMAL)
-            vi_dict = self.vod_info.pop(self.vod_download.get_def().get_infohash(), None)
-            if vi_dict and 'stream' in vi_dict:
-                vi_dict['stream'][0].close()
+            self.vod_info.pop(self.vod_download.get_def().get_infohash(), None)
+            for producer in [producer for producer in self.producers if producer.download == self.vod_download]:
+                producer.stop()
 
         self.vod_download = new_download
 
-    def get_vod_stream(self, dl_hash, wait=False):
-        if 'stream' not in self.vod_info[dl_hash] and self.session.get_download(dl_hash):
-            download = self.session.get_download(dl_hash)
-            vod_filename = self.get_vod_destination(download)
-            while wait and not os.path.exists(vod_filename):
-                time.sleep(1)
-            self.vod_info[dl_hash]['stream'] = (VODFile(open(vod_filename, 'rb'), download), RLock())
+    def prepare_vod_download(self, download, fileindex, filename):
+        """
+        Put the download in VOD mode for the given file, unless we are streaming that file already.
+        Returns a deferred that fires when the download is ready to stream.
+        """
+        if self.vod_fileindex == fileindex and self.vod_download == download:
+            return succeed(None)
 
-        if self.vod_info[dl_hash].has_key('stream'):
-            return self.vod_info[dl_hash]['stream']
-        return None, None
+        self.vod_fileindex = fileindex
+        self.set_vod_download(download)
+
+        def on_handle(_):
+            if download.get_def().is_multifile_torrent():
+                download.set_selected_files([filename])
+            download.set_mode(DLMODE_VOD)
+            download.restart()
+
+        return download.get_handle().addCallback(on_handle)
 
     @staticmethod
     def get_vod_destination(download):
@@ -80,150 +140,312 @@ class VideoServer(ThreadingMixIn, HTTPServer):
             return download.get_content_dest()
 
     def start(self):
-        self.server_thread = Thread(target=self.serve_forever, name="VideoHTTPServerThread-1")
-        self.server_thread.setDaemon(True)
-        self.server_thread.start()
-
-    def process_request_thread(self, request, client_address):
-        try:
-            self.finish_request(request, client_address)
-            self.close_request(request)
-        except socket.error:
-            pass
-        except Exception:
-            print_exc()
+        site = server.Site(VideoStreamResource(self))
+        self.listening_port = reactor.listenTCP(self.port, site, interface="127.0.0.1")
 
     def shutdown_server(self):
         """
-        Shutdown the video HTTP server.
+        Shutdown the video HTTP server. Returns a deferred that fires when the server has stopped listening.
         """
-        self.shutdown()
-        self.server_close()
+        self.cancel_all_pending_tasks()
         self.set_vod_download(None)
+        for producer in list(self.producers):
+            producer.stop()
+        if self.listening_port:
+            return maybeDeferred(self.listening_port.stopListening)
+        return succeed(None)
 
+    def get_primary_producer(self):
+        """
+        Return the stream that was started last. Players often open several connections at once, for instance to read
+        the end of a file, but only the primary stream moves the streaming scheduler of the download.
+        """
+        return self.producers[-1] if self.producers else None
 
-class VideoRequestHandler(BaseHTTPRequestHandler):
+    def on_stream_started(self, producer):
+        self.producers.append(producer)
+        self.total_sessions += 1
 
-    def __init__(self, request, client_address, video_server):
+    def on_stream_stopped(self, producer):
+        if producer not in self.producers:
+            return
+        was_primary = producer is self.get_primary_producer()
+        self.producers.remove(producer)
+        if was_primary and self.producers:
+            self.get_primary_producer().seek_scheduler()
+
+    def on_bytes_sent(self, num_bytes):
+        self.bytes_sent += num_bytes
+
+    def get_stats(self):
+        """
+        Return the number of active streams and the throughput of the server.
+        """
+        now = time.time()
+        if now - self.last_throughput_update >= 1:
+            rate = (self.bytes_sent - self.last_bytes_sent) / (now - self.last_throughput_update)
+            self.throughput = (1 - THROUGHPUT_SMOOTHING) * self.throughput + THROUGHPUT_SMOOTHING * rate
+            self.last_bytes_sent = self.bytes_sent
+            self.last_throughput_update = now
+
+        return {'active_sessions': len(self.producers),
+                'total_sessions': self.total_sessions,
+                'bytes_sent': self.bytes_sent,
+                'throughput': self.throughput}
+
+
+@implementer(IPushProducer)
+class VideoStreamProducer(object):
+    """
+    Writes byte ranges of a file that is being downloaded to an HTTP request. Data is only read from pieces that have
+    been completed. If the next chunk is not available yet, the producer waits until libtorrent finishes a piece, or
+    PIECES_WAIT_TIMEOUT seconds at most. Writing pauses when the consumer cannot keep up.
+    """
+
+    def __init__(self, video_server, request, download, fileindex, ranges, boundary=None, content_type=None,
+                 length=None, clock=reactor):
         self._logger = logging.getLogger(self.__class__.__name__)
-        self.event = None
+        self.clock = clock
+
         self.video_server = video_server
-        BaseHTTPRequestHandler.__init__(self, request, client_address, video_server)
+        self.request = request
+        self.download = download
+        self.fileindex = fileindex
+        self.piece_length = download.get_def().get_piece_length()
+
+        # Every part consists of a start offset, an exclusive stop offset and the headers that precede it
+        self.parts = [(start, stop, get_part_header(boundary, content_type, start, stop, length) if boundary else '')
+                      for start, stop in ranges]
+        self.trailer = '\r\n--%s--\r\n' % boundary if boundary else ''
+        self.position = self.parts[0][0] if self.parts else 0
+        self.part_started = False
+
+        self.file = None
+        self.paused = False
+        self.waiting = False
+        self.pieces_deferred = None
+        self.wait_call = None
+        self.stopped = False
 
-    def log_message(self, f, *args):
-        pass
+    def start(self):
+        # The player may have closed the connection while the download was being prepared
+        if self.stopped:
+            return
 
-    def do_GET(self):
-        if self.request_version == 'HTTP/1.1':
-            self.protocol_version = 'HTTP/1.1'
+        self.video_server.on_stream_started(self)
+        self.request.registerProducer(self, True)
 
-        self._logger.debug("VOD request %s %s", self.client_address, self.path)
-        downloadhash, fileindex = self.path.strip('/').split('/')
-        downloadhash = unhexlify(downloadhash)
-        download = self.server.session.get_download(downloadhash)
+        if self.parts:
+            self.seek_scheduler()
+        self.produce()
 
-        if not download or not fileindex.isdigit() or int(fileindex) > len(download.get_def().get_files()):
-            self.send_error(404, "Not Found")
-            return
+    def stop(self):
+        """
+        Stop streaming and close the connection, for instance because another download is being streamed now.
+        """
+        if not self.stopped:
+            self.stopProducing()
+            self.request.loseConnection()
 
-        fileindex = int(fileindex)
-        filename, length = download.get_def().get_files_with_length()[fileindex]
+    def is_primary(self):
+        return self.video_server.get_primary_producer() is self
+
+    def seek_scheduler(self):
+        """
+        Move the streaming scheduler of the download to the position of this stream, once it is the primary stream.
+        """
+        if self.download.vod_scheduler:
+            self.download.vod_scheduler.seek(self.position)
+        if self.download.vod_seekpos is not None:
+            self.download.vod_seekpos = self.position
+
+    def pauseProducing(self):
+        self.paused = True
+
+    def resumeProducing(self):
+        self.paused = False
+        self.produce()
 
-        requested_range = get_ranges(self.headers.getheader('range'), length)
-        if requested_range is not None and len(requested_range) != 1:
-            self.send_error(416, "Requested Range Not Satisfiable")
+    def stopProducing(self):
+        if self.stopped:
             return
+        self.stopped = True
+        self.cancel_wait()
+        if self.file:
+            self.file.close()
+        self.video_server.on_stream_stopped(self)
+
+    def is_available(self, start, stop):
+        return self.download.get_byte_progress([(self.fileindex, start, stop - 1)]) >= 1
+
+    def wait_for_pieces(self, start, stop):
+        scheduler = self.download.vod_scheduler
+        if scheduler:
+            scheduler.request_range(start, stop - start)
+
+        self.waiting = True
+        # Without piece alerts, the deferred only fires once the torrent finishes, so the download is polled as well
+        self.wait_call = self.clock.callLater(PIECES_WAIT_TIMEOUT, self.on_pieces_changed, None)
+        self.pieces_deferred = self.download.get_pieces_changed_deferred()
+        self.pieces_deferred.addCallbacks(self.on_pieces_changed, lambda failure: failure.trap(CancelledError))
+
+    def on_pieces_changed(self, _):
+        self.cancel_wait()
+        self.produce()
+
+    def cancel_wait(self):
+        self.waiting = False
+        if self.wait_call and self.wait_call.active():
+            self.wait_call.cancel()
+        if self.pieces_deferred and not self.pieces_deferred.called:
+            self.pieces_deferred.cancel()
+        self.wait_call = self.pieces_deferred = None
+
+    def open_file(self):
+        try:
+            self.file = open(self.video_server.get_vod_destination(self.download), 'rb')
+        except IOError:
+            # libtorrent did not create the file yet
+            self.file = None
+        return self.file is not None
+
+    def produce(self):
+        while not (self.paused or self.waiting or self.stopped):
+            if not self.parts:
+                self.finish()
+                return
 
-        has_changed = self.video_server.vod_fileindex != fileindex or\
-            self.video_server.get_vod_download() != download
-        if has_changed:
-            self.video_server.vod_fileindex = fileindex
-            self.video_server.set_vod_download(download)
+            start, stop, header = self.parts[0]
+            if not self.part_started:
+                self.part_started = True
+                self.position = start
+                if header:
+                    self.request.write(header)
+
+            if self.position >= stop:
+                self.parts.pop(0)
+                self.part_started = False
+                continue
+
+            # Never read beyond the end of the piece we are in, so we can write as soon as that piece is done
+            chunk_stop = min(stop, self.position + CHUNK_SIZE,
+                             (self.position // self.piece_length + 1) * self.piece_length)
+            if not self.is_available(self.position, chunk_stop) or (not self.file and not self.open_file()):
+                self.wait_for_pieces(self.position, chunk_stop)
+                return
 
-            # Put download in sequential mode + trigger initial buffering.
-            self.wait_for_handle(download)
-            if download.get_def().is_multifile_torrent():
-                download.set_selected_files([filename])
-            download.set_mode(DLMODE_VOD)
-            download.restart()
+            self.file.seek(self.position)
+            data = self.file.read(chunk_stop - self.position)
+            if not data:
+                self._logger.error("Unexpected end of file at %d", self.position)
+                self.stop()
+                return
 
-        piecelen = download.get_def().get_piece_length()
-        blocksize = piecelen
+            self.request.write(data)
+            self.position += len(data)
+            self.video_server.on_bytes_sent(len(data))
 
-        if requested_range is not None:
-            firstbyte, lastbyte = requested_range[0]
-            nbytes2send = lastbyte - firstbyte
-            self.send_response(206)
-            self.send_header('Content-Range', 'bytes %d-%d/%d' % (firstbyte, lastbyte - 1, length))
-        else:
-            firstbyte = 0
-            nbytes2send = length
-            self.send_response(200)
+            # Other streams only request the pieces they are waiting for, without moving the scheduler
+            if self.is_primary():
+                if self.download.vod_scheduler:
+                    self.download.vod_scheduler.set_position(self.position)
+                if self.download.vod_seekpos is not None:
+                    self.download.vod_seekpos = self.position
 
-        self._logger.debug("requested range %d - %d", firstbyte, firstbyte + nbytes2send)
+    def finish(self):
+        if self.trailer:
+            self.request.write(self.trailer)
+        self.request.unregisterProducer()
+        self.stopProducing()
+        self.request.finish()
 
-        mimetype = mimetypes.guess_type(filename)[0]
-        if mimetype:
-            self.send_header('Content-Type', mimetype)
-        self.send_header('Accept-Ranges', 'bytes')
 
-        if length is not None:
-            self.send_header('Content-Length', nbytes2send)
-        else:
-            self.send_header('Transfer-Encoding', 'chunked')
+def get_part_header(boundary, content_type, start, stop, length):
+    return '\r\n--%s\r\nContent-Type: %s\r\nContent-Range: bytes %d-%d/%d\r\n\r\n' % \
+           (boundary, content_type, start, stop - 1, length)
 
-        if self.request_version == 'HTTP/1.1' and self.headers.get('Connection', '').lower() != 'close':
-            self.send_header('Connection', 'Keep-Alive')
-            self.send_header('Keep-Alive', 'timeout=300, max=1')
 
-        self.end_headers()
+class VideoStreamResource(resource.Resource):
+    """
+    Serves /<infohash>/<fileindex> requests of the video server.
+    """
+    isLeaf = True
 
-        if has_changed:
-            self.wait_for_buffer(download)
+    def __init__(self, video_server):
+        resource.Resource.__init__(self)
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self.video_server = video_server
 
-        stream, lock = self.video_server.get_vod_stream(downloadhash, wait=True)
+    def render_GET(self, request):
+        return self.render_stream(request, send_body=True)
 
-        with lock:
-            if stream.closed:
-                return
+    def render_HEAD(self, request):
+        # Only the headers are sent, so there is no need to put the download in VOD mode
+        return self.render_stream(request, send_body=False)
+
+    def render_stream(self, request, send_body):
+        self._logger.debug("VOD %s request %s %s", request.method, request.getClientIP(), request.path)
 
-            stream.seek(firstbyte)
-            nbyteswritten = 0
-            while True:
-                data = stream.read(blocksize)
-
-                if len(data) == 0:
-                    break
-                elif length is not None and nbyteswritten + len(data) > nbytes2send:
-                    endlen = nbytes2send - nbyteswritten
-                    if endlen != 0:
-                        self.wfile.write(data[:endlen])
-                        nbyteswritten += endlen
-                    break
-                else:
-                    self.wfile.write(data)
-                    nbyteswritten += len(data)
-
-            if nbyteswritten != nbytes2send:
-                self._logger.error("sent wrong amount, wanted %s got %s", nbytes2send, nbyteswritten)
-
-            if not requested_range:
-                stream.close()
-
-    def wait_for_handle(self, download):
-        # TODO(Martijn): Ugly time.sleep required, should be refactored when we Twistify the video server
-        while not (download.handle and download.handle.is_valid()):
-            time.sleep(1)
-
-    def wait_for_buffer(self, download):
-        self.event = Event()
-
-        def wait_for_buffer(ds):
-            if download.vod_seekpos is None or download != self.video_server.get_vod_download()\
-                    or ds.get_vod_prebuffering_progress() == 1.0:
-                self.event.set()
-                return 0, False
-            return 1.0, False
-        download.set_state_callback(wait_for_buffer)
-        self.event.wait()
-        self.event.clear()
+        if len(request.postpath) != 2:
+            request.setResponseCode(http.NOT_FOUND)
+            return "Not Found"
+
+        infohash, fileindex = request.postpath
+        try:
+            download = self.video_server.session.get_download(unhexlify(infohash))
+        except TypeError:
+            download = None
+
+        if not download or not fileindex.isdigit() or int(fileindex) >= len(download.get_def().get_files()):
+            request.setResponseCode(http.NOT_FOUND)
+            return "Not Found"
+
+        fileindex = int(fileindex)
+        filename, length = download.get_def().get_files_with_length()[fileindex]
+        content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+        ranges = parse_range_header(request.getHeader('range'), length)
+        request.setHeader('Accept-Ranges', 'bytes')
+
+        if ranges == []:
+            request.setResponseCode(http.REQUESTED_RANGE_NOT_SATISFIABLE)
+            request.setHeader('Content-Range', 'bytes */%d' % length)
+            return ""
+
+        boundary = None
+        if ranges is None:
+            ranges = [(0, length)]
+            request.setHeader('Content-Type', content_type)
+            request.setHeader('Content-Length', str(length))
+        elif len(ranges) == 1:
+            start, stop = ranges[0]
+            request.setResponseCode(http.PARTIAL_CONTENT)
+            request.setHeader('Content-Type', content_type)
+            request.setHeader('Content-Range', 'bytes %d-%d/%d' % (start, stop - 1, length))
+            request.setHeader('Content-Length', str(stop - start))
+        else:
+            boundary = uuid.uuid4().hex
+            content_length = sum(len(get_part_header(boundary, content_type, start, stop, length)) + stop - start
+                                 for start, stop in ranges) + len('\r\n--%s--\r\n' % boundary)
+            request.setResponseCode(http.PARTIAL_CONTENT)
+            request.setHeader('Content-Type', 'multipart/byteranges; boundary=%s' % boundary)
+            request.setHeader('Content-Length', str(content_length))
+
+        if not send_body:
+            return ""
+
+        producer = VideoStreamProducer(self.video_server, request, download, fileindex, ranges, boundary=boundary,
+                                       content_type=content_type, length=length)
+        # The player may close the connection before the download is ready, the producer should not start then
+        request.notifyFinish().addBoth(lambda _: producer.stopProducing())
+
+        def on_error(failure):
+            self._logger.error("Could not prepare download for streaming: %s", failure.getErrorMessage())
+            if not producer.stopped:
+                producer.stop()
+
+        self.video_server.prepare_vod_download(download, fileindex, filename)\
+            .addCallback(lambda _: producer.start())\
+            .addErrback(on_error)
+
+        return server.NOT_DONE_YET
@@ -4,15 +4,18 @@ Video utilities.
 Author(s): Egbert Bouman
 """
 import os
+import shutil
 import subprocess
 import sys
 import tempfile
 from math import sqrt
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 from re import search
 
-from PIL import Image
+from PIL import Image, ImageChops, ImageMath, ImageStat
 
-from Tribler.Core.osutils import is_android
+FFMPEG_WORKERS = min(cpu_count(), 4)  # The maximum number of ffmpeg processes that extract frames concurrently
 
 
 def get_thumbnail(videofile, thumbfile, resolution, ffmpeg, timecode):
@@ -89,75 +92,81 @@ def limit_resolution(cur_res, max_res):
     return tuple(new_res)
 
 
-def preferred_timecodes(videofile, duration, sample_res, ffmpeg, num_samples=20, k=4):
-    results = []
-    dest_dir = tempfile.gettempdir()
+def preferred_timecodes(videofile, duration, sample_res, ffmpeg, num_samples=20, k=4, num_workers=None):
+    """
+    Return the k timecodes of the video that give the most colourful thumbnails. The candidate frames are
+    extracted by a bounded pool of ffmpeg processes.
+    """
     num_samples = min(num_samples, duration)
+    if num_samples <= 0:
+        return []
 
-    for timecode in range(0, duration, duration / num_samples):
+    dest_dir = tempfile.mkdtemp()
+    timecodes = range(0, duration, duration / num_samples)
+
+    def get_colourfulness(timecode):
         outputfile = os.path.join(dest_dir, 'tn%d.jpg' % timecode)
         get_thumbnail(videofile, outputfile, sample_res, ffmpeg, timecode)
-        if os.path.exists(outputfile):
-            # Android doesn't have wx, use PIL instead
-            if is_android():
-                def get_image_data():
-                    im = Image.open(outputfile)
-                    return list(im.getdata())
-            else:
-                import wx
-                from Tribler.Main.vwxGUI import forceAndReturnWxThread
-
-                @forceAndReturnWxThread
-                def get_image_data():
-                    pxls = []
-                    wxstr = wx.Bitmap(outputfile, wx.BITMAP_TYPE_ANY).ConvertToImage().GetData()
-                    for index in range(0, len(wxstr), 3):
-                        pxls.append(tuple(map(ord, wxstr[index:index + 3])))
-                    return pxls
-
-            this_colour = colourfulness(get_image_data())
-            if this_colour is not None:
-                results.append((this_colour, timecode))
-                if os.path.exists(outputfile):
-                    os.remove(outputfile)
-
-    results.sort()
-    results.reverse()
-    topk = results[:k]
-    return [item[1] for item in topk]
+        if not os.path.exists(outputfile):
+            return None
+        try:
+            return colourfulness(Image.open(outputfile))
+        except IOError:
+            return None
+        finally:
+            os.remove(outputfile)
+
+    pool = ThreadPool(min(num_workers or FFMPEG_WORKERS, len(timecodes)))
+    try:
+        colours = pool.map(get_colourfulness, timecodes)
+    finally:
+        pool.close()
+        pool.join()
+        shutil.rmtree(dest_dir, ignore_errors=True)
 
+    results = sorted(((colour, timecode) for colour, timecode in zip(colours, timecodes) if colour is not None),
+                     reverse=True)
+    return [timecode for _, timecode in results[:k]]
 
-def colourfulness(image_data):
-    if image_data:
-        rg_values = []
-        yb_values = []
 
-        for pxl in image_data:
-            r, g, b = pxl
-            rg = r - g
-            yb = 0.5 * (r + g) - b
-            rg_values.append(rg)
-            yb_values.append(yb)
+def get_rgb_image(image_data):
+    """
+    For backwards compatibility the image may also be given as a sequence of (r, g, b) tuples.
+    """
+    if not isinstance(image_data, Image.Image):
+        pixels = list(image_data)
+        image_data = Image.new('RGB', (len(pixels), 1))
+        image_data.putdata(pixels)
+    return image_data.convert('RGB')
+
 
-        s_rg, m_rg = meanstdv(rg_values)
-        s_yb, m_yb = meanstdv(yb_values)
+def colourfulness(image_data):
+    """
+    Return the colourfulness metric of Hasler and Suesstrunk for an image.
+
+    Instead of building the opponent colour channels pixel by pixel, their moments are derived from the statistics
+    of the colour bands and of the absolute differences between them, which PIL computes on the image buffers:
+    E[rg^2] = E[(r - g)^2] and E[yb^2] = (2 E[(r - b)^2] + 2 E[(g - b)^2] - E[(r - g)^2]) / 4.
+    """
+    if not image_data:
+        return None
 
-        s_rgyb = sqrt(s_rg ** 2 + s_yb ** 2)
-        m_rgyb = sqrt(m_rg ** 2 + m_yb ** 2)
+    image = get_rgb_image(image_data)
+    r, g, b = image.split()
+    differences = ImageChops.difference(image, Image.merge('RGB', (g, b, r)))
 
-        return s_rgyb + 0.3 * m_rgyb
+    m_r, m_g, m_b = ImageStat.Stat(image).mean
+    d_rg, d_gb, d_br = [rms ** 2 for rms in ImageStat.Stat(differences).rms]
 
+    m_rg = m_r - m_g
+    m_yb = 0.5 * (m_r + m_g) - m_b
+    var_rg = d_rg - m_rg ** 2
+    var_yb = 0.25 * (2 * d_br + 2 * d_gb - d_rg) - m_yb ** 2
 
-# Source: http://www.physics.rutgers.edu/~masud/computing/WPark_recipes_in_python.html
-def meanstdv(x):
-    n, mean, std = len(x), 0, 0
-    for a in x:
-        mean += a
-        mean /= float(n)
-    for a in x:
-        std += (a - mean) ** 2
-    std = sqrt(std / float(n - 1))
-    return mean, std
+    s_rgyb = sqrt(max(var_rg, 0) + max(var_yb, 0))
+    m_rgyb = sqrt(m_rg ** 2 + m_yb ** 2)
+
+    return s_rgyb + 0.3 * m_rgyb
 
 
 def considered_xxx(image_file, filter_ratio=0.30):
@@ -169,16 +178,13 @@ def skinratio(image_fie):
         image = Image.open(image_fie).convert('RGB')
 
         image = image.resize((int(image.size[0] * 0.20), int(image.size[1] * 0.20)))
-        image_data = list(image.getdata())
-        skin_pixels = total_pixels = 0
-
-        for index in range(0, len(image_data)):
-            r, g, b = image_data[index]
-            if r > 60 and g < (r * 0.85) and b < (r * 0.7) and g > (r * 0.4) and b > (r * 0.2):
-                skin_pixels += 1
-            total_pixels += 1
-        if total_pixels == 0:
+        if not image.size[0] or not image.size[1]:
             return 0
-        return skin_pixels / float(total_pixels)
+
+        r, g, b = [band.convert('F') for band in image.split()]
+        skin = ImageMath.eval("(r > 60) * (g < r * 0.85) * (b < r * 0.7) * (g > r * 0.4) * (b > r * 0.2)",
+                              r=r, g=g, b=b)
+        # The mask only contains zeros and ones, so it can be counted exactly as an 8-bit image
+        return ImageStat.Stat(skin.convert('L')).mean[0]
     except:
         return 0
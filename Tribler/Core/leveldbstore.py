@@ -131,6 +131,13 @@ class LevelDbStore(MutableMapping, TaskManager):
         else:
             return self._db.RangeIter(key_from=start, key_to=end)
 
+    def get_disk_usage(self):
+        """
+        Return the number of bytes the files of the store take on disk. Counting the keys would require a full scan.
+        """
+        return sum(os.path.getsize(os.path.join(self._store_dir, name)) for name in os.listdir(self._store_dir)
+                   if os.path.isfile(os.path.join(self._store_dir, name)))
+
     def flush(self):
         if self._pending_torrents:
             write_batch = self._writebatch(self._db)
@@ -33,6 +33,7 @@ DLMODE_VOD = 1
 PERSISTENTSTATE_CURRENTVERSION = 5
 
 STATEDIR_DLPSTATE_DIR = u'dlcheckpoints'
+STATEDIR_CHECKPOINT_STORE_DIR = u'dlcheckpoint_store'
 STATEDIR_WALLET_DIR = u'wallet'
 
 # For observer/callback mechanism, see Session.add_observer()
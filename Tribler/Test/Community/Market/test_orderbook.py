@@ -125,6 +125,16 @@ class TestOrderBook(AbstractTestOrderBook):
         self.order_book.remove_bid(self.bid2.order_id)
         self.assertFalse(self.order_book.tick_exists(self.bid2.order_id))
 
+    def test_version(self):
+        """
+        Test whether the version of the order book changes with its ticks
+        """
+        self.order_book.insert_ask(self.ask2)
+        self.assertEqual(self.order_book.version, 1)
+        self.order_book.remove_ask(self.ask2.order_id)
+        self.order_book.remove_ask(self.ask2.order_id)
+        self.assertEqual(self.order_book.version, 2)
+
     def test_properties(self):
         # Test for properties
         self.order_book.insert_ask(self.ask2)
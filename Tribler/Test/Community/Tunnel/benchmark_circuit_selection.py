@@ -0,0 +1,134 @@
+"""
+Simulation of circuit selection over lossy links.
+
+A fixed set of circuits with different round-trip times, loss rates and capacities carries a number of concurrent
+downloads. Every download selects a circuit when it starts, like a SOCKS5 connection does for a new destination, and
+achieves a rate that decreases with the round-trip time and the loss of its circuit (the TCP-friendly rate). Circuits
+that carry more than their capacity slow down all of their downloads and get longer round-trip times. Pings are sent
+every PING_INTERVAL seconds and get lost according to the loss rate of the circuit.
+
+The simulation runs the same workload with every selection strategy and reports the average download speed.
+
+Run with: python -m Tribler.Test.Community.Tunnel.benchmark_circuit_selection [seconds] [seed]
+"""
+import math
+import random
+import sys
+from collections import defaultdict
+
+from Tribler.community.tunnel import CIRCUIT_HEALTH_INTERVAL, CIRCUIT_STATE_READY, CIRCUIT_TYPE_DATA, PING_INTERVAL
+from Tribler.community.tunnel.routing import CircuitRing
+from Tribler.community.tunnel.tunnel_community import HealthAwareSelection, RoundRobin
+
+HOPS = 3
+MSS = 1400                      # Bytes per packet of a download
+FLOW_SIZE = 4 * 1024 * 1024     # Bytes per download
+NUM_FLOWS = 24                  # The number of concurrent downloads
+MAX_FLOW_RATE = 512 * 1024      # The rate at which a download is limited by the peer at the other end, in bytes/s
+
+# Round-trip time in seconds, loss rate and capacity in bytes/s of the simulated circuits
+CIRCUITS = [(0.15, 0.001, 1024 * 1024),
+            (0.20, 0.005, 768 * 1024),
+            (0.25, 0.002, 1024 * 1024),
+            (0.40, 0.020, 512 * 1024),
+            (0.60, 0.050, 256 * 1024),
+            (0.90, 0.100, 128 * 1024),
+            (1.20, 0.200, 64 * 1024),
+            (0.30, 0.010, 96 * 1024)]   # A congested relay
+
+
+class SimulatedCircuit(object):
+
+    def __init__(self, circuit_id, rtt, loss, capacity):
+        self.circuit_id = circuit_id
+        self.base_rtt = rtt
+        self.rtt = rtt
+        self.loss = loss
+        self.capacity = capacity
+        self.bytes_up = self.bytes_down = 0
+        self.state = CIRCUIT_STATE_READY
+        self.ctype = CIRCUIT_TYPE_DATA
+        self.hops = (None,) * HOPS
+
+    def get_flow_rate(self):
+        # The TCP-friendly rate of a single download over this circuit
+        return min(MAX_FLOW_RATE, MSS / self.rtt * math.sqrt(1.5 / self.loss))
+
+
+class SimulatedCommunity(object):
+
+    def __init__(self, circuits):
+        self.circuits = {circuit.circuit_id: circuit for circuit in circuits}
+        self.circuit_rings = defaultdict(CircuitRing)
+        for circuit in circuits:
+            self.circuit_rings[HOPS].add(circuit)
+
+
+class Flow(object):
+
+    def __init__(self, circuit):
+        self.circuit = circuit
+        self.remaining = FLOW_SIZE
+
+
+def simulate(strategy_class, duration, seed):
+    """
+    Return the average download speed in bytes/s that the downloads achieve when using the given selection strategy.
+    """
+    rand = random.Random(seed)
+    now = [0.0]
+
+    circuits = [SimulatedCircuit(long(index + 1), *properties) for index, properties in enumerate(CIRCUITS)]
+    community = SimulatedCommunity(circuits)
+    if strategy_class is HealthAwareSelection:
+        strategy = strategy_class(community, clock=lambda: now[0], rand=random.Random(seed).random)
+    else:
+        strategy = strategy_class(community)
+
+    flows = []
+    downloaded = 0
+    for second in xrange(duration):
+        now[0] = float(second)
+        while len(flows) < NUM_FLOWS:
+            flows.append(Flow(strategy.select(None, HOPS)))
+
+        flows_by_circuit = defaultdict(list)
+        for flow in flows:
+            flows_by_circuit[flow.circuit].append(flow)
+
+        for circuit in circuits:
+            circuit_flows = flows_by_circuit[circuit]
+            demand = circuit.get_flow_rate() * len(circuit_flows)
+            share = min(1.0, circuit.capacity / demand) if demand else 1.0
+            for flow in circuit_flows:
+                num_bytes = min(flow.remaining, int(circuit.get_flow_rate() * share))
+                flow.remaining -= num_bytes
+                circuit.bytes_down += num_bytes
+                downloaded += num_bytes
+
+            # Queueing at an overloaded circuit adds to the round-trip time
+            circuit.rtt = circuit.base_rtt * (1 + min(demand / circuit.capacity, 4.0))
+
+        flows = [flow for flow in flows if flow.remaining > 0]
+
+        if second % PING_INTERVAL == 0:
+            for circuit in circuits:
+                if rand.random() < 1 - (1 - circuit.loss) ** 2:
+                    strategy.on_ping_lost(circuit)
+                else:
+                    strategy.on_pong(circuit, circuit.rtt)
+
+        if second % CIRCUIT_HEALTH_INTERVAL == 0:
+            strategy.update()
+
+    return downloaded / float(duration)
+
+
+def main(duration=600, seed=42):
+    for strategy_class in (RoundRobin, HealthAwareSelection):
+        speed = simulate(strategy_class, duration, seed)
+        print "%-20s %8.1f KiB/s" % (strategy_class.__name__, speed / 1024)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,134 @@
+"""
+Benchmark of the packet handling of a relay and an exit node, in packets per second.
+
+The legacy implementation rebuilds the whole relayed packet to replace the circuit id, and encodes and decodes the
+addresses of data packets field by field, like TunnelConversion used to do. The memoryview implementation avoids copying
+the encrypted content out of the packet, and rewrites the circuit id of a bytearray header in place.
+
+Run with: python -m Tribler.Test.Community.Tunnel.benchmark_conversion [num_packets] [packet_size]
+"""
+import os
+import sys
+import timeit
+from socket import error as socket_error, inet_aton, inet_ntoa
+from struct import pack, unpack_from
+
+from Tribler.community.tunnel.conversion import ADDRESS_TYPE_DOMAIN_NAME, ADDRESS_TYPE_IPV4, TunnelConversion
+from Tribler.community.tunnel.crypto.tunnelcrypto import NoTunnelCrypto, TunnelCrypto
+
+ADDRESS = ("1.2.3.4", 5678)
+# Start with a high explicit salt, so every packet uses the same code path
+FIRST_SALT_EXPLICIT = 10 ** 6
+
+
+def legacy_swap_circuit_id(packet, message_type, old_circuit_id, new_circuit_id):
+    circuit_id_pos = 0 if message_type == u"data" else 31
+    circuit_id, = unpack_from('!I', packet, circuit_id_pos)
+    assert circuit_id == old_circuit_id, circuit_id
+    packet = packet[:circuit_id_pos] + pack('!I', new_circuit_id) + packet[circuit_id_pos + 4:]
+    return packet
+
+
+def legacy_split_encrypted_packet(packet, message_type):
+    encryped_pos = 4 if message_type == u"data" else 36
+    return packet[:encryped_pos], packet[encryped_pos:]
+
+
+def legacy_encode_data(circuit_id, dest_address, org_address, data):
+    def encode_address(host, port):
+        try:
+            ip = inet_aton(host)
+            is_ip = True
+        except socket_error:
+            is_ip = False
+
+        if is_ip:
+            return pack("!B4sH", ADDRESS_TYPE_IPV4, ip, port)
+        else:
+            return pack("!BH", ADDRESS_TYPE_DOMAIN_NAME, len(host)) + host + pack("!H", port)
+
+    return pack("!I", circuit_id) + encode_address(*dest_address) + encode_address(*org_address) + data
+
+
+def legacy_decode_data(packet):
+    circuit_id, = unpack_from("!I", packet)
+    offset = 4
+
+    def decode_address(packet, offset):
+        addr_type, = unpack_from("!B", packet, offset)
+        offset += 1
+
+        if addr_type == ADDRESS_TYPE_IPV4:
+            host, port = unpack_from('!4sH', packet, offset)
+            offset += 6
+            return (inet_ntoa(host), port), offset
+
+        elif addr_type == ADDRESS_TYPE_DOMAIN_NAME:
+            length, = unpack_from('!H', packet, offset)
+            offset += 2
+            host = packet[offset:offset + length]
+            offset += length
+            port, = unpack_from('!H', packet, offset)
+            offset += 2
+            return (host, port), offset
+
+        return None, offset
+
+    dest_address, offset = decode_address(packet, offset)
+    org_address, offset = decode_address(packet, offset)
+
+    return circuit_id, dest_address, org_address, packet[offset:]
+
+
+def legacy_relay(crypto, packets, session_keys):
+    for packet in packets:
+        plaintext, encrypted = legacy_split_encrypted_packet(packet, u"data")
+        packet = plaintext + crypto.decrypt_str(encrypted, session_keys[1], session_keys[3])
+        legacy_swap_circuit_id(packet, u"data", 1, 2)
+
+
+def memoryview_relay(crypto, packets, session_keys):
+    for packet in packets:
+        encrypted = memoryview(packet)[4:]
+        encrypted = crypto.decrypt_str(encrypted.tobytes(), session_keys[1], session_keys[3])
+        str(TunnelConversion.swap_circuit_id(bytearray(packet[:4]), u"data", 1, 2)) + encrypted
+
+
+def relay(crypto, packets, session_keys):
+    for packet in packets:
+        plaintext, encrypted = TunnelConversion.split_encrypted_packet(packet, u"data")
+        encrypted = crypto.decrypt_str(encrypted, session_keys[1], session_keys[3])
+        TunnelConversion.swap_circuit_id(plaintext, u"data", 1, 2) + encrypted
+
+
+def codec(encode_data, decode_data, payloads):
+    for payload in payloads:
+        decode_data(encode_data(1, ADDRESS, ADDRESS, payload))
+
+
+def main(num_packets=10000, packet_size=1024):
+    crypto = TunnelCrypto()
+    session_keys = crypto.generate_session_keys(os.urandom(64))
+    payloads = [os.urandom(packet_size) for _ in xrange(num_packets)]
+    packets = [pack('!I', 1) + crypto.encrypt_str(payload, session_keys[1], session_keys[3], salt_explicit)
+               for salt_explicit, payload in enumerate(payloads, FIRST_SALT_EXPLICIT)]
+
+    no_crypto = NoTunnelCrypto()
+
+    print "%d packets of %d bytes" % (num_packets, packet_size)
+    benchmarks = [("relay (legacy)", lambda: legacy_relay(crypto, packets, session_keys)),
+                  ("relay (memoryview)", lambda: memoryview_relay(crypto, packets, session_keys)),
+                  ("relay", lambda: relay(crypto, packets, session_keys)),
+                  ("relay w/o crypto (legacy)", lambda: legacy_relay(no_crypto, packets, session_keys)),
+                  ("relay w/o crypto (memoryview)", lambda: memoryview_relay(no_crypto, packets, session_keys)),
+                  ("relay w/o crypto", lambda: relay(no_crypto, packets, session_keys)),
+                  ("encode/decode (legacy)", lambda: codec(legacy_encode_data, legacy_decode_data, payloads)),
+                  ("encode/decode", lambda: codec(TunnelConversion.encode_data, TunnelConversion.decode_data,
+                                                  payloads))]
+    for name, func in benchmarks:
+        duration = min(timeit.repeat(func, number=1, repeat=5))
+        print "%-30s %10.0f packets/s" % (name, num_packets / duration)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:3]])
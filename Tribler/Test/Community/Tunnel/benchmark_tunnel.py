@@ -0,0 +1,354 @@
+"""
+Benchmark of the data plane of the tunnel community.
+
+Every node runs its own Dispersy instance and tunnel community in this process and the nodes talk to each other over
+UDP on the local machine. The benchmark builds circuits of 1, 2 and 3 hops from the originator to the exit node, sends
+a fixed number of datagrams through the SOCKS5 UDP associate of the originator and lets a UDP sink behind the exit node
+echo them back. Only a window of datagrams is in flight at any time, so the results do not depend on how many packets
+the socket buffers happen to drop.
+
+Since all nodes share a process, the CPU time includes the work of every hop; it is reported per MB and per hop. The
+relays and the exit node can forward data packets using data plane workers, whose CPU time is not included.
+
+Run with: python -m Tribler.Test.Community.Tunnel.benchmark_tunnel [num_packets] [packet_size] [max_hops] [workers]
+"""
+import os
+import shutil
+import socket
+import struct
+import sys
+import tempfile
+import time
+
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, inlineCallbacks, returnValue
+from twisted.internet.endpoints import TCP4ClientEndpoint, connectProtocol
+from twisted.internet.protocol import DatagramProtocol, Protocol
+from twisted.internet.task import LoopingCall, deferLater
+
+from Tribler.Core.Utilities.network_utils import get_random_port
+from Tribler.community.tunnel.Socks5 import conversion
+from Tribler.community.tunnel.crypto.tunnelcrypto import NoTunnelCrypto
+from Tribler.community.tunnel.tunnel_community import TunnelCommunity, TunnelSettings
+from Tribler.dispersy.candidate import Candidate
+from Tribler.dispersy.crypto import ECCrypto
+from Tribler.dispersy.dispersy import Dispersy
+from Tribler.dispersy.endpoint import StandaloneEndpoint
+
+MAX_HOPS = 3
+WINDOW = 64                 # The number of datagrams that may be in flight
+STALL_TIMEOUT = 1.0         # Datagrams in flight are considered lost if nothing arrives for this many seconds
+SETUP_TIMEOUT = 30.0        # The number of seconds that discovering the other nodes or building a circuit may take
+
+# A uTP data packet header, so the exit node allows the datagrams to leave the tunnel
+UTP_HEADER = "\x01\x00" + "\x00" * 18
+
+
+class BenchmarkTunnelCommunity(TunnelCommunity):
+    """
+    A tunnel community with its own master member, so the benchmark never talks to the Tribler network.
+    """
+    master_key = ""
+
+    @classmethod
+    def get_master_members(cls, dispersy):
+        return [dispersy.get_member(public_key=cls.master_key)]
+
+
+class EchoSink(DatagramProtocol):
+    """
+    Receives the datagrams that leave the tunnel at the exit node and sends them back.
+    """
+
+    def __init__(self):
+        self.packets_received = self.bytes_received = 0
+
+    def datagramReceived(self, data, source):
+        self.packets_received += 1
+        self.bytes_received += len(data)
+        self.transport.write(data, source)
+
+
+class Socks5ControlConnection(Protocol):
+    """
+    The TCP connection with the SOCKS5 server of the originator. Requests a UDP associate and fires the deferred with
+    the UDP port of the server.
+    """
+
+    def __init__(self, client_address):
+        self.client_address = client_address
+        self.associated = Deferred()
+        self.buffer = ""
+        self.method_selected = False
+
+    def connectionMade(self):
+        self.transport.write(struct.pack("!BBB", conversion.SOCKS_VERSION, 1, 0x00))
+
+    def dataReceived(self, data):
+        self.buffer += data
+        if not self.method_selected and len(self.buffer) >= 2:
+            self.buffer = self.buffer[2:]
+            self.method_selected = True
+            self.transport.write(struct.pack("!BBBB", conversion.SOCKS_VERSION, conversion.REQ_CMD_UDP_ASSOCIATE, 0,
+                                             conversion.ADDRESS_TYPE_IPV4) +
+                                 socket.inet_aton(self.client_address[0]) + struct.pack("!H", self.client_address[1]))
+
+        elif self.method_selected and len(self.buffer) >= 10 and not self.associated.called:
+            version, reply = struct.unpack_from("!BB", self.buffer)
+            if version != conversion.SOCKS_VERSION or reply != conversion.REP_SUCCEEDED:
+                self.associated.errback(RuntimeError("UDP associate refused with reply %d" % reply))
+            else:
+                self.associated.callback(struct.unpack_from("!H", self.buffer, 8)[0])
+
+
+class Socks5UDPClient(DatagramProtocol):
+    """
+    Sends a fixed number of datagrams through the SOCKS5 UDP associate and counts the echoes. At most WINDOW datagrams
+    are in flight; the deferred fires when every datagram has been echoed or given up on.
+    """
+
+    def __init__(self, socks_address, destination, num_packets, packet_size):
+        self.socks_address = socks_address
+        self.destination = destination
+        self.num_packets = num_packets
+        self.packet = conversion.encode_udp_packet(0, 0, conversion.ADDRESS_TYPE_IPV4, destination[0], destination[1],
+                                                   UTP_HEADER + "\x00" * max(0, packet_size - len(UTP_HEADER)))
+        self.finished = Deferred()
+        self.packets_sent = self.packets_received = self.packets_lost = 0
+        self.bytes_received = 0
+        self.last_received = self.packets_received
+        self.watchdog = LoopingCall(self.check_stalled)
+
+    def start(self):
+        self.watchdog.start(STALL_TIMEOUT, now=False)
+        self.fill_window()
+        return self.finished
+
+    @property
+    def in_flight(self):
+        return self.packets_sent - self.packets_received - self.packets_lost
+
+    def fill_window(self):
+        while self.in_flight < WINDOW and self.packets_sent < self.num_packets:
+            self.transport.write(self.packet, self.socks_address)
+            self.packets_sent += 1
+        self.check_finished()
+
+    def datagramReceived(self, data, source):
+        self.packets_received += 1
+        self.bytes_received += len(conversion.decode_udp_packet(data).payload)
+        self.fill_window()
+
+    def check_stalled(self):
+        if self.packets_received == self.last_received:
+            self.packets_lost += self.in_flight
+            self.fill_window()
+        self.last_received = self.packets_received
+
+    def check_finished(self):
+        if self.packets_received + self.packets_lost == self.num_packets and not self.finished.called:
+            self.watchdog.stop()
+            self.finished.callback(self)
+
+
+class BenchmarkResult(object):
+
+    def __init__(self, hops, client, sink, wall_time, cpu_time):
+        self.hops = hops
+        self.packets = client.packets_received
+        self.packets_lost = client.packets_lost
+        # Every echoed datagram travelled through the tunnel twice
+        self.bytes = sink.bytes_received + client.bytes_received
+        self.wall_time = wall_time
+        self.cpu_time = cpu_time
+
+    @property
+    def mbit_per_second(self):
+        return self.bytes * 8 / self.wall_time / 1000000.0
+
+    @property
+    def packets_per_second(self):
+        return 2 * self.packets / self.wall_time
+
+    @property
+    def cpu_seconds_per_mb_per_hop(self):
+        return self.cpu_time / (self.bytes / 1000000.0) / self.hops if self.bytes else float('inf')
+
+    def __str__(self):
+        return "%d hop(s): %8.2f Mbit/s %10.1f packets/s %8.3f CPU s/MB/hop %6d lost" % \
+               (self.hops, self.mbit_per_second, self.packets_per_second, self.cpu_seconds_per_mb_per_hop,
+                self.packets_lost)
+
+
+def get_cpu_time():
+    user, system = os.times()[:2]
+    return user + system
+
+
+class TunnelBenchmark(object):
+    """
+    Runs an originator, MAX_HOPS - 1 relays and an exit node in this process. Call start() before running workloads
+    and stop() afterwards; all methods should be called on the reactor thread.
+    """
+
+    def __init__(self, crypto_enabled=True, dataplane_workers=0):
+        self.crypto_enabled = crypto_enabled
+        self.dataplane_workers = dataplane_workers
+        self.state_dir = None
+        self.nodes = []
+        self.sink = self.sink_port = None
+
+    @property
+    def originator(self):
+        return self.nodes[0]
+
+    @property
+    def exit_node(self):
+        return self.nodes[-1]
+
+    @inlineCallbacks
+    def start(self):
+        self.state_dir = tempfile.mkdtemp(prefix="tribler_tunnel_benchmark_")
+        crypto = ECCrypto()
+        BenchmarkTunnelCommunity.master_key = crypto.key_to_bin(crypto.generate_key(u"curve25519").pub())
+
+        self.nodes.append(self.create_node(0, exitnode=False, socks_listen_ports=self.get_socks5_ports()))
+        for index in xrange(1, MAX_HOPS):
+            self.nodes.append(self.create_node(index, exitnode=False))
+        self.nodes.append(self.create_node(MAX_HOPS, exitnode=True))
+
+        self.sink = EchoSink()
+        self.sink_port = reactor.listenUDP(0, self.sink, interface="127.0.0.1")
+
+        for community in self.nodes:
+            for other in self.nodes:
+                if other is not community:
+                    community.add_discovered_candidate(Candidate(other.dispersy.lan_address, tunnel=False))
+
+        yield self.wait_for(self.is_discovered, "the nodes did not discover each other")
+
+    @staticmethod
+    def get_socks5_ports():
+        ports = []
+        while len(ports) < MAX_HOPS:
+            port = get_random_port(socket_type="tcp")
+            if port not in ports:
+                ports.append(port)
+        return ports
+
+    def create_node(self, index, exitnode, socks_listen_ports=()):
+        state_dir = os.path.join(self.state_dir, str(index))
+        os.mkdir(state_dir)
+
+        crypto = ECCrypto()
+        dispersy = Dispersy(StandaloneEndpoint(get_random_port(socket_type="udp")), unicode(state_dir),
+                            u"dispersy.db", crypto)
+        if not dispersy.start(autoload_discovery=False):
+            raise RuntimeError("Unable to start Dispersy")
+
+        member = dispersy.get_member(private_key=crypto.key_to_bin(crypto.generate_key(u"curve25519")))
+        settings = TunnelSettings()
+        settings.socks_listen_ports = list(socks_listen_ports)
+        settings.become_exitnode = exitnode
+        # The sink only echoes datagrams that have arrived, so the exit node sends a full window without reply
+        settings.max_packets_without_reply = WINDOW
+        if not self.crypto_enabled:
+            settings.crypto = NoTunnelCrypto()
+        if index > 0:
+            settings.dataplane_workers = self.dataplane_workers
+        return dispersy.define_auto_load(BenchmarkTunnelCommunity, member, (None, settings), load=True)[0]
+
+    def is_discovered(self):
+        for community in self.nodes:
+            known = set(candidate.sock_addr for candidate in community.compatible_candidates)
+            if len(known) < len(self.nodes) - 1:
+                return False
+        return len(self.originator.exit_candidates) > 0
+
+    @inlineCallbacks
+    def wait_for(self, condition, error):
+        deadline = time.time() + SETUP_TIMEOUT
+        while not condition():
+            if time.time() > deadline:
+                raise RuntimeError(error)
+            yield deferLater(reactor, 0.1, lambda: None)
+
+    @inlineCallbacks
+    def build_circuit(self, hops):
+        """
+        Build a data circuit with the given number of hops and return it once it is ready.
+        """
+        ready = Deferred()
+        required_exit = self.originator.exit_candidates.values()[0]
+        if not self.originator.create_circuit(hops, callback=ready.callback, required_exit=required_exit):
+            raise RuntimeError("Unable to create a circuit of %d hops" % hops)
+
+        timeout = reactor.callLater(SETUP_TIMEOUT, ready.errback,
+                                    RuntimeError("The circuit of %d hops was not built in time" % hops))
+        circuit = yield ready
+        timeout.cancel()
+        returnValue(circuit)
+
+    @inlineCallbacks
+    def run_workload(self, hops, num_packets, packet_size):
+        """
+        Send num_packets datagrams of packet_size bytes through a new circuit of the given number of hops.
+        """
+        circuit = yield self.build_circuit(hops)
+
+        client = Socks5UDPClient(None, ("127.0.0.1", self.sink_port.getHost().port), num_packets, packet_size)
+        client_port = reactor.listenUDP(0, client, interface="127.0.0.1")
+        control = Socks5ControlConnection(("127.0.0.1", client_port.getHost().port))
+        socks_port = self.originator.settings.socks_listen_ports[hops - 1]
+        yield connectProtocol(TCP4ClientEndpoint(reactor, "127.0.0.1", socks_port), control)
+        client.socks_address = ("127.0.0.1", (yield control.associated))
+
+        self.sink.packets_received = self.sink.bytes_received = 0
+        start_time, start_cpu_time = time.time(), get_cpu_time()
+        yield client.start()
+        result = BenchmarkResult(hops, client, self.sink, time.time() - start_time,
+                                 get_cpu_time() - start_cpu_time)
+
+        control.transport.loseConnection()
+        yield client_port.stopListening()
+        self.originator.remove_circuit(circuit.circuit_id, "benchmark finished", destroy=True)
+        returnValue(result)
+
+    @inlineCallbacks
+    def stop(self):
+        if self.sink_port:
+            yield self.sink_port.stopListening()
+        for community in self.nodes:
+            yield community.dispersy.stop()
+        self.nodes = []
+        if self.state_dir:
+            shutil.rmtree(self.state_dir, ignore_errors=True)
+
+
+@inlineCallbacks
+def run_benchmark(num_packets, packet_size, max_hops, dataplane_workers=0):
+    benchmark = TunnelBenchmark(dataplane_workers=dataplane_workers)
+    try:
+        yield benchmark.start()
+        print "%d packets of %d bytes" % (num_packets, packet_size)
+        for hops in xrange(1, max_hops + 1):
+            result = yield benchmark.run_workload(hops, num_packets, packet_size)
+            print result
+    finally:
+        yield benchmark.stop()
+
+
+def main(num_packets=20000, packet_size=1024, max_hops=MAX_HOPS, dataplane_workers=0):
+    def on_error(failure):
+        failure.printTraceback()
+
+    def run():
+        run_benchmark(num_packets, packet_size, min(max_hops, MAX_HOPS), dataplane_workers).addErrback(on_error)\
+            .addBoth(lambda _: reactor.stop())
+
+    reactor.callWhenRunning(run)
+    reactor.run()
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:5]])
@@ -0,0 +1,71 @@
+"""
+Benchmark of the onion encryption of the tunnel community, in packets per second for every number of layers.
+
+The legacy implementation sets up a new AES-GCM cipher for every packet and every layer, like TunnelCrypto used to do.
+
+Run with: python -m Tribler.Test.Community.Tunnel.benchmark_tunnelcrypto [num_packets] [packet_size]
+"""
+import os
+import struct
+import sys
+import timeit
+
+from Tribler.community.tunnel.crypto.cryptowrapper import Cipher, algorithms, modes, default_backend
+from Tribler.community.tunnel.crypto.tunnelcrypto import TunnelCrypto
+
+MAX_LAYERS = 3
+# Start with a high explicit salt, so every packet uses the same code path
+FIRST_SALT_EXPLICIT = 10 ** 6
+
+
+def legacy_encrypt_str(content, key, salt, salt_explicit):
+    cipher = Cipher(algorithms.AES(key), modes.GCM(initialization_vector=salt + str(salt_explicit)),
+                    backend=default_backend()).encryptor()
+    ciphertext = cipher.update(content) + cipher.finalize()
+    return struct.pack('!q16s', salt_explicit, cipher.tag) + ciphertext
+
+
+def legacy_decrypt_str(content, key, salt):
+    salt_explicit, gcm_tag = struct.unpack_from('!q16s', content)
+    cipher = Cipher(algorithms.AES(key), modes.GCM(initialization_vector=salt + str(salt_explicit), tag=gcm_tag),
+                    backend=default_backend()).decryptor()
+    return cipher.update(content[24:]) + cipher.finalize()
+
+
+def encrypt_layers(encrypt, packets, hops):
+    for salt_explicit, packet in enumerate(packets, FIRST_SALT_EXPLICIT):
+        for session_keys in reversed(hops):
+            packet = encrypt(packet, session_keys[1], session_keys[3], salt_explicit)
+
+
+def decrypt_layers(decrypt, packets, hops):
+    for packet in packets:
+        for session_keys in hops:
+            packet = decrypt(packet, session_keys[1], session_keys[3])
+
+
+def main(num_packets=10000, packet_size=1024):
+    crypto = TunnelCrypto()
+    print "%d packets of %d bytes" % (num_packets, packet_size)
+    for num_layers in xrange(1, MAX_LAYERS + 1):
+        hops = [crypto.generate_session_keys(os.urandom(64)) for _ in xrange(num_layers)]
+        packets = [os.urandom(packet_size) for _ in xrange(num_packets)]
+
+        encrypted = list(packets)
+        for session_keys in reversed(hops):
+            encrypted = [crypto.encrypt_str(packet, session_keys[1], session_keys[3], salt_explicit)
+                         for salt_explicit, packet in enumerate(encrypted, FIRST_SALT_EXPLICIT)]
+        assert [legacy_decrypt_str(packet, hops[0][1], hops[0][3]) for packet in encrypted[:10]] == \
+            [crypto.decrypt_str(packet, hops[0][1], hops[0][3]) for packet in encrypted[:10]]
+
+        benchmarks = [("encrypt (legacy)", lambda: encrypt_layers(legacy_encrypt_str, packets, hops)),
+                      ("encrypt", lambda: encrypt_layers(crypto.encrypt_str, packets, hops)),
+                      ("decrypt (legacy)", lambda: decrypt_layers(legacy_decrypt_str, encrypted, hops)),
+                      ("decrypt", lambda: decrypt_layers(crypto.decrypt_str, encrypted, hops))]
+        for name, func in benchmarks:
+            duration = min(timeit.repeat(func, number=1, repeat=3))
+            print "%d layer(s) %-20s %10.0f packets/s" % (num_layers, name, num_packets / duration)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,48 @@
+from Tribler.Test.Core.base_test import TriblerCoreTest
+from Tribler.community.tunnel.circuit_pool import WarmCircuitPool
+
+
+class TestWarmCircuitPool(TriblerCoreTest):
+
+    def setUp(self, annotate=True):
+        TriblerCoreTest.setUp(self, annotate=annotate)
+        self.now = 0.0
+        self.pool = WarmCircuitPool(4, retention=100, clock=lambda: self.now)
+
+    def test_no_usage(self):
+        """
+        Test whether no circuits are kept ready for circuit lengths that have not been used
+        """
+        self.assertEqual(self.pool.get_targets(), {})
+
+    def test_peak_usage(self):
+        """
+        Test whether the peak number of ready circuits is kept ready, up to the maximum size of the pool
+        """
+        self.pool.record_usage(1, 0)
+        self.assertEqual(self.pool.get_targets(), {1: 1})
+        self.pool.record_usage(1, 3)
+        self.pool.record_usage(1, 2)
+        self.pool.record_usage(3, 8)
+        self.assertEqual(self.pool.get_targets(), {1: 3, 3: 4})
+
+    def test_retention(self):
+        """
+        Test whether circuit lengths that have not been used for a while are forgotten
+        """
+        self.pool.record_usage(1, 3)
+        self.now = 100
+        self.assertEqual(self.pool.get_targets(), {1: 3})
+        self.now = 101
+        self.assertEqual(self.pool.get_targets(), {})
+
+        self.pool.record_usage(1, 2)
+        self.assertEqual(self.pool.get_targets(), {1: 2})
+
+    def test_disabled(self):
+        """
+        Test whether no circuits are kept ready if the pool is disabled
+        """
+        pool = WarmCircuitPool(0)
+        pool.record_usage(1, 3)
+        self.assertEqual(pool.get_targets(), {})
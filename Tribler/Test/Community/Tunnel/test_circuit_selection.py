@@ -0,0 +1,88 @@
+from Tribler.Test.Community.Tunnel.benchmark_circuit_selection import (HOPS, SimulatedCircuit, SimulatedCommunity,
+                                                                       simulate)
+from Tribler.Test.Core.base_test import TriblerCoreTest
+from Tribler.community.tunnel.tunnel_community import HealthAwareSelection, RoundRobin
+
+
+class TestHealthAwareSelection(TriblerCoreTest):
+
+    def setUp(self, annotate=True):
+        TriblerCoreTest.setUp(self, annotate=annotate)
+        self.now = 0.0
+        self.random_values = []
+        self.circuits = [SimulatedCircuit(1L, 0.1, 0.0, 1024), SimulatedCircuit(2L, 0.1, 0.0, 1024)]
+        self.community = SimulatedCommunity(self.circuits)
+        self.strategy = HealthAwareSelection(self.community, clock=lambda: self.now, rand=self.random_values.pop)
+
+    def test_rtt(self):
+        """
+        Test whether the round-trip times are averaged and circuits with a shorter round-trip time get more weight
+        """
+        self.strategy.on_pong(self.circuits[0], 0.1)
+        self.strategy.on_pong(self.circuits[0], 0.2)
+        self.strategy.on_pong(self.circuits[1], 0.4)
+        self.assertAlmostEqual(self.strategy.health[1].rtt, 0.13)
+
+        weights = self.strategy.get_weights(self.circuits)
+        self.assertAlmostEqual(weights[0] / weights[1], 0.4 / 0.13)
+
+    def test_unmeasured_rtt(self):
+        """
+        Test whether circuits without a round-trip time are assumed to be average
+        """
+        self.strategy.on_pong(self.circuits[0], 0.2)
+        self.assertEqual(len(set(self.strategy.get_weights(self.circuits))), 1)
+
+    def test_loss(self):
+        """
+        Test whether circuits that lose pings get less weight, until they answer pings again
+        """
+        self.strategy.on_ping_lost(self.circuits[1])
+        self.assertAlmostEqual(self.strategy.health[2].loss, 0.3)
+        weights = self.strategy.get_weights(self.circuits)
+        self.assertLess(weights[1], weights[0])
+
+        for _ in xrange(20):
+            self.strategy.on_pong(self.circuits[1], 0.1)
+        self.assertLess(self.strategy.health[2].loss, 0.001)
+
+    def test_throughput(self):
+        """
+        Test whether the throughput of the circuits is sampled and removed circuits are forgotten
+        """
+        self.strategy.update()
+        self.now = 10.0
+        self.circuits[0].bytes_down = 1000
+        self.strategy.update()
+        self.assertAlmostEqual(self.strategy.health[1].throughput, 30.0)
+        self.assertEqual(self.strategy.health[2].throughput, 0.0)
+
+        weights = self.strategy.get_weights(self.circuits)
+        self.assertAlmostEqual(weights[0] / weights[1], 2.0)
+
+        del self.community.circuits[2]
+        self.strategy.update()
+        self.assertNotIn(2, self.strategy.health)
+
+    def test_select(self):
+        """
+        Test whether circuits are selected by weight, except for the selections that explore
+        """
+        self.strategy.on_ping_lost(self.circuits[0])
+        self.strategy.on_pong(self.circuits[1], 0.1)
+
+        # The weights are 0.49 and 1.0
+        self.random_values.extend([0.3, 0.5])
+        self.assertIs(self.strategy.select(None, HOPS), self.circuits[0])
+        self.random_values.extend([0.5, 0.5])
+        self.assertIs(self.strategy.select(None, HOPS), self.circuits[1])
+
+        self.random_values.append(0.0)
+        self.assertIs(self.strategy.select(None, HOPS), self.circuits[0])
+        self.assertIsNone(self.strategy.select(None, HOPS + 1))
+
+    def test_simulation(self):
+        """
+        Test whether downloads over lossy circuits are faster than when selecting circuits round robin
+        """
+        self.assertGreater(simulate(HealthAwareSelection, 300, 42), simulate(RoundRobin, 300, 42))
@@ -0,0 +1,66 @@
+import os
+
+from Tribler.Test.Community.Tunnel.benchmark_conversion import (legacy_decode_data, legacy_encode_data,
+                                                                legacy_split_encrypted_packet, legacy_swap_circuit_id)
+from Tribler.Test.Core.base_test import TriblerCoreTest
+from Tribler.community.tunnel.conversion import TunnelConversion
+
+
+class TestTunnelConversion(TriblerCoreTest):
+
+    ADDRESSES = [(("1.2.3.4", 5678), ("127.0.0.1", 1)),
+                 (("tracker.example.org", 80), ("127.0.0.1", 1)),
+                 (("1.2.3.4", 5678), ("localhost", 1))]
+
+    def setUp(self, annotate=True):
+        TriblerCoreTest.setUp(self, annotate=annotate)
+        self.cell = os.urandom(31) + "\x00\x00\x00\x2a" + os.urandom(100)
+
+    def test_swap_circuit_id(self):
+        """
+        Test whether the circuit id is replaced the same way as it used to be
+        """
+        for packet, message_type in ((self.cell, u"cell"), ("\x00\x00\x00\x2a" + "content", u"data")):
+            swapped = TunnelConversion.swap_circuit_id(packet, message_type, 42, 7)
+            self.assertEqual(swapped, legacy_swap_circuit_id(packet, message_type, 42, 7))
+            self.assertEqual(TunnelConversion.get_circuit_id(swapped, message_type), 7)
+
+    def test_split_encrypted_packet(self):
+        """
+        Test whether a packet is split at the same position as it used to be
+        """
+        for message_type in (u"cell", u"data"):
+            self.assertEqual(TunnelConversion.split_encrypted_packet(self.cell, message_type),
+                             legacy_split_encrypted_packet(self.cell, message_type))
+
+    def test_relay_header(self):
+        """
+        Test whether replacing the circuit id in the plaintext header results in the same packet as replacing it in
+        the whole packet
+        """
+        for message_type in (u"cell", u"data"):
+            plaintext, encrypted = TunnelConversion.split_encrypted_packet(self.cell, message_type)
+            circuit_id = TunnelConversion.get_circuit_id(self.cell, message_type)
+            self.assertEqual(TunnelConversion.swap_circuit_id(plaintext, message_type, circuit_id, 7) + encrypted,
+                             legacy_swap_circuit_id(self.cell, message_type, circuit_id, 7))
+
+    def test_encode_data(self):
+        """
+        Test whether data packets are encoded byte for byte the same as they used to be
+        """
+        for dest_address, org_address in self.ADDRESSES:
+            self.assertEqual(TunnelConversion.encode_data(42, dest_address, org_address, "content"),
+                             legacy_encode_data(42, dest_address, org_address, "content"))
+
+    def test_decode_data(self):
+        """
+        Test whether data packets are decoded the same as they used to be
+        """
+        for dest_address, org_address in self.ADDRESSES:
+            packet = legacy_encode_data(42, dest_address, org_address, "content")
+            self.assertEqual(TunnelConversion.decode_data(packet), (42, dest_address, org_address, "content"))
+            self.assertEqual(TunnelConversion.decode_data(packet), legacy_decode_data(packet))
+
+        # An unknown address type
+        packet = "\x00\x00\x00\x2a\x03" + "content" * 3
+        self.assertEqual(TunnelConversion.decode_data(packet), legacy_decode_data(packet))
@@ -0,0 +1,237 @@
+import os
+import socket
+
+from Tribler.Test.Core.base_test import MockObject, TriblerCoreTest
+from Tribler.community.tunnel import EXIT_NODE, ORIGINATOR
+from Tribler.community.tunnel.crypto.tunnelcrypto import TunnelCrypto
+from Tribler.community.tunnel.dataplane import (CIRCUIT_ID, DataPlane, DataPlaneWorker, FRAME_ADD_ROUTE, FRAME_EXIT,
+                                                FRAME_HEADER, FRAME_RELAY, FRAME_REMOVE_ROUTE, FRAME_SEND, FRAME_STOP,
+                                                ROUTE_EXIT, ROUTE_INFO, WORKER_SALT_EXPLICIT_OFFSET, decode_address,
+                                                encode_address, iter_frames)
+
+DATA_PREFIX = "fffffffe".decode("HEX")
+
+
+def make_frame(frame_type, circuit_id, body=''):
+    return FRAME_HEADER.pack(frame_type, circuit_id, len(body)) + body
+
+
+class TestDataPlaneWorker(TriblerCoreTest):
+
+    def setUp(self, annotate=True):
+        TriblerCoreTest.setUp(self, annotate=annotate)
+        self.crypto = object.__new__(TunnelCrypto)
+        self.session_keys = self.crypto.generate_session_keys(os.urandom(64))
+
+        self.sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sink.bind(("127.0.0.1", 0))
+        self.sink.settimeout(5)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.parent_conn, self.worker_conn = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.parent_conn.settimeout(5)
+
+        self.worker = DataPlaneWorker(self.crypto, DATA_PREFIX, self.sock, self.worker_conn)
+
+    def tearDown(self, annotate=True):
+        for sock in (self.sink, self.sock, self.parent_conn, self.worker_conn):
+            sock.close()
+        TriblerCoreTest.tearDown(self, annotate=annotate)
+
+    def add_route(self, circuit_id, next_circuit_id, direction):
+        keys = self.session_keys
+        body = ROUTE_INFO.pack(next_circuit_id, direction, socket.inet_aton("127.0.0.1"), self.sink.getsockname()[1],
+                               keys[0], keys[2], keys[1], keys[3], 10 ** 8)
+        self.assertTrue(self.worker.process_batch(make_frame(FRAME_ADD_ROUTE, circuit_id, body)))
+
+    def receive(self):
+        packet = self.sink.recv(65536)
+        self.assertTrue(packet.startswith(DATA_PREFIX))
+        packet = packet[len(DATA_PREFIX):]
+        return CIRCUIT_ID.unpack_from(packet)[0], packet[CIRCUIT_ID.size:]
+
+    def test_relay_decrypt(self):
+        """
+        Test whether a worker removes a layer of encryption from a packet coming from the originator
+        """
+        self.add_route(1, 2, EXIT_NODE)
+        encrypted = self.crypto.encrypt_str("content", self.session_keys[EXIT_NODE], self.session_keys[3], 12345678)
+        self.worker.process_batch(make_frame(FRAME_RELAY, 1, encrypted))
+
+        self.assertEqual(self.receive(), (2, "content"))
+        self.assertEqual(self.worker.stats["relayed"], 1)
+
+    def test_relay_encrypt(self):
+        """
+        Test whether a worker adds a layer of encryption to a packet going to the originator
+        """
+        self.add_route(2, 1, ORIGINATOR)
+        self.worker.process_batch(make_frame(FRAME_RELAY, 2, "content") + make_frame(FRAME_RELAY, 2, "content"))
+
+        for salt_explicit in (10 ** 8 + 1, 10 ** 8 + 2):
+            circuit_id, encrypted = self.receive()
+            self.assertEqual(circuit_id, 1)
+            self.assertEqual(self.crypto.decrypt_str(encrypted, self.session_keys[ORIGINATOR], self.session_keys[2]),
+                             "content")
+            self.assertEqual(encrypted, self.crypto.encrypt_str("content", self.session_keys[ORIGINATOR],
+                                                                self.session_keys[2], salt_explicit))
+
+    def test_relay_invalid(self):
+        """
+        Test whether a worker drops packets that it cannot decrypt or that belong to an unknown circuit
+        """
+        self.add_route(1, 2, EXIT_NODE)
+        self.worker.process_batch(make_frame(FRAME_RELAY, 1, "x" * 40) + make_frame(FRAME_RELAY, 3, "content"))
+        self.assertEqual(self.worker.stats["dropped"], 2)
+        self.assertEqual(self.worker.stats["relayed"], 0)
+
+    def test_remove_route(self):
+        """
+        Test whether a worker stops forwarding the packets of a removed circuit
+        """
+        self.add_route(2, 1, ORIGINATOR)
+        self.worker.process_batch(make_frame(FRAME_REMOVE_ROUTE, 2) + make_frame(FRAME_RELAY, 2, "content"))
+        self.assertEqual(self.worker.routes, {})
+        self.assertEqual(self.worker.stats["dropped"], 1)
+
+    def test_exit(self):
+        """
+        Test whether a worker returns the decrypted packets of an exit socket to the main process
+        """
+        self.add_route(1, 1, ROUTE_EXIT)
+        encrypted = self.crypto.encrypt_str("content", self.session_keys[EXIT_NODE], self.session_keys[3], 12345678)
+        self.worker.process_batch(make_frame(FRAME_EXIT, 1, encode_address(("1.2.3.4", 5)) + encrypted))
+
+        frames = list(iter_frames(self.parent_conn.recv(65536)))
+        self.assertEqual(len(frames), 1)
+        frame_type, circuit_id, body = frames[0]
+        self.assertEqual((frame_type, circuit_id), (FRAME_EXIT, 1))
+        self.assertEqual(decode_address(body), ("1.2.3.4", 5))
+        self.assertEqual(body[6:], "content")
+
+    def test_send(self):
+        """
+        Test whether a worker encrypts the packets of an exit socket and sends them back into the tunnel
+        """
+        self.add_route(1, 1, ROUTE_EXIT)
+        self.worker.process_batch(make_frame(FRAME_SEND, 1, "content"))
+
+        circuit_id, encrypted = self.receive()
+        self.assertEqual(circuit_id, 1)
+        self.assertEqual(self.crypto.decrypt_str(encrypted, self.session_keys[ORIGINATOR], self.session_keys[2]),
+                         "content")
+
+    def test_stop(self):
+        """
+        Test whether a worker stops at a stop frame
+        """
+        self.assertFalse(self.worker.process_batch(make_frame(FRAME_STOP, 0)))
+
+
+class FailingConnection(object):
+
+    def __init__(self):
+        self.sent = []
+        self.fail = True
+
+    def send(self, data):
+        if self.fail:
+            raise socket.error("full")
+        self.sent.append(data)
+
+    def close(self):
+        pass
+
+
+class FakeProcess(object):
+
+    def __init__(self):
+        self.alive = True
+        self.exitcode = None
+
+    def is_alive(self):
+        return self.alive
+
+
+class TestDataPlane(TriblerCoreTest):
+
+    def setUp(self, annotate=True):
+        TriblerCoreTest.setUp(self, annotate=annotate)
+        self.dataplane = DataPlane(None, DATA_PREFIX, -1, 2, lambda *args: None)
+        self.dataplane.conns = [FailingConnection(), FailingConnection()]
+        self.dataplane.batches = [[], []]
+        self.dataplane.batch_sizes = [0, 0]
+        self.dataplane.controls = [[], []]
+        self.session_keys = [os.urandom(16), os.urandom(16), os.urandom(4), os.urandom(4), 5, 1]
+
+    def tearDown(self, annotate=True):
+        if self.dataplane.flush_call and self.dataplane.flush_call.active():
+            self.dataplane.flush_call.cancel()
+        TriblerCoreTest.tearDown(self, annotate=annotate)
+
+    def test_sharding(self):
+        """
+        Test whether the frames of a circuit always go to the same worker
+        """
+        self.dataplane.add_relay(4, 7, ORIGINATOR, ("127.0.0.1", 1234), self.session_keys)
+        self.dataplane.relay(4, "content")
+        self.dataplane.relay(5, "content")
+        self.assertEqual(len(self.dataplane.batches[0]), 2)
+        self.assertEqual(len(self.dataplane.batches[1]), 1)
+        self.assertTrue(self.dataplane.has_route(4))
+
+    def test_salt_explicit_offset(self):
+        """
+        Test whether the workers encrypt using a range of salt_explicit that the main process does not use
+        """
+        self.dataplane.add_relay(5, 7, ORIGINATOR, ("127.0.0.1", 1234), self.session_keys)
+        _, _, body = next(iter_frames(self.dataplane.batches[1][0]))
+        self.assertEqual(ROUTE_INFO.unpack(body)[-1], 5 + 2 * WORKER_SALT_EXPLICIT_OFFSET)
+
+    def test_dropped_batch(self):
+        """
+        Test whether the changes to the routes are kept when a batch cannot be handed to a worker
+        """
+        self.dataplane.add_relay(4, 7, ORIGINATOR, ("127.0.0.1", 1234), self.session_keys)
+        self.dataplane.relay(4, "content")
+        self.dataplane.flush()
+        self.assertEqual(self.dataplane.stats["dropped_batches"], 1)
+
+        self.dataplane.conns[0].fail = False
+        self.dataplane.flush()
+        frames = list(iter_frames(self.dataplane.conns[0].sent[0]))
+        self.assertEqual([frame[0] for frame in frames], [FRAME_ADD_ROUTE])
+
+    def test_remove_route(self):
+        """
+        Test whether removing a route is passed on to the worker only for known routes
+        """
+        self.dataplane.remove_route(4)
+        self.assertEqual(self.dataplane.batches, [[], []])
+
+        self.dataplane.add_relay(4, 7, ORIGINATOR, ("127.0.0.1", 1234), self.session_keys)
+        self.dataplane.remove_route(4)
+        self.assertFalse(self.dataplane.has_route(4))
+        self.assertEqual(len(self.dataplane.batches[0]), 2)
+
+    def test_dead_worker(self):
+        """
+        Test whether the circuits of a dead worker are no longer handed to the data plane
+        """
+        self.dataplane.processes = [FakeProcess(), FakeProcess()]
+        self.dataplane.readers = [MockObject(), MockObject()]
+        for reader in self.dataplane.readers:
+            reader.fileno = lambda: -1
+        self.dataplane.add_relay(4, 7, ORIGINATOR, ("127.0.0.1", 1234), self.session_keys)
+        self.dataplane.add_relay(5, 7, ORIGINATOR, ("127.0.0.1", 1234), self.session_keys)
+
+        self.dataplane.processes[0].alive = False
+        self.dataplane.flush()
+        self.assertFalse(self.dataplane.can_offload(4))
+        self.assertFalse(self.dataplane.has_route(4))
+        self.assertTrue(self.dataplane.can_offload(5))
+        self.assertTrue(self.dataplane.has_route(5))
+        self.assertEqual(self.dataplane.batches[0], [])
+
+        self.dataplane.relay(4, "content")
+        self.assertEqual(self.dataplane.batches[0], [])
+        self.assertEqual(self.dataplane.get_stats()["dead_workers"], 1)
@@ -0,0 +1,192 @@
+from twisted.internet.defer import Deferred, fail, succeed
+from twisted.internet.error import ConnectionRefusedError
+from twisted.internet.task import Clock
+from twisted.names import dns
+from twisted.names.error import DNSNameError, DNSQueryTimeoutError, DNSServerError
+from twisted.python.failure import Failure
+
+from Tribler.Test.Core.base_test import TriblerCoreTest
+from Tribler.community.tunnel.dns_cache import DNSCache, FAILURE_TTL, FALLBACK_TTL, MIN_TTL, NXDOMAIN_TTL
+
+
+class FakeResolver(object):
+    """
+    Resolves hostnames on demand, so the tests decide when and how a lookup finishes.
+    """
+
+    def __init__(self):
+        self.lookups = []
+
+    def lookupAddress(self, hostname):
+        deferred = Deferred()
+        self.lookups.append((hostname, deferred))
+        return deferred
+
+    def answer(self, address, ttl, index=-1):
+        hostname, deferred = self.lookups[index]
+        record = dns.RRHeader(hostname, dns.A, dns.IN, ttl, dns.Record_A(address, ttl))
+        cname = dns.RRHeader(hostname, dns.CNAME, dns.IN, ttl, dns.Record_CNAME("alias.example.com"))
+        deferred.callback(([cname, record], [], []))
+
+    def fail(self, exception, index=-1):
+        self.lookups[index][1].errback(Failure(exception))
+
+
+class TestDNSCache(TriblerCoreTest):
+
+    def setUp(self, annotate=True):
+        TriblerCoreTest.setUp(self, annotate=annotate)
+        self.resolver = FakeResolver()
+        self.clock = Clock()
+        self.cache = DNSCache(resolver=self.resolver, clock=self.clock, fallback=self.fallback)
+        self.results = []
+        self.errors = []
+        self.fallbacks = []
+
+    def fallback(self, hostname):
+        self.fallbacks.append(hostname)
+        if hostname == "unreachable.example.com":
+            return fail(ConnectionRefusedError())
+        return succeed("5.6.7.8")
+
+    def resolve(self, hostname):
+        self.cache.resolve(hostname).addCallbacks(self.results.append, self.errors.append)
+
+    def test_literal_address(self):
+        """
+        Test whether IP addresses are returned without a lookup
+        """
+        self.resolve("1.2.3.4")
+        self.assertEqual(self.results, ["1.2.3.4"])
+        self.assertFalse(self.resolver.lookups)
+        self.assertEqual(self.cache.get_stats()["literals"], 1)
+
+    def test_cache_hit(self):
+        """
+        Test whether a resolved hostname is served from the cache until its TTL expires
+        """
+        self.resolve("tracker.example.com")
+        self.resolver.answer("1.2.3.4", 300)
+        self.resolve("tracker.example.com")
+        self.assertEqual(self.results, ["1.2.3.4", "1.2.3.4"])
+        self.assertEqual(len(self.resolver.lookups), 1)
+
+        self.clock.advance(301)
+        self.resolve("tracker.example.com")
+        self.assertEqual(len(self.resolver.lookups), 2)
+
+        stats = self.cache.get_stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 2))
+        self.assertAlmostEqual(stats["hit_rate"], 1 / 3.0)
+
+    def test_minimum_ttl(self):
+        """
+        Test whether records with a very short TTL are cached for a minimum amount of time
+        """
+        self.resolve("tracker.example.com")
+        self.resolver.answer("1.2.3.4", 0)
+        self.clock.advance(MIN_TTL - 1)
+        self.resolve("tracker.example.com")
+        self.assertEqual(len(self.resolver.lookups), 1)
+
+    def test_coalescing(self):
+        """
+        Test whether concurrent lookups of a hostname result in a single query
+        """
+        for _ in xrange(3):
+            self.resolve("tracker.example.com")
+        self.assertEqual(len(self.resolver.lookups), 1)
+        self.assertFalse(self.results)
+
+        self.resolver.answer("1.2.3.4", 300)
+        self.assertEqual(self.results, ["1.2.3.4"] * 3)
+        self.assertEqual(self.cache.get_stats()["coalesced"], 2)
+        self.assertFalse(self.cache.pending)
+
+    def test_nxdomain(self):
+        """
+        Test whether a non-existing hostname is remembered
+        """
+        self.resolve("missing.example.com")
+        self.resolve("missing.example.com")
+        self.resolver.fail(DNSNameError())
+        self.resolve("missing.example.com")
+        self.assertEqual(len(self.errors), 3)
+        self.assertEqual(len(self.resolver.lookups), 1)
+        self.assertEqual(self.cache.get_stats()["negative_hits"], 1)
+
+        self.clock.advance(NXDOMAIN_TTL)
+        self.resolve("missing.example.com")
+        self.assertEqual(len(self.resolver.lookups), 2)
+
+    def test_failure(self):
+        """
+        Test whether other failures are remembered for a shorter time
+        """
+        self.resolve("tracker.example.com")
+        self.resolver.fail(DNSServerError())
+        self.clock.advance(FAILURE_TTL - 1)
+        self.resolve("tracker.example.com")
+        self.assertEqual(len(self.resolver.lookups), 1)
+
+        self.clock.advance(1)
+        self.resolve("tracker.example.com")
+        self.assertEqual(len(self.resolver.lookups), 2)
+        self.assertEqual(len(self.errors), 2)
+
+    def test_no_address_records(self):
+        """
+        Test whether an answer without address records is treated as a failed lookup
+        """
+        self.resolve("tracker.example.com")
+        self.resolver.lookups[0][1].callback(([], [], []))
+        self.assertEqual(len(self.errors), 1)
+        self.assertEqual(self.cache.get_stats()["failures"], 1)
+
+    def test_prune_and_max_entries(self):
+        """
+        Test whether expired entries are pruned and the oldest entries are evicted when the cache is full
+        """
+        self.cache.max_entries = 2
+        for index, ttl in enumerate((100, 300, 300)):
+            self.resolve("host%d.example.com" % index)
+            self.resolver.answer("1.2.3.%d" % index, ttl)
+        self.assertEqual(self.cache.entries.keys(), ["host1.example.com", "host2.example.com"])
+
+        self.resolve("host3.example.com")
+        self.resolver.answer("1.2.3.3", 100)
+        self.clock.advance(200)
+        self.cache.prune()
+        self.assertEqual(self.cache.entries.keys(), ["host2.example.com"])
+
+    def test_fallback(self):
+        """
+        Test whether lookups that no name server answered are retried with the fallback resolver
+        """
+        self.resolve("tracker.example.com")
+        self.resolver.fail(DNSQueryTimeoutError(1))
+        self.resolve("tracker.example.com")
+        self.assertEqual(self.results, ["5.6.7.8", "5.6.7.8"])
+        self.assertEqual(self.fallbacks, ["tracker.example.com"])
+
+        self.clock.advance(FALLBACK_TTL)
+        self.resolve("tracker.example.com")
+        self.assertEqual(len(self.resolver.lookups), 2)
+
+        self.resolve("unreachable.example.com")
+        self.resolver.fail(ConnectionRefusedError())
+        self.assertEqual(len(self.errors), 1)
+        self.assertEqual(self.cache.get_stats()["fallbacks"], 2)
+
+    def test_fallback_without_resolver(self):
+        """
+        Test whether the fallback resolver is used if no DNS resolver can be created
+        """
+        def get_resolver():
+            raise ValueError("No nameservers specified")
+
+        self.cache = DNSCache(clock=self.clock, fallback=self.fallback)
+        self.cache.create_resolver = get_resolver
+        self.resolve("tracker.example.com")
+        self.assertEqual(self.results, ["5.6.7.8"])
+        self.assertTrue(self.cache.resolver_failed)
@@ -0,0 +1,122 @@
+from Tribler.Test.Core.base_test import MockObject, TriblerCoreTest
+from Tribler.community.tunnel.exit_pool import ExitSocketPool
+
+
+class TestExitSocketPool(TriblerCoreTest):
+
+    def setUp(self, annotate=True):
+        TriblerCoreTest.setUp(self, annotate=annotate)
+        self.now = 0
+        self.received = []
+        self.written = []
+        self.pool = ExitSocketPool(2, lambda *args: self.received.append(args), timeout=60, clock=lambda: self.now)
+        for index, protocol in enumerate(self.pool.protocols):
+            self.pool.ports[index] = MockObject()
+            protocol.transport = MockObject()
+            protocol.transport.write = lambda data, address, index=index: self.written.append((index, data, address))
+
+    def test_write(self):
+        """
+        Test whether circuits are spread over the sockets of the pool and keep using the same socket
+        """
+        self.assertTrue(self.pool.write(1, "a", ("1.2.3.4", 5)))
+        self.assertTrue(self.pool.write(2, "b", ("5.6.7.8", 9)))
+        self.assertTrue(self.pool.write(1, "c", ("5.6.7.8", 9)))
+        self.assertEqual(self.written, [(0, "a", ("1.2.3.4", 5)), (1, "b", ("5.6.7.8", 9)), (0, "c", ("5.6.7.8", 9))])
+
+    def test_shared_destination(self):
+        """
+        Test whether circuits never share a socket towards the same destination
+        """
+        address = ("1.2.3.4", 5)
+        self.assertEqual(self.pool.get_socket(1, address), 0)
+        self.assertEqual(self.pool.get_socket(2, address), 1)
+        self.assertIsNone(self.pool.get_socket(3, address))
+        self.assertFalse(self.pool.write(3, "a", address))
+        self.assertEqual(self.pool.get_stats()["overflows"], 2)
+
+        self.pool.release(1)
+        self.assertEqual(self.pool.get_socket(3, address), 0)
+
+    def test_shared_host(self):
+        """
+        Test whether circuits never share a socket towards the same host, even when they talk to different ports
+        """
+        self.assertEqual(self.pool.get_socket(1, ("1.2.3.4", 80)), 0)
+        self.assertEqual(self.pool.get_socket(2, ("1.2.3.4", 6969)), 1)
+        self.assertEqual(self.pool.get_socket(1, ("1.2.3.4", 6969)), 0)
+        self.assertIsNone(self.pool.get_socket(3, ("1.2.3.4", 443)))
+
+        # Replies are still routed by the port they come from
+        self.pool.protocols[0].datagramReceived("a", ("1.2.3.4", 6969))
+        self.pool.protocols[1].datagramReceived("b", ("1.2.3.4", 80))
+        self.assertEqual(self.received, [(1, "a", ("1.2.3.4", 6969))])
+
+        self.pool.release(1)
+        self.assertEqual(self.pool.hosts.keys(), [(1, "1.2.3.4")])
+        self.assertEqual(self.pool.get_socket(3, ("1.2.3.4", 443)), 0)
+
+    def test_receive(self):
+        """
+        Test whether data is handed to the circuit that the destination is mapped to, and dropped otherwise
+        """
+        self.pool.write(1, "a", ("1.2.3.4", 5))
+        self.pool.protocols[0].datagramReceived("b", ("1.2.3.4", 5))
+        self.pool.protocols[1].datagramReceived("c", ("1.2.3.4", 5))
+        self.pool.protocols[0].datagramReceived("d", ("1.2.3.4", 6))
+        self.assertEqual(self.received, [(1, "b", ("1.2.3.4", 5))])
+        self.assertEqual(self.pool.get_stats()["unmapped"], 2)
+
+    def test_prune(self):
+        """
+        Test whether mappings expire once they have not been used for a while
+        """
+        self.pool.write(1, "a", ("1.2.3.4", 5))
+        self.pool.write(1, "b", ("5.6.7.8", 9))
+        self.now = 50
+        self.pool.protocols[0].datagramReceived("c", ("1.2.3.4", 5))
+        self.now = 100
+        self.pool.prune()
+        self.assertEqual(self.pool.mappings.keys(), [(0, ("1.2.3.4", 5))])
+        self.assertEqual(self.pool.get_stats()["expired"], 1)
+
+        self.now = 200
+        self.pool.prune()
+        self.assertFalse(self.pool.mappings)
+        self.assertFalse(self.pool.circuit_mappings)
+        self.assertFalse(self.pool.hosts)
+
+    def test_release(self):
+        """
+        Test whether the mappings of a circuit are removed once its exit socket is closed
+        """
+        self.pool.write(1, "a", ("1.2.3.4", 5))
+        self.pool.write(2, "b", ("1.2.3.4", 5))
+        self.pool.release(1)
+        self.assertEqual(self.pool.mappings.keys(), [(1, ("1.2.3.4", 5))])
+        self.assertEqual(self.pool.num_circuits, [0, 1])
+
+    def test_sticky_fallback(self):
+        """
+        Test whether a circuit that fell back to a socket of its own keeps using it until the fallback expires
+        """
+        address = ("1.2.3.4", 5)
+        self.pool.write(1, "a", address)
+        self.pool.write(2, "b", address)
+        self.assertFalse(self.pool.write(3, "c", address))
+
+        self.pool.release(1)
+        self.now = 50
+        self.assertFalse(self.pool.write(3, "d", address))
+        self.assertEqual(self.pool.get_stats()["overflows"], 1)
+
+        self.now = 100
+        self.pool.touch_fallback(3, address)
+        self.now = 150
+        self.pool.prune()
+        self.assertIn((3, address), self.pool.fallbacks)
+
+        self.now = 200
+        self.pool.prune()
+        self.assertTrue(self.pool.write(3, "e", address))
+        self.assertEqual(self.written[-1], (0, "e", address))
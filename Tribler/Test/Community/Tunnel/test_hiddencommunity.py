@@ -1,5 +1,7 @@
 import time
 
+from twisted.internet.defer import Deferred
+
 from Tribler.Core.simpledefs import DLSTATUS_DOWNLOADING
 from Tribler.Test.Community.Tunnel.test_tunnel_base import AbstractTestTunnelCommunity
 from Tribler.Test.Core.base_test import MockObject
@@ -29,3 +31,25 @@ class TestHiddenCommunity(AbstractTestTunnelCommunity):
         """
         self.tunnel_community.find_download = lambda _: None
         self.tunnel_community.create_introduction_point('a' * 20)
+
+    @blocking_call_on_reactor_thread
+    def test_dht_lookup_coalesced(self):
+        """
+        Test whether concurrent DHT lookups of the same infohash share a single dht-request
+        """
+        infohash = '\00' * 20
+        lookups = []
+        key_requests = []
+
+        self.tunnel_community.settings = MockObject()
+        self.tunnel_community.settings.dht_lookup_interval = 30
+        self.tunnel_community.intro_point_cache.lookup = lambda info_hash: lookups.append(Deferred()) or lookups[-1]
+        self.tunnel_community.create_key_request = lambda info_hash, peer: key_requests.append(peer)
+
+        self.tunnel_community.do_dht_lookup(infohash)
+        self.tunnel_community.do_dht_lookup(infohash)
+        lookups[0].callback([("1.2.3.4", 5)])
+        self.tunnel_community.do_dht_lookup(infohash)
+
+        self.assertEqual(len(lookups), 1)
+        self.assertEqual(key_requests, [("1.2.3.4", 5)])
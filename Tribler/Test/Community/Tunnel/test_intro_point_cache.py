@@ -0,0 +1,114 @@
+from twisted.internet.defer import Deferred
+from twisted.internet.task import Clock
+
+from Tribler.Test.Core.base_test import TriblerCoreTest
+from Tribler.community.tunnel.intro_point_cache import IntroductionPointCache
+
+PEERS = [("1.2.3.4", 5), ("5.6.7.8", 9)]
+
+
+class TestIntroductionPointCache(TriblerCoreTest):
+
+    def setUp(self, annotate=True):
+        TriblerCoreTest.setUp(self, annotate=annotate)
+        self.clock = Clock()
+        self.lookups = []
+        self.cache = IntroductionPointCache(self.lookup, clock=self.clock, max_backoff=4)
+
+    def lookup(self, info_hash):
+        deferred = Deferred()
+        self.lookups.append(deferred)
+        return deferred
+
+    def test_hit(self):
+        """
+        Test whether introduction points are served from the cache until they are older than the interval
+        """
+        results = []
+        self.cache.get_peers("a" * 20, 30).addCallback(results.append)
+        self.lookups[0].callback(PEERS)
+        self.cache.get_peers("a" * 20, 30).addCallback(results.append)
+        self.assertEqual(results, [set(PEERS), set(PEERS)])
+        self.assertEqual(len(self.lookups), 1)
+
+        self.clock.advance(30)
+        self.cache.get_peers("a" * 20, 30)
+        self.assertEqual(len(self.lookups), 2)
+        self.assertEqual(self.cache.get_stats()["hit_rate"], 1 / 3.0)
+
+    def test_coalesce(self):
+        """
+        Test whether concurrent lookups of the same infohash wait for a single lookup
+        """
+        results = []
+        for _ in xrange(3):
+            self.cache.get_peers("a" * 20, 30).addCallback(results.append)
+        self.assertEqual(len(self.lookups), 1)
+        self.assertFalse(self.cache.needs_refresh("a" * 20, 30))
+
+        self.lookups[0].callback(PEERS)
+        self.assertEqual(results, [set(PEERS)] * 3)
+        self.assertEqual(self.cache.get_stats()["coalesced"], 2)
+
+    def test_backoff(self):
+        """
+        Test whether the refresh interval grows while the lookups return the same introduction points, and is reset
+        once they change
+        """
+        intervals = []
+        for peers in (PEERS, PEERS, PEERS, PEERS, PEERS[:1]):
+            self.cache.refresh("a" * 20)
+            self.lookups[-1].callback(peers)
+            waited = 0
+            while not self.cache.needs_refresh("a" * 20, 10):
+                self.clock.advance(10)
+                waited += 10
+            intervals.append(waited)
+        self.assertEqual(intervals, [10, 20, 40, 40, 10])
+
+    def test_failure(self):
+        """
+        Test whether failed lookups are not cached and fail every waiting lookup
+        """
+        failures = []
+        for _ in xrange(2):
+            self.cache.get_peers("a" * 20, 30).addErrback(failures.append)
+        self.lookups[0].errback(RuntimeError("dht-request timed out"))
+        self.assertEqual(len(failures), 2)
+        self.assertTrue(self.cache.needs_refresh("a" * 20, 30))
+        self.assertEqual(self.cache.get_stats()["failures"], 1)
+
+    def test_remove(self):
+        """
+        Test whether the introduction points of a removed infohash are looked up again
+        """
+        self.cache.get_peers("a" * 20, 30)
+        self.lookups[0].callback(PEERS)
+        self.cache.remove("a" * 20)
+        self.assertTrue(self.cache.needs_refresh("a" * 20, 30))
+        self.cache.get_peers("a" * 20, 30)
+        self.assertEqual(len(self.lookups), 2)
+
+    def test_merge(self):
+        """
+        Test whether the introduction points of later responses are added to the cached ones
+        """
+        results = []
+        self.cache.get_peers("a" * 20, 30)
+        self.lookups[0].callback(PEERS[:1])
+        self.cache.merge("a" * 20, set(PEERS[1:]))
+        self.cache.merge("b" * 20, set(PEERS))
+        self.cache.get_peers("a" * 20, 30).addCallback(results.append)
+        self.assertEqual(results, [set(PEERS)])
+        self.assertNotIn("b" * 20, self.cache.entries)
+        self.assertEqual(self.cache.get_stats()["merged"], 1)
+
+    def test_clear(self):
+        """
+        Test whether the lookups that are still waiting fail once the cache is cleared
+        """
+        failures = []
+        self.cache.get_peers("a" * 20, 30).addErrback(failures.append)
+        self.cache.clear()
+        self.assertEqual(len(failures), 1)
+        self.assertFalse(self.cache.pending)
@@ -1,6 +1,6 @@
 from Tribler.Test.Core.base_test import TriblerCoreTest
 from Tribler.community.tunnel.hidden_community import HiddenTunnelCommunity
-from Tribler.community.tunnel.routing import Circuit
+from Tribler.community.tunnel.routing import Circuit, CircuitRing
 
 
 class TestRouting(TriblerCoreTest):
@@ -17,3 +17,23 @@ class TestRouting(TriblerCoreTest):
         proxy.send_data = lambda *_: 0
         circuit.tunnel_data(("1.2.3.4", 1234), 'abcd')
         self.assertEqual(proxy.stats['bytes_up'], 3)
+
+    def test_circuit_ring(self):
+        """
+        Test whether a circuit ring keeps selecting circuits in turn when circuits are added or removed
+        """
+        ring = CircuitRing()
+        self.assertIsNone(ring.next())
+
+        ring.add('a')
+        ring.add('b')
+        ring.add('c')
+        ring.add('a')
+        self.assertEqual(len(ring), 3)
+        self.assertEqual([ring.next(), ring.next()], ['a', 'b'])
+
+        ring.remove('a')
+        self.assertEqual(ring.next(), 'c')
+        ring.remove('c')
+        ring.remove('d')
+        self.assertEqual([ring.next(), ring.next()], ['b', 'b'])
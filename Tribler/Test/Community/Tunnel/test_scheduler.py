@@ -0,0 +1,123 @@
+from twisted.internet.task import Clock
+
+from Tribler.Test.Core.base_test import TriblerCoreTest
+from Tribler.community.tunnel.scheduler import FairScheduler, TokenBucket
+
+
+class TestTokenBucket(TriblerCoreTest):
+
+    def test_rate(self):
+        """
+        Test whether a token bucket allows a burst and then the configured rate
+        """
+        bucket = TokenBucket(1000, 2000, 0.0)
+        self.assertEqual(bucket.get_delay(2000, 0.0), 0)
+        bucket.consume(2000)
+        self.assertAlmostEqual(bucket.get_delay(500, 0.0), 0.5)
+        self.assertEqual(bucket.get_delay(500, 0.5), 0)
+
+    def test_large_packet(self):
+        """
+        Test whether packets that are larger than the burst size are allowed once the bucket is full
+        """
+        bucket = TokenBucket(1000, 1000, 0.0)
+        self.assertEqual(bucket.get_delay(1500, 0.0), 0)
+        bucket.consume(1500)
+        self.assertAlmostEqual(bucket.get_delay(1500, 0.0), 1.5)
+
+    def test_unlimited(self):
+        """
+        Test whether a bucket without a rate never holds packets back
+        """
+        bucket = TokenBucket(0, 0, 0.0)
+        bucket.consume(10 ** 9)
+        self.assertEqual(bucket.get_delay(10 ** 9, 0.0), 0)
+
+
+class TestFairScheduler(TriblerCoreTest):
+
+    def setUp(self, annotate=True):
+        TriblerCoreTest.setUp(self, annotate=annotate)
+        self.clock = Clock()
+        self.sent = []
+
+    def create_scheduler(self, **kwargs):
+        return FairScheduler(quantum=1000, clock=self.clock, **kwargs)
+
+    def send(self, scheduler, circuit_id, num_packets, num_bytes=1000):
+        for _ in xrange(num_packets):
+            scheduler.send(circuit_id, num_bytes, self.sent.append, circuit_id)
+
+    def test_unlimited(self):
+        """
+        Test whether packets are forwarded right away without rate limits
+        """
+        scheduler = self.create_scheduler()
+        self.send(scheduler, 1, 100)
+        self.assertEqual(len(self.sent), 100)
+        self.assertFalse(self.clock.getDelayedCalls())
+
+    def test_fair_share(self):
+        """
+        Test whether circuits that are held back by the node limit share it equally, and a circuit that was idle gets
+        its packet through before the backlog of a bulk transfer
+        """
+        scheduler = self.create_scheduler(node_rate=10000, node_burst_size=1000)
+        self.send(scheduler, 1, 50)
+        self.send(scheduler, 2, 50)
+        self.clock.pump([0.01] * 200)
+        self.assertAlmostEqual(len(self.sent), 21, delta=1)
+        # The first packet of circuit 1 was sent right away
+        self.assertLessEqual(abs(self.sent[1:].count(1) - self.sent[1:].count(2)), 1)
+
+        del self.sent[:]
+        self.send(scheduler, 3, 1, 100)
+        self.clock.pump([0.1] * 2)
+        self.assertEqual(self.sent[0], 3)
+
+    def test_circuit_limit(self):
+        """
+        Test whether a circuit is limited to its own rate, without holding back other circuits
+        """
+        scheduler = self.create_scheduler(circuit_rate=1000, circuit_burst_size=1000)
+        self.send(scheduler, 1, 5)
+        self.send(scheduler, 2, 1)
+        self.assertEqual(self.sent, [1, 2])
+
+        self.clock.pump([1.0] * 2)
+        self.assertEqual(self.sent, [1, 2, 1, 1])
+
+    def test_drop(self):
+        """
+        Test whether packets are dropped when the queue of a circuit is full
+        """
+        scheduler = self.create_scheduler(circuit_rate=1000, circuit_burst_size=1000, max_queued_bytes=2000)
+        self.send(scheduler, 1, 4)
+        self.assertEqual(scheduler.get_stats()["dropped"], 1)
+        self.assertEqual(scheduler.get_stats()["queued_bytes"], 2000)
+
+        self.assertFalse(scheduler.send(1, 1000, self.sent.append, 1))
+        self.assertEqual(scheduler.queues[1].dropped, 2)
+
+    def test_remove(self):
+        """
+        Test whether the queued packets of a removed circuit are dropped
+        """
+        scheduler = self.create_scheduler(node_rate=1000, node_burst_size=1000)
+        self.send(scheduler, 1, 3)
+        self.send(scheduler, 2, 1)
+        scheduler.remove(1)
+        self.clock.pump([1.0] * 3)
+        self.assertEqual(self.sent, [1, 2])
+        self.assertEqual(scheduler.get_stats()["dropped"], 2)
+        self.assertEqual(scheduler.get_stats()["backlogged_circuits"], 0)
+
+    def test_stop(self):
+        """
+        Test whether stopping the scheduler cancels the pending forwarding
+        """
+        scheduler = self.create_scheduler(node_rate=1000, node_burst_size=1000)
+        self.send(scheduler, 1, 3)
+        scheduler.stop()
+        self.assertFalse(self.clock.getDelayedCalls())
+        self.assertFalse(scheduler.has_backlog)
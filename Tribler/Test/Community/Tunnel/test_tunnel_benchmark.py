@@ -0,0 +1,37 @@
+from twisted.internet.defer import inlineCallbacks
+
+from Tribler.Test.Community.Tunnel.benchmark_tunnel import TunnelBenchmark
+from Tribler.Test.test_as_server import AbstractServer
+from Tribler.Test.twisted_thread import deferred
+from Tribler.dispersy.util import blocking_call_on_reactor_thread
+
+
+class TestTunnelBenchmark(AbstractServer):
+    """
+    Makes sure that the tunnel benchmark keeps working, with a workload that is too small to measure anything.
+    """
+
+    @blocking_call_on_reactor_thread
+    @inlineCallbacks
+    def setUp(self, annotate=True):
+        yield super(TestTunnelBenchmark, self).setUp(annotate=annotate)
+        self.benchmark = TunnelBenchmark()
+        yield self.benchmark.start()
+
+    @blocking_call_on_reactor_thread
+    @inlineCallbacks
+    def tearDown(self, annotate=True):
+        yield self.benchmark.stop()
+        yield super(TestTunnelBenchmark, self).tearDown(annotate=annotate)
+
+    @deferred(timeout=60)
+    @inlineCallbacks
+    def test_run_workload(self):
+        """
+        Testing whether datagrams are echoed through circuits of one and three hops
+        """
+        for hops in (1, 3):
+            result = yield self.benchmark.run_workload(hops, 100, 512)
+            self.assertEqual(result.hops, hops)
+            self.assertGreater(result.packets, 0)
+            self.assertGreater(result.mbit_per_second, 0)
@@ -2,12 +2,15 @@ import time
 from twisted.internet.defer import inlineCallbacks, returnValue
 
 from Tribler.Test.Community.Tunnel.test_tunnel_base import AbstractTestTunnelCommunity
+from Tribler.Test.Core.base_test import MockObject
 from Tribler.Test.twisted_thread import deferred
+from Tribler.community.tunnel import CIRCUIT_ROTATION_GRACE
 from Tribler.community.tunnel.conversion import TunnelConversion
 from Tribler.community.tunnel.crypto.tunnelcrypto import CryptoException, TunnelCrypto
 from Tribler.community.tunnel.routing import Circuit, Hop, RelayRoute
+from Tribler.community.tunnel.scheduler import FairScheduler
 from Tribler.community.tunnel.tunnel_community import (TunnelSettings, TunnelExitSocket, CircuitRequestCache,
-                                                       PingRequestCache)
+                                                       PingRequestCache, RoundRobin)
 from Tribler.dispersy.candidate import Candidate
 from Tribler.dispersy.message import DropMessage
 from Tribler.dispersy.util import blocking_call_on_reactor_thread
@@ -27,6 +30,90 @@ class TestTunnelCommunity(AbstractTestTunnelCommunity):
         circuit_request_cache.on_timeout()
         self.assertNotIn(42, self.tunnel_community.circuits)
 
+    @blocking_call_on_reactor_thread
+    def test_select_circuit(self):
+        """
+        Test whether the ready data circuits are selected in turn and no longer selected once removed
+        """
+        circuits = [Circuit(long(circuit_id), 1) for circuit_id in xrange(1, 4)]
+        for circuit in circuits:
+            circuit.add_hop(Hop())
+            self.tunnel_community.circuits[circuit.circuit_id] = circuit
+            self.tunnel_community.add_active_circuit(circuit)
+
+        strategy = RoundRobin(self.tunnel_community)
+        self.assertTrue(strategy.has_options(1))
+        self.assertFalse(strategy.has_options(2))
+        self.assertIsNone(strategy.select(None, 2))
+        self.assertEqual([strategy.select(None, 1) for _ in xrange(4)], circuits + circuits[:1])
+
+        self.tunnel_community.remove_circuit(2)
+        self.assertEqual([strategy.select(None, 1) for _ in xrange(2)], [circuits[2], circuits[0]])
+
+    def add_ready_circuits(self, num_circuits, hops=1):
+        circuits = []
+        for circuit_id in xrange(1, num_circuits + 1):
+            circuit = Circuit(long(circuit_id), hops, first_hop=("1.2.3.4", 5))
+            for _ in xrange(hops):
+                circuit.add_hop(Hop())
+            self.tunnel_community.circuits[circuit.circuit_id] = circuit
+            self.tunnel_community.add_active_circuit(circuit)
+            circuits.append(circuit)
+        return circuits
+
+    @blocking_call_on_reactor_thread
+    def test_rotate_circuit(self):
+        """
+        Test whether a circuit that is about to expire stops being selected and is removed after a grace period
+        """
+        self.tunnel_community.settings = TunnelSettings()
+        self.tunnel_community.send_destroy = lambda *_: None
+        circuits = self.add_ready_circuits(2)
+        circuits[0].creation_time = time.time() - self.tunnel_community.settings.max_time + 30
+
+        self.tunnel_community.do_rotate()
+        self.assertIsNotNone(self.tunnel_community.rotating_circuits[1])
+        self.assertEqual(self.tunnel_community.circuit_rings[1].circuits, [circuits[1]])
+        self.assertIn(1, self.tunnel_community.circuits)
+
+        self.tunnel_community.rotating_circuits[1] -= CIRCUIT_ROTATION_GRACE + 1
+        moved = []
+        self.tunnel_community.move_circuit_traffic = moved.append
+        self.tunnel_community.do_rotate()
+        self.assertNotIn(1, self.tunnel_community.circuits)
+        self.assertNotIn(1, self.tunnel_community.rotating_circuits)
+        self.assertEqual(moved, [])
+
+    @blocking_call_on_reactor_thread
+    def test_rotate_circuit_no_replacement(self):
+        """
+        Test whether a circuit that is about to expire keeps being used until a replacement is ready
+        """
+        self.tunnel_community.settings = TunnelSettings()
+        circuit = self.add_ready_circuits(1)[0]
+        circuit.bytes_down = self.tunnel_community.settings.max_traffic
+
+        self.tunnel_community.do_rotate()
+        self.assertIsNone(self.tunnel_community.rotating_circuits[1])
+        self.assertEqual(self.tunnel_community.circuit_rings[1].circuits, [circuit])
+
+    @blocking_call_on_reactor_thread
+    def test_time_to_first_byte(self):
+        """
+        Test whether the time to the first tunneled byte is only measured if no data has been arriving recently
+        """
+        self.tunnel_community.settings = TunnelSettings()
+        circuit = self.add_ready_circuits(1)[0]
+
+        self.tunnel_community.tunnels_ready(1)
+        self.assertIn(1, self.tunnel_community.first_byte_pending)
+        self.tunnel_community.on_tunneled_data(circuit)
+        self.assertNotIn(1, self.tunnel_community.first_byte_pending)
+        self.assertIn(1, self.tunnel_community.last_tunneled_byte)
+
+        self.tunnel_community.tunnels_ready(1)
+        self.assertNotIn(1, self.tunnel_community.first_byte_pending)
+
     @blocking_call_on_reactor_thread
     def test_ping_request_cache(self):
         circuit = Circuit(42L)
@@ -91,6 +178,33 @@ class TestTunnelCommunity(AbstractTestTunnelCommunity):
         for i in self.tunnel_community.check_destroy([msg1]):
             self.assertIsInstance(i, type(msg1))
 
+    @blocking_call_on_reactor_thread
+    def test_exit_data_rate_limit(self):
+        """
+        Test whether the data of an exit socket is held back by the rate limit of its circuit, and dropped when the
+        exit socket goes away
+        """
+        self.tunnel_community.settings = TunnelSettings()
+        self.tunnel_community.settings.become_exitnode = True
+        self.tunnel_community.scheduler = FairScheduler(circuit_rate=1000, circuit_burst_size=1000)
+        sent = []
+        exit_socket = MockObject()
+        exit_socket.enabled = True
+        exit_socket.sendto = lambda data, destination: sent.append(data)
+        self.tunnel_community.exit_sockets[42] = exit_socket
+
+        for data in ("a" * 1000, "b" * 1000):
+            self.tunnel_community.exit_data(42, ("127.0.0.1", 1234), ("1.2.3.4", 5), data)
+        self.assertEqual(sent, ["a" * 1000])
+        self.assertEqual(self.tunnel_community.scheduler.get_stats()["queued_bytes"], 1000)
+
+        del self.tunnel_community.exit_sockets[42]
+        self.tunnel_community.scheduler.process()
+        self.tunnel_community.scheduler.queues[42].bucket.tokens = 1000
+        self.tunnel_community.scheduler.process()
+        self.assertEqual(sent, ["a" * 1000])
+        self.tunnel_community.scheduler.stop()
+
     @deferred(timeout=5)
     @inlineCallbacks
     def test_send_to_destination_ip(self):
@@ -0,0 +1,54 @@
+import os
+
+from cryptography.exceptions import InvalidTag
+
+from Tribler.Test.Community.Tunnel.benchmark_tunnelcrypto import legacy_decrypt_str, legacy_encrypt_str
+from Tribler.Test.Core.base_test import TriblerCoreTest
+from Tribler.community.tunnel.crypto.cryptowrapper import AESGCM
+from Tribler.community.tunnel.crypto.tunnelcrypto import SessionKey, TunnelCrypto
+
+
+class TestTunnelCrypto(TriblerCoreTest):
+
+    def setUp(self, annotate=True):
+        TriblerCoreTest.setUp(self, annotate=annotate)
+        self.crypto = object.__new__(TunnelCrypto)
+        self.session_keys = self.crypto.generate_session_keys(os.urandom(64))
+        self.key, self.salt = self.session_keys[0], self.session_keys[2]
+
+    def test_session_keys(self):
+        """
+        Test whether the session keys keep their AES-GCM context
+        """
+        self.assertIsInstance(self.key, SessionKey)
+        self.crypto.encrypt_str("content", self.key, self.salt, 123456)
+        if AESGCM:
+            aead = self.key.aead
+            self.assertIsNotNone(aead)
+            self.crypto.encrypt_str("content", self.key, self.salt, 123457)
+            self.assertIs(self.key.aead, aead)
+
+    def test_wire_compatibility(self):
+        """
+        Test whether the encrypted content can be exchanged with the cipher that is set up for every packet
+        """
+        for salt_explicit in (12345678, 2 ** 40):
+            encrypted = self.crypto.encrypt_str("content", self.key, self.salt, salt_explicit)
+            self.assertEqual(encrypted, legacy_encrypt_str("content", self.key, self.salt, salt_explicit))
+            self.assertEqual(legacy_decrypt_str(encrypted, self.key, self.salt), "content")
+            self.assertEqual(self.crypto.decrypt_str(encrypted, self.key, self.salt), "content")
+
+    def test_plain_key(self):
+        """
+        Test whether keys that are not session keys can be used as well
+        """
+        encrypted = self.crypto.encrypt_str("content", str(self.key), self.salt, 123456)
+        self.assertEqual(self.crypto.decrypt_str(encrypted, str(self.key), self.salt), "content")
+
+    def test_invalid_tag(self):
+        """
+        Test whether tampered content is refused
+        """
+        encrypted = self.crypto.encrypt_str("content", self.key, self.salt, 123456)
+        self.assertRaises(InvalidTag, self.crypto.decrypt_str, encrypted[:-1] + chr(ord(encrypted[-1]) ^ 1),
+                          self.key, self.salt)
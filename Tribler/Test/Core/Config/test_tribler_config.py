@@ -156,6 +156,12 @@ class TestTriblerConfig(TriblerCoreTest):
         self.assertEqual(self.tribler_config.get_http_api_enabled(), True)
         self.tribler_config.set_http_api_port(True)
         self.assertEqual(self.tribler_config.get_http_api_port(), True)
+        self.tribler_config.set_http_api_events_queue_size(42)
+        self.assertEqual(self.tribler_config.get_http_api_events_queue_size(), 42)
+        self.tribler_config.set_http_api_events_overflow_policy("drop_newest")
+        self.assertEqual(self.tribler_config.get_http_api_events_overflow_policy(), "drop_newest")
+        self.tribler_config.set_http_api_profile_reactor(True)
+        self.assertTrue(self.tribler_config.get_http_api_profile_reactor())
 
     def test_get_set_methods_dispersy(self):
         """
@@ -223,6 +229,8 @@ class TestTriblerConfig(TriblerCoreTest):
         self.assertEqual(self.tribler_config.get_tunnel_community_socks5_listen_ports(), [5])
         self.tribler_config.set_tunnel_community_exitnode_enabled(True)
         self.assertEqual(self.tribler_config.get_tunnel_community_exitnode_enabled(), True)
+        self.tribler_config.set_tunnel_community_warm_pool_size(2)
+        self.assertEqual(self.tribler_config.get_tunnel_community_warm_pool_size(), 2)
         self.tribler_config.set_default_number_hops(True)
         self.assertEqual(self.tribler_config.get_default_number_hops(), True)
         self.tribler_config.set_default_anonymity_enabled(True)
@@ -1,6 +1,5 @@
-import binascii
 import os
-from twisted.internet.defer import Deferred
+from twisted.internet.defer import Deferred, succeed
 
 import libtorrent as lt
 
@@ -9,7 +8,7 @@ from Tribler.Core.Libtorrent.LibtorrentDownloadImpl import LibtorrentDownloadImp
 from Tribler.Core.TorrentDef import TorrentDef
 from Tribler.Core.Utilities.configparser import CallbackConfigParser
 from Tribler.Core.Utilities.torrent_utils import get_info_from_handle
-from Tribler.Core.simpledefs import DLSTATUS_DOWNLOADING, DLMODE_VOD
+from Tribler.Core.simpledefs import DLSTATUS_DOWNLOADING, DLSTATUS_STOPPED, DLMODE_VOD
 from Tribler.Test.Core.base_test import TriblerCoreTest, MockObject
 from Tribler.Test.common import TESTS_DATA_DIR
 from Tribler.Test.test_as_server import TestAsServer
@@ -135,7 +134,7 @@ class TestLibtorrentDownloadImpl(TestAsServer):
         impl = LibtorrentDownloadImpl(self.session, tdef)
         # Override the add_torrent because it will be called
         impl.ltmgr = MockObject()
-        impl.ltmgr.add_torrent = lambda _, _dummy2: fake_handler
+        impl.ltmgr.add_torrent = lambda _, _dummy2: succeed(fake_handler)
         impl.set_selected_files = lambda: None
         fake_handler = MockObject()
         fake_handler.is_valid = lambda: True
@@ -168,11 +167,7 @@ class TestLibtorrentDownloadImpl(TestAsServer):
             """
             check if resume data is ready
             """
-            basename = binascii.hexlify(tdef.get_infohash()) + '.state'
-            filename = os.path.join(self.session.get_downloads_pstate_dir(), basename)
-
-            engine_data = CallbackConfigParser()
-            engine_data.read_file(filename)
+            engine_data = self.session.lm.checkpoint_manager.load_pstate(tdef.get_infohash())
 
             self.assertEqual(tdef.get_infohash(), engine_data.get('state', 'engineresumedata').get('info-hash'))
 
@@ -206,6 +201,7 @@ class TestLibtorrentDownloadImplNoSession(TriblerCoreTest):
         map_file_result.piece = 123
         torrent_info.map_file = lambda _dummy1, _dummy2, _dummy3: map_file_result
         torrent_info.num_pieces = lambda: 5
+        torrent_info.piece_length = lambda: 250
 
         mock_handle.is_valid = lambda: True
         mock_handle.status = lambda: mock_status
@@ -213,6 +209,9 @@ class TestLibtorrentDownloadImplNoSession(TriblerCoreTest):
         mock_handle.set_sequential_download = lambda _: None
         mock_handle.set_priority = lambda _: None
         mock_handle.prioritize_pieces = lambda _: None
+        mock_handle.set_piece_deadline = lambda *_: None
+        mock_handle.reset_piece_deadline = lambda _: None
+        mock_handle.clear_piece_deadlines = lambda: None
 
         self.libtorrent_download_impl.handle = mock_handle
 
@@ -223,6 +222,7 @@ class TestLibtorrentDownloadImplNoSession(TriblerCoreTest):
 
     def tearDown(self, annotate=True):
         self.libtorrent_download_impl.cancel_all_pending_tasks()
+        self.libtorrent_download_impl.stop_vod_scheduler()
         super(TestLibtorrentDownloadImplNoSession, self).tearDown(annotate=annotate)
 
     def test_selected_files(self):
@@ -557,6 +557,25 @@ class TestLibtorrentDownloadImplNoSession(TriblerCoreTest):
                 has_priorities_task = True
         self.assertTrue(has_priorities_task)
 
+    def test_wait_for_pieces_change(self):
+        """
+        Testing whether a reader waiting for pieces is woken up by a piece_finished_alert
+        """
+        generation = self.libtorrent_download_impl.get_pieces_generation()
+        alert = MockObject()
+        alert.piece_index = 1
+        reactor.callFromThread(self.libtorrent_download_impl.on_piece_finished_alert, alert)
+        self.libtorrent_download_impl.wait_for_pieces_change(generation)
+        self.assertEqual(self.libtorrent_download_impl.get_pieces_generation(), generation + 1)
+
+    def test_wait_for_pieces_change_stopped(self):
+        """
+        Testing whether a reader waiting for pieces stops waiting once the download has stopped
+        """
+        generation = self.libtorrent_download_impl.get_pieces_generation()
+        self.libtorrent_download_impl.dlstate = DLSTATUS_STOPPED
+        self.assertFalse(self.libtorrent_download_impl.wait_for_pieces_change(generation, timeout=0.01))
+
     def test_get_pieces_bitmask(self):
         """
         Testing whether a correct pieces bitmask is returned when requested
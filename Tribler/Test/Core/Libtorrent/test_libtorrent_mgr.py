@@ -2,7 +2,7 @@ import os
 import shutil
 import tempfile
 from libtorrent import bencode
-from twisted.internet.defer import inlineCallbacks, Deferred
+from twisted.internet.defer import CancelledError, inlineCallbacks, Deferred
 
 from Tribler.Core.CacheDB.Notifier import Notifier
 from Tribler.Core.Libtorrent.LibtorrentMgr import LibtorrentMgr
@@ -170,9 +170,109 @@ class TestLibtorrentMgr(AbstractServer):
 
         infohash = MockObject()
         infohash.info_hash = lambda: 'a' * 20
-        self.assertEqual(self.ltmgr.add_torrent(None, {'ti': infohash}), mock_handle)
+        self.ltmgr.add_torrent(None, {'ti': infohash}).addCallback(self.assertEqual, mock_handle)
         self.assertRaises(DuplicateDownloadException, self.ltmgr.add_torrent, None, {'ti': infohash})
 
+    @deferred(timeout=10)
+    def test_async_add_torrent(self):
+        """
+        Testing whether a torrent that is added asynchronously is registered when the add_torrent_alert arrives
+        """
+        mock_handle = MockObject()
+        mock_handle.info_hash = lambda: 'a' * 20
+        mock_handle.is_valid = lambda: True
+
+        mock_error = MockObject()
+        mock_error.value = lambda: 0
+
+        mock_alert = type('add_torrent_alert', (object,), dict(handle=mock_handle, error=mock_error))()
+
+        mock_ltsession = MockObject()
+        mock_ltsession.async_add_torrent = lambda _: None
+        mock_ltsession.stop_upnp = lambda: None
+        mock_ltsession.save_state = lambda: None
+
+        self.ltmgr.get_session = lambda *_: mock_ltsession
+        self.ltmgr.metadata_tmpdir = tempfile.mkdtemp(suffix=u'tribler_metainfo_tmpdir')
+
+        infohash = MockObject()
+        infohash.info_hash = lambda: 'a' * 20
+
+        def on_added(handle):
+            self.assertEqual(handle, mock_handle)
+            self.assertIn('a' * 20, self.ltmgr.torrents)
+            self.assertFalse(self.ltmgr.pending_torrents)
+
+        add_deferred = self.ltmgr.add_torrent(None, {'ti': infohash}).addCallback(on_added)
+        self.assertIn('a' * 20, self.ltmgr.pending_torrents)
+        self.assertRaises(DuplicateDownloadException, self.ltmgr.add_torrent, None, {'ti': infohash})
+
+        self.ltmgr.process_alert(mock_alert)
+        return add_deferred
+
+    @deferred(timeout=10)
+    def test_remove_pending_torrent(self):
+        """
+        Testing whether a torrent that is removed while it is being added is removed once the add_torrent_alert arrives
+        """
+        mock_handle = MockObject()
+        mock_handle.info_hash = lambda: 'a' * 20
+        mock_handle.is_valid = lambda: True
+
+        mock_error = MockObject()
+        mock_error.value = lambda: 0
+
+        mock_alert = type('add_torrent_alert', (object,), dict(handle=mock_handle, error=mock_error))()
+
+        removed = []
+        mock_ltsession = MockObject()
+        mock_ltsession.async_add_torrent = lambda _: None
+        mock_ltsession.remove_torrent = lambda handle, flags: removed.append((handle, flags))
+        mock_ltsession.stop_upnp = lambda: None
+        mock_ltsession.save_state = lambda: None
+
+        self.ltmgr.get_session = lambda *_: mock_ltsession
+        self.ltmgr.metadata_tmpdir = tempfile.mkdtemp(suffix=u'tribler_metainfo_tmpdir')
+
+        infohash = MockObject()
+        infohash.info_hash = lambda: 'a' * 20
+        mock_download = MockObject()
+        mock_download.handle = None
+
+        def on_cancelled(failure):
+            failure.trap(CancelledError)
+            self.assertNotIn('a' * 20, self.ltmgr.pending_torrents)
+            self.ltmgr.process_alert(mock_alert)
+            self.assertEqual(removed, [(mock_handle, 1)])
+            self.assertFalse(self.ltmgr.removed_torrents)
+            self.assertNotIn('a' * 20, self.ltmgr.torrents)
+
+        add_deferred = self.ltmgr.add_torrent(mock_download, {'ti': infohash}).addCallbacks(self.fail, on_cancelled)
+        self.ltmgr.remove_torrent(mock_download, removecontent=True)
+        return add_deferred
+
+    @deferred(timeout=10)
+    def test_shutdown_pending_torrent(self):
+        """
+        Testing whether the torrents that are still being added fail on shutdown
+        """
+        mock_ltsession = MockObject()
+        mock_ltsession.async_add_torrent = lambda _: None
+        mock_ltsession.stop_upnp = lambda: None
+        mock_ltsession.save_state = lambda: None
+
+        self.ltmgr.get_session = lambda *_: mock_ltsession
+        self.ltmgr.metadata_tmpdir = tempfile.mkdtemp(suffix=u'tribler_metainfo_tmpdir')
+
+        infohash = MockObject()
+        infohash.info_hash = lambda: 'a' * 20
+        add_deferred = self.ltmgr.add_torrent(None, {'ti': infohash})
+
+        self.ltmgr.shutdown()
+        # The manager has already been shut down when the test is torn down
+        self.ltmgr.shutdown = lambda: None
+        return add_deferred.addCallbacks(self.fail, lambda failure: failure.trap(CancelledError))
+
     def test_start_download_corrupt(self):
         """
         Testing whether starting the download of a corrupt torrent file raises an exception
@@ -0,0 +1,135 @@
+from Tribler.Core.Libtorrent import StreamingScheduler as streaming_module
+from Tribler.Core.Libtorrent.StreamingScheduler import StreamingScheduler
+from Tribler.Test.Core.base_test import TriblerCoreTest, MockObject
+
+
+class TestStreamingScheduler(TriblerCoreTest):
+    """
+    This class contains tests for the deadline based VOD scheduler.
+    """
+
+    def setUp(self, annotate=True):
+        TriblerCoreTest.setUp(self, annotate=annotate)
+
+        # Scenario: we stream a file of 20 pieces, 100 bytes in each piece.
+        self.deadlines = {}
+        self.status = MockObject()
+        self.status.pieces = [False] * 20
+        self.status.download_payload_rate = 100
+
+        torrent_info = MockObject()
+        torrent_info.piece_length = lambda: 100
+
+        def map_file(_, offset, __):
+            result = MockObject()
+            result.piece = offset / 100
+            return result
+        torrent_info.map_file = map_file
+
+        handle = MockObject()
+        handle.is_valid = lambda: True
+        handle.status = lambda: self.status
+        handle.get_torrent_info = lambda: torrent_info
+        handle.set_piece_deadline = lambda piece, deadline: self.deadlines.__setitem__(piece, deadline)
+        handle.reset_piece_deadline = lambda piece: self.deadlines.pop(piece)
+        handle.clear_piece_deadlines = self.deadlines.clear
+
+        download = MockObject()
+        download.handle = handle
+
+        self.old_initial_rate = streaming_module.STREAMING_INITIAL_RATE
+        streaming_module.STREAMING_INITIAL_RATE = 100
+        self.scheduler = StreamingScheduler(download, 0, 2000, tail_size=100)
+
+    def tearDown(self, annotate=True):
+        self.scheduler.stop()
+        streaming_module.STREAMING_INITIAL_RATE = self.old_initial_rate
+        super(TestStreamingScheduler, self).tearDown(annotate=annotate)
+
+    def test_start(self):
+        """
+        Testing whether the window ahead of the read position and the tail of the file get a deadline
+        """
+        self.status.pieces[1] = True
+        self.scheduler.start()
+
+        self.assertEqual(self.scheduler.get_window_size(), 11)
+        self.assertEqual(sorted(self.deadlines.keys()), [0] + range(2, 11) + [19])
+        self.assertLess(self.deadlines[0], self.deadlines[2])
+
+    def test_window_size(self):
+        """
+        Testing whether the window size follows the download rate
+        """
+        self.scheduler.download_rate = 0
+        self.assertEqual(self.scheduler.get_window_size(), streaming_module.STREAMING_MIN_WINDOW)
+        self.scheduler.download_rate = 10 ** 9
+        self.assertEqual(self.scheduler.get_window_size(), streaming_module.STREAMING_MAX_WINDOW)
+
+    def test_set_position(self):
+        """
+        Testing whether the window slides forward when the player reads
+        """
+        self.scheduler.start()
+        self.scheduler.set_position(550)
+
+        self.assertEqual(self.scheduler.position, 5)
+        self.assertNotIn(4, self.deadlines)
+        self.assertIn(15, self.deadlines)
+
+    def test_seek(self):
+        """
+        Testing whether a seek outside of the window clears the outstanding deadlines
+        """
+        self.scheduler.start()
+        self.scheduler.seek(1500)
+
+        self.assertEqual(self.scheduler.seek_count, 1)
+        self.assertEqual(sorted(self.deadlines.keys()), range(15, 20))
+
+        self.status.pieces[15] = True
+        self.scheduler.update()
+        self.assertIsNotNone(self.scheduler.seek_latency)
+        self.assertNotIn(15, self.scheduler.deadlines)
+
+    def test_deadline_misses(self):
+        """
+        Testing whether missed deadlines are counted once
+        """
+        self.scheduler.start()
+        self.scheduler.deadlines[0] = 0
+        self.scheduler.update()
+        self.scheduler.update()
+        self.assertEqual(self.scheduler.get_stats()['deadline_misses'], 1)
+
+    def test_rebuffering(self):
+        """
+        Testing whether stalls of the player are counted
+        """
+        self.scheduler.on_stall()
+        self.scheduler.on_stall()
+        self.scheduler.on_resume()
+        self.scheduler.on_resume()
+        self.assertEqual(self.scheduler.get_stats()['rebuffer_count'], 1)
+        self.assertGreaterEqual(self.scheduler.get_stats()['rebuffer_time'], 0)
+
+    def test_request_range(self):
+        """
+        Testing whether the pieces the player waits for get the shortest deadline
+        """
+        self.scheduler.start()
+        self.scheduler.request_range(1250, 300)
+        self.assertEqual(self.deadlines[12], 0)
+        self.assertEqual(self.deadlines[15], 0)
+        self.assertNotIn(16, self.deadlines)
+
+    def test_on_piece_finished(self):
+        """
+        Testing whether finished pieces are removed from the window and complete a pending seek
+        """
+        self.scheduler.start()
+        self.scheduler.seek(1500)
+        self.status.pieces[15] = True
+        self.scheduler.on_piece_finished(15)
+        self.assertNotIn(15, self.scheduler.deadlines)
+        self.assertIsNotNone(self.scheduler.seek_latency)
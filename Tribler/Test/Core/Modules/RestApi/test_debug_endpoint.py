@@ -1,6 +1,7 @@
 import json
 from twisted.internet.defer import inlineCallbacks
 
+from Tribler.Core.Utilities.memory import cache_registry, MemorySnapshots
 from Tribler.Test.Core.Modules.RestApi.base_api_test import AbstractApiTest
 from Tribler.Test.Core.base_test import MockObject
 from Tribler.Test.twisted_thread import deferred
@@ -69,3 +70,160 @@ class TestCircuitDebugEndpoint(AbstractApiTest):
 
         self.should_check_equality = False
         return self.do_request('debug/circuits', expected_code=200).addCallback(verify_response)
+
+
+class TestVideoServerDebugEndpoint(AbstractApiTest):
+
+    @deferred(timeout=10)
+    def test_get_stats_disabled(self):
+        """
+        Testing whether the API returns error 404 if the video server is disabled
+        """
+        return self.do_request('debug/videoserver', expected_code=404)
+
+    @deferred(timeout=10)
+    def test_get_stats(self):
+        """
+        Testing whether the API returns the statistics of the video server
+        """
+        video_server = MockObject()
+        video_server.get_stats = lambda: {'active_sessions': 1, 'total_sessions': 2, 'bytes_sent': 3,
+                                          'throughput': 4.0}
+        video_server.shutdown_server = lambda: None
+        self.session.lm.video_server = video_server
+
+        expected_json = {'videoserver': {'active_sessions': 1, 'total_sessions': 2, 'bytes_sent': 3,
+                                         'throughput': 4.0}}
+        return self.do_request('debug/videoserver', expected_code=200, expected_json=expected_json)
+
+
+class TestEventsDebugEndpoint(AbstractApiTest):
+
+    @deferred(timeout=10)
+    def test_get_stats(self):
+        """
+        Testing whether the API returns the statistics of the events endpoint
+        """
+        def verify_response(response):
+            response_json = json.loads(response)
+            self.assertEqual(response_json['events']['clients'], 0)
+            self.assertEqual(response_json['events']['events_dropped'], {})
+
+        self.should_check_equality = False
+        return self.do_request('debug/events', expected_code=200).addCallback(verify_response)
+
+
+class TestRESTDebugEndpoint(AbstractApiTest):
+
+    @deferred(timeout=10)
+    def test_get_stats(self):
+        """
+        Testing whether the API returns the statistics of the heavy REST endpoints
+        """
+        self.session.lm.api_manager.worker_pool.get_stats = lambda: {'SearchEndpoint': {'pending': 1, 'rejected': 2}}
+        expected_json = {'rest': {'SearchEndpoint': {'pending': 1, 'rejected': 2}}}
+        return self.do_request('debug/rest', expected_code=200, expected_json=expected_json)
+
+
+class TestReactorDebugEndpoint(AbstractApiTest):
+
+    @deferred(timeout=10)
+    def test_get_report(self):
+        """
+        Testing whether the API returns the report of the reactor lag monitor
+        """
+        def verify_response(response):
+            response_json = json.loads(response)
+            self.assertIn('max_lag', response_json['reactor'])
+            self.assertIn('callables', response_json['reactor'])
+
+        self.should_check_equality = False
+        return self.do_request('debug/reactor', expected_code=200).addCallback(verify_response)
+
+    @deferred(timeout=10)
+    def test_get_report_disabled(self):
+        """
+        Testing whether the API returns error 404 if the reactor lag monitor is not running
+        """
+        self.session.lm.lag_monitor.stop()
+        self.session.lm.lag_monitor = None
+        return self.do_request('debug/reactor', expected_code=404)
+
+
+class TestMemoryDebugEndpoint(AbstractApiTest):
+
+    @deferred(timeout=10)
+    def test_get_memory(self):
+        """
+        Testing whether the API returns the object counts and the sizes of the registered caches
+        """
+        cache_owner = MockObject()
+        cache_owner.cache = [1, 2, 3]
+        cache_registry.register("test.cache", cache_owner, "cache")
+
+        def verify_response(response):
+            response_json = json.loads(response)
+            cache_registry.unregister("test.cache")
+            self.assertEqual(response_json['memory']['caches']['test.cache'], 3)
+            self.assertTrue(response_json['memory']['objects'])
+            self.assertEqual(response_json['memory']['tracemalloc'], MemorySnapshots.has_tracemalloc())
+
+        self.should_check_equality = False
+        return self.do_request('debug/memory', expected_code=200).addCallback(verify_response)
+
+    @deferred(timeout=10)
+    def test_get_snapshots(self):
+        """
+        Testing whether the API returns an empty list if no snapshots have been taken
+        """
+        return self.do_request('debug/memory/snapshots', expected_code=200, expected_json={'snapshots': []})
+
+    @deferred(timeout=10)
+    def test_compare_snapshots(self):
+        """
+        Testing whether two snapshots can be taken and compared, with or without tracemalloc
+        """
+        cache_owner = MockObject()
+        cache_owner.cache = [1, 2, 3]
+        cache_registry.register("test.cache", cache_owner, "cache")
+
+        def take_second_snapshot(_):
+            cache_owner.cache.append(4)
+            return self.do_request('debug/memory/snapshots', expected_code=200, request_type='PUT')
+
+        def verify_statistics(response):
+            cache_registry.unregister("test.cache")
+            statistics = json.loads(response)['statistics']
+            self.assertEqual(statistics['caches']['test.cache'], {'size': 4, 'size_diff': 1})
+            self.assertTrue(all('count_diff' in item for item in statistics['objects']))
+            self.assertEqual('allocations' in statistics, MemorySnapshots.has_tracemalloc())
+
+        self.should_check_equality = False
+        return self.do_request('debug/memory/snapshots', expected_code=200, request_type='PUT')\
+            .addCallback(take_second_snapshot)\
+            .addCallback(lambda _: self.do_request('debug/memory/snapshots/2?compare_to=1', expected_code=200))\
+            .addCallback(verify_statistics)
+
+    @deferred(timeout=10)
+    def test_get_unknown_snapshot(self):
+        """
+        Testing whether the API returns error 404 if a snapshot does not exist
+        """
+        self.should_check_equality = False
+        return self.do_request('debug/memory/snapshots/42', expected_code=404)
+
+    @deferred(timeout=10)
+    def test_get_snapshot_invalid_id(self):
+        """
+        Testing whether the API returns error 400 if the identifier of a snapshot is not a number
+        """
+        self.should_check_equality = False
+        return self.do_request('debug/memory/snapshots/abc', expected_code=400)
+
+    @deferred(timeout=10)
+    def test_delete_snapshots(self):
+        """
+        Testing whether the snapshots can be removed
+        """
+        return self.do_request('debug/memory/snapshots', expected_code=200, expected_json={'removed': True},
+                               request_type='DELETE')
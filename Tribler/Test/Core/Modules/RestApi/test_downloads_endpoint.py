@@ -4,8 +4,11 @@ from binascii import hexlify
 from urllib import pathname2url
 
 from Tribler.Core.DownloadConfig import DownloadStartupConfig
+from Tribler.Core.Modules.restapi.downloads_endpoint import DownloadsEndpoint
 from Tribler.Core.Utilities.network_utils import get_random_port
+from Tribler.Core.simpledefs import DLMODE_NORMAL, DLSTATUS_SEEDING, DLSTATUS_STOPPED
 from Tribler.Test.Core.Modules.RestApi.base_api_test import AbstractApiTest
+from Tribler.Test.Core.base_test import MockObject, TriblerCoreTest
 from Tribler.Test.common import UBUNTU_1504_INFOHASH, TESTS_DATA_DIR
 from Tribler.Test.twisted_thread import deferred
 
@@ -41,6 +44,65 @@ class TestDownloadsEndpoint(AbstractApiTest):
         self.should_check_equality = False
         return self.do_request('downloads?get_peers=1&get_pieces=1', expected_code=200).addCallback(verify_download)
 
+    @deferred(timeout=20)
+    def test_get_downloads_projection_pagination(self):
+        """
+        Testing whether the API only returns the requested fields of a page of sorted downloads
+        """
+        def verify_download(downloads):
+            downloads_json = json.loads(downloads)
+            self.assertEqual(downloads_json['total'], 2)
+            self.assertEqual(len(downloads_json['downloads']), 1)
+            self.assertEqual(set(downloads_json['downloads'][0].keys()), {"infohash", "name", "progress"})
+            names = [download.get_def().get_name() for download in self.session.get_downloads()]
+            self.assertEqual(downloads_json['downloads'][0]['name'], min(names))
+
+        video_tdef, _ = self.create_local_torrent(os.path.join(TESTS_DATA_DIR, 'video.avi'))
+        self.session.start_download_from_tdef(video_tdef, DownloadStartupConfig())
+        self.session.start_download_from_uri("file:" + pathname2url(
+            os.path.join(TESTS_DATA_DIR, "bak_single.torrent")))
+
+        self.should_check_equality = False
+        return self.do_request('downloads?fields=name,progress&sort_by=name&sort_asc=1&limit=1', expected_code=200)\
+            .addCallback(verify_download)
+
+    @deferred(timeout=20)
+    def test_get_downloads_since(self):
+        """
+        Testing whether the API returns the changed downloads since a version
+        """
+        def verify_full(downloads):
+            downloads_json = json.loads(downloads)
+            self.assertTrue(downloads_json['full'])
+            self.assertEqual(len(downloads_json['downloads']), 1)
+            self.assertEqual(downloads_json['downloads'][0]['version'], downloads_json['version'])
+
+            self.session.remove_download(self.session.get_downloads()[0])
+            return self.do_request('downloads?since=%d' % downloads_json['version'], expected_code=200)
+
+        def verify_removed(downloads):
+            downloads_json = json.loads(downloads)
+            self.assertFalse(downloads_json['full'])
+            self.assertEqual(downloads_json['downloads'], [])
+            self.assertEqual(downloads_json['removed'], [hexlify(video_tdef.get_infohash())])
+
+        video_tdef, _ = self.create_local_torrent(os.path.join(TESTS_DATA_DIR, 'video.avi'))
+        self.session.start_download_from_tdef(video_tdef, DownloadStartupConfig())
+
+        self.should_check_equality = False
+        return self.do_request('downloads?since=0', expected_code=200).addCallback(verify_full)\
+            .addCallback(verify_removed)
+
+    @deferred(timeout=10)
+    def test_get_downloads_bad_params(self):
+        """
+        Testing whether the API returns error 400 when unknown fields or invalid parameters are requested
+        """
+        self.should_check_equality = False
+        return self.do_request('downloads?fields=name,foo', expected_code=400)\
+            .addCallback(lambda _: self.do_request('downloads?sort_by=files', expected_code=400))\
+            .addCallback(lambda _: self.do_request('downloads?since=abc', expected_code=400))
+
     @deferred(timeout=10)
     def test_start_download_no_uri(self):
         """
@@ -331,3 +393,70 @@ class TestDownloadsDispersyEndpoint(AbstractApiTest):
 
         return self.do_request('downloads/%s' % infohash, post_data={'anon_hops': 1},
                                expected_code=200, expected_json={'modified': True}, request_type='PATCH')
+
+
+class TestDownloadsEndpointSummaries(TriblerCoreTest):
+
+    def setUp(self, annotate=True):
+        TriblerCoreTest.setUp(self, annotate=annotate)
+        self.num_states = 0
+        self.download = MockObject()
+        self.download.status = DLSTATUS_SEEDING
+        mock_def = MockObject()
+        mock_def.get_infohash = lambda: "a" * 20
+        mock_def.get_name = lambda: "test"
+        mock_def.get_length = lambda: 1000
+        self.download.get_def = lambda: mock_def
+        self.download.get_status = lambda: self.download.status
+        self.download.get_progress = lambda: 1.0
+        self.download.get_current_speed = lambda _: 0.0
+        self.download.get_hops = lambda: 0
+        self.download.get_safe_seeding = lambda: False
+        self.download.get_anon_mode = lambda: False
+        self.download.get_mode = lambda: DLMODE_NORMAL
+        self.download.get_dest_dir = lambda: "/tmp"
+        self.download.get_selected_files = lambda: []
+        self.download.get_num_pieces = lambda: 1
+        self.download.get_time_added = lambda: 0
+        self.download.network_create_statistics_reponse = lambda: None
+        self.download.network_tracker_status = lambda: {}
+        self.download.network_calc_eta = lambda: 0
+        self.download.network_get_state = self.get_state
+
+        session = MockObject()
+        session.get_downloads = lambda: [self.download]
+        session.config = MockObject()
+        session.config.get_libtorrent_max_upload_rate = lambda: 0
+        session.config.get_libtorrent_max_download_rate = lambda: 0
+        self.endpoint = DownloadsEndpoint(session)
+
+    def get_state(self, *_):
+        self.num_states += 1
+        state = MockObject()
+        state.get_availability = lambda: 1.0
+        state.get_vod_prebuffering_progress = lambda: 0.0
+        state.get_vod_prebuffering_progress_consec = lambda: 0.0
+        state.get_error = lambda: None
+        return state
+
+    def get_downloads(self, since):
+        request = MockObject()
+        request.args = {'since': [str(since)], 'fields': ['name,status']}
+        return json.loads(self.endpoint.render_GET(request))
+
+    def test_skip_unchanged(self):
+        """
+        Testing whether the state of a download that looks unchanged is not fetched again
+        """
+        version = self.get_downloads(0)['version']
+        self.assertEqual(self.get_downloads(version)['downloads'], [])
+        self.assertEqual(self.num_states, 1)
+
+        self.download.status = DLSTATUS_STOPPED
+        downloads = self.get_downloads(version)['downloads']
+        self.assertEqual(downloads[0]['status'], "DLSTATUS_STOPPED")
+        self.assertEqual(self.num_states, 2)
+
+        self.endpoint.download_keys[hexlify("a" * 20)] = (self.endpoint.get_download_key(self.download), 0)
+        self.get_downloads(version)
+        self.assertEqual(self.num_states, 3)
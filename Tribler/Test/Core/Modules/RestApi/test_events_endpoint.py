@@ -11,9 +11,11 @@ from Tribler.Core.simpledefs import SIGNAL_CHANNEL, SIGNAL_ON_SEARCH_RESULTS, SI
     NTFY_STARTED, NTFY_FINISHED, NTFY_UPGRADER_TICK, NTFY_WATCH_FOLDER_CORRUPT_TORRENT, NTFY_INSERT, NTFY_NEW_VERSION, \
     NTFY_CHANNEL, NTFY_DISCOVERED, NTFY_TORRENT, NTFY_ERROR, NTFY_DELETE, NTFY_MARKET_ON_ASK, NTFY_UPDATE, \
     NTFY_MARKET_ON_BID, NTFY_MARKET_ON_ASK_TIMEOUT, NTFY_MARKET_ON_BID_TIMEOUT, NTFY_MARKET_ON_TRANSACTION_COMPLETE, \
-    NTFY_MARKET_ON_PAYMENT_RECEIVED, NTFY_MARKET_ON_PAYMENT_SENT
+    NTFY_MARKET_ON_PAYMENT_RECEIVED, NTFY_MARKET_ON_PAYMENT_SENT, NTFY_STARTUP_TICK
+from Tribler.Core.Modules.restapi.events_endpoint import EventsClient, OVERFLOW_DROP_NEWEST, OVERFLOW_DROP_OLDEST
 from Tribler.Core.version import version_id
 from Tribler.Test.Core.Modules.RestApi.base_api_test import AbstractApiTest
+from Tribler.Test.Core.base_test import MockObject, TriblerCoreTest
 from Tribler.Test.twisted_thread import deferred
 from Tribler.dispersy.util import blocking_call_on_reactor_thread
 
@@ -24,6 +26,7 @@ class EventDataProtocol(Protocol):
     """
     def __init__(self, messages_to_wait_for, finished, response):
         self.json_buffer = []
+        self.data_buffer = ""
         self._logger = logging.getLogger(self.__class__.__name__)
         self.messages_to_wait_for = messages_to_wait_for + 1  # The first event message is always events_start
         self.finished = finished
@@ -31,10 +34,14 @@ class EventDataProtocol(Protocol):
 
     def dataReceived(self, data):
         self._logger.info("Received data: %s" % data)
-        self.json_buffer.append(json.loads(data))
-        self.messages_to_wait_for -= 1
-        if self.messages_to_wait_for == 0:
-            self.response.loseConnection()
+        # Several events can arrive in a single chunk, each of them is terminated by a newline
+        self.data_buffer += data
+        while '\n' in self.data_buffer:
+            message, self.data_buffer = self.data_buffer.split('\n', 1)
+            self.json_buffer.append(json.loads(message))
+            self.messages_to_wait_for -= 1
+            if self.messages_to_wait_for == 0:
+                self.response.loseConnection()
 
     def connectionLost(self, reason="done"):
         self.finished.callback(self.json_buffer[1:])
@@ -99,7 +106,7 @@ class TestEventsEndpoint(AbstractApiTest):
         """
         Testing whether various events are coming through the events endpoints
         """
-        self.messages_to_wait_for = 20
+        self.messages_to_wait_for = 21
 
         def send_notifications(_):
             self.session.lm.api_manager.root_endpoint.events_endpoint.start_new_query()
@@ -123,6 +130,7 @@ class TestEventsEndpoint(AbstractApiTest):
             self.session.notifier.notify(NTFY_MARKET_ON_TRANSACTION_COMPLETE, NTFY_UPDATE, None, {'a': 'b'})
             self.session.notifier.notify(NTFY_MARKET_ON_PAYMENT_RECEIVED, NTFY_UPDATE, None, {'a': 'b'})
             self.session.notifier.notify(NTFY_MARKET_ON_PAYMENT_SENT, NTFY_UPDATE, None, {'a': 'b'})
+            self.session.notifier.notify(NTFY_STARTUP_TICK, NTFY_UPDATE, None, {'resumed': 1, 'total': 2})
             self.session.lm.api_manager.root_endpoint.events_endpoint.on_tribler_exception("hi")
 
         self.socket_open_deferred.addCallback(send_notifications)
@@ -154,3 +162,87 @@ class TestEventsEndpoint(AbstractApiTest):
         self.socket_open_deferred.addCallback(send_searches)
 
         return self.events_deferred
+
+
+class TestEventsClient(TriblerCoreTest):
+    """
+    This class contains tests for the queue of a single client of the events endpoint.
+    """
+
+    def setUp(self, annotate=True):
+        TriblerCoreTest.setUp(self, annotate=annotate)
+        self.written = []
+        self.dropped = []
+
+        self.endpoint = MockObject()
+        self.endpoint.events_sent = 0
+        self.endpoint.events_coalesced = 0
+        self.endpoint.on_event_dropped = self.dropped.append
+
+    def create_client(self, overflow_policy):
+        request = MockObject()
+        request.write = self.written.append
+        return EventsClient(self.endpoint, request, 2, overflow_policy)
+
+    def test_write_batch(self):
+        """
+        Testing whether a batch of events is written at once
+        """
+        client = self.create_client(OVERFLOW_DROP_OLDEST)
+        client.enqueue([("a", "1\n"), ("b", "2\n")])
+        self.assertEqual(self.written, ["1\n2\n"])
+        self.assertEqual(self.endpoint.events_sent, 2)
+
+    def test_drop_oldest(self):
+        """
+        Testing whether the oldest high-rate events are dropped when a paused client's queue is full
+        """
+        client = self.create_client(OVERFLOW_DROP_OLDEST)
+        client.pauseProducing()
+        client.enqueue([("channel_discovered", "1\n"), ("torrent_discovered", "2\n"), ("torrent_discovered", "3\n")])
+        self.assertEqual(self.dropped, ["channel_discovered"])
+        self.assertEqual(self.written, [])
+
+        client.resumeProducing()
+        self.assertEqual(self.written, ["2\n3\n"])
+
+    def test_drop_newest(self):
+        """
+        Testing whether new high-rate events are dropped when a paused client's queue is full
+        """
+        client = self.create_client(OVERFLOW_DROP_NEWEST)
+        client.pauseProducing()
+        client.enqueue([("channel_discovered", "1\n"), ("torrent_discovered", "2\n"), ("torrent_discovered", "3\n")])
+        self.assertEqual(self.dropped, ["torrent_discovered"])
+
+        client.resumeProducing()
+        self.assertEqual(self.written, ["1\n2\n"])
+
+    def test_control_event_overflow(self):
+        """
+        Testing whether control events are never dropped, even when the queue overflows with high-rate events
+        """
+        for overflow_policy in (OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST):
+            self.written = []
+            client = self.create_client(overflow_policy)
+            client.pauseProducing()
+            client.enqueue([("tribler_started", "0\n")])
+            client.enqueue([("torrent_discovered", "%d\n" % index) for index in xrange(1, 4)])
+            client.enqueue([("torrent_finished", "4\n")])
+            self.assertEqual(len(client.queue), 4)
+
+            client.resumeProducing()
+            self.assertTrue(self.written[0].startswith("0\n"))
+            self.assertTrue(self.written[0].endswith("4\n"))
+
+    def test_coalesce(self):
+        """
+        Testing whether queued progress events are replaced by newer ones
+        """
+        client = self.create_client(OVERFLOW_DROP_OLDEST)
+        client.pauseProducing()
+        client.enqueue([("upgrader_tick", "1\n"), ("upgrader_tick", "2\n")])
+        self.assertEqual(self.endpoint.events_coalesced, 1)
+
+        client.resumeProducing()
+        self.assertEqual(self.written, ["2\n"])
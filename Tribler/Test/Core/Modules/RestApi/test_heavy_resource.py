@@ -0,0 +1,83 @@
+from threading import current_thread
+
+from twisted.internet.defer import inlineCallbacks, Deferred
+
+from Tribler.Core.Modules.restapi.heavy_resource import HeavyResource, RESTWorkerPool, REST_REQUEST_SECONDS
+from Tribler.Test.Core.base_test import MockObject, TriblerCoreTest
+from Tribler.Test.twisted_thread import deferred
+
+
+class TestRESTWorkerPool(TriblerCoreTest):
+    """
+    This class contains tests for the pool of threads that renders heavy REST requests.
+    """
+
+    def setUp(self, annotate=True):
+        TriblerCoreTest.setUp(self, annotate=annotate)
+        self.worker_pool = RESTWorkerPool(num_threads=2)
+        self.worker_pool.start()
+
+    @inlineCallbacks
+    def tearDown(self, annotate=True):
+        yield self.worker_pool.stop()
+        yield super(TestRESTWorkerPool, self).tearDown(annotate=annotate)
+
+    @deferred(timeout=10)
+    @inlineCallbacks
+    def test_run(self):
+        """
+        Testing whether a call is executed in a worker thread and its latency is recorded
+        """
+        reactor_thread = current_thread()
+        count = REST_REQUEST_SECONDS.labels("test_run").count
+        worker_thread = yield self.worker_pool.run("test_run", 1, 1, current_thread)
+        self.assertNotEqual(worker_thread, reactor_thread)
+        self.assertEqual(REST_REQUEST_SECONDS.labels("test_run").count, count + 1)
+
+        stats = self.worker_pool.get_stats()
+        self.assertEqual(stats["test_run"]["pending"], 0)
+        self.assertEqual(stats["test_run"]["latency"]["count"], count + 1)
+        self.assertEqual(stats["test_run"]["latency"]["buckets"][-1], ("+Inf", count + 1))
+
+    @deferred(timeout=10)
+    def test_reject(self):
+        """
+        Testing whether calls are rejected when too many are waiting for the endpoint
+        """
+        block = self.worker_pool.get_semaphore("test", 1)
+        block.acquire()
+
+        self.assertIsInstance(self.worker_pool.run("test", 1, 1, lambda: None), Deferred)
+        self.assertIsNone(self.worker_pool.run("test", 1, 1, lambda: None))
+        self.assertEqual(self.worker_pool.get_stats()["test"]["rejected"], 1)
+
+        block.release()
+        return self.worker_pool.run("test", 1, 1, lambda: None)
+
+    @deferred(timeout=10)
+    def test_render_in_worker(self):
+        """
+        Testing whether a heavy resource encodes in a worker thread and writes the body on the reactor thread
+        """
+        reactor_thread = current_thread()
+        heavy_resource = HeavyResource()
+        heavy_resource.session = MockObject()
+        heavy_resource.session.lm = MockObject()
+        heavy_resource.session.lm.api_manager = MockObject()
+        heavy_resource.session.lm.api_manager.worker_pool = self.worker_pool
+
+        written = Deferred()
+        request = MockObject()
+        request.notifyFinish = Deferred
+        request.write_body = lambda body: written.callback((body, current_thread()))
+
+        def encode():
+            return "worker" if current_thread() != reactor_thread else "reactor"
+
+        def verify_body(result):
+            body, writing_thread = result
+            self.assertEqual(body, "worker")
+            self.assertEqual(writing_thread, reactor_thread)
+
+        heavy_resource.render_in_worker(request, encode)
+        return written.addCallback(verify_body)
@@ -0,0 +1,17 @@
+from Tribler.Test.Core.Modules.RestApi.base_api_test import AbstractApiTest
+from Tribler.Test.twisted_thread import deferred
+
+
+class TestMetricsEndpoint(AbstractApiTest):
+
+    @deferred(timeout=10)
+    def test_get_metrics(self):
+        """
+        Testing whether the API returns the metrics in the text exposition format
+        """
+        def verify_response(response):
+            self.assertIn("# TYPE tribler_reactor_lag_seconds gauge\n", response)
+            self.assertIn("# TYPE tribler_db_statement_seconds histogram\n", response)
+
+        self.should_check_equality = False
+        return self.do_request('metrics', expected_code=200).addCallback(verify_response)
@@ -1,7 +1,13 @@
 import json
+import zlib
+
+from twisted.internet.defer import inlineCallbacks
+from twisted.web.client import Agent, readBody
+from twisted.web.http_headers import Headers
 
 from Tribler.Core.exceptions import TriblerException
-from Tribler.Test.twisted_thread import deferred
+from Tribler.Core.version import version_id
+from Tribler.Test.twisted_thread import deferred, reactor
 from base_api_test import AbstractApiTest
 
 
@@ -36,3 +42,48 @@ class RestRequestTest(AbstractApiTest):
         self.should_check_equality = False
         return self.do_request('channels/discovered', expected_code=500, expected_json=None, request_type='PUT',
                                post_data=post_data).addCallback(verify_error_message)
+
+
+class RestResponseTest(AbstractApiTest):
+    """
+    This class contains tests for the compression and entity tags of the responses of the REST API.
+    """
+
+    def request_settings(self, headers):
+        headers['User-Agent'] = ['Tribler ' + version_id]
+        agent = Agent(reactor, pool=self.connection_pool)
+        return agent.request('GET', 'http://localhost:%s/settings' % self.session.config.get_http_api_port(),
+                             Headers(headers))
+
+    @deferred(timeout=10)
+    @inlineCallbacks
+    def test_gzip(self):
+        """
+        Testing whether large responses are compressed for clients that accept gzip
+        """
+        response = yield self.request_settings({'Accept-Encoding': ['gzip']})
+        self.assertEqual(response.headers.getRawHeaders('Content-Encoding'), ['gzip'])
+        body = yield readBody(response)
+        self.assertIn('settings', json.loads(zlib.decompress(body, 16 + zlib.MAX_WBITS)))
+
+        response = yield self.request_settings({})
+        self.assertIsNone(response.headers.getRawHeaders('Content-Encoding'))
+        body = yield readBody(response)
+        self.assertIn('settings', json.loads(body))
+
+    @deferred(timeout=10)
+    @inlineCallbacks
+    def test_not_modified(self):
+        """
+        Testing whether the API answers 304 Not Modified if the client has the latest version of a response
+        """
+        response = yield self.request_settings({})
+        yield readBody(response)
+        etag = response.headers.getRawHeaders('ETag')[0]
+
+        response = yield self.request_settings({'If-None-Match': [etag]})
+        self.assertEqual(response.code, 304)
+
+        response = yield self.request_settings({'If-None-Match': ['"outdated"']})
+        self.assertEqual(response.code, 200)
+        yield readBody(response)
@@ -0,0 +1,216 @@
+import os
+
+from twisted.internet.defer import fail, succeed
+
+from Tribler.Core.Modules.checkpoint_manager import (CheckpointManager, pstate_from_string,
+                                                     pstate_summary_from_string, pstate_to_string)
+from Tribler.Core.Utilities.configparser import CallbackConfigParser
+from Tribler.Test.Core.base_test import TriblerCoreTest, MockObject
+from Tribler.Test.twisted_thread import deferred
+
+
+class TestCheckpointManager(TriblerCoreTest):
+    """
+    This class contains tests for the incremental download checkpointing.
+    """
+
+    def setUp(self, annotate=True):
+        TriblerCoreTest.setUp(self, annotate=annotate)
+        self.pstate_dir = os.path.join(self.session_base_dir, u"dlcheckpoints")
+        os.mkdir(self.pstate_dir)
+
+        self.session = MockObject()
+        self.session.config = MockObject()
+        self.session.config.get_state_dir = lambda: self.session_base_dir
+        self.session.get_downloads_pstate_dir = lambda: self.pstate_dir
+        self.session.lm = MockObject()
+        self.session.lm.downloads = {}
+
+        self.checkpoint_manager = None
+
+    def tearDown(self, annotate=True):
+        if self.checkpoint_manager:
+            self.checkpoint_manager.shutdown()
+        TriblerCoreTest.tearDown(self, annotate=annotate)
+
+    def start_checkpoint_manager(self):
+        self.checkpoint_manager = CheckpointManager(self.session)
+        self.checkpoint_manager.initialize()
+
+    @staticmethod
+    def create_pstate(name):
+        pstate = CallbackConfigParser()
+        pstate.add_section('state')
+        pstate.set('state', 'metainfo', {'infohash': 'a' * 20, 'name': name})
+        pstate.set('state', 'engineresumedata', None)
+        return pstate
+
+    def create_download(self, infohash, dirty, has_handle=True):
+        download = MockObject()
+        download.needs_checkpoint = lambda: dirty and has_handle
+        download.can_checkpoint = lambda: has_handle
+
+        def checkpoint():
+            download.checkpointed = True
+            self.checkpoint_manager.save_pstate(infohash, self.create_pstate(u"test"))
+            return succeed(None)
+
+        download.checkpointed = False
+        download.checkpoint = checkpoint
+        self.session.lm.downloads[infohash] = download
+        return download
+
+    def test_pstate_serialization(self):
+        """
+        Testing whether a pstate survives a round trip through the store format
+        """
+        pstate = pstate_from_string(pstate_to_string(self.create_pstate(u"\u4f60\u597d")))
+        self.assertEqual(pstate.get('state', 'metainfo')['name'], u"\u4f60\u597d")
+        self.assertIsNone(pstate.get('state', 'engineresumedata'))
+
+    def test_pstate_summary(self):
+        """
+        Testing whether a pstate summary only holds the options that decide the resume order
+        """
+        pstate = self.create_pstate(u"test")
+        pstate.add_section('download_defaults')
+        pstate.set('download_defaults', 'time_added', 42)
+        pstate.set('state', 'dlstate', {'progress': 0.5})
+        summary = pstate_summary_from_string(pstate_to_string(pstate))
+        self.assertEqual(summary.get('download_defaults', 'time_added'), 42)
+        self.assertEqual(summary.get('state', 'dlstate'), {'progress': 0.5})
+        self.assertIsNone(summary.get('state', 'metainfo'))
+
+    def test_migrate_state_files(self):
+        """
+        Testing whether legacy .state files are moved into the store on first start
+        """
+        filename = os.path.join(self.pstate_dir, ('a' * 20).encode('hex') + '.state')
+        self.create_pstate(u"test").write_file(filename)
+        with open(os.path.join(self.pstate_dir, 'invalid.state'), 'wb') as state_file:
+            state_file.write("hi")
+
+        self.start_checkpoint_manager()
+
+        self.assertFalse(os.path.exists(filename))
+        self.assertTrue(os.path.exists(os.path.join(self.pstate_dir, 'invalid.state')))
+        self.assertEqual(self.checkpoint_manager.load_pstate('a' * 20).get('state', 'metainfo')['name'], u"test")
+
+    def test_save_remove_pstate(self):
+        """
+        Testing whether a pstate can be saved, loaded and removed again
+        """
+        self.start_checkpoint_manager()
+        self.checkpoint_manager.save_pstate('a' * 20, self.create_pstate(u"test"))
+        self.assertTrue(self.checkpoint_manager.has_pstate('a' * 20))
+        self.assertEqual([infohash for infohash, _ in self.checkpoint_manager.get_pstates()], ['a' * 20])
+
+        self.checkpoint_manager.remove_pstate('a' * 20)
+        self.assertFalse(self.checkpoint_manager.has_pstate('a' * 20))
+        self.assertIsNone(self.checkpoint_manager.load_pstate('a' * 20))
+
+    def test_get_pstates_invalid(self):
+        """
+        Testing whether an invalid pstate in the store is returned as None
+        """
+        self.start_checkpoint_manager()
+        self.checkpoint_manager.store['b' * 20] = "[state\nnot a pstate"
+        self.assertEqual(list(self.checkpoint_manager.get_pstates()), [('b' * 20, None)])
+
+    @deferred(timeout=10)
+    def test_checkpoint_only_dirty(self):
+        """
+        Testing whether only the dirty downloads are checkpointed
+        """
+        self.start_checkpoint_manager()
+        dirty_download = self.create_download('a' * 20, True)
+        clean_download = self.create_download('b' * 20, False)
+
+        def verify(_):
+            self.assertTrue(dirty_download.checkpointed)
+            self.assertFalse(clean_download.checkpointed)
+            self.assertFalse(self.checkpoint_manager.dirty)
+            self.assertFalse(self.checkpoint_manager.store._pending_torrents)
+            self.assertTrue(self.checkpoint_manager.has_pstate('a' * 20))
+
+        return self.checkpoint_manager.checkpoint_dirty().addCallback(verify)
+
+    @deferred(timeout=10)
+    def test_checkpoint_rolling(self):
+        """
+        Testing whether a checkpoint round only handles a limited number of dirty downloads
+        """
+        self.start_checkpoint_manager()
+        self.checkpoint_manager.batch_size = 2
+        downloads = [self.create_download(chr(ord('a') + ind) * 20, False) for ind in xrange(3)]
+        for infohash in self.session.lm.downloads.iterkeys():
+            self.checkpoint_manager.mark_dirty(infohash)
+
+        def verify(_):
+            self.assertEqual(len([download for download in downloads if download.checkpointed]), 2)
+            self.assertEqual(len(self.checkpoint_manager.dirty), 1)
+
+        return self.checkpoint_manager.checkpoint_dirty().addCallback(verify)
+
+    @deferred(timeout=10)
+    def test_checkpoint_all_dirty(self):
+        """
+        Testing whether all dirty downloads are checkpointed during shutdown
+        """
+        self.start_checkpoint_manager()
+        self.checkpoint_manager.batch_size = 2
+        downloads = [self.create_download(chr(ord('a') + ind) * 20, True) for ind in xrange(3)]
+
+        def verify(_):
+            self.assertTrue(all(download.checkpointed for download in downloads))
+            self.assertFalse(self.checkpoint_manager.dirty)
+
+        return self.checkpoint_manager.checkpoint_all_dirty().addCallback(verify)
+
+    @deferred(timeout=10)
+    def test_checkpoint_failed(self):
+        """
+        Testing whether a download stays dirty when its checkpoint fails
+        """
+        self.start_checkpoint_manager()
+        download = self.create_download('a' * 20, True)
+        download.checkpoint = lambda: fail(RuntimeError("no resume data"))
+
+        def verify(_):
+            self.assertTrue(self.checkpoint_manager.is_dirty('a' * 20))
+
+        return self.checkpoint_manager.checkpoint_dirty().addCallback(verify)
+
+    @deferred(timeout=10)
+    def test_checkpoint_no_handle(self):
+        """
+        Testing whether downloads without a handle are skipped and stay dirty
+        """
+        self.start_checkpoint_manager()
+        download = self.create_download('a' * 20, True, has_handle=False)
+        self.checkpoint_manager.mark_dirty('a' * 20)
+
+        def verify(_):
+            self.assertFalse(download.checkpointed)
+            self.assertTrue(self.checkpoint_manager.is_dirty('a' * 20))
+
+        return self.checkpoint_manager.checkpoint_dirty().addCallback(verify)
+
+    @deferred(timeout=10)
+    def test_checkpoint_dirty_again(self):
+        """
+        Testing whether a download that changes while it is checkpointed stays dirty
+        """
+        self.start_checkpoint_manager()
+        download = self.create_download('a' * 20, False)
+        self.checkpoint_manager.mark_dirty('a' * 20)
+
+        def checkpoint():
+            self.checkpoint_manager.mark_dirty('a' * 20)
+            return succeed(None)
+        download.checkpoint = checkpoint
+
+        def verify(_):
+            self.assertTrue(self.checkpoint_manager.is_dirty('a' * 20))
+
+        return self.checkpoint_manager.checkpoint_dirty().addCallback(verify)
@@ -0,0 +1,48 @@
+from Tribler.Core.Modules.metrics_collector import SessionMetricsCollector
+from Tribler.Test.Core.base_test import TriblerCoreTest, MockObject
+
+
+class TestSessionMetricsCollector(TriblerCoreTest):
+    """
+    This class contains tests for the collector of the metrics of a session.
+    """
+
+    def setUp(self, annotate=True):
+        TriblerCoreTest.setUp(self, annotate=annotate)
+        status = MockObject()
+        for name in ("total_upload", "total_download", "total_payload_upload", "total_payload_download",
+                     "upload_rate", "download_rate", "payload_upload_rate", "payload_download_rate", "num_peers",
+                     "dht_nodes"):
+            setattr(status, name, 7)
+        ltsession = MockObject()
+        ltsession.status = lambda: status
+
+        store = MockObject()
+        store.get_disk_usage = lambda: 1024
+
+        self.session = MockObject()
+        self.session.get_dispersy_instance = lambda: None
+        self.session.lm = MockObject()
+        self.session.lm.torrent_store = store
+        self.session.lm.metadata_store = None
+        self.session.lm.checkpoint_manager = None
+        self.session.lm.ltmgr = MockObject()
+        self.session.lm.ltmgr.ltsessions = {0: ltsession}
+        self.collector = SessionMetricsCollector(self.session)
+
+    def test_collect(self):
+        """
+        Testing whether the LevelDB stores and libtorrent sessions are exported
+        """
+        text = "".join(metric.to_text() for metric in self.collector())
+        self.assertIn('tribler_leveldb_size_bytes{store="torrents"} 1024\n', text)
+        self.assertNotIn('store="metadata"', text)
+        self.assertIn('tribler_libtorrent_total_download_bytes{hops="0"} 7\n', text)
+        self.assertIn('tribler_libtorrent_dht_nodes{hops="0"} 7\n', text)
+
+    def test_collect_no_libtorrent(self):
+        """
+        Testing whether nothing is exported for libtorrent if it is not running
+        """
+        self.session.lm.ltmgr = None
+        self.assertNotIn("libtorrent", "".join(metric.to_text() for metric in self.collector()))
@@ -0,0 +1,65 @@
+"""
+Benchmark of the piece bitfield operations that are used to build the state of a download.
+
+Run with: python -m Tribler.Test.Core.Utilities.benchmark_bitfield [num_pieces] [num_files]
+"""
+import base64
+import random
+import sys
+import timeit
+
+from Tribler.Core.Utilities.bitfield import PieceBitfield
+
+
+def legacy_pieces_base64(pieces):
+    bitstr = ""
+    for bit in pieces:
+        bitstr += '1' if bit else '0'
+
+    encoded_str = ""
+    for i in range(0, len(bitstr), 8):
+        encoded_str += chr(int(bitstr[i:i + 8].ljust(8, '0'), 2))
+    return base64.b64encode(encoded_str)
+
+
+def legacy_files_completion(pieces, filepieceranges, files):
+    completion = []
+    for t, tl, _, f in filepieceranges:
+        if f in files:
+            completed = 0
+            for index in range(t, tl):
+                if pieces[index]:
+                    completed += 1
+            completion.append((f, completed / ((tl - t) * 1.0)))
+    return completion
+
+
+def bitfield_files_completion(pieces, filepieceranges, files):
+    bitfield = PieceBitfield(pieces)
+    files = set(files)
+    return [(f, bitfield.fraction(t, tl)) for t, tl, _, f in filepieceranges if f in files]
+
+
+def main(num_pieces=100000, num_files=10000):
+    pieces = [random.random() < 0.5 for _ in xrange(num_pieces)]
+    pieces_per_file = max(1, num_pieces // num_files)
+    filepieceranges = [(start, min(start + pieces_per_file, num_pieces), 0, u"file%d" % index)
+                       for index, start in enumerate(xrange(0, num_pieces, pieces_per_file))]
+
+    assert legacy_pieces_base64(pieces) == PieceBitfield(pieces).to_base64()
+    files = [f for _, _, _, f in filepieceranges]
+    assert legacy_files_completion(pieces, filepieceranges, files) == \
+        bitfield_files_completion(pieces, filepieceranges, files)
+
+    benchmarks = [("pieces base64 (legacy)", lambda: legacy_pieces_base64(pieces)),
+                  ("pieces base64 (bitfield)", lambda: PieceBitfield(pieces).to_base64()),
+                  ("files completion (legacy)", lambda: legacy_files_completion(pieces, filepieceranges, files)),
+                  ("files completion (bitfield)", lambda: bitfield_files_completion(pieces, filepieceranges, files))]
+
+    print "%d pieces, %d files" % (num_pieces, len(filepieceranges))
+    for name, func in benchmarks:
+        print "%-30s %8.2f ms" % (name, min(timeit.repeat(func, number=1, repeat=5)) * 1000)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,53 @@
+from Tribler.Core.Utilities.bitfield import PieceBitfield, merge_piece_ranges
+from Tribler.Test.Core.base_test import TriblerCoreTest
+
+
+class TestPieceBitfield(TriblerCoreTest):
+    """
+    Tests for the PieceBitfield class.
+    """
+
+    def setUp(self, annotate=True):
+        TriblerCoreTest.setUp(self, annotate=annotate)
+        self.bitfield = PieceBitfield([True, True, False, True, False, False, True, True, True])
+
+    def test_count(self):
+        self.assertEqual(len(self.bitfield), 9)
+        self.assertEqual(self.bitfield.count(), 6)
+        self.assertEqual(self.bitfield.count(1, 4), 2)
+        self.assertEqual(self.bitfield.count(6, 20), 3)
+        self.assertEqual(self.bitfield.count(4, 2), 0)
+
+    def test_count_large(self):
+        """
+        Test whether counting long ranges using the prefix sums gives the same result as counting every piece
+        """
+        pieces = [index % 3 == 0 or index % 7 == 0 for index in xrange(1000)]
+        bitfield = PieceBitfield(pieces)
+        for start, end in [(0, 1000), (0, 128), (1, 999), (63, 193), (64, 192), (100, 900), (500, 2000)]:
+            self.assertEqual(bitfield.count(start, end), sum(pieces[start:end]))
+        self.assertEqual(bitfield.get_ranges_progress([(10, 300), (200, 700)]), sum(pieces[10:700]) / 690.0)
+
+    def test_count_consecutive(self):
+        self.assertEqual(self.bitfield.count_consecutive(0, 9), 2)
+        self.assertEqual(self.bitfield.count_consecutive(6, 9), 3)
+        self.assertEqual(self.bitfield.count_consecutive(2, 9), 0)
+
+    def test_fraction(self):
+        self.assertEqual(self.bitfield.fraction(0, 4), 0.75)
+        self.assertEqual(self.bitfield.fraction(3, 3), 0.0)
+        self.assertEqual(PieceBitfield([]).fraction(), 0.0)
+
+    def test_merge_piece_ranges(self):
+        self.assertEqual(merge_piece_ranges([(5, 8), (0, 2), (1, 3), (3, 3)]), [(0, 3), (5, 8)])
+
+    def test_get_ranges_progress(self):
+        self.assertEqual(self.bitfield.get_ranges_progress([]), 1.0)
+        self.assertEqual(self.bitfield.get_ranges_progress([(0, 2), (1, 4)]), 0.75)
+        self.assertEqual(self.bitfield.get_ranges_progress([(0, 2), (1, 4)], consecutive=True), 0.5)
+        self.assertEqual(self.bitfield.get_ranges_progress([(7, 11)]), 0.5)
+
+    def test_to_base64(self):
+        self.assertEqual(PieceBitfield([True, False, True, False, False]).to_base64(), "oA==")
+        self.assertEqual(PieceBitfield([True] * 9).to_base64(), "/4A=")
+        self.assertEqual(PieceBitfield([]).to_base64(), "")
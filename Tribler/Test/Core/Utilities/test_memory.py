@@ -0,0 +1,89 @@
+from Tribler.Core.Utilities.memory import CacheRegistry, get_object_counts, MemorySnapshots
+from Tribler.Test.Core.base_test import TriblerCoreTest
+
+
+class CacheOwner(object):
+
+    def __init__(self):
+        self.cache = {"a": 1, "b": 2}
+
+    def get_cache_size(self):
+        return 42
+
+
+class TestCacheRegistry(TriblerCoreTest):
+
+    def setUp(self, annotate=True):
+        TriblerCoreTest.setUp(self, annotate=annotate)
+        self.registry = CacheRegistry()
+        self.owner = CacheOwner()
+
+    def test_get_sizes(self):
+        """
+        Test whether the sizes of attributes and the return values of methods are reported
+        """
+        self.registry.register("owner.cache", self.owner, "cache")
+        self.registry.register("owner.size", self.owner, "get_cache_size")
+        self.assertEqual(self.registry.get_sizes(), {"owner.cache": 2, "owner.size": 42})
+
+        self.owner.cache["c"] = 3
+        self.assertEqual(self.registry.get_sizes()["owner.cache"], 3)
+
+    def test_owner_garbage_collected(self):
+        """
+        Test whether the registry does not keep the owners of caches alive
+        """
+        self.registry.register("owner.cache", self.owner, "cache")
+        self.owner = None
+        self.assertEqual(self.registry.get_sizes(), {})
+        self.assertFalse(self.registry.caches)
+
+    def test_unregister(self):
+        """
+        Test whether an unregistered cache is not reported anymore
+        """
+        self.registry.register("owner.cache", self.owner, "cache")
+        self.registry.unregister("owner.cache")
+        self.assertEqual(self.registry.get_sizes(), {})
+
+
+class TestMemory(TriblerCoreTest):
+
+    def test_get_object_counts(self):
+        """
+        Test whether the objects are counted by type, the most common types first
+        """
+        owners = [CacheOwner() for _ in xrange(100)]
+        counts = get_object_counts(limit=1000)
+        self.assertGreaterEqual(dict(counts)["%s.CacheOwner" % __name__], len(owners))
+        self.assertEqual(counts, sorted(counts, key=lambda item: item[1], reverse=True))
+        self.assertEqual(len(get_object_counts(limit=5)), 5)
+
+    def test_snapshots_empty(self):
+        """
+        Test whether clearing the snapshots works, even if none have been taken
+        """
+        snapshots = MemorySnapshots()
+        snapshots.clear()
+        self.assertEqual(snapshots.get_snapshot_list(), [])
+
+    def test_compare_snapshots(self):
+        """
+        Test whether the growth of the object counts and the caches between two snapshots is reported
+        """
+        snapshots = MemorySnapshots()
+        first_id = snapshots.take_snapshot({"owner.cache": 2})
+        owners = [CacheOwner() for _ in xrange(100)]
+        second_id = snapshots.take_snapshot({"owner.cache": 5})
+        self.assertEqual([snapshot["id"] for snapshot in snapshots.get_snapshot_list()], [first_id, second_id])
+
+        statistics = snapshots.get_statistics(second_id, compare_to=first_id, limit=1000)
+        self.assertEqual(statistics["caches"], {"owner.cache": {"size": 5, "size_diff": 3}})
+        counts = dict((item["type"], item["count_diff"]) for item in statistics["objects"])
+        self.assertGreaterEqual(counts["%s.CacheOwner" % __name__], len(owners))
+        self.assertEqual("allocations" in statistics, MemorySnapshots.has_tracemalloc())
+
+        statistics = snapshots.get_statistics(first_id, limit=5)
+        self.assertEqual(len(statistics["objects"]), 5)
+        self.assertEqual(statistics["caches"], {"owner.cache": {"size": 2}})
+        snapshots.clear()
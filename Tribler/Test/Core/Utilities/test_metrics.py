@@ -0,0 +1,104 @@
+import re
+
+from Tribler.Core.Utilities.metrics import MetricsRegistry, Gauge
+from Tribler.Test.Core.base_test import TriblerCoreTest
+
+# A sample line of the text exposition format: a metric name, optional labels and a value
+SAMPLE_LINE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{([a-zA-Z_][a-zA-Z0-9_]*="([^"\\]|\\.)*",?)*\})? '
+                         r'([-+]?[0-9.eE+-]+|[+-]Inf|NaN)$')
+
+
+class TestMetricsRegistry(TriblerCoreTest):
+    """
+    This class contains tests for the registry of metrics and the text exposition format.
+    """
+
+    def setUp(self, annotate=True):
+        TriblerCoreTest.setUp(self, annotate=annotate)
+        self.registry = MetricsRegistry()
+
+    def assert_valid_exposition(self, text):
+        """
+        Check whether every line is a comment or a sample, and every metric is described before its samples.
+        """
+        self.assertTrue(text.endswith("\n"))
+        described = set()
+        for line in text.splitlines():
+            if line.startswith("# HELP ") or line.startswith("# TYPE "):
+                described.add(line.split()[2])
+                continue
+            self.assertRegexpMatches(line, SAMPLE_LINE)
+            name = re.match(r'[a-zA-Z0-9_:]*', line).group(0)
+            self.assertTrue(any(name == metric or name.startswith(metric + "_") for metric in described), line)
+
+    def test_counter(self):
+        """
+        Testing whether counters are exported with their labels
+        """
+        counter = self.registry.counter("test_total", "A test counter", ["kind"])
+        counter.labels("a").inc()
+        counter.labels("a").inc(2)
+        counter.labels('b"\n').inc()
+
+        text = self.registry.to_text()
+        self.assert_valid_exposition(text)
+        self.assertIn("# TYPE test_total counter\n", text)
+        self.assertIn('test_total{kind="a"} 3\n', text)
+        self.assertIn('test_total{kind="b\\"\\n"} 1\n', text)
+        self.assertRaises(ValueError, counter.labels("a").inc, -1)
+
+    def test_gauge(self):
+        """
+        Testing whether gauges without labels are exported before they are set
+        """
+        gauge = self.registry.gauge("test_gauge", "A test gauge")
+        self.assertIn("test_gauge 0\n", self.registry.to_text())
+        gauge.set(2.5)
+        gauge.dec()
+        self.assertIn("test_gauge 1.5\n", self.registry.to_text())
+
+    def test_histogram(self):
+        """
+        Testing whether histograms are exported with cumulative buckets, a sum and a count
+        """
+        histogram = self.registry.histogram("test_seconds", "A test histogram", buckets=(0.1, 1))
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+
+        text = self.registry.to_text()
+        self.assert_valid_exposition(text)
+        self.assertIn('test_seconds_bucket{le="0.1"} 1\n', text)
+        self.assertIn('test_seconds_bucket{le="1.0"} 2\n', text)
+        self.assertIn('test_seconds_bucket{le="+Inf"} 3\n', text)
+        self.assertIn('test_seconds_count 3\n', text)
+        self.assertIn('test_seconds_sum 5.55\n', text)
+
+    def test_register_twice(self):
+        """
+        Testing whether registering a metric twice returns the existing metric, unless the types differ
+        """
+        counter = self.registry.counter("test_total", "A test counter")
+        self.assertIs(self.registry.counter("test_total", "A test counter"), counter)
+        self.assertRaises(ValueError, self.registry.gauge, "test_total", "A test gauge")
+
+    def test_collector(self):
+        """
+        Testing whether the metrics of collectors are exported and failing collectors are skipped
+        """
+        def collector():
+            gauge = Gauge("test_collected", "A collected gauge", ["hops"])
+            gauge.labels(1).set(4)
+            return [gauge]
+
+        def failing_collector():
+            raise RuntimeError("collector failed")
+
+        self.registry.register_collector(failing_collector)
+        self.registry.register_collector(collector)
+        text = self.registry.to_text()
+        self.assert_valid_exposition(text)
+        self.assertIn('test_collected{hops="1"} 4\n', text)
+
+        self.registry.unregister_collector(collector)
+        self.assertNotIn('test_collected', self.registry.to_text())
@@ -0,0 +1,69 @@
+"""
+Benchmark of the image statistics that are used to pick and filter video thumbnails.
+
+Run with: python -m Tribler.Test.Core.Video.benchmark_video_utility [image_file]
+"""
+import os
+import sys
+import timeit
+from math import sqrt
+
+from PIL import Image
+
+from Tribler.Core.Video.VideoUtility import colourfulness, skinratio
+from Tribler.Test.common import TESTS_DATA_DIR
+
+
+def legacy_colourfulness(image_data):
+    rg_values = []
+    yb_values = []
+
+    for pxl in image_data:
+        r, g, b = pxl
+        rg_values.append(r - g)
+        yb_values.append(0.5 * (r + g) - b)
+
+    m_rg, s_rg = legacy_meanstdv(rg_values)
+    m_yb, s_yb = legacy_meanstdv(yb_values)
+    return sqrt(s_rg ** 2 + s_yb ** 2) + 0.3 * sqrt(m_rg ** 2 + m_yb ** 2)
+
+
+def legacy_meanstdv(x):
+    n = len(x)
+    mean = sum(x) / float(n)
+    std = 0
+    for a in x:
+        std += (a - mean) ** 2
+    return mean, sqrt(std / float(n))
+
+
+def legacy_skinratio(image_file):
+    image = Image.open(image_file).convert('RGB')
+    image = image.resize((int(image.size[0] * 0.20), int(image.size[1] * 0.20)))
+    image_data = list(image.getdata())
+    skin_pixels = 0
+    for r, g, b in image_data:
+        if r > 60 and g < (r * 0.85) and b < (r * 0.7) and g > (r * 0.4) and b > (r * 0.2):
+            skin_pixels += 1
+    return skin_pixels / float(len(image_data))
+
+
+def main(image_file=os.path.join(TESTS_DATA_DIR, "ubuntu-logo14.png")):
+    image = Image.open(image_file).convert('RGB')
+    pixels = list(image.getdata())
+
+    assert abs(legacy_colourfulness(pixels) - colourfulness(image)) < 1e-6
+    assert abs(legacy_skinratio(image_file) - skinratio(image_file)) < 1e-6
+
+    benchmarks = [("colourfulness (legacy)", lambda: legacy_colourfulness(list(image.getdata()))),
+                  ("colourfulness (bands)", lambda: colourfulness(image)),
+                  ("skinratio (legacy)", lambda: legacy_skinratio(image_file)),
+                  ("skinratio (bands)", lambda: skinratio(image_file))]
+
+    print "%s, %dx%d pixels" % (os.path.basename(image_file), image.size[0], image.size[1])
+    for name, func in benchmarks:
+        print "%-30s %8.2f ms" % (name, min(timeit.repeat(func, number=1, repeat=5)) * 1000)
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:2])
@@ -8,12 +8,15 @@ import os
 from twisted.internet import reactor
 from twisted.internet.defer import inlineCallbacks, Deferred
 from twisted.internet.endpoints import TCP4ClientEndpoint, connectProtocol
+from twisted.internet.error import ConnectionDone
 from twisted.internet.protocol import Protocol, connectionDone
+from twisted.internet.task import Clock
 
 from Tribler.Core.DownloadConfig import DownloadStartupConfig
+from Tribler.Core.Libtorrent import PIECES_WAIT_TIMEOUT
 from Tribler.Core.TorrentDef import TorrentDef
 from Tribler.Core.Utilities.network_utils import get_random_port
-from Tribler.Core.Video.VideoServer import VideoServer
+from Tribler.Core.Video.VideoServer import VideoServer, VideoStreamProducer, VideoStreamResource, parse_range_header
 from Tribler.Test.Core.base_test import MockObject, TriblerCoreTest
 from Tribler.Test.common import TESTS_DATA_DIR
 from Tribler.Test.test_as_server import TestAsServer
@@ -26,54 +29,46 @@ class VideoServerProtocol(Protocol):
     def __init__(self, finished, content_size, expected_content, setset, exp_byte_range):
         self.finished = finished
         self.content_size = content_size
-        self.seen_empty_line = False
-        self.has_header = False
         self.expected_content = expected_content
         self.setset = setset
         self.exp_byte_range = exp_byte_range
+        self.response = ""
 
     def sendMessage(self, msg):
         self.transport.write("%s" % msg)
 
     def dataReceived(self, data):
-        if not self.has_header:
-            for line in data.split('\r\n'):
-                if len(line) == 0 and self.seen_empty_line:
-                    self.has_header = True
-                elif len(line) == 0:
-                    self.seen_empty_line = True
-                else:
-                    self.seen_empty_line = False
-                    self.check_header(line)
-        else:
-            assert self.expected_content == data
-            self.transport.loseConnection()
+        self.response += data
 
     def connectionLost(self, reason=connectionDone):
-        self.finished.callback(None)
-
-    def check_header(self, line):
-        if line.startswith("HTTP"):
-            if not self.setset:
-                # Python returns "HTTP/1.0 206 Partial Content\r\n" HTTP 1.0???
-                assert line.startswith("HTTP/1.")
-                assert line.find("206") != -1  # Partial content
-            else:
-                assert line.startswith("HTTP/1.")
-                assert line.find("416") != -1  # Requested Range Not Satisfiable
-                self.transport.loseConnection()
-
-        elif line.startswith("Content-Range:"):
-            expline = "Content-Range: bytes " + TestVideoServerSession.create_range_str(
-                self.exp_byte_range[0], self.exp_byte_range[1]) + "/" + str(self.content_size)
-            assert expline == line
-
-        elif line.startswith("Content-Type:") and not self.setset:
-            # We do not check for an exact content-type since that might differ between platforms.
-            assert line.startswith("Content-Type: video")
+        try:
+            self.check_response()
+        except AssertionError as error:
+            self.finished.errback(error)
+        else:
+            self.finished.callback(None)
+
+    def check_response(self):
+        header, _, body = self.response.partition('\r\n\r\n')
+        lines = header.split('\r\n')
+
+        assert lines[0].startswith("HTTP/1.")
+        assert lines[0].find("206") != -1  # Partial content
+
+        headers = dict(line.split(': ', 1) for line in lines[1:])
+        assert headers["Content-Length"] == str(len(body))
 
-        elif line.startswith("Content-Length:"):
-            assert line == "Content-Length: " + str(len(self.expected_content))
+        content_range = "bytes " + TestVideoServerSession.create_range_str(
+            self.exp_byte_range[0], self.exp_byte_range[1]) + "/" + str(self.content_size)
+        if not self.setset:
+            assert headers["Content-Range"] == content_range
+            # We do not check for an exact content-type since that might differ between platforms.
+            assert headers["Content-Type"].startswith("video")
+            assert body == self.expected_content
+        else:
+            assert headers["Content-Type"].startswith("multipart/byteranges; boundary=")
+            assert ("Content-Range: %s\r\n\r\n%s" % (content_range, self.expected_content)) in body
+            assert ("Content-Range: bytes 0-99/%d\r\n\r\n" % self.content_size) in body
 
 
 class TestVideoServer(TriblerCoreTest):
@@ -96,12 +91,166 @@ class TestVideoServer(TriblerCoreTest):
 
         self.assertEqual(self.video_server.get_vod_destination(mock_download), os.path.join("abc", "def"))
 
-    def test_get_vod_stream(self):
+    def test_parse_range_header(self):
+        """
+        Testing whether HTTP range headers are parsed correctly
+        """
+        self.assertIsNone(parse_range_header(None, 1000))
+        self.assertIsNone(parse_range_header("items=0-10", 1000))
+        self.assertIsNone(parse_range_header("bytes=10-5", 1000))
+        self.assertIsNone(parse_range_header("bytes=a-b", 1000))
+        self.assertEqual(parse_range_header("bytes=0-99", 1000), [(0, 100)])
+        self.assertEqual(parse_range_header("bytes=900-", 1000), [(900, 1000)])
+        self.assertEqual(parse_range_header("bytes=-100", 1000), [(900, 1000)])
+        self.assertEqual(parse_range_header("bytes=-2000", 1000), [(0, 1000)])
+        self.assertEqual(parse_range_header("bytes=990-2000", 1000), [(990, 1000)])
+        self.assertEqual(parse_range_header("bytes=0-9, 20-29", 1000), [(0, 10), (20, 30)])
+        self.assertEqual(parse_range_header("bytes=1000-", 1000), [])
+        self.assertEqual(parse_range_header("bytes=2000-2999", 1000), [])
+
+    def test_get_stats(self):
+        """
+        Testing whether the statistics of the video server are counted
+        """
+        producer = MockObject()
+        self.video_server.on_stream_started(producer)
+        self.video_server.on_bytes_sent(1024)
+        self.video_server.last_throughput_update -= 2
+
+        stats = self.video_server.get_stats()
+        self.assertEqual(stats['active_sessions'], 1)
+        self.assertEqual(stats['total_sessions'], 1)
+        self.assertEqual(stats['bytes_sent'], 1024)
+        self.assertGreater(stats['throughput'], 0)
+
+        self.video_server.on_stream_stopped(producer)
+        self.assertEqual(self.video_server.get_stats()['active_sessions'], 0)
+
+    def create_producer(self, download, start, clock=None):
+        request = MockObject()
+        request.notifyFinish = Deferred
+        request.registerProducer = lambda *_: None
+        return VideoStreamProducer(self.video_server, request, download, 0, [(start, start + 100)],
+                                   clock=clock or Clock())
+
+    @staticmethod
+    def create_download(seeks=None):
+        download = MockObject()
+        download.vod_seekpos = 0
+        download.vod_scheduler = MockObject()
+        download.vod_scheduler.seek = seeks.append if seeks is not None else lambda _: None
+        download.vod_scheduler.request_range = lambda *_: None
+        download.vod_scheduler.set_position = lambda _: None
+        download.get_byte_progress = lambda _: 0
+        download.get_pieces_changed_deferred = Deferred
+        mock_def = MockObject()
+        mock_def.get_piece_length = lambda: 16384
+        download.get_def = lambda: mock_def
+        return download
+
+    def test_primary_stream(self):
+        """
+        Testing whether only the stream that was started last moves the streaming scheduler
+        """
+        seeks = []
+        download = self.create_download(seeks)
+
+        first = self.create_producer(download, 1000)
+        second = self.create_producer(download, 5000)
+        first.start()
+        second.start()
+        self.assertTrue(second.is_primary())
+        self.assertEqual(seeks, [1000, 5000])
+        self.assertEqual(download.vod_seekpos, 5000)
+
+        first.stopProducing()
+        self.assertEqual(seeks, [1000, 5000])
+        third = self.create_producer(download, 9000)
+        third.start()
+        third.stopProducing()
+        self.assertEqual(seeks, [1000, 5000, 9000, 5000])
+        self.assertEqual(download.vod_seekpos, 5000)
+        second.stopProducing()
+
+    def test_poll_without_piece_alerts(self):
         """
-        Testing whether the right VOD stream is returned
+        Testing whether a stream continues once its pieces are available, even if the download never notifies it
         """
-        self.mock_session.get_download = lambda _: None
-        self.assertEqual(self.video_server.get_vod_stream("abcd"), (None, None))
+        written = []
+        clock = Clock()
+        download = self.create_download()
+        producer = self.create_producer(download, 0, clock)
+        producer.request.write = written.append
+        producer.open_file = lambda: False
+        producer.start()
+        self.assertTrue(producer.waiting)
+
+        download.get_byte_progress = lambda _: 1
+        opened = []
+        producer.open_file = lambda: opened.append(True)
+        clock.advance(PIECES_WAIT_TIMEOUT)
+        self.assertEqual(opened, [True])
+        self.assertEqual(len(clock.getDelayedCalls()), 1)
+
+        producer.stopProducing()
+        self.assertFalse(clock.getDelayedCalls())
+
+    def test_disconnect_while_preparing(self):
+        """
+        Testing whether a stream does not start if the player disconnected while the download was being prepared
+        """
+        mock_def = MockObject()
+        mock_def.get_files = lambda: ["video.avi"]
+        mock_def.get_files_with_length = lambda: [("video.avi", 1000)]
+        mock_def.get_piece_length = lambda: 16384
+        download = MockObject()
+        download.get_def = lambda: mock_def
+        self.mock_session.get_download = lambda _: download
+        prepared = Deferred()
+        self.video_server.prepare_vod_download = lambda *_: prepared
+
+        finished = Deferred()
+        request = MockObject()
+        request.method = "GET"
+        request.path = "/%s/0" % ("a" * 40)
+        request.postpath = ["a" * 40, "0"]
+        request.getClientIP = lambda: "127.0.0.1"
+        request.getHeader = lambda _: None
+        request.setHeader = lambda *_: None
+        request.notifyFinish = lambda: finished
+        request.registerProducer = lambda *_: self.fail("The stream should not start")
+
+        VideoStreamResource(self.video_server).render_GET(request)
+        finished.errback(ConnectionDone())
+        prepared.callback(None)
+        self.assertEqual(self.video_server.producers, [])
+
+    def test_head(self):
+        """
+        Testing whether a HEAD request only gets the headers, without putting the download in VOD mode
+        """
+        headers = {}
+        mock_def = MockObject()
+        mock_def.get_files = lambda: ["video.avi"]
+        mock_def.get_files_with_length = lambda: [("video.avi", 1000)]
+        download = MockObject()
+        download.get_def = lambda: mock_def
+        self.mock_session.get_download = lambda _: download
+        self.video_server.prepare_vod_download = lambda *_: self.fail("The download should not be prepared")
+
+        request = MockObject()
+        request.method = "HEAD"
+        request.path = "/%s/0" % ("a" * 40)
+        request.postpath = ["a" * 40, "0"]
+        request.getClientIP = lambda: "127.0.0.1"
+        request.getHeader = lambda _: "bytes=0-99"
+        request.setHeader = headers.__setitem__
+        request.setResponseCode = lambda _: None
+
+        resource = VideoStreamResource(self.video_server)
+        self.assertEqual(resource.render_HEAD(request), "")
+        self.assertEqual(headers['Content-Length'], "100")
+        self.assertEqual(headers['Content-Range'], "bytes 0-99/1000")
 
 
 class TestVideoServerSession(TestAsServer):
@@ -145,6 +294,7 @@ class TestVideoServerSession(TestAsServer):
 
     @deferred(timeout=10)
     def test_combined(self):
+        # A set of byte ranges is sent as a multipart response
         return self.range_check(115, 214, setset=True)
 
     def start_vod_download(self):
@@ -181,7 +331,6 @@ class TestVideoServerSession(TestAsServer):
         head += "Range: bytes="
         head += self.create_range_str(firstbyte, lastbyte)
         if setset:
-            # Make into set of byte ranges, VideoHTTPServer should refuse.
             head += ",0-99"
         head += "\r\n"
 
@@ -0,0 +1,79 @@
+import os
+from math import sqrt
+
+from PIL import Image
+
+from Tribler.Core.Video import VideoUtility
+from Tribler.Core.Video.VideoUtility import colourfulness, preferred_timecodes, skinratio
+from Tribler.Test.Core.base_test import TriblerCoreTest
+from Tribler.Test.common import TESTS_DATA_DIR
+
+
+def reference_colourfulness(pixels):
+    """
+    Per-pixel implementation of the colourfulness metric, used to check the results of the band operations.
+    """
+    def meanstdv(values):
+        mean = sum(values) / float(len(values))
+        return mean, sqrt(sum((value - mean) ** 2 for value in values) / float(len(values)))
+
+    m_rg, s_rg = meanstdv([r - g for r, g, b in pixels])
+    m_yb, s_yb = meanstdv([0.5 * (r + g) - b for r, g, b in pixels])
+    return sqrt(s_rg ** 2 + s_yb ** 2) + 0.3 * sqrt(m_rg ** 2 + m_yb ** 2)
+
+
+class TestVideoUtility(TriblerCoreTest):
+    """
+    This class contains tests for the image statistics and thumbnail selection in the video utilities.
+    """
+
+    def setUp(self, annotate=True):
+        TriblerCoreTest.setUp(self, annotate=annotate)
+        self.image_file = os.path.join(TESTS_DATA_DIR, "ubuntu-logo14.png")
+        self.old_get_thumbnail = VideoUtility.get_thumbnail
+
+    def tearDown(self, annotate=True):
+        VideoUtility.get_thumbnail = self.old_get_thumbnail
+        super(TestVideoUtility, self).tearDown(annotate=annotate)
+
+    def test_colourfulness(self):
+        """
+        Testing whether the colourfulness of an image matches the per-pixel computation
+        """
+        image = Image.open(self.image_file)
+        expected = reference_colourfulness(list(image.convert('RGB').getdata()))
+        self.assertAlmostEqual(colourfulness(image), expected, places=6)
+
+    def test_colourfulness_pixels(self):
+        """
+        Testing whether the colourfulness can still be computed from a list of pixels
+        """
+        pixels = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (10, 20, 30)]
+        self.assertAlmostEqual(colourfulness(pixels), reference_colourfulness(pixels), places=6)
+        self.assertAlmostEqual(colourfulness([(50, 50, 50)] * 4), 0.0)
+        self.assertIsNone(colourfulness([]))
+
+    def test_skinratio(self):
+        """
+        Testing whether the fraction of skin coloured pixels is computed correctly
+        """
+        image = Image.new('RGB', (100, 100))
+        image.putdata([(200, 130, 90)] * 2500 + [(10, 20, 30)] * 7500)
+        image_file = os.path.join(self.session_base_dir, "skin.png")
+        image.save(image_file)
+
+        self.assertAlmostEqual(skinratio(image_file), 0.25)
+        self.assertEqual(skinratio(os.path.join(self.session_base_dir, "missing.png")), 0)
+
+    def test_preferred_timecodes(self):
+        """
+        Testing whether the timecodes of the most colourful frames are returned
+        """
+        def mocked_get_thumbnail(_, thumbfile, resolution, __, timecode):
+            if timecode != 30:
+                Image.new('RGB', resolution, (timecode * 2, 0, 0)).save(thumbfile)
+        VideoUtility.get_thumbnail = mocked_get_thumbnail
+
+        self.assertEqual(preferred_timecodes("video.avi", 100, (32, 32), "ffmpeg", num_samples=10, k=3,
+                                             num_workers=2), [90, 80, 70])
+        self.assertEqual(preferred_timecodes("video.avi", 0, (32, 32), "ffmpeg"), [])
@@ -1,4 +1,5 @@
 from Tribler.Core.DownloadState import DownloadState
+from Tribler.Core.Utilities.bitfield import PieceBitfield
 from Tribler.Core.simpledefs import DLSTATUS_DOWNLOADING, UPLOAD, DOWNLOAD, DLSTATUS_STOPPED, DLSTATUS_SEEDING, \
     DLSTATUS_STOPPED_ON_ERROR, DLSTATUS_WAITING4HASHCHECK
 from Tribler.Test.Core.base_test import TriblerCoreTest, MockObject
@@ -120,6 +121,9 @@ class TestDownloadState(TriblerCoreTest):
         self.assertEqual(download_state.get_files_completion(), [(['test.txt', 42], 1.0)])
         self.mock_download.get_selected_files = lambda: [['test.txt', 42], ['test2.txt', 43]]
         self.assertEqual(download_state.get_files_completion(), [(['test.txt', 42], 1.0)])
+        download_state.progress = 0.5
+        download_state.haveslice_total = PieceBitfield([False] * 5 + [True, True, False, False, True])
+        self.assertEqual(download_state.get_files_completion(), [(['test.txt', 42], 0.6)])
 
     def test_get_availability(self):
         """
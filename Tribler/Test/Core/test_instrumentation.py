@@ -1,6 +1,12 @@
-from threading import Event, Thread
+import os
+import sys
+from threading import Event, Thread, current_thread
+from time import sleep, time
 
-from Tribler.Core.Utilities.instrumentation import synchronized, WatchDog
+from twisted.internet.task import Clock
+
+from Tribler.Core.Utilities.instrumentation import synchronized, WatchDog, ReactorLagMonitor, SlowCallbackProfiler, \
+    get_responsible_callable, DISPERSY_DIR
 from Tribler.Test.Core.base_test import TriblerCoreTest
 
 
@@ -121,3 +127,86 @@ class TriblerCoreTestWatchDog(TriblerCoreTest):
         self.watchdog.start()
         # The even gets set when a thread has the same stack for more than 0 seconds.
         self.assertTrue(self._printe_event.wait(1))
+
+
+class TestReactorLagMonitor(TriblerCoreTest):
+
+    def setUp(self, annotate=True):
+        super(TestReactorLagMonitor, self).setUp(annotate=annotate)
+        self.clock = Clock()
+        self.monitor = ReactorLagMonitor(interval=0.1, clock=self.clock)
+        self.monitor.start()
+
+    def tearDown(self, annotate=True):
+        self.monitor.stop()
+        super(TestReactorLagMonitor, self).tearDown(annotate=annotate)
+
+    def test_no_lag(self):
+        """
+        Testing whether heartbeats that fire in time have no lag
+        """
+        self.clock.advance(0.1)
+        self.assertEqual(self.monitor.max_lag, 0.0)
+
+    def test_lag(self):
+        """
+        Testing whether a late heartbeat is measured
+        """
+        self.clock.advance(0.5)
+        self.assertAlmostEqual(self.monitor.max_lag, 0.4)
+
+    def test_stall(self):
+        """
+        Testing whether a lag above the threshold is reported as a stall
+        """
+        self.clock.advance(0.1)
+        self.clock.advance(0.5)
+        report = self.monitor.get_report()
+        self.assertEqual(report["num_stalls"], 1)
+        self.assertAlmostEqual(report["recent_stalls"][0]["lag"], 0.4)
+
+
+class TestSlowCallbackProfiler(TriblerCoreTest):
+
+    def test_get_responsible_callable(self):
+        """
+        Testing whether a stack is attributed to the outermost function of a chain of Tribler calls
+        """
+        def inner():
+            return get_responsible_callable(sys._getframe())
+        self.assertIn("test_instrumentation.py:test_get_responsible_callable:", inner())
+
+    def test_get_responsible_callable_dispatched(self):
+        """
+        Testing whether decorators do not end a chain of Tribler calls, while the frames that dispatch them do
+        """
+        namespace = {}
+        exec(compile("def decorated(func):\n    return func()\n", os.path.join(DISPERSY_DIR, "util.py"), "exec"),
+             namespace)
+        exec(compile("def dispatch(func):\n    return func()\n", os.path.join(DISPERSY_DIR, "taskmanager.py"),
+                     "exec"), namespace)
+
+        def handler():
+            return namespace['decorated'](inner)
+
+        def inner():
+            return get_responsible_callable(sys._getframe())
+        self.assertIn("test_instrumentation.py:handler:", namespace['dispatch'](handler))
+
+    def test_sample_stall(self):
+        """
+        Testing whether the callable that blocks the monitored thread is sampled
+        """
+        monitor = ReactorLagMonitor(interval=0.1)
+        monitor.last_beat = time() - 10
+        profiler = SlowCallbackProfiler(monitor, current_thread().ident, threshold=0.25, sample_interval=0.005)
+        profiler.start()
+        sleep(0.2)
+        profiler.stop()
+        profiler.join()
+
+        callables = profiler.get_callables()
+        self.assertTrue(callables)
+        self.assertIn("test_sample_stall", callables[0]["callable"])
+        self.assertEqual(profiler.pop_stall_samples()[0][0], callables[0]["callable"])
+        self.assertEqual(profiler.pop_stall_samples(), [])
@@ -1,9 +1,10 @@
 import os
 from nose.tools import raises
-from twisted.internet.defer import Deferred
+from twisted.internet.defer import Deferred, succeed
 
 from Tribler.Core import NoDispersyRLock
-from Tribler.Core.APIImplementation.LaunchManyCore import TriblerLaunchMany
+from Tribler.Core.APIImplementation import LaunchManyCore
+from Tribler.Core.APIImplementation.LaunchManyCore import TriblerLaunchMany, get_resume_priority
 from Tribler.Core.DownloadConfig import DefaultDownloadStartupConfig
 from Tribler.Core.TorrentDef import TorrentDef
 from Tribler.Core.Utilities.configparser import CallbackConfigParser
@@ -141,43 +142,100 @@ class TestLaunchManyCore(TriblerCoreTest):
         """
         Test whether we are resuming downloads after loading checkpoint
         """
-        def mocked_resume_download(filename, setupDelay=3):
-            self.assertTrue(filename.endswith('abcd.state'))
-            self.assertEqual(setupDelay, 0)
+        def mocked_resume_download(infohash, pstate):
+            self.assertEqual(infohash, 'abcd')
+            self.assertIsNone(pstate)
             mocked_resume_download.called = True
+            return succeed(None)
 
         mocked_resume_download.called = False
-        self.lm.session.get_downloads_pstate_dir = lambda: self.session_base_dir
-
-        with open(os.path.join(self.lm.session.get_downloads_pstate_dir(), 'abcd.state'), 'wb') as state_file:
-            state_file.write("hi")
+        self.lm.checkpoint_manager = MockObject()
+        self.lm.checkpoint_manager.get_pstate_summaries = lambda: [('abcd', None)]
+        self.lm.checkpoint_manager.load_pstate = lambda _: None
 
         self.lm.initComplete = True
         self.lm.resume_download = mocked_resume_download
         self.lm.load_checkpoint()
         self.assertTrue(mocked_resume_download.called)
 
+    @staticmethod
+    def create_pstate(progress, time_added=0, user_stopped=False, share_mode=False):
+        pstate = CallbackConfigParser()
+        pstate.add_section('download_defaults')
+        pstate.set('download_defaults', 'time_added', time_added)
+        pstate.set('download_defaults', 'user_stopped', user_stopped)
+        pstate.add_section('state')
+        pstate.set('state', 'share_mode', share_mode)
+        pstate.set('state', 'dlstate', {'progress': progress})
+        return pstate
+
+    def test_resume_priority(self):
+        """
+        Testing whether unfinished downloads are resumed before seeding, credit mining and stopped downloads
+        """
+        pstates = [None,
+                   self.create_pstate(0.5, user_stopped=True),
+                   self.create_pstate(0.5, share_mode=True),
+                   self.create_pstate(1.0),
+                   self.create_pstate(0.5, time_added=1),
+                   self.create_pstate(0.5, time_added=2)]
+        self.assertEqual(sorted(pstates, key=get_resume_priority), pstates[::-1])
+
+    def test_load_checkpoint_batches(self):
+        """
+        Testing whether checkpointed downloads are resumed in batches, ordered by priority
+        """
+        resumed = []
+        pending = []
+
+        def mocked_resume_download(infohash, _):
+            resumed.append(infohash)
+            pending.append(Deferred())
+            return pending[-1]
+
+        self.lm.checkpoint_manager = MockObject()
+        self.lm.checkpoint_manager.get_pstate_summaries = lambda: [('a', self.create_pstate(1.0)),
+                                                                   ('b', None),
+                                                                   ('c', self.create_pstate(0.5))]
+        self.lm.checkpoint_manager.load_pstate = lambda _: None
+        self.lm.initComplete = True
+        self.lm.resume_download = mocked_resume_download
+
+        old_batch_size = LaunchManyCore.RESUME_BATCH_SIZE
+        LaunchManyCore.RESUME_BATCH_SIZE = 2
+        try:
+            self.lm.load_checkpoint()
+        finally:
+            LaunchManyCore.RESUME_BATCH_SIZE = old_batch_size
+
+        self.assertEqual(resumed, ['c', 'a'])
+        self.assertTrue(self.lm.is_pending_task_active("resume_batch_timeout"))
+
+        for deferred_resume in pending[:]:
+            deferred_resume.callback(None)
+        self.assertEqual(resumed, ['c', 'a', 'b'])
+        self.lm.cancel_all_pending_tasks()
+
     def test_resume_download(self):
         with open(os.path.join(TESTS_DATA_DIR, "bak_single.torrent"), mode='rb') as torrent_file:
             torrent_data = torrent_file.read()
 
-        def mocked_load_download_pstate(_):
-            raise ValueError()
-
         def mocked_add(tdef, dscfg, pstate, **_):
             self.assertTrue(tdef)
             self.assertTrue(dscfg)
             self.assertIsNone(pstate)
             mocked_add.called = True
+            download = MockObject()
+            download.get_handle = lambda: succeed(None)
+            return download
         mocked_add.called = False
 
-        self.lm.load_download_pstate = mocked_load_download_pstate
         self.lm.torrent_store = MockObject()
         self.lm.torrent_store.get = lambda _: torrent_data
         self.lm.add = mocked_add
         self.lm.mypref_db = MockObject()
         self.lm.mypref_db.getMyPrefStatsInfohash = lambda _: TESTS_DATA_DIR
-        self.lm.resume_download('%s.state' % ('a' * 20))
+        self.lm.resume_download('a' * 20, None)
         self.assertTrue(mocked_add.called)
 
 
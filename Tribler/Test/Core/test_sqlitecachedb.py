@@ -6,9 +6,12 @@ from unittest import skipIf
 from apsw import SQLError, CantOpenError
 from nose.tools import raises
 from twisted.internet.defer import inlineCallbacks
+from twisted.internet.threads import deferToThread
 
-from Tribler.Core.CacheDB.sqlitecachedb import SQLiteCacheDB, DB_SCRIPT_ABSOLUTE_PATH, CorruptedDatabaseError
+from Tribler.Core.CacheDB.sqlitecachedb import SQLiteCacheDB, DB_SCRIPT_ABSOLUTE_PATH, CorruptedDatabaseError, \
+    DB_STATEMENT_SECONDS
 from Tribler.Test.Core.base_test import TriblerCoreTest
+from Tribler.Test.twisted_thread import deferred
 from Tribler.dispersy.util import blocking_call_on_reactor_thread
 
 
@@ -167,6 +170,36 @@ class TestSqliteCacheDB(TriblerCoreTest):
         all = self.sqlite_test.fetchall("select * from person where lastname=='101'")
         self.assertEqual(all, [])
 
+    @blocking_call_on_reactor_thread
+    def test_statement_seconds(self):
+        self.test_insertmany()
+        selects = DB_STATEMENT_SECONDS.labels(u"SELECT")
+        count = selects.count
+
+        # The rows of a SELECT statement are read lazily, so only the fetch methods time it
+        self.sqlite_test.execute(u"SELECT * FROM person")
+        self.assertEqual(selects.count, count)
+        self.sqlite_test.fetchall(u"SELECT * FROM person")
+        self.assertEqual(selects.count, count + 1)
+
+    @deferred(timeout=10)
+    def test_fetchall_in_thread(self):
+        """
+        Testing whether rows can be read from a worker thread through a read-only connection
+        """
+        sqlite_test_2 = SQLiteCacheDB(os.path.join(self.session_base_dir, "test_db.db"))
+        sqlite_test_2.initialize()
+        sqlite_test_2.execute(u"CREATE TABLE person(lastname, firstname);")
+        sqlite_test_2.insert('person', lastname='a', firstname='b')
+
+        def check_rows(rows):
+            self.assertEqual(rows, [('a', 'b')])
+            self.assertEqual(len(sqlite_test_2._read_connections), 1)
+            sqlite_test_2.close()
+            self.assertFalse(sqlite_test_2._read_connections)
+
+        return deferToThread(sqlite_test_2.fetchall_in_thread, u"SELECT * FROM person").addCallback(check_rows)
+
     @blocking_call_on_reactor_thread
     def test_insertorder(self):
         self.test_insertmany()
@@ -5,6 +5,7 @@ from twisted.internet import reactor
 from twisted.internet.defer import inlineCallbacks
 from twisted.internet.task import LoopingCall, deferLater
 
+from Tribler.Core.Utilities.memory import cache_registry
 from Tribler.Core.simpledefs import NTFY_MARKET_ON_ASK, NTFY_MARKET_ON_BID, NTFY_MARKET_ON_TRANSACTION_COMPLETE, \
     NTFY_MARKET_ON_ASK_TIMEOUT, NTFY_MARKET_ON_BID_TIMEOUT, NTFY_MARKET_ON_PAYMENT_RECEIVED, NTFY_MARKET_ON_PAYMENT_SENT
 from Tribler.Core.simpledefs import NTFY_UPDATE
@@ -103,6 +104,8 @@ class MarketCommunity(Community):
         self.mid_register = {}
         self.relayed_ticks = {}  # Dictionary of OrderId -> Timestamp
         self.relayed_cancels = []
+        cache_registry.register("market.relayed_ticks", self, "relayed_ticks")
+        cache_registry.register("market.relayed_cancels", self, "relayed_cancels")
         self.order_manager = None
         self.order_book = None
         self.market_database = None
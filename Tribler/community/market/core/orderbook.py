@@ -31,6 +31,7 @@ class OrderBook(TaskManager):
         self.message_repository = message_repository
         self._bids = Side()
         self._asks = Side()
+        self.version = 0  # Incremented on every change to the ticks in the order book
 
     def timeout_ask(self, order_id):
         ask = self.get_ask(order_id).tick
@@ -56,6 +57,7 @@ class OrderBook(TaskManager):
 
         if not self._asks.tick_exists(ask.order_id) and ask.is_valid():
             self._asks.insert_tick(ask)
+            self.version += 1
             timeout_delay = float(ask.timestamp) + float(ask.timeout) - time.time()
             task = deferLater(reactor, timeout_delay, self.timeout_ask, ask.order_id)
             self.register_task("ask_%s_timeout" % ask.order_id, task)
@@ -71,6 +73,7 @@ class OrderBook(TaskManager):
         if self._asks.tick_exists(order_id):
             self.cancel_pending_task("ask_%s_timeout" % order_id)
             self._asks.remove_tick(order_id)
+            self.version += 1
 
     def insert_bid(self, bid):
         """
@@ -80,6 +83,7 @@ class OrderBook(TaskManager):
 
         if not self._bids.tick_exists(bid.order_id) and bid.is_valid():
             self._bids.insert_tick(bid)
+            self.version += 1
             timeout_delay = float(bid.timestamp) + float(bid.timeout) - time.time()
             task = deferLater(reactor, timeout_delay, self.timeout_bid, bid.order_id)
             self.register_task("bid_%s_timeout" % bid.order_id, task)
@@ -95,6 +99,7 @@ class OrderBook(TaskManager):
         if self._bids.tick_exists(order_id):
             self.cancel_pending_task("bid_%s_timeout" % order_id)
             self._bids.remove_tick(order_id)
+            self.version += 1
 
     def trade_tick(self, order_id, recipient_order_id, quantity, end_transaction_timestamp):
         """
@@ -112,10 +117,12 @@ class OrderBook(TaskManager):
         if self.tick_exists(order_id):
             tick = self.get_tick(order_id)
             tick.quantity -= quantity
+            self.version += 1
         if self.tick_exists(recipient_order_id):
             tick = self.get_tick(recipient_order_id)
             if tick.tick.timestamp < end_transaction_timestamp:
                 tick.quantity -= quantity
+                self.version += 1
 
     def tick_exists(self, order_id):
         """
@@ -21,6 +21,13 @@ class Side(object):
         """
         return len(self._tick_map)
 
+    def get_depth(self):
+        """
+        Return the number of price levels for every (price_type, quantity_type) pair of this side
+        :rtype: dict
+        """
+        return dict(self._depth)
+
     def get_price_level(self, price):
         """
         Return the price level corresponding to the given price
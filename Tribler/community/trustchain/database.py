@@ -29,6 +29,8 @@ class TrustChainDB(Database):
         super(TrustChainDB, self).__init__(db_path)
         self._logger.debug("TrustChain database path: %s", db_path)
         self.db_name = db_name
+        self.version = 0  # Incremented whenever a block is added
+        self._block_count = None
         self.open()
 
     def add_block(self, block):
@@ -41,6 +43,7 @@ class TrustChainDB(Database):
             u"link_sequence_number, previous_hash, signature, block_hash) VALUES(?,?,?,?,?,?,?,?)" % self.db_name,
             block.pack_db_insert())
         self.commit()
+        self.version += 1
 
     def _get(self, query, params):
         db_result = self.execute(self.get_sql_header() + query, params).fetchone()
@@ -114,6 +117,15 @@ class TrustChainDB(Database):
                             u"ORDER BY insert_time ASC LIMIT ?" % self.db_name,
                             (buffer(public_key), sequence_number, buffer(public_key), buffer(public_key), limit))
 
+    def get_number_of_blocks(self):
+        """
+        Return the number of blocks in the database. The count is cached until a block is added.
+        """
+        if self._block_count is None or self._block_count[0] != self.version:
+            count, = self.execute(u"SELECT COUNT(*) FROM %s" % self.db_name).fetchone()
+            self._block_count = (self.version, count)
+        return self._block_count[1]
+
     def get_sql_header(self):
         """
         Return the first part of a generic sql select query.
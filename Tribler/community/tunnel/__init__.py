@@ -30,3 +30,16 @@ CIRCUIT_STATE_BROKEN = 'BROKEN'
 
 CIRCUIT_ID_PORT = 1024
 PING_INTERVAL = 15.0
+DNS_PRUNE_INTERVAL = 60.0
+CIRCUIT_HEALTH_INTERVAL = 5.0
+
+# Circuits are kept ready for an hour after downloads last needed circuits of their length
+WARM_POOL_RETENTION = 60 * 60
+# Circuits are replaced this many seconds before they reach max_time, or when they reach this share of max_traffic
+CIRCUIT_ROTATION_MARGIN = 60
+CIRCUIT_ROTATION_TRAFFIC = 0.9
+# The number of seconds that a replaced circuit is kept for packets that are still underway
+CIRCUIT_ROTATION_GRACE = 30
+# Exit sockets share a pool of UDP sockets, of which the mappings to circuits expire after this many seconds without data
+EXIT_MAPPING_TIMEOUT = 120
+EXIT_PRUNE_INTERVAL = 30.0
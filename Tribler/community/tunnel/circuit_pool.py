@@ -0,0 +1,44 @@
+"""
+Keeping circuits ready before they are needed.
+
+Building a circuit takes a create/extend round-trip for every hop, which a new anonymous download would otherwise have
+to wait for. The warm pool remembers how many circuits of every length were in use while downloads needed them, and
+keeps that many circuits built for a while after the demand has gone, up to a configurable number.
+"""
+import time
+
+from Tribler.community.tunnel import WARM_POOL_RETENTION
+
+
+class WarmCircuitPool(object):
+
+    def __init__(self, max_size, retention=WARM_POOL_RETENTION, clock=time.time):
+        self.max_size = max_size
+        self.retention = retention
+        self.clock = clock
+        self.peak_usage = {}
+        self.last_used = {}
+
+    def record_usage(self, hops, num_circuits):
+        """
+        Record that downloads need circuits of the given length, of which num_circuits are ready.
+        """
+        now = self.clock()
+        if hops not in self.last_used or self.last_used[hops] < now - self.retention:
+            self.peak_usage[hops] = 0
+        self.peak_usage[hops] = max(self.peak_usage[hops], num_circuits, 1)
+        self.last_used[hops] = now
+
+    def get_targets(self):
+        """
+        Return the number of circuits that should be kept ready, by circuit length.
+        """
+        now = self.clock()
+        targets = {}
+        for hops, last_used in self.last_used.items():
+            if last_used < now - self.retention:
+                del self.last_used[hops]
+                del self.peak_usage[hops]
+            elif self.max_size > 0:
+                targets[hops] = min(self.max_size, self.peak_usage[hops])
+        return targets
@@ -2,13 +2,25 @@ import struct
 
 from Tribler.dispersy.crypto import ECCrypto, LibNaCLPK
 from Tribler.community.tunnel.crypto.cryptowrapper import crypto_box_beforenm, crypto_auth, crypto_auth_verify, Cipher,\
-    algorithms, modes, HKDFExpand, hashes, default_backend
+    algorithms, modes, HKDFExpand, hashes, default_backend, AESGCM
+
+# The AEAD interface of cryptography refuses shorter nonces, which we use for the first packets of every hop
+AEAD_MIN_NONCE_LENGTH = 8
+GCM_TAG_LENGTH = 16
 
 
 class CryptoException(Exception):
     pass
 
 
+class SessionKey(str):
+    """
+    An AES key of a hop. It keeps the AES-GCM context that is prepared for it, so that the context is set up once per
+    hop instead of once for every packet.
+    """
+    aead = None
+
+
 class TunnelCrypto(ECCrypto):
 
     def initialize(self, community):
@@ -47,8 +59,8 @@ class TunnelCrypto(ECCrypto):
         hkdf = HKDFExpand(algorithm=hashes.SHA256(), backend=default_backend(), length=40, info="key_generation")
         key = hkdf.derive(shared_secret)
 
-        kf = key[:16]
-        kb = key[16:32]
+        kf = SessionKey(key[:16])
+        kb = SessionKey(key[16:32])
         sf = key[32:36]
         sb = key[36:40]
         return [kf, kb, sf, sb, 1, 1]
@@ -62,11 +74,32 @@ class TunnelCrypto(ECCrypto):
 
         return salt + str(salt_explicit)
 
+    @staticmethod
+    def _get_aead(key, iv):
+        """
+        Return the AES-GCM context of a key, or None if the legacy cipher interface should be used for this IV.
+        """
+        if AESGCM is None or len(iv) < AEAD_MIN_NONCE_LENGTH:
+            return None
+
+        aead = getattr(key, 'aead', None)
+        if aead is None:
+            aead = AESGCM(key)
+            if isinstance(key, SessionKey):
+                key.aead = aead
+        return aead
+
     def encrypt_str(self, content, key, salt, salt_explicit):
         # return the encrypted content prepended with the
         # gcm tag and salt_explicit
+        iv = self._bulid_iv(salt, salt_explicit)
+        aead = self._get_aead(key, iv)
+        if aead:
+            ciphertext = aead.encrypt(iv, content, None)
+            return struct.pack('!q16s', salt_explicit, ciphertext[-GCM_TAG_LENGTH:]) + ciphertext[:-GCM_TAG_LENGTH]
+
         cipher = Cipher(algorithms.AES(key),
-                        modes.GCM(initialization_vector=self._bulid_iv(salt, salt_explicit)),
+                        modes.GCM(initialization_vector=iv),
                         backend=default_backend()
                         ).encryptor()
         ciphertext = cipher.update(content) + cipher.finalize()
@@ -78,8 +111,13 @@ class TunnelCrypto(ECCrypto):
             raise CryptoException("truncated content")
 
         salt_explicit, gcm_tag = struct.unpack_from('!q16s', content)
+        iv = self._bulid_iv(salt, salt_explicit)
+        aead = self._get_aead(key, iv)
+        if aead:
+            return aead.decrypt(iv, content[24:] + gcm_tag, None)
+
         cipher = Cipher(algorithms.AES(key),
-                        modes.GCM(initialization_vector=self._bulid_iv(salt, salt_explicit), tag=gcm_tag),
+                        modes.GCM(initialization_vector=iv, tag=gcm_tag),
                         backend=default_backend()
                         ).decryptor()
         return cipher.update(content[24:]) + cipher.finalize()
@@ -0,0 +1,427 @@
+"""
+Multi-process data plane for relays and exit sockets.
+
+A dedicated tunnel helper node spends most of its CPU time on removing or adding a single layer of AES-GCM to data
+packets that it forwards. The data plane moves this work to a number of worker processes. The main process keeps
+receiving all packets, so that circuit setup and everything else that needs the state of the community stays where it
+is. Data packets of established relays and exit sockets are sharded by circuit id and handed to a worker, which does
+the crypto and sends the result using the UDP socket of the endpoint, inherited when the worker is forked. Packets that
+leave the tunnel at an exit are returned to the main process after decryption, since the exit sockets live there.
+
+Workers receive batches of frames over a datagram socket pair. When a worker cannot keep up, batches are dropped just
+like UDP packets would be. When a worker dies, the circuits of its shard are forwarded by the main process again.
+"""
+import logging
+import os
+import signal
+import socket
+import struct
+from multiprocessing import Process
+
+from cryptography.exceptions import InvalidTag
+from twisted.internet import reactor
+from twisted.internet.task import LoopingCall
+
+from Tribler.community.tunnel import EXIT_NODE, EXIT_NODE_SALT, ORIGINATOR, ORIGINATOR_SALT, ORIGINATOR_SALT_EXPLICIT
+from Tribler.community.tunnel.crypto.tunnelcrypto import CryptoException, SessionKey
+
+FRAME_ADD_ROUTE = 1     # Parent -> worker: forward the packets of a circuit
+FRAME_REMOVE_ROUTE = 2  # Parent -> worker: forget a circuit
+FRAME_RELAY = 3         # Parent -> worker: forward a packet of a relay
+FRAME_EXIT = 4          # Parent -> worker: decrypt a packet for an exit socket. Worker -> parent: the decrypted packet
+FRAME_SEND = 5          # Parent -> worker: encrypt a packet from an exit socket and send it back into the tunnel
+FRAME_STOP = 6          # Parent -> worker: shut down
+CONTROL_FRAMES = (FRAME_ADD_ROUTE, FRAME_REMOVE_ROUTE, FRAME_STOP)
+
+ROUTE_EXIT = 2          # The direction of an exit socket route, next to ORIGINATOR and EXIT_NODE
+
+# Packets that a worker encrypts use a salt_explicit from a range of its own, so that they never share an IV with
+# packets that the main process encrypts using the same key
+WORKER_SALT_EXPLICIT_OFFSET = 2 ** 48
+
+MAX_BATCH_SIZE = 60000  # Batches are single datagrams on a unix socket and should stay below its buffer size
+WORKER_JOIN_TIMEOUT = 1.0
+WORKER_CHECK_INTERVAL = 5  # The number of seconds between checks whether the workers are still alive
+
+FRAME_HEADER = struct.Struct('!BIH')
+ROUTE_INFO = struct.Struct('!IB4sH16s4s16s4sQ')
+ADDRESS = struct.Struct('!4sH')
+CIRCUIT_ID = struct.Struct('!I')
+
+
+def encode_address(sock_addr):
+    return ADDRESS.pack(socket.inet_aton(sock_addr[0]), sock_addr[1])
+
+
+def decode_address(data, offset=0):
+    host, port = ADDRESS.unpack_from(data, offset)
+    return socket.inet_ntoa(host), port
+
+
+def iter_frames(batch):
+    offset = 0
+    while offset + FRAME_HEADER.size <= len(batch):
+        frame_type, circuit_id, length = FRAME_HEADER.unpack_from(batch, offset)
+        offset += FRAME_HEADER.size
+        yield frame_type, circuit_id, batch[offset:offset + length]
+        offset += length
+
+
+class WorkerRoute(object):
+
+    def __init__(self, next_circuit_id, direction, sock_addr, enc_key, enc_salt, dec_key, dec_salt, salt_explicit):
+        self.next_circuit_id = next_circuit_id
+        self.direction = direction
+        self.sock_addr = sock_addr
+        self.enc_key = enc_key
+        self.enc_salt = enc_salt
+        self.dec_key = dec_key
+        self.dec_salt = dec_salt
+        self.salt_explicit = salt_explicit
+
+
+class DataPlaneWorker(object):
+    """
+    The part of the data plane that runs in a worker process. It keeps the routes of the circuits in its shard and
+    processes the frames it gets from the main process.
+    """
+
+    def __init__(self, crypto, data_prefix, sock, conn):
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self.crypto = crypto
+        self.data_prefix = data_prefix
+        self.sock = sock
+        self.conn = conn
+        self.routes = {}
+        self.stats = dict.fromkeys(("relayed", "exited", "sent", "dropped"), 0)
+
+    def run(self):
+        while True:
+            try:
+                batch = self.conn.recv(65536)
+            except socket.error:
+                return
+            if not batch or not self.process_batch(batch):
+                return
+
+    def process_batch(self, batch):
+        results = []
+        for frame_type, circuit_id, body in iter_frames(batch):
+            if frame_type == FRAME_STOP:
+                return False
+            try:
+                self.process_frame(frame_type, circuit_id, body, results)
+            except (CryptoException, InvalidTag, KeyError, socket.error):
+                self.stats["dropped"] += 1
+        if results:
+            self.send_results(results)
+        return True
+
+    def process_frame(self, frame_type, circuit_id, body, results):
+        if frame_type == FRAME_RELAY:
+            route = self.routes[circuit_id]
+            if route.direction == ORIGINATOR:
+                content = self.encrypt(route, body)
+            else:
+                content = self.crypto.decrypt_str(body, route.dec_key, route.dec_salt)
+            self.sendto(route.next_circuit_id, content, route.sock_addr)
+            self.stats["relayed"] += 1
+
+        elif frame_type == FRAME_EXIT:
+            route = self.routes[circuit_id]
+            content = self.crypto.decrypt_str(body[ADDRESS.size:], route.dec_key, route.dec_salt)
+            results.append(FRAME_HEADER.pack(FRAME_EXIT, circuit_id, ADDRESS.size + len(content)) +
+                           body[:ADDRESS.size] + content)
+            self.stats["exited"] += 1
+
+        elif frame_type == FRAME_SEND:
+            route = self.routes[circuit_id]
+            self.sendto(circuit_id, self.encrypt(route, body), route.sock_addr)
+            self.stats["sent"] += 1
+
+        elif frame_type == FRAME_ADD_ROUTE:
+            next_circuit_id, direction, host, port, enc_key, enc_salt, dec_key, dec_salt, salt_explicit = \
+                ROUTE_INFO.unpack(body)
+            self.routes[circuit_id] = WorkerRoute(next_circuit_id, direction, (socket.inet_ntoa(host), port),
+                                                  SessionKey(enc_key), enc_salt, SessionKey(dec_key), dec_salt,
+                                                  salt_explicit)
+
+        elif frame_type == FRAME_REMOVE_ROUTE:
+            self.routes.pop(circuit_id, None)
+
+    def encrypt(self, route, content):
+        route.salt_explicit += 1
+        return self.crypto.encrypt_str(content, route.enc_key, route.enc_salt, route.salt_explicit)
+
+    def sendto(self, circuit_id, content, sock_addr):
+        self.sock.sendto(self.data_prefix + CIRCUIT_ID.pack(circuit_id) + content, sock_addr)
+
+    def send_results(self, results):
+        batch = []
+        batch_size = 0
+        for result in results:
+            if batch and batch_size + len(result) > MAX_BATCH_SIZE:
+                self.conn.sendall(''.join(batch))
+                batch, batch_size = [], 0
+            batch.append(result)
+            batch_size += len(result)
+        self.conn.sendall(''.join(batch))
+
+
+def run_worker(crypto, data_prefix, socket_fd, conn, parent_conns):
+    # The reactor of the main process handles the signals, workers are stopped by it
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for parent_conn in parent_conns:
+        parent_conn.close()
+
+    # The duplicated socket shares its blocking mode with the endpoint, so packets that cannot be sent are dropped
+    sock = socket.fromfd(socket_fd, socket.AF_INET, socket.SOCK_DGRAM)
+    DataPlaneWorker(crypto, data_prefix, sock, conn).run()
+
+
+class WorkerReader(object):
+    """
+    Reads the frames that a worker returns to the main process from the reactor.
+    """
+
+    def __init__(self, conn, callback, lost_callback):
+        self.conn = conn
+        self.callback = callback
+        self.lost_callback = lost_callback
+
+    def fileno(self):
+        return self.conn.fileno()
+
+    def logPrefix(self):
+        return self.__class__.__name__
+
+    def doRead(self):
+        while True:
+            try:
+                batch = self.conn.recv(65536)
+            except socket.error:
+                return
+            if not batch:
+                return
+            for frame in iter_frames(batch):
+                self.callback(*frame)
+
+    def connectionLost(self, reason):
+        self.lost_callback()
+
+
+class DataPlane(object):
+    """
+    The part of the data plane that runs in the main process. It shards the circuits over the workers and batches the
+    frames for every worker until the reactor gets around to sending them.
+    """
+
+    def __init__(self, crypto, data_prefix, socket_fd, num_workers, exit_callback):
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self.crypto = crypto
+        self.data_prefix = data_prefix
+        self.socket_fd = socket_fd
+        self.num_workers = num_workers
+        self.exit_callback = exit_callback
+
+        self.processes = []
+        self.conns = []
+        self.readers = []
+        self.batches = []
+        self.batch_sizes = []
+        self.controls = []
+        self.flush_call = None
+        self.check_lc = None
+        self.routes = set()
+        # The shards of dead workers are forwarded in-process
+        self.dead_workers = set()
+        self.stats = dict.fromkeys(("relayed", "exited", "sent", "dropped_batches"), 0)
+
+    @staticmethod
+    def is_supported():
+        # Workers inherit the socket of the endpoint, which requires fork
+        return os.name == 'posix'
+
+    @property
+    def running(self):
+        return bool(self.processes)
+
+    def start(self):
+        pairs = [socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM) for _ in xrange(self.num_workers)]
+        parent_conns = [parent_conn for parent_conn, _ in pairs]
+
+        for index, (parent_conn, worker_conn) in enumerate(pairs):
+            process = Process(target=run_worker, name="DataPlaneWorker-%d" % index,
+                              args=(self.crypto, self.data_prefix, self.socket_fd, worker_conn, parent_conns))
+            process.daemon = True
+            process.start()
+            worker_conn.close()
+
+            parent_conn.setblocking(False)
+            reader = WorkerReader(parent_conn, self.on_worker_frame, lambda index=index: self.check_worker(index))
+            reactor.addReader(reader)
+
+            self.processes.append(process)
+            self.conns.append(parent_conn)
+            self.readers.append(reader)
+            self.batches.append([])
+            self.batch_sizes.append(0)
+            self.controls.append([])
+
+        self.check_lc = LoopingCall(self.check_workers)
+        self.check_lc.start(WORKER_CHECK_INTERVAL, now=False)
+        self._logger.info("Started %d data plane workers", self.num_workers)
+
+    def stop(self):
+        if not self.running:
+            return
+
+        self.flush()
+        for index in xrange(self.num_workers):
+            self.write(index, FRAME_STOP, 0, '')
+        self.flush()
+
+        if self.check_lc and self.check_lc.running:
+            self.check_lc.stop()
+        self.check_lc = None
+        for index, reader in enumerate(self.readers):
+            if index not in self.dead_workers:
+                reactor.removeReader(reader)
+        for process in self.processes:
+            process.join(WORKER_JOIN_TIMEOUT)
+            if process.is_alive():
+                process.terminate()
+        for conn in self.conns:
+            conn.close()
+
+        if self.flush_call and self.flush_call.active():
+            self.flush_call.cancel()
+        self.flush_call = None
+        self.processes, self.conns, self.readers = [], [], []
+        self.batches, self.batch_sizes, self.controls = [], [], []
+        self.routes.clear()
+        self.dead_workers.clear()
+
+    def check_workers(self):
+        for index in xrange(len(self.processes)):
+            self.check_worker(index)
+
+    def check_worker(self, index):
+        if index < len(self.processes) and index not in self.dead_workers and not self.processes[index].is_alive():
+            self.on_worker_died(index)
+
+    def on_worker_died(self, index):
+        """
+        Stop handing frames to a dead worker. Its routes are forgotten, so the packets of the circuits in its shard are
+        forwarded in-process from now on. Those encrypt with the salt_explicit of the main process, which never
+        overlaps with the range that the worker used.
+        """
+        self._logger.warning("Data plane worker %d died with exit code %s, forwarding its circuits in-process",
+                             index, self.processes[index].exitcode)
+        self.dead_workers.add(index)
+        reactor.removeReader(self.readers[index])
+        self.conns[index].close()
+        self.batches[index] = []
+        self.batch_sizes[index] = 0
+        self.controls[index] = []
+        self.routes = set(circuit_id for circuit_id in self.routes if self.get_worker_index(circuit_id) != index)
+
+    def get_worker_index(self, circuit_id):
+        return circuit_id % self.num_workers
+
+    def has_route(self, circuit_id):
+        return circuit_id in self.routes
+
+    def can_offload(self, circuit_id):
+        """
+        Return whether the worker of the shard of a circuit is alive.
+        """
+        return self.get_worker_index(circuit_id) not in self.dead_workers
+
+    def add_relay(self, circuit_id, next_circuit_id, direction, sock_addr, session_keys):
+        self.add_route(circuit_id, next_circuit_id, direction, sock_addr, session_keys)
+
+    def add_exit(self, circuit_id, sock_addr, session_keys):
+        self.add_route(circuit_id, circuit_id, ROUTE_EXIT, sock_addr, session_keys)
+
+    def add_route(self, circuit_id, next_circuit_id, direction, sock_addr, session_keys):
+        host, port = sock_addr
+        salt_explicit = session_keys[ORIGINATOR_SALT_EXPLICIT] + \
+            (self.get_worker_index(circuit_id) + 1) * WORKER_SALT_EXPLICIT_OFFSET
+        body = ROUTE_INFO.pack(next_circuit_id, direction, socket.inet_aton(host), port,
+                               session_keys[ORIGINATOR], session_keys[ORIGINATOR_SALT],
+                               session_keys[EXIT_NODE], session_keys[EXIT_NODE_SALT], salt_explicit)
+        self.routes.add(circuit_id)
+        self.write(self.get_worker_index(circuit_id), FRAME_ADD_ROUTE, circuit_id, body)
+
+    def remove_route(self, circuit_id):
+        if circuit_id in self.routes:
+            self.routes.discard(circuit_id)
+            self.write(self.get_worker_index(circuit_id), FRAME_REMOVE_ROUTE, circuit_id, '')
+
+    def relay(self, circuit_id, encrypted):
+        self.stats["relayed"] += 1
+        self.write(self.get_worker_index(circuit_id), FRAME_RELAY, circuit_id, encrypted)
+
+    def exit(self, circuit_id, sock_addr, encrypted):
+        self.stats["exited"] += 1
+        self.write(self.get_worker_index(circuit_id), FRAME_EXIT, circuit_id, encode_address(sock_addr) + encrypted)
+
+    def send(self, circuit_id, plaintext):
+        self.stats["sent"] += 1
+        self.write(self.get_worker_index(circuit_id), FRAME_SEND, circuit_id, plaintext)
+
+    def write(self, index, frame_type, circuit_id, body):
+        if index in self.dead_workers:
+            return
+
+        frame = FRAME_HEADER.pack(frame_type, circuit_id, len(body)) + body
+        if self.batch_sizes[index] + len(frame) > MAX_BATCH_SIZE:
+            self.flush_worker(index)
+
+        self.batches[index].append(frame)
+        self.batch_sizes[index] += len(frame)
+        if frame_type in CONTROL_FRAMES:
+            self.controls[index].append(frame)
+        if not self.flush_call:
+            self.flush_call = reactor.callLater(0, self.flush)
+
+    def flush(self):
+        self.flush_call = None
+        for index in xrange(len(self.batches)):
+            if self.batches[index]:
+                self.flush_worker(index)
+
+    def flush_worker(self, index):
+        batch = ''.join(self.batches[index])
+        controls = self.controls[index]
+        self.batches[index] = []
+        self.batch_sizes[index] = 0
+        self.controls[index] = []
+        try:
+            self.conns[index].send(batch)
+        except socket.error as e:
+            self.stats["dropped_batches"] += 1
+            # Sending to a worker that exited is refused
+            self.check_worker(index)
+            if index in self.dead_workers:
+                return
+            self._logger.debug("Dropping a batch for data plane worker %d: %s", index, e)
+
+            # Data packets may get lost, but the worker should not miss any changes to its routes
+            self.batches[index] = controls
+            self.batch_sizes[index] = sum(len(frame) for frame in controls)
+            self.controls[index] = list(controls)
+            if controls and not self.flush_call:
+                self.flush_call = reactor.callLater(0, self.flush)
+
+    def on_worker_frame(self, frame_type, circuit_id, body):
+        if frame_type == FRAME_EXIT:
+            self.exit_callback(circuit_id, decode_address(body), CIRCUIT_ID.pack(circuit_id) + body[ADDRESS.size:])
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats["workers"] = self.num_workers
+        stats["routes"] = len(self.routes)
+        stats["dead_workers"] = len(self.dead_workers)
+        return stats
@@ -0,0 +1,162 @@
+"""
+Caching hostname resolution for exit sockets.
+
+Tracker and DHT traffic that leaves the tunnels is addressed to a limited set of hostnames. Instead of resolving the
+destination of every datagram, the exit sockets of a tunnel community share a DNSCache that keeps addresses for as long
+as the DNS records allow, remembers failed lookups for a little while and lets concurrent lookups of the same hostname
+wait for a single query. If the twisted.names resolver cannot be used, because no name servers could be found or
+they cannot be reached, hostnames are resolved by the resolver of the reactor instead.
+"""
+import logging
+from collections import OrderedDict
+
+from twisted.internet import reactor
+from twisted.internet.abstract import isIPAddress
+from twisted.internet.defer import Deferred, fail, maybeDeferred, succeed
+from twisted.internet.error import DNSLookupError
+from twisted.names import dns
+from twisted.names.error import AuthoritativeDomainError, DNSNameError, DomainError
+
+MIN_TTL = 5                 # Records with a shorter TTL are cached for this many seconds anyway
+MAX_TTL = 60 * 60           # Records are never cached for longer than this many seconds
+NXDOMAIN_TTL = 60           # The number of seconds that a non-existing hostname is remembered
+FAILURE_TTL = 10            # The number of seconds that another failed lookup is remembered
+FALLBACK_TTL = 60           # The number of seconds that an address from the reactor resolver is cached, it has no TTL
+MAX_ENTRIES = 10000         # The maximum number of hostnames in the cache
+
+
+class DNSCacheEntry(object):
+
+    def __init__(self, address, expiry, error=None):
+        self.address = address
+        self.expiry = expiry
+        self.error = error
+
+
+class DNSCache(object):
+    """
+    Resolves hostnames to IPv4 addresses using a twisted.names resolver, which can be replaced by a fake one in tests.
+    The resolve method returns a deferred, just like reactor.resolve. Lookups that fail without an answer of a name
+    server are retried with the fallback, which defaults to reactor.resolve.
+    """
+
+    def __init__(self, resolver=None, clock=reactor, max_entries=MAX_ENTRIES, fallback=None):
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self._resolver = resolver
+        self.resolver_failed = False
+        self.fallback = fallback or reactor.resolve
+        self.clock = clock
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.pending = {}
+        self.stats = dict.fromkeys(("hits", "negative_hits", "misses", "coalesced", "literals", "failures",
+                                    "fallbacks"), 0)
+
+    @property
+    def resolver(self):
+        if self._resolver is None and not self.resolver_failed:
+            try:
+                self._resolver = self.create_resolver()
+            except Exception as exc:
+                self._logger.warning("Cannot create a DNS resolver, falling back to the reactor resolver: %s", exc)
+                self.resolver_failed = True
+        return self._resolver
+
+    @staticmethod
+    def create_resolver():
+        from twisted.names.client import getResolver
+        return getResolver()
+
+    def resolve(self, hostname):
+        if isIPAddress(hostname):
+            self.stats["literals"] += 1
+            return succeed(hostname)
+
+        entry = self.entries.get(hostname)
+        if entry and entry.expiry > self.clock.seconds():
+            if entry.address is None:
+                self.stats["negative_hits"] += 1
+                return fail(DNSLookupError("%s: %s" % (hostname, entry.error)))
+            self.stats["hits"] += 1
+            return succeed(entry.address)
+
+        waiter = Deferred()
+        if hostname in self.pending:
+            self.stats["coalesced"] += 1
+            self.pending[hostname].append(waiter)
+            return waiter
+
+        self.stats["misses"] += 1
+        self.pending[hostname] = [waiter]
+        resolver = self.resolver
+        if resolver is None:
+            self.fallback_lookup(hostname)
+        else:
+            maybeDeferred(resolver.lookupAddress, hostname).addCallbacks(self.on_lookup_result, self.on_lookup_error,
+                                                                         callbackArgs=(hostname,),
+                                                                         errbackArgs=(hostname,))
+        return waiter
+
+    def fallback_lookup(self, hostname):
+        self.stats["fallbacks"] += 1
+        maybeDeferred(self.fallback, hostname).addCallbacks(self.on_resolved, self.on_fallback_error,
+                                                            callbackArgs=(hostname, FALLBACK_TTL),
+                                                            errbackArgs=(hostname,))
+
+    def on_lookup_result(self, result, hostname):
+        answers = result[0]
+        records = [record for record in answers if record.type == dns.A]
+        if not records:
+            self.on_lookup_failed(hostname, "no address records", NXDOMAIN_TTL)
+            return
+
+        ttl = min(max(min(record.ttl for record in records), MIN_TTL), MAX_TTL)
+        self.on_resolved(records[0].payload.dottedQuad(), hostname, ttl)
+
+    def on_resolved(self, address, hostname, ttl):
+        self.add_entry(hostname, DNSCacheEntry(address, self.clock.seconds() + ttl))
+        for waiter in self.pending.pop(hostname, []):
+            waiter.callback(address)
+
+    def on_lookup_error(self, failure, hostname):
+        if failure.check(DNSNameError):
+            self.on_lookup_failed(hostname, "hostname does not exist", NXDOMAIN_TTL)
+        elif failure.check(DomainError, AuthoritativeDomainError):
+            self.on_lookup_failed(hostname, failure.getErrorMessage() or failure.type.__name__, FAILURE_TTL)
+        else:
+            # No name server answered, like when none are configured or they time out
+            self._logger.debug("Failed to look up %s, falling back to the reactor resolver: %s", hostname,
+                               failure.getErrorMessage() or failure.type.__name__)
+            self.fallback_lookup(hostname)
+
+    def on_fallback_error(self, failure, hostname):
+        self.on_lookup_failed(hostname, failure.getErrorMessage() or failure.type.__name__, FAILURE_TTL)
+
+    def on_lookup_failed(self, hostname, error, ttl):
+        self._logger.debug("Failed to resolve %s: %s", hostname, error)
+        self.stats["failures"] += 1
+        self.add_entry(hostname, DNSCacheEntry(None, self.clock.seconds() + ttl, error))
+        for waiter in self.pending.pop(hostname, []):
+            waiter.errback(DNSLookupError("%s: %s" % (hostname, error)))
+
+    def add_entry(self, hostname, entry):
+        self.entries.pop(hostname, None)
+        self.entries[hostname] = entry
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def prune(self):
+        """
+        Remove the entries that have expired.
+        """
+        now = self.clock.seconds()
+        for hostname, entry in self.entries.items():
+            if entry.expiry <= now:
+                del self.entries[hostname]
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        lookups = stats["hits"] + stats["negative_hits"] + stats["misses"] + stats["coalesced"]
+        stats["entries"] = len(self.entries)
+        stats["hit_rate"] = (lookups - stats["misses"]) / float(lookups) if lookups else 0.0
+        return stats
@@ -0,0 +1,209 @@
+"""
+Sharing a fixed set of UDP sockets between exit sockets.
+
+An exit node used to listen on a UDP socket of its own for every circuit that exits through it, so a busy exit node held
+a file descriptor for every circuit. The ExitSocketPool sends the data of all exit sockets over a fixed number of UDP
+sockets instead and works like a NAT: every (socket, destination) pair is mapped to the circuit that sent data to the
+destination over that socket, so that the replies can be handed back to the right circuit. Mappings that are not used
+for a while expire.
+
+A socket is mapped to at most one circuit per destination host, so unrelated circuits never share a source port towards
+the same host, not even when they talk to different ports of it. When every socket of the pool is already mapped to
+other circuits for a host, the exit socket falls back to a socket of its own. The fallback is remembered like a mapping,
+so the circuit keeps its source port towards that destination until the fallback expires. Like a NAT, the pool only
+accepts data from destinations that a circuit has sent data to.
+"""
+import logging
+import time
+from collections import defaultdict
+
+from twisted.internet import reactor
+from twisted.internet.defer import DeferredList, maybeDeferred
+from twisted.internet.protocol import DatagramProtocol
+
+from Tribler.community.tunnel import EXIT_MAPPING_TIMEOUT
+
+
+class ExitMapping(object):
+
+    def __init__(self, circuit_id, last_used):
+        self.circuit_id = circuit_id
+        self.last_used = last_used
+
+
+class HostMapping(object):
+
+    def __init__(self, circuit_id):
+        self.circuit_id = circuit_id
+        self.ports = set()
+
+
+class PooledSocket(DatagramProtocol):
+
+    def __init__(self, pool, index):
+        self.pool = pool
+        self.index = index
+
+    def datagramReceived(self, data, source):
+        self.pool.on_datagram(self.index, data, source)
+
+
+class ExitSocketPool(object):
+    """
+    Writes the data of circuits using size shared UDP sockets, which are only opened once they are needed. Data from a
+    mapped destination is passed to on_data(circuit_id, data, source).
+    """
+
+    def __init__(self, size, on_data, timeout=EXIT_MAPPING_TIMEOUT, clock=time.time):
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self.size = size
+        self.on_data = on_data
+        self.timeout = timeout
+        self.clock = clock
+        self.protocols = [PooledSocket(self, index) for index in xrange(size)]
+        self.ports = [None] * size
+        self.mappings = {}
+        self.circuit_mappings = defaultdict(set)
+        # The circuit that every (socket, host) pair is taken by, with the ports of the host that it is mapped to
+        self.hosts = {}
+        # The (circuit_id, address) pairs that use the socket of the exit socket itself, with the time they were used
+        self.fallbacks = {}
+        # The socket that every circuit prefers, circuits are spread over the sockets of the pool
+        self.home_sockets = {}
+        self.num_circuits = [0] * size
+        self.stats = dict.fromkeys(("mapped", "expired", "overflows", "unmapped"), 0)
+
+    def get_socket(self, circuit_id, address):
+        """
+        Return the index of the socket over which a circuit sends data to address, or None if every socket is already
+        mapped to other circuits for the host of this address.
+        """
+        host = address[0]
+        free_index = None
+        for index in xrange(self.size):
+            host_mapping = self.hosts.get((index, host))
+            if host_mapping is None:
+                if free_index is None:
+                    free_index = index
+            elif host_mapping.circuit_id == circuit_id:
+                if (index, address) not in self.mappings:
+                    self.add_mapping(index, circuit_id, address)
+                return index
+
+        home_index = self.home_sockets.get(circuit_id)
+        if home_index is None:
+            home_index = self.home_sockets[circuit_id] = self.num_circuits.index(min(self.num_circuits))
+            self.num_circuits[home_index] += 1
+        if (home_index, host) not in self.hosts:
+            free_index = home_index
+        if free_index is None:
+            self.stats["overflows"] += 1
+            return None
+
+        self.add_mapping(free_index, circuit_id, address)
+        return free_index
+
+    def add_mapping(self, index, circuit_id, address):
+        self.mappings[(index, address)] = ExitMapping(circuit_id, self.clock())
+        self.circuit_mappings[circuit_id].add((index, address))
+        self.hosts.setdefault((index, address[0]), HostMapping(circuit_id)).ports.add(address[1])
+        self.stats["mapped"] += 1
+
+    def remove_mapping(self, key):
+        """
+        Remove the mapping of a (socket, address) pair. The socket is free for the host again once none of the ports of
+        the host are mapped.
+        """
+        del self.mappings[key]
+        index, (host, port) = key
+        host_mapping = self.hosts[(index, host)]
+        host_mapping.ports.discard(port)
+        if not host_mapping.ports:
+            del self.hosts[(index, host)]
+
+    def write(self, circuit_id, data, address):
+        """
+        Send data of a circuit to address. Return False if the pool has no socket for it, the exit socket should use
+        a socket of its own in that case. It keeps doing so until the fallback expires.
+        """
+        if (circuit_id, address) in self.fallbacks:
+            self.fallbacks[(circuit_id, address)] = self.clock()
+            return False
+
+        index = self.get_socket(circuit_id, address)
+        if index is None:
+            self.fallbacks[(circuit_id, address)] = self.clock()
+            return False
+
+        if self.ports[index] is None:
+            self.ports[index] = reactor.listenUDP(0, self.protocols[index])
+        self.mappings[(index, address)].last_used = self.clock()
+        self.protocols[index].transport.write(data, address)
+        return True
+
+    def on_datagram(self, index, data, source):
+        mapping = self.mappings.get((index, source))
+        if mapping is None:
+            self.stats["unmapped"] += 1
+            self._logger.debug("Dropping data from %s:%d, it is not mapped to a circuit", *source)
+            return
+        mapping.last_used = self.clock()
+        self.on_data(mapping.circuit_id, data, source)
+
+    def touch_fallback(self, circuit_id, source):
+        """
+        Keep the fallback of a circuit for source alive, once data from source arrived on the socket of its own.
+        """
+        if (circuit_id, source) in self.fallbacks:
+            self.fallbacks[(circuit_id, source)] = self.clock()
+
+    def release(self, circuit_id):
+        """
+        Remove the mappings of a circuit, once its exit socket is closed.
+        """
+        for key in self.circuit_mappings.pop(circuit_id, ()):
+            self.remove_mapping(key)
+        home_index = self.home_sockets.pop(circuit_id, None)
+        if home_index is not None:
+            self.num_circuits[home_index] -= 1
+        for key in [key for key in self.fallbacks if key[0] == circuit_id]:
+            del self.fallbacks[key]
+
+    def prune(self):
+        """
+        Remove the mappings and fallbacks that have not been used for timeout seconds.
+        """
+        expiry = self.clock() - self.timeout
+        for key, mapping in self.mappings.items():
+            if mapping.last_used < expiry:
+                self.remove_mapping(key)
+                circuit_mappings = self.circuit_mappings[mapping.circuit_id]
+                circuit_mappings.discard(key)
+                if not circuit_mappings:
+                    del self.circuit_mappings[mapping.circuit_id]
+                self.stats["expired"] += 1
+        for key, last_used in self.fallbacks.items():
+            if last_used < expiry:
+                del self.fallbacks[key]
+
+    def stop(self):
+        """
+        Close the sockets of the pool.
+        :return: A deferred that fires once all sockets have closed.
+        """
+        deferreds = [maybeDeferred(port.stopListening) for port in self.ports if port is not None]
+        self.ports = [None] * self.size
+        self.mappings.clear()
+        self.circuit_mappings.clear()
+        self.hosts.clear()
+        self.fallbacks.clear()
+        self.home_sockets.clear()
+        self.num_circuits = [0] * self.size
+        return DeferredList(deferreds)
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats["mappings"] = len(self.mappings)
+        stats["fallbacks"] = len(self.fallbacks)
+        stats["sockets"] = sum(1 for port in self.ports if port is not None)
+        return stats
@@ -11,14 +11,18 @@ import struct
 import time
 from collections import defaultdict
 
+from twisted.internet.defer import Deferred, fail
+
 from Tribler.Core.DecentralizedTracking.pymdht.core.identifier import Id
 from Tribler.Core.Utilities.encoding import encode, decode
+from Tribler.Core.Utilities.metrics import registry
 from Tribler.Core.simpledefs import DLSTATUS_SEEDING, DLSTATUS_STOPPED, \
     NTFY_TUNNEL, NTFY_IP_REMOVED, NTFY_RP_REMOVED, NTFY_IP_RECREATE, \
     NTFY_DHT_LOOKUP, NTFY_KEY_REQUEST, NTFY_KEY_RESPOND, NTFY_KEY_RESPONSE, \
     NTFY_CREATE_E2E, NTFY_ONCREATED_E2E, NTFY_IP_CREATED, DLSTATUS_DOWNLOADING
 from Tribler.community.tunnel import CIRCUIT_TYPE_IP, CIRCUIT_TYPE_RP, CIRCUIT_TYPE_RENDEZVOUS, \
     EXIT_NODE, EXIT_NODE_SALT, CIRCUIT_ID_PORT
+from Tribler.community.tunnel.intro_point_cache import IntroductionPointCache
 from Tribler.community.tunnel.payload import (EstablishIntroPayload, IntroEstablishedPayload,
                                               EstablishRendezvousPayload, RendezvousEstablishedPayload,
                                               KeyResponsePayload, KeyRequestPayload, CreateE2EPayload,
@@ -36,6 +40,9 @@ from Tribler.dispersy.requestcache import RandomNumberCache
 from Tribler.dispersy.resolution import PublicResolution
 from Tribler.dispersy.util import call_on_reactor_thread
 
+TIME_TO_RENDEZVOUS_SECONDS = registry.histogram("tribler_tunnel_time_to_rendezvous_seconds",
+                                                "Time between starting a hidden download and linking the first "
+                                                "end-to-end circuit", buckets=(1, 2, 5, 10, 20, 30, 60, 120, 300))
 
 class IPRequestCache(RandomNumberCache):
 
@@ -92,9 +99,10 @@ class DHTRequestCache(RandomNumberCache):
         super(DHTRequestCache, self).__init__(community.request_cache, u"dht-request")
         self.circuit = circuit
         self.info_hash = info_hash
+        self.deferred = Deferred()
 
     def on_timeout(self):
-        pass
+        self.deferred.errback(RuntimeError("dht-request timed out"))
 
 
 class KeyRelayCache(RandomNumberCache):
@@ -150,7 +158,8 @@ class HiddenTunnelCommunity(TunnelCommunity):
         self.infohash_pex = defaultdict(set)
 
         self.dht_blacklist = defaultdict(list)
-        self.last_dht_lookup = {}
+        self.intro_point_cache = IntroductionPointCache(self.send_dht_request)
+        self.rendezvous_pending = {}  # The time at which hidden downloads started, by lookup infohash
 
         self.tunnel_logger = logging.getLogger('TunnelLogger')
 
@@ -195,6 +204,10 @@ class HiddenTunnelCommunity(TunnelCommunity):
                      CandidateDestination(), RendezvousEstablishedPayload(), self.check_rendezvous_established,
                      self.on_rendezvous_established)]
 
+    def unload_community(self):
+        self.intro_point_cache.clear()
+        return super(HiddenTunnelCommunity, self).unload_community()
+
     def remove_circuit(self, circuit_id, additional_info='', destroy=False):
         super(HiddenTunnelCommunity, self).remove_circuit(circuit_id, additional_info, destroy)
 
@@ -252,12 +265,18 @@ class HiddenTunnelCommunity(TunnelCommunity):
                         self.tunnel_logger.info('Recreate the introducing circuit for %s' % info_hash.encode('hex'))
                         self.create_introduction_point(info_hash)
 
-            time_elapsed = (time.time() - self.last_dht_lookup.get(info_hash, 0))
-            force_dht_lookup = time_elapsed >= self.settings.dht_lookup_interval
-            if (state_changed or force_dht_lookup) and \
-               (new_state == DLSTATUS_SEEDING or new_state == DLSTATUS_DOWNLOADING):
-                self.tunnel_logger.info('Do dht lookup to find hidden services peers for %s' % info_hash.encode('hex'))
-                self.do_dht_lookup(info_hash)
+            # Measure the time until the first end-to-end circuit of a download that starts downloading
+            if state_changed and new_state == DLSTATUS_DOWNLOADING:
+                self.rendezvous_pending.setdefault(info_hash, time.time())
+            elif state_changed:
+                self.rendezvous_pending.pop(info_hash, None)
+
+            if new_state == DLSTATUS_SEEDING or new_state == DLSTATUS_DOWNLOADING:
+                # A download that (re)starts may use the introduction points that were looked up recently
+                if state_changed:
+                    self.do_dht_lookup(info_hash)
+                elif self.intro_point_cache.needs_refresh(info_hash, self.settings.dht_lookup_interval):
+                    self.do_dht_lookup(info_hash, refresh=True)
 
             if state_changed and new_state == DLSTATUS_SEEDING:
                 self.create_introduction_point(info_hash)
@@ -265,6 +284,7 @@ class HiddenTunnelCommunity(TunnelCommunity):
             elif state_changed and new_state in [DLSTATUS_STOPPED, None]:
                 if info_hash in self.infohash_pex:
                     self.infohash_pex.pop(info_hash)
+                self.intro_point_cache.remove(info_hash)
 
                 for cid, info_hash_hops in self.my_download_points.items():
                     if info_hash_hops[0] == info_hash:
@@ -280,21 +300,41 @@ class HiddenTunnelCommunity(TunnelCommunity):
 
         self.download_states = new_states
 
-    def do_dht_lookup(self, info_hash):
+    def do_dht_lookup(self, info_hash, refresh=False):
+        """
+        Find the introduction points of the hidden seeders of an infohash and request their keys. Unless refresh is
+        set, introduction points that were looked up recently are used without asking the DHT again.
+        """
+        self.tunnel_logger.info('Do dht lookup to find hidden services peers for %s', info_hash.encode('hex'))
+        if refresh:
+            lookup_deferred = self.intro_point_cache.refresh(info_hash)
+        else:
+            lookup_deferred = self.intro_point_cache.get_peers(info_hash, self.settings.dht_lookup_interval)
+
+        def on_error(failure):
+            self.tunnel_logger.info("DHT lookup for %s failed: %s", info_hash.encode('hex'), failure.getErrorMessage())
+
+        return lookup_deferred.addCallbacks(lambda peers: self.on_intro_points(info_hash, peers), on_error)
+
+    def send_dht_request(self, info_hash):
+        """
+        Ask an exit node to look up an infohash in the DHT.
+        :return: A deferred that fires with the peers in the dht-response.
+        """
         # Select a circuit from the pool of exit circuits
         self.tunnel_logger.info("Do DHT request: select circuit")
         circuit = self.selection_strategy.select(None, self.hops[info_hash])
         if not circuit:
             self.tunnel_logger.info("No circuit for dht-request")
-            return False
+            return fail(RuntimeError("no circuit for dht-request"))
 
         # Send a dht-request message over this circuit
         self.tunnel_logger.info("Do DHT request: send dht request")
-        self.last_dht_lookup[info_hash] = time.time()
         cache = self.request_cache.add(DHTRequestCache(self, circuit, info_hash))
         self.send_cell([Candidate(circuit.first_hop, False)],
                        u"dht-request",
                        (circuit.circuit_id, cache.number, info_hash))
+        return cache.deferred
 
     def on_dht_request(self, messages):
         for message in messages:
@@ -333,29 +373,37 @@ class HiddenTunnelCommunity(TunnelCommunity):
 
     def on_dht_response(self, messages):
         for message in messages:
-            self.request_cache.pop(u"dht-request", message.payload.identifier)
+            cache = self.request_cache.pop(u"dht-request", message.payload.identifier)
 
-            info_hash = message.payload.info_hash
             _, peers = decode(message.payload.peers)
-            peers = set(peers)
             self.tunnel_logger.info("Received dht response containing %d peers" % len(peers))
+            if cache:
+                cache.deferred.callback(peers)
+            else:
+                # A later response to a lookup that has already been answered
+                self.intro_point_cache.merge(message.payload.info_hash, set(peers))
+                self.on_intro_points(message.payload.info_hash, set(peers))
 
-            blacklist = self.dht_blacklist[info_hash]
+    def on_intro_points(self, info_hash, peers):
+        """
+        Request the keys of the introduction points that were found for an infohash.
+        """
+        blacklist = self.dht_blacklist[info_hash]
 
-            if self.notifier:
-                self.notifier.notify(NTFY_TUNNEL, NTFY_DHT_LOOKUP, info_hash.encode('hex')[:6], peers)
-
-            # cleanup dht_blacklist
-            for i in xrange(len(blacklist) - 1, -1, -1):
-                if time.time() - blacklist[i][0] > 60:
-                    blacklist.pop(i)
-            exclude = [rp[2] for rp in self.my_download_points.values()] + [sock_addr for _, sock_addr in blacklist]
-            for peer in peers:
-                if peer not in exclude:
-                    self.tunnel_logger.info("Requesting key from dht peer %s", peer)
-                    # Blacklist this sock_addr for a period of at least 60s
-                    self.dht_blacklist[info_hash].append((time.time(), peer))
-                    self.create_key_request(info_hash, peer)
+        if self.notifier:
+            self.notifier.notify(NTFY_TUNNEL, NTFY_DHT_LOOKUP, info_hash.encode('hex')[:6], peers)
+
+        # cleanup dht_blacklist
+        for i in xrange(len(blacklist) - 1, -1, -1):
+            if time.time() - blacklist[i][0] > 60:
+                blacklist.pop(i)
+        exclude = [rp[2] for rp in self.my_download_points.values()] + [sock_addr for _, sock_addr in blacklist]
+        for peer in peers:
+            if peer not in exclude:
+                self.tunnel_logger.info("Requesting key from dht peer %s", peer)
+                # Blacklist this sock_addr for a period of at least 60s
+                self.dht_blacklist[info_hash].append((time.time(), peer))
+                self.create_key_request(info_hash, peer)
 
     def create_key_request(self, info_hash, sock_addr):
         # 1. Select a circuit
@@ -609,6 +657,9 @@ class HiddenTunnelCommunity(TunnelCommunity):
     def on_linked_e2e(self, messages):
         for message in messages:
             cache = self.request_cache.pop(u"link-request", message.payload.identifier)
+            started = self.rendezvous_pending.pop(cache.info_hash, None)
+            if started is not None:
+                TIME_TO_RENDEZVOUS_SECONDS.observe(time.time() - started)
             download = self.find_download(cache.info_hash)
             if download:
                 download.add_peer((self.circuit_id_to_ip(cache.circuit.circuit_id), CIRCUIT_ID_PORT))
@@ -0,0 +1,131 @@
+"""
+Caching the introduction points of hidden services.
+
+Hidden downloads find the introduction points of hidden seeders by looking up the lookup infohash of the download in the
+DHT, through an exit node. The lookup used to be repeated every dht_lookup_interval seconds for every hidden download,
+whether or not the introduction points had changed. The IntroductionPointCache keeps the result of the last lookup of
+every infohash, lets concurrent lookups of the same infohash wait for a single lookup and refreshes the introduction
+points less often while the lookups keep returning the same ones. A lookup may be answered by several responses, the
+introduction points in the later ones are merged into the cache entry.
+"""
+import logging
+
+from twisted.internet import reactor
+from twisted.internet.defer import Deferred, succeed
+
+MAX_BACKOFF = 8     # Unchanged results stretch the refresh interval up to this many times dht_lookup_interval
+
+
+class IntroductionPointEntry(object):
+
+    def __init__(self, peers, timestamp, backoff=1):
+        self.peers = peers
+        self.timestamp = timestamp
+        self.backoff = backoff
+
+
+class IntroductionPointCache(object):
+    """
+    Caches the peers that DHT lookups return by infohash. The lookup function takes an infohash and returns a deferred
+    that fires with the set of peers, or fails if the lookup could not be done. Like the dht_lookup_interval setting it
+    follows, the refresh interval is passed to every call.
+    """
+
+    def __init__(self, lookup, clock=reactor, max_backoff=MAX_BACKOFF):
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self.lookup = lookup
+        self.clock = clock
+        self.max_backoff = max_backoff
+        self.entries = {}
+        self.pending = {}
+        self.stats = dict.fromkeys(("hits", "misses", "coalesced", "failures", "merged"), 0)
+
+    def get_peers(self, info_hash, interval):
+        """
+        Return a deferred that fires with the introduction points of an infohash, from the cache if they were looked
+        up less than interval seconds ago.
+        """
+        entry = self.entries.get(info_hash)
+        if entry and entry.timestamp + interval > self.clock.seconds():
+            self.stats["hits"] += 1
+            return succeed(entry.peers)
+        return self.refresh(info_hash)
+
+    def needs_refresh(self, info_hash, interval):
+        """
+        Return whether the introduction points of an infohash should be looked up again. The interval grows while the
+        lookups return the same introduction points.
+        """
+        if info_hash in self.pending:
+            return False
+        entry = self.entries.get(info_hash)
+        return not entry or entry.timestamp + interval * entry.backoff <= self.clock.seconds()
+
+    def refresh(self, info_hash):
+        """
+        Look up the introduction points of an infohash, or wait for the lookup that is already underway.
+        """
+        waiter = Deferred()
+        if info_hash in self.pending:
+            self.stats["coalesced"] += 1
+            self.pending[info_hash].append(waiter)
+            return waiter
+
+        self.stats["misses"] += 1
+        self.pending[info_hash] = [waiter]
+        self.lookup(info_hash).addCallbacks(self.on_lookup_result, self.on_lookup_error,
+                                            callbackArgs=(info_hash,), errbackArgs=(info_hash,))
+        return waiter
+
+    def on_lookup_result(self, peers, info_hash):
+        peers = set(peers)
+        entry = self.entries.get(info_hash)
+        if entry and peers and peers == entry.peers:
+            backoff = min(entry.backoff * 2, self.max_backoff)
+        else:
+            backoff = 1
+        self.entries[info_hash] = IntroductionPointEntry(peers, self.clock.seconds(), backoff)
+        for waiter in self.pending.pop(info_hash, []):
+            waiter.callback(peers)
+
+    def on_lookup_error(self, failure, info_hash):
+        # Failed lookups are not cached, the next refresh looks up the infohash again
+        self._logger.debug("Failed to look up introduction points for %s: %s", info_hash.encode('hex'),
+                           failure.getErrorMessage())
+        self.stats["failures"] += 1
+        for waiter in self.pending.pop(info_hash, []):
+            waiter.errback(failure)
+
+    def merge(self, info_hash, peers):
+        """
+        Add the introduction points of a later response to a lookup to the cache entry of an infohash.
+        """
+        entry = self.entries.get(info_hash)
+        if entry and not peers <= entry.peers:
+            self.stats["merged"] += 1
+            # The set may have been handed out already, so it is replaced rather than changed
+            entry.peers = entry.peers | peers
+            entry.backoff = 1
+
+    def remove(self, info_hash):
+        """
+        Forget the introduction points of an infohash, once it is no longer downloaded or seeded.
+        """
+        self.entries.pop(info_hash, None)
+
+    def clear(self):
+        """
+        Forget all introduction points and fail the lookups that are still waiting, once the community unloads.
+        """
+        self.entries.clear()
+        pending, self.pending = self.pending, {}
+        for waiters in pending.itervalues():
+            for waiter in waiters:
+                waiter.errback(RuntimeError("the community was unloaded"))
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"] + stats["coalesced"]
+        stats["entries"] = len(self.entries)
+        stats["hit_rate"] = (lookups - stats["misses"]) / float(lookups) if lookups else 0.0
+        return stats
@@ -196,6 +196,52 @@ class RelayRoute(object):
         self.rendezvous_relay = rendezvous_relay
         self.mid = mid
 
+
+class CircuitRing(object):
+
+    """
+    The ready circuits of a certain length, in the order in which they are selected. Circuits are only added or
+    removed when their state changes, so that selecting the next circuit takes constant time.
+    """
+
+    def __init__(self):
+        self.circuits = []
+        self.index = -1
+
+    def __len__(self):
+        return len(self.circuits)
+
+    def add(self, circuit):
+        """
+        Add a circuit at the end of the ring
+        @param Circuit circuit: the circuit that became ready
+        """
+        if circuit not in self.circuits:
+            self.circuits.append(circuit)
+
+    def remove(self, circuit):
+        """
+        Remove a circuit from the ring, without changing which circuit is selected next
+        @param Circuit circuit: the circuit that is no longer ready
+        """
+        if circuit in self.circuits:
+            position = self.circuits.index(circuit)
+            self.circuits.pop(position)
+            if position <= self.index:
+                self.index -= 1
+
+    def next(self):
+        """
+        Return the next circuit in the ring, or None if the ring is empty
+        @rtype: Circuit
+        """
+        if not self.circuits:
+            return None
+
+        self.index = (self.index + 1) % len(self.circuits)
+        return self.circuits[self.index]
+
+
 class RendezvousPoint(object):
 
     def __init__(self, circuit, cookie, finished_callback):
@@ -0,0 +1,216 @@
+"""
+Fair forwarding of the data packets of relays and exit sockets.
+
+Relays and exit nodes forward the packets of every circuit in the order in which they arrive, so a single circuit
+that carries a bulk transfer can take all of the bandwidth of a node. The FairScheduler limits the rate at which every
+circuit, and the node as a whole, forwards data using token buckets. Packets that cannot be forwarded right away are
+queued per circuit and sent using deficit round robin, so that every circuit with queued packets gets an equal share
+of what the node may send. Circuits that were idle are served before circuits that have been sending for a while, which
+keeps circuits with little traffic, such as DHT lookups or interactive traffic, responsive while bulk transfers share the
+remaining capacity.
+
+Without a rate limit for the node, packets are only held back by the limit of their own circuit.
+"""
+import logging
+from collections import deque
+
+from twisted.internet import reactor
+
+QUANTUM = 1500                  # The number of bytes that a circuit may send per round, about one full packet
+MAX_QUEUED_BYTES = 256 * 1024   # The default maximum number of bytes that are queued per circuit
+MIN_DELAY = 0.001               # The shortest wait for a token bucket, which keeps rounding errors from busy looping
+
+
+class TokenBucket(object):
+    """
+    Limits a rate in bytes per second, allowing bursts of up to burst_size bytes. A rate of 0 means unlimited.
+    """
+
+    def __init__(self, rate, burst_size, now):
+        self.rate = rate
+        self.burst_size = burst_size
+        self.tokens = burst_size
+        self.last_update = now
+
+    def get_delay(self, num_bytes, now):
+        """
+        Return the number of seconds until num_bytes may be sent. Packets that are larger than the burst size may be
+        sent once the bucket is full.
+        """
+        if not self.rate:
+            return 0
+        self.tokens = min(self.burst_size, self.tokens + (now - self.last_update) * self.rate)
+        self.last_update = now
+        needed = min(num_bytes, self.burst_size)
+        if self.tokens >= needed:
+            return 0
+        return max((needed - self.tokens) / float(self.rate), MIN_DELAY)
+
+    def consume(self, num_bytes):
+        if self.rate:
+            self.tokens -= num_bytes
+
+
+class CircuitQueue(object):
+
+    def __init__(self, circuit_id, bucket):
+        self.circuit_id = circuit_id
+        self.bucket = bucket
+        self.packets = deque()
+        self.num_bytes = 0
+        self.deficit = 0
+        self.active = False
+        self.dropped = 0
+
+
+class FairScheduler(object):
+    """
+    Schedules the forwarding of the data packets of circuits. Every packet comes with the function that forwards it,
+    which is called right away when no packets are queued and the rate limits allow it, and later otherwise.
+    """
+
+    def __init__(self, circuit_rate=0, circuit_burst_size=0, node_rate=0, node_burst_size=0,
+                 max_queued_bytes=MAX_QUEUED_BYTES, quantum=QUANTUM, clock=reactor):
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self.circuit_rate = circuit_rate
+        self.circuit_burst_size = circuit_burst_size
+        self.max_queued_bytes = max_queued_bytes
+        self.quantum = quantum
+        self.clock = clock
+        self.node_bucket = TokenBucket(node_rate, node_burst_size, clock.seconds())
+        self.queues = {}
+        # The circuits with queued packets, as in fq_codel: circuits that became active recently are served first
+        self.new_circuits = deque()
+        self.old_circuits = deque()
+        self.delayed_call = None
+        self.stats = dict.fromkeys(("sent", "sent_bytes", "queued", "dropped", "dropped_bytes"), 0)
+
+    @property
+    def has_backlog(self):
+        return bool(self.new_circuits or self.old_circuits)
+
+    def get_queue(self, circuit_id):
+        queue = self.queues.get(circuit_id)
+        if queue is None:
+            bucket = TokenBucket(self.circuit_rate, self.circuit_burst_size, self.clock.seconds())
+            queue = self.queues[circuit_id] = CircuitQueue(circuit_id, bucket)
+        return queue
+
+    def send(self, circuit_id, num_bytes, callback, *args):
+        """
+        Forward a packet of num_bytes bytes of a circuit by calling callback(*args), now or once the rate limits and
+        the other circuits allow it. Return False if the packet is dropped because the queue of the circuit is full.
+        """
+        queue = self.get_queue(circuit_id)
+        # Without a limit for the node, circuits do not compete and only have to wait for their own packets
+        if not queue.packets and (not self.has_backlog or not self.node_bucket.rate):
+            now = self.clock.seconds()
+            if not queue.bucket.get_delay(num_bytes, now) and not self.node_bucket.get_delay(num_bytes, now):
+                self.forward(queue, num_bytes, callback, args)
+                return True
+
+        if queue.num_bytes + num_bytes > self.max_queued_bytes:
+            queue.dropped += 1
+            self.stats["dropped"] += 1
+            self.stats["dropped_bytes"] += num_bytes
+            self._logger.debug("Dropping a packet of circuit %d, %d bytes are queued", circuit_id, queue.num_bytes)
+            return False
+
+        queue.packets.append((num_bytes, callback, args))
+        queue.num_bytes += num_bytes
+        self.stats["queued"] += 1
+        if not queue.active:
+            queue.active = True
+            queue.deficit = self.quantum
+            self.new_circuits.append(queue)
+        self.schedule(0)
+        return True
+
+    def forward(self, queue, num_bytes, callback, args):
+        queue.bucket.consume(num_bytes)
+        self.node_bucket.consume(num_bytes)
+        self.stats["sent"] += 1
+        self.stats["sent_bytes"] += num_bytes
+        callback(*args)
+
+    def schedule(self, delay):
+        if self.delayed_call and self.delayed_call.active():
+            if self.delayed_call.getTime() <= self.clock.seconds() + delay:
+                return
+            self.delayed_call.cancel()
+        self.delayed_call = self.clock.callLater(delay, self.process)
+
+    def process(self):
+        """
+        Forward queued packets using deficit round robin, for as long as the rate limits allow it.
+        """
+        self.delayed_call = None
+        now = self.clock.seconds()
+        # The circuits that have to wait for their own rate limit, they do not take part in the rest of this round
+        limited = []
+        delay = None
+
+        while self.has_backlog:
+            circuits = self.new_circuits or self.old_circuits
+            queue = circuits[0]
+
+            if not queue.packets:
+                circuits.popleft()
+                queue.active = False
+                continue
+
+            if queue.deficit <= 0:
+                queue.deficit += self.quantum
+                circuits.popleft()
+                self.old_circuits.append(queue)
+                continue
+
+            num_bytes, callback, args = queue.packets[0]
+            circuit_delay = queue.bucket.get_delay(num_bytes, now)
+            if circuit_delay:
+                circuits.popleft()
+                limited.append(queue)
+                delay = min(delay, circuit_delay) if delay else circuit_delay
+                continue
+
+            node_delay = self.node_bucket.get_delay(num_bytes, now)
+            if node_delay:
+                delay = min(delay, node_delay) if delay else node_delay
+                break
+
+            queue.packets.popleft()
+            queue.num_bytes -= num_bytes
+            queue.deficit -= num_bytes
+            self.forward(queue, num_bytes, callback, args)
+
+        self.old_circuits.extend(limited)
+        if delay:
+            self.schedule(delay)
+
+    def remove(self, circuit_id):
+        """
+        Forget a circuit and drop the packets that are queued for it.
+        """
+        queue = self.queues.pop(circuit_id, None)
+        if queue and queue.packets:
+            self.stats["dropped"] += len(queue.packets)
+            self.stats["dropped_bytes"] += queue.num_bytes
+            queue.packets.clear()
+            queue.num_bytes = 0
+            # Let the other circuits continue, the empty queue leaves the round when it is its turn
+            self.schedule(0)
+
+    def stop(self):
+        for circuit_id in self.queues.keys():
+            self.remove(circuit_id)
+        self.new_circuits.clear()
+        self.old_circuits.clear()
+        if self.delayed_call and self.delayed_call.active():
+            self.delayed_call.cancel()
+        self.delayed_call = None
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats["queued_bytes"] = sum(queue.num_bytes for queue in self.queues.itervalues())
+        stats["backlogged_circuits"] = len(self.new_circuits) + len(self.old_circuits)
+        return stats
@@ -19,17 +19,26 @@ from twisted.internet.task import LoopingCall
 from twisted.python.threadable import isInIOThread
 
 from Tribler.Core.Utilities.encoding import decode, encode
+from Tribler.Core.Utilities.memory import cache_registry
+from Tribler.Core.Utilities.metrics import registry
 from Tribler.community.tunnel import (CIRCUIT_ID_PORT, CIRCUIT_STATE_EXTENDING, CIRCUIT_STATE_READY, CIRCUIT_TYPE_DATA,
                                       CIRCUIT_TYPE_RENDEZVOUS, CIRCUIT_TYPE_RP, EXIT_NODE, EXIT_NODE_SALT, ORIGINATOR,
-                                      ORIGINATOR_SALT, PING_INTERVAL)
+                                      ORIGINATOR_SALT, PING_INTERVAL, DNS_PRUNE_INTERVAL, CIRCUIT_HEALTH_INTERVAL,
+                                      CIRCUIT_ROTATION_GRACE, CIRCUIT_ROTATION_MARGIN, CIRCUIT_ROTATION_TRAFFIC,
+                                      EXIT_PRUNE_INTERVAL)
 from Tribler.community.tunnel.Socks5.server import Socks5Server
+from Tribler.community.tunnel.circuit_pool import WarmCircuitPool
 from Tribler.community.tunnel.conversion import TunnelConversion
 from Tribler.community.tunnel.crypto.tunnelcrypto import CryptoException, TunnelCrypto
+from Tribler.community.tunnel.dataplane import DataPlane
+from Tribler.community.tunnel.dns_cache import DNSCache
+from Tribler.community.tunnel.exit_pool import ExitSocketPool
 from Tribler.community.tunnel.payload import (CellPayload, CreatePayload, CreatedPayload, DestroyPayload, ExtendPayload,
                                               ExtendedPayload, PingPayload, PongPayload, StatsRequestPayload,
                                               StatsResponsePayload, TunnelIntroductionRequestPayload,
                                               TunnelIntroductionResponsePayload)
-from Tribler.community.tunnel.routing import Circuit, Hop, RelayRoute
+from Tribler.community.tunnel.routing import Circuit, CircuitRing, Hop, RelayRoute
+from Tribler.community.tunnel.scheduler import FairScheduler, MAX_QUEUED_BYTES
 from Tribler.dispersy.authentication import MemberAuthentication, NoAuthentication
 from Tribler.dispersy.candidate import Candidate
 from Tribler.dispersy.community import Community
@@ -43,6 +52,9 @@ from Tribler.dispersy.resolution import PublicResolution
 from Tribler.dispersy.taskmanager import TaskManager
 from Tribler.dispersy.util import call_on_reactor_thread
 
+TIME_TO_FIRST_BYTE_SECONDS = registry.histogram("tribler_tunnel_time_to_first_byte_seconds",
+                                                "Time between requesting circuits and receiving the first tunneled data",
+                                                ["hops"], buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120))
 
 class CircuitRequestCache(NumberCache):
 
@@ -92,12 +104,14 @@ class PingRequestCache(RandomNumberCache):
         self.tunnel_logger = logging.getLogger('TunnelLogger')
         self.circuit = circuit
         self.community = community
+        self.sent_time = time.time()
 
     @property
     def timeout_delay(self):
         return PING_INTERVAL + 5
 
     def on_timeout(self):
+        self.community.selection_strategy.on_ping_lost(self.circuit)
         if self.circuit.last_incoming < time.time() - self.timeout_delay:
             self.tunnel_logger.info("PingRequestCache: no response on ping, circuit %d timed out",
                                     self.circuit.circuit_id)
@@ -122,6 +136,7 @@ class TunnelExitSocket(DatagramProtocol, TaskManager):
         super(TunnelExitSocket, self).__init__()
 
         self.port = None
+        self.exit_pool = None
         self.sock_addr = sock_addr
         self.circuit_id = circuit_id
         self.community = community
@@ -132,11 +147,23 @@ class TunnelExitSocket(DatagramProtocol, TaskManager):
 
     def enable(self):
         if not self.enabled:
-            self.port = reactor.listenUDP(0, self)
+            if self.community.exit_pool.size:
+                self.exit_pool = self.community.exit_pool
+            else:
+                self.port = reactor.listenUDP(0, self)
 
     @property
     def enabled(self):
-        return self.port is not None
+        return self.port is not None or self.exit_pool is not None
+
+    def write(self, data, address):
+        if self.exit_pool:
+            if self.exit_pool.write(self.circuit_id, data, address):
+                return
+            # The sockets of the pool are mapped to other circuits for this address, use a socket of our own
+            if self.port is None:
+                self.port = reactor.listenUDP(0, self)
+        self.transport.write(data, address)
 
     def sendto(self, data, destination):
         if self.check_num_packets(destination, False):
@@ -148,22 +175,25 @@ class TunnelExitSocket(DatagramProtocol, TaskManager):
                 def on_ip_address(ip_address):
                     self.tunnel_logger.debug("Resolved hostname %s to ip_address %s", destination[0], ip_address)
                     try:
-                        self.transport.write(data, (ip_address, destination[1]))
+                        self.write(data, (ip_address, destination[1]))
                         self.community.increase_bytes_sent(self, len(data))
                     except (AttributeError, MessageLengthError, socket.error) as exception:
                         self.tunnel_logger.error(
                             "Failed to write data to transport: %s. Destination: %r error was: %r",
                             exception, destination, exception)
 
-                resolve_ip_address_deferred = reactor.resolve(destination[0])
+                resolve_ip_address_deferred = self.community.dns_cache.resolve(destination[0])
                 resolve_ip_address_deferred.addCallbacks(on_ip_address, on_error)
-                self.register_task("resolving_%r" % destination[0], resolve_ip_address_deferred)
+                if not resolve_ip_address_deferred.called:
+                    self.register_task("resolving_%r" % destination[0], resolve_ip_address_deferred)
             else:
                 self.tunnel_logger.error("dropping forbidden packets from exit socket with circuit_id %d",
                                          self.circuit_id)
 
     def datagramReceived(self, data, source):
         self.community.increase_bytes_received(self, len(data))
+        if self.exit_pool:
+            self.exit_pool.touch_fallback(self.circuit_id, source)
         if self.check_num_packets(source, True):
             if TunnelConversion.is_allowed(data):
                 self.tunnel_data(source, data)
@@ -178,7 +208,7 @@ class TunnelExitSocket(DatagramProtocol, TaskManager):
     @inlineCallbacks
     def close(self):
         """
-        Closes the UDP socket if enabled and cancels all pending deferreds.
+        Closes the UDP socket if enabled, releases the sockets of the pool and cancels all pending deferreds.
         :return: A deferred that fires once the UDP socket has closed.
         """
         assert isInIOThread()
@@ -187,7 +217,10 @@ class TunnelExitSocket(DatagramProtocol, TaskManager):
         yield self.wait_for_deferred_tasks()
         self.cancel_all_pending_tasks()
         done_closing_deferred = succeed(None)
-        if self.enabled:
+        if self.exit_pool:
+            self.exit_pool.release(self.circuit_id)
+            self.exit_pool = None
+        if self.port is not None:
             done_closing_deferred = maybeDeferred(self.port.stopListening)
             self.port = None
         res = yield done_closing_deferred
@@ -232,24 +265,44 @@ class TunnelSettings(object):
         self.max_packets_without_reply = 50
         self.dht_lookup_interval = 30
 
+        # Number of worker processes that forward the data packets of relays and exit sockets (0 = in-process)
+        self.dataplane_workers = 0
+
+        # Rate limits in bytes/s for the data that we relay or exit, per circuit and for all circuits together
+        # (0 = unlimited), the number of bytes that may be sent in a burst, and the number of bytes that are queued
+        # per circuit while a limit holds its packets back
+        self.circuit_rate_limit = 0
+        self.circuit_burst_size = 256 * 1024
+        self.node_rate_limit = 0
+        self.node_burst_size = 1024 * 1024
+        self.max_queued_bytes = MAX_QUEUED_BYTES
+
+        # Number of UDP sockets that the exit sockets share (0 = a socket for every exit socket)
+        self.exit_pool_size = 8
+
+        # The class that selects the circuit for a new destination, RoundRobin or HealthAwareSelection
+        self.selection_strategy = HealthAwareSelection
+
         if tribler_session:
             self.socks_listen_ports = tribler_session.config.get_tunnel_community_socks5_listen_ports()
             self.become_exitnode = tribler_session.config.get_tunnel_community_exitnode_enabled()
             self.enable_trustchain = tribler_session.config.get_trustchain_enabled()
+            self.warm_pool_size = tribler_session.config.get_tunnel_community_warm_pool_size()
         else:
             self.socks_listen_ports = range(1080, 1085)
             self.become_exitnode = False
             self.enable_trustchain = False
+            # Maximum number of circuits per circuit length that are kept ready ahead of demand
+            self.warm_pool_size = 0
 
 
 class RoundRobin(object):
 
     def __init__(self, community):
         self.community = community
-        self.index = -1
 
     def has_options(self, hops):
-        return len(self.community.active_data_circuits(hops)) > 0
+        return len(self.community.circuit_rings[hops]) > 0
 
     def select(self, destination, hops):
         if destination and destination[1] == CIRCUIT_ID_PORT:
@@ -260,14 +313,109 @@ class RoundRobin(object):
                circuit.ctype == CIRCUIT_TYPE_RENDEZVOUS:
                 return circuit
 
-        circuit_ids = sorted(self.community.active_data_circuits(hops).keys())
+        return self.select_from_ring(self.community.circuit_rings[hops])
+
+    def select_from_ring(self, ring):
+        return ring.next()
+
+    def on_pong(self, circuit, rtt):
+        pass
+
+    def on_ping_lost(self, circuit):
+        pass
+
+    def update(self):
+        pass
+
+
+class CircuitHealth(object):
+
+    def __init__(self, num_bytes, timestamp):
+        self.rtt = None
+        self.loss = 0.0
+        self.throughput = 0.0
+        self.num_bytes = num_bytes
+        self.timestamp = timestamp
+
+
+class HealthAwareSelection(RoundRobin):
+    """
+    Selects circuits in proportion to their health. For every circuit, it keeps exponentially weighted moving averages of
+    the round-trip time of pings, the fraction of pings that got lost and the achieved throughput. A share of the
+    selections is still made round robin, so that circuits without traffic keep being probed.
+    """
+
+    ALPHA = 0.3                 # The weight of a new sample in the moving averages
+    EXPLORE = 0.1               # The share of selections that is made round robin
+    DEFAULT_RTT = 1.0           # The round-trip time that is assumed as long as no circuit has been measured
+    MIN_RTT = 0.01              # Round-trip times below this number of seconds are not rewarded any further
+
+    def __init__(self, community, clock=time.time, rand=random.random):
+        super(HealthAwareSelection, self).__init__(community)
+        self.clock = clock
+        self.random = rand
+        self.health = {}
 
-        if not circuit_ids:
-            return None
+    def get_health(self, circuit):
+        health = self.health.get(circuit.circuit_id)
+        if not health:
+            health = self.health[circuit.circuit_id] = CircuitHealth(circuit.bytes_up + circuit.bytes_down,
+                                                                     self.clock())
+        return health
 
-        self.index = (self.index + 1) % len(circuit_ids)
-        circuit_id = circuit_ids[self.index]
-        return self.community.active_data_circuits()[circuit_id]
+    def on_pong(self, circuit, rtt):
+        health = self.get_health(circuit)
+        health.rtt = rtt if health.rtt is None else (1 - self.ALPHA) * health.rtt + self.ALPHA * rtt
+        health.loss *= 1 - self.ALPHA
+
+    def on_ping_lost(self, circuit):
+        health = self.get_health(circuit)
+        health.loss = (1 - self.ALPHA) * health.loss + self.ALPHA
+
+    def update(self):
+        """
+        Sample the throughput of every circuit and forget the circuits that have been removed.
+        """
+        now = self.clock()
+        for circuit_id in self.health.keys():
+            if circuit_id not in self.community.circuits:
+                del self.health[circuit_id]
+
+        for circuit in self.community.circuits.itervalues():
+            health = self.get_health(circuit)
+            num_bytes = circuit.bytes_up + circuit.bytes_down
+            if now > health.timestamp:
+                throughput = (num_bytes - health.num_bytes) / (now - health.timestamp)
+                health.throughput = (1 - self.ALPHA) * health.throughput + self.ALPHA * throughput
+            health.num_bytes = num_bytes
+            health.timestamp = now
+
+    def get_weights(self, circuits):
+        healths = [self.get_health(circuit) for circuit in circuits]
+        rtts = [health.rtt for health in healths if health.rtt is not None]
+        default_rtt = sum(rtts) / len(rtts) if rtts else self.DEFAULT_RTT
+        max_throughput = max(health.throughput for health in healths)
+
+        weights = []
+        for health in healths:
+            rtt = max(health.rtt if health.rtt is not None else default_rtt, self.MIN_RTT)
+            weight = (1 - health.loss) ** 2 / rtt
+            if max_throughput > 0:
+                weight *= 1 + health.throughput / max_throughput
+            weights.append(weight)
+        return weights
+
+    def select_from_ring(self, ring):
+        if len(ring) < 2 or self.random() < self.EXPLORE:
+            return ring.next()
+
+        weights = self.get_weights(ring.circuits)
+        target = self.random() * sum(weights)
+        for circuit, weight in zip(ring.circuits, weights):
+            target -= weight
+            if target < 0:
+                return circuit
+        return ring.circuits[-1]
 
 
 class TunnelCommunity(Community):
@@ -278,11 +426,15 @@ class TunnelCommunity(Community):
 
         self.data_prefix = "fffffffe".decode("HEX")
         self.circuits = {}
+        self.circuit_rings = defaultdict(CircuitRing)  # The ready data circuits by number of hops
         self.directions = {}
         self.relay_from_to = {}
         self.relay_session_keys = {}
         self.exit_sockets = {}
         self.circuits_needed = defaultdict(int)
+        self.rotating_circuits = {}  # Circuits that are being replaced, with the time at which their traffic moved
+        self.first_byte_pending = {}  # The time at which circuits were requested, by circuit length
+        self.last_tunneled_byte = {}  # The time at which data last arrived over a data circuit, by circuit length
         self.num_hops_by_downloads = defaultdict(int)  # Keeps track of the number of hops required by downloads
         self.exit_candidates = {}  # Keeps track of the candidates that want to be an exit node
         self.notifier = None
@@ -293,15 +445,34 @@ class TunnelCommunity(Community):
                              '43e8807e6f86ef2f0a784fbc8fa21f8bc49a82ae'.decode('hex'),
                              'e79efd8853cef1640b93c149d7b0f067f6ccf221'.decode('hex')]
         self.bittorrent_peers = {}
+        self.dns_cache = DNSCache()
+        self.dataplane = None
+        self.warm_pool = WarmCircuitPool(0)
+        self.scheduler = FairScheduler()
+        self.exit_pool = ExitSocketPool(0, self.on_exit_pool_data)
 
         self.tribler_session = self.settings = self.socks_server = None
 
+        cache_registry.register("tunnel.circuits", self, "circuits")
+        cache_registry.register("tunnel.relay_from_to", self, "relay_from_to")
+        cache_registry.register("tunnel.relay_session_keys", self, "relay_session_keys")
+        cache_registry.register("tunnel.exit_sockets", self, "exit_sockets")
+        cache_registry.register("tunnel.exit_candidates", self, "exit_candidates")
+        cache_registry.register("tunnel.dns_cache", self.dns_cache, "entries")
+
     def initialize(self, tribler_session=None, settings=None):
         self.tribler_session = tribler_session
         self.settings = settings if settings else TunnelSettings(tribler_session=tribler_session)
 
         self.tunnel_logger.info("TunnelCommunity: setting become_exitnode = %s" % self.settings.become_exitnode)
 
+        self.selection_strategy = self.settings.selection_strategy(self)
+        self.warm_pool = WarmCircuitPool(self.settings.warm_pool_size)
+        self.scheduler = FairScheduler(self.settings.circuit_rate_limit, self.settings.circuit_burst_size,
+                                       self.settings.node_rate_limit, self.settings.node_burst_size,
+                                       self.settings.max_queued_bytes)
+        self.exit_pool = ExitSocketPool(self.settings.exit_pool_size, self.on_exit_pool_data)
+
         super(TunnelCommunity, self).initialize()
 
         assert isinstance(self.settings.crypto, TunnelCrypto), self.settings.crypto
@@ -312,6 +483,13 @@ class TunnelCommunity(Community):
 
         self.register_task("do_circuits", LoopingCall(self.do_circuits)).start(5, now=True)
         self.register_task("do_ping", LoopingCall(self.do_ping)).start(PING_INTERVAL)
+        self.register_task("prune_dns_cache", LoopingCall(self.dns_cache.prune)).start(DNS_PRUNE_INTERVAL, now=False)
+        self.register_task("prune_exit_pool", LoopingCall(self.exit_pool.prune)).start(EXIT_PRUNE_INTERVAL, now=False)
+        self.register_task("update_selection_strategy",
+                           LoopingCall(self.selection_strategy.update)).start(CIRCUIT_HEALTH_INTERVAL, now=False)
+
+        if self.settings.dataplane_workers > 0:
+            self.start_dataplane(self.settings.dataplane_workers)
 
         self.socks_server = Socks5Server(self, self.settings.socks_listen_ports)
         self.socks_server.start()
@@ -406,8 +584,23 @@ class TunnelCommunity(Community):
         for circuit_id in self.exit_sockets.keys():
             self.remove_exit_socket(circuit_id, 'unload', destroy=True)
 
+        if self.dataplane:
+            self.dataplane.stop()
+            self.dataplane = None
+        self.scheduler.stop()
+        yield self.exit_pool.stop()
+
         yield super(TunnelCommunity, self).unload_community()
 
+    def start_dataplane(self, num_workers):
+        if not DataPlane.is_supported():
+            self.tunnel_logger.error("Data plane workers are not supported on this platform, forwarding in-process")
+            return
+
+        socket_fd = self.dispersy.endpoint._socket.fileno()
+        self.dataplane = DataPlane(self.crypto, self.data_prefix, socket_fd, num_workers, self.on_dataplane_exit)
+        self.dataplane.start()
+
     @property
     def crypto(self):
         return self.settings.crypto
@@ -436,18 +629,28 @@ class TunnelCommunity(Community):
 
     @call_on_reactor_thread
     def do_circuits(self):
-        for circuit_length, num_circuits in self.circuits_needed.items():
-            num_to_build = num_circuits - len(self.data_circuits(circuit_length))
+        for hops, num_downloads in self.num_hops_by_downloads.items():
+            if hops > 0 and num_downloads > 0:
+                self.warm_pool.record_usage(hops, len(self.circuit_rings[hops]))
+        warm_targets = self.warm_pool.get_targets()
+
+        for circuit_length in set(self.circuits_needed) | set(warm_targets):
+            num_circuits = max(self.circuits_needed[circuit_length], warm_targets.get(circuit_length, 0))
+            # Circuits that are being replaced do not count, so that their replacement gets built
+            num_to_build = num_circuits - len([circuit_id for circuit_id in self.data_circuits(circuit_length)
+                                               if circuit_id not in self.rotating_circuits])
             self.tunnel_logger.info("want %d data circuits of length %d", num_to_build, circuit_length)
             for _ in range(num_to_build):
                 if not self.create_circuit(circuit_length):
                     self.tunnel_logger.info("circuit creation of %d circuits failed, no need to continue" %
                                              num_to_build)
                     break
+        self.do_rotate()
         self.do_remove()
 
     def tunnels_ready(self, hops):
         if hops > 0:
+            self.start_first_byte_timer(hops)
             if self.settings.min_circuits:
                 return min(1, len(self.active_data_circuits(hops)) / float(self.settings.min_circuits))
             else:
@@ -456,6 +659,7 @@ class TunnelCommunity(Community):
 
     def build_tunnels(self, hops):
         if hops > 0:
+            self.start_first_byte_timer(hops)
             self.num_hops_by_downloads[hops] += 1
             self.circuits_needed[hops] = max(1, self.settings.max_circuits, self.circuits_needed[hops])
             self.do_circuits()
@@ -469,6 +673,51 @@ class TunnelCommunity(Community):
             self.num_hops_by_downloads[download.get_hops()] -= 1
             if self.num_hops_by_downloads[download.get_hops()] == 0:
                 self.circuits_needed[download.get_hops()] = 0
+                self.first_byte_pending.pop(download.get_hops(), None)
+
+    def start_first_byte_timer(self, hops):
+        """
+        Start measuring the time until tunneled data arrives over circuits of the given length, unless data has been
+        arriving over such circuits recently.
+        """
+        now = time.time()
+        if hops not in self.first_byte_pending and \
+                self.last_tunneled_byte.get(hops, 0) < now - self.settings.max_time_inactive:
+            self.first_byte_pending[hops] = now
+
+    def on_tunneled_data(self, circuit):
+        hops = len(circuit.hops)
+        now = time.time()
+        self.last_tunneled_byte[hops] = now
+        requested = self.first_byte_pending.pop(hops, None)
+        if requested is not None:
+            TIME_TO_FIRST_BYTE_SECONDS.labels(hops).observe(now - requested)
+
+    def do_rotate(self):
+        """
+        Replace data circuits before they reach max_time or max_traffic (make-before-break). A circuit that is about to
+        expire no longer counts as a needed circuit, so that a replacement gets built. Once another circuit of the same
+        length is ready, the traffic of the old circuit moves over and the old circuit is removed after a grace period.
+        """
+        now = time.time()
+        for circuit_id, circuit in self.circuits.items():
+            if circuit_id not in self.rotating_circuits and circuit.ctype == CIRCUIT_TYPE_DATA and \
+                    circuit.state == CIRCUIT_STATE_READY and \
+                    (circuit.creation_time < now - self.settings.max_time + CIRCUIT_ROTATION_MARGIN or
+                     circuit.bytes_up + circuit.bytes_down > self.settings.max_traffic * CIRCUIT_ROTATION_TRAFFIC):
+                self.tunnel_logger.info("Replacing circuit %d", circuit_id)
+                self.rotating_circuits[circuit_id] = None
+
+        for circuit_id, moved_time in self.rotating_circuits.items():
+            circuit = self.circuits[circuit_id]
+            if moved_time is None:
+                ring = self.circuit_rings[len(circuit.hops)]
+                if any(other.circuit_id not in self.rotating_circuits for other in ring.circuits):
+                    self.remove_active_circuit(circuit)
+                    self.move_circuit_traffic(circuit)
+                    self.rotating_circuits[circuit_id] = now
+            elif moved_time < now - CIRCUIT_ROTATION_GRACE:
+                self.remove_circuit(circuit_id, 'replaced', destroy=True)
 
     def do_remove(self):
         # Remove circuits that are inactive / are too old / have transferred too many bytes.
@@ -610,33 +859,42 @@ class TunnelCommunity(Community):
                 self.destroy_circuit(circuit_id)
 
             circuit = self.circuits.pop(circuit_id)
+            self.remove_active_circuit(circuit)
+            moved_time = self.rotating_circuits.pop(circuit_id, None)
             if self.notifier:
                 peer = (circuit.first_hop[0], circuit.first_hop[1])
                 from Tribler.Core.simpledefs import NTFY_TUNNEL, NTFY_REMOVE
                 self.notifier.notify(NTFY_TUNNEL, NTFY_REMOVE, circuit, self.copy_shallow_candidate(circuit, peer))
             circuit.destroy()
 
-            affected_peers = self.socks_server.circuit_dead(circuit)
-            ltmgr = self.tribler_session.lm.ltmgr \
-                if self.tribler_session and self.tribler_session.config.get_libtorrent_enabled() else None
-            if ltmgr:
-                affected_torrents = {d: affected_peers.intersection(peer.ip for peer in d.handle.get_peer_info())
-                                     for d, s in ltmgr.torrents.values() if s == ltmgr.get_session(d.get_hops())}
-
-                for download, peers in affected_torrents.iteritems():
-                    if peers:
-                        if download not in self.bittorrent_peers:
-                            self.bittorrent_peers[download] = peers
-                        else:
-                            self.bittorrent_peers[download] = peers | self.bittorrent_peers[download]
-
-                # If there are active circuits, add peers immediately. Otherwise postpone.
-                if self.active_data_circuits():
-                    self.readd_bittorrent_peers()
-
+            # The traffic of a replaced circuit has already moved to another circuit
+            if moved_time is None:
+                self.move_circuit_traffic(circuit)
             return True
         return False
 
+    def move_circuit_traffic(self, circuit):
+        """
+        Let the destinations that use a circuit select another circuit, and re-add the BitTorrent peers behind them.
+        """
+        affected_peers = self.socks_server.circuit_dead(circuit)
+        ltmgr = self.tribler_session.lm.ltmgr \
+            if self.tribler_session and self.tribler_session.config.get_libtorrent_enabled() else None
+        if ltmgr:
+            affected_torrents = {d: affected_peers.intersection(peer.ip for peer in d.handle.get_peer_info())
+                                 for d, s in ltmgr.torrents.values() if s == ltmgr.get_session(d.get_hops())}
+
+            for download, peers in affected_torrents.iteritems():
+                if peers:
+                    if download not in self.bittorrent_peers:
+                        self.bittorrent_peers[download] = peers
+                    else:
+                        self.bittorrent_peers[download] = peers | self.bittorrent_peers[download]
+
+            # If there are active circuits, add peers immediately. Otherwise postpone.
+            if self.active_data_circuits():
+                self.readd_bittorrent_peers()
+
     def remove_relay(self, circuit_id, additional_info='', destroy=False, got_destroy_from=None, both_sides=True):
 
         self.tunnel_logger.info("TRUSTCHAIN: Removing relay")
@@ -657,6 +915,9 @@ class TunnelCommunity(Community):
                 self.tunnel_logger.info("Removing relay %d %s", cid, additional_info)
                 # Remove the relay
                 relay = self.relay_from_to.pop(cid)
+                if self.dataplane:
+                    self.dataplane.remove_route(cid)
+                self.scheduler.remove(cid)
                 if self.notifier:
                     peer = (relay.sock_addr[0], relay.sock_addr[1])
                     from Tribler.Core.simpledefs import NTFY_TUNNEL, NTFY_REMOVE
@@ -677,6 +938,9 @@ class TunnelCommunity(Community):
 
             # Close socket
             exit_socket = self.exit_sockets.pop(circuit_id)
+            if self.dataplane:
+                self.dataplane.remove_route(circuit_id)
+            self.scheduler.remove(circuit_id)
             if self.notifier:
                 peer = (exit_socket.sock_addr[0], exit_socket.sock_addr[1])
                 from Tribler.Core.simpledefs import NTFY_TUNNEL, NTFY_REMOVE
@@ -736,6 +1000,15 @@ class TunnelCommunity(Community):
                 if c.state == CIRCUIT_STATE_READY and c.ctype == CIRCUIT_TYPE_DATA and
                 (hops is None or hops == len(c.hops))}
 
+    def add_active_circuit(self, circuit):
+        if circuit.ctype == CIRCUIT_TYPE_DATA:
+            self.circuit_rings[len(circuit.hops)].add(circuit)
+
+    def remove_active_circuit(self, circuit):
+        ring = self.circuit_rings.get(len(circuit.hops))
+        if ring:
+            ring.remove(circuit)
+
     def is_relay(self, circuit_id):
         return circuit_id > 0 and circuit_id in self.relay_from_to
 
@@ -754,6 +1027,10 @@ class TunnelCommunity(Community):
 
     def send_data(self, candidates, circuit_id, dest_address, source_address, data):
         packet = TunnelConversion.encode_data(circuit_id, dest_address, source_address, data)
+        if self.dataplane and self.dataplane.has_route(circuit_id):
+            plaintext, content = TunnelConversion.split_encrypted_packet(packet, u"data")
+            self.dataplane.send(circuit_id, content)
+            return len(packet) + 24
         return self.send_message(candidates, u"data", packet, circuit_id)
 
     def send_message(self, candidates, message_type, packet, circuit_id):
@@ -804,13 +1081,14 @@ class TunnelCommunity(Community):
                 encrypted = self.crypto_out(next_relay.circuit_id, decrypted)
             else:
                 encrypted = self.crypto_relay(circuit_id, encrypted)
-            packet = plaintext + encrypted
 
         except CryptoException, e:
             self.tunnel_logger.error(str(e))
             return False
 
-        packet = TunnelConversion.swap_circuit_id(packet, message_type, circuit_id, next_relay.circuit_id)
+        # The circuit id is part of the plaintext header, so the encrypted content is copied only once
+        plaintext = TunnelConversion.swap_circuit_id(plaintext, message_type, circuit_id, next_relay.circuit_id)
+        packet = plaintext + encrypted
         self.increase_bytes_sent(next_relay, self.send_packet([Candidate(next_relay.sock_addr, False)], message_type, packet))
         return True
 
@@ -970,6 +1248,7 @@ class TunnelCommunity(Community):
 
         elif circuit.state == CIRCUIT_STATE_READY:
             self.request_cache.pop(u"anon-circuit", circuit.circuit_id)
+            self.add_active_circuit(circuit)
             # Re-add BitTorrent peers, if needed.
             self.readd_bittorrent_peers()
 
@@ -1169,7 +1448,10 @@ class TunnelCommunity(Community):
         self.tunnel_logger.debug("Got data (%d) from %s", circuit_id, sock_addr)
 
         if self.is_relay(circuit_id):
-            self.relay_packet(circuit_id, message_type, packet)
+            self.scheduler.send(circuit_id, len(packet), self.relay_data, circuit_id, packet)
+
+        elif self.offload_exit_packet(circuit_id, sock_addr, packet):
+            return
 
         else:
             plaintext, encrypted = TunnelConversion.split_encrypted_packet(packet, message_type)
@@ -1188,6 +1470,8 @@ class TunnelCommunity(Community):
             if circuit and origin and sock_addr == circuit.first_hop:
                 circuit.beat_heart()
                 self.increase_bytes_received(circuit, len(packet))
+                if circuit.ctype == CIRCUIT_TYPE_DATA:
+                    self.on_tunneled_data(circuit)
 
                 if TunnelConversion.could_be_dispersy(data):
                     self.tunnel_logger.debug("Giving incoming data packet to dispersy")
@@ -1206,6 +1490,65 @@ class TunnelCommunity(Community):
                 else:
                     self.tunnel_logger.warning("cannot exit data, destination is 0.0.0.0:0")
 
+    def relay_data(self, circuit_id, packet):
+        # The relay may have been removed while the packet was queued by the scheduler
+        if self.is_relay(circuit_id) and not self.offload_relay_packet(circuit_id, packet):
+            self.relay_packet(circuit_id, u'data', packet)
+
+    def offload_relay_packet(self, circuit_id, packet):
+        """
+        Hand a data packet of a relay to the data plane, if its worker is running. Rendezvous relays need the keys of
+        both circuits and are always handled in-process.
+        """
+        if not self.dataplane or not self.dataplane.can_offload(circuit_id):
+            return False
+
+        next_relay = self.relay_from_to[circuit_id]
+        if next_relay.rendezvous_relay:
+            return False
+
+        if not self.dataplane.has_route(circuit_id):
+            self.dataplane.add_relay(circuit_id, next_relay.circuit_id, self.directions[circuit_id],
+                                     next_relay.sock_addr, self.relay_session_keys[circuit_id])
+
+        this_relay = self.relay_from_to.get(next_relay.circuit_id, None)
+        if this_relay:
+            this_relay.last_incoming = time.time()
+            self.increase_bytes_received(this_relay, len(packet))
+
+        # The data plane adds or removes a layer of encryption, which changes the size of the packet
+        overhead = 24 if self.directions[circuit_id] == ORIGINATOR else -24
+        self.increase_bytes_sent(next_relay, len(packet) + overhead)
+
+        plaintext, encrypted = TunnelConversion.split_encrypted_packet(packet, u"data")
+        self.dataplane.relay(circuit_id, encrypted)
+        return True
+
+    def offload_exit_packet(self, circuit_id, sock_addr, packet):
+        """
+        Hand a data packet for an exit socket to the data plane for decryption, if it is running. The decrypted packet
+        comes back to on_dataplane_exit.
+        """
+        if not self.dataplane or not self.dataplane.can_offload(circuit_id) or not self.is_exit(circuit_id) or \
+                circuit_id in self.circuits:
+            return False
+
+        if not self.dataplane.has_route(circuit_id):
+            self.dataplane.add_exit(circuit_id, self.exit_sockets[circuit_id].sock_addr,
+                                    self.relay_session_keys[circuit_id])
+
+        plaintext, encrypted = TunnelConversion.split_encrypted_packet(packet, u"data")
+        self.dataplane.exit(circuit_id, sock_addr, encrypted)
+        return True
+
+    def on_dataplane_exit(self, circuit_id, sock_addr, packet):
+        circuit_id, destination, _, data = TunnelConversion.decode_data(packet)
+        self.tunnel_logger.debug("data for circuit %d exiting tunnel (%s)", circuit_id, destination)
+        if destination != ('0.0.0.0', 0):
+            self.exit_data(circuit_id, sock_addr, destination, data)
+        else:
+            self.tunnel_logger.warning("cannot exit data, destination is 0.0.0.0:0")
+
     def on_ping(self, messages):
         for message in messages:
             self.send_cell([message.candidate], u"pong", (message.payload.circuit_id, message.payload.identifier))
@@ -1213,7 +1556,9 @@ class TunnelCommunity(Community):
 
     def on_pong(self, messages):
         for message in messages:
-            self.request_cache.pop(u"ping", message.payload.identifier)
+            cache = self.request_cache.pop(u"ping", message.payload.identifier)
+            if cache:
+                self.selection_strategy.on_pong(cache.circuit, time.time() - cache.sent_time)
             self.tunnel_logger.info("Got pong from %s", message.candidate)
 
     def do_ping(self):
@@ -1281,12 +1626,22 @@ class TunnelCommunity(Community):
                     self.exit_sockets[circuit_id].enable()
                 else:
                     self._logger.error("Dropping outbound relayed packet: IP's are %s != %s", str(sock_addr), str(self.exit_sockets[circuit_id].sock_addr))
+            self.scheduler.send(circuit_id, len(data), self.send_exit_data, circuit_id, data, destination)
+        else:
+            self.tunnel_logger.error("Dropping data packets with unknown circuit_id")
+
+    def on_exit_pool_data(self, circuit_id, data, source):
+        exit_socket = self.exit_sockets.get(circuit_id, None)
+        if exit_socket:
+            exit_socket.datagramReceived(data, source)
+
+    def send_exit_data(self, circuit_id, data, destination):
+        exit_socket = self.exit_sockets.get(circuit_id, None)
+        if exit_socket:
             try:
-                self.exit_sockets[circuit_id].sendto(data, destination)
+                exit_socket.sendto(data, destination)
             except:
                 self.tunnel_logger.warning("Dropping data packets while EXITing")
-        else:
-            self.tunnel_logger.error("Dropping data packets with unknown circuit_id")
 
     def crypto_out(self, circuit_id, content, is_data=False):
         circuit = self.circuits.get(circuit_id, None)
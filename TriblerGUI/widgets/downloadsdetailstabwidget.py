@@ -121,12 +121,14 @@ class DownloadsDetailsTabWidget(QTabWidget):
             item = QTreeWidgetItem(self.window().download_trackers_list)
             DownloadsDetailsTabWidget.update_tracker_row(item, tracker)
 
-        # Populate the peers list if the peer information is available
-        self.window().download_peers_list.clear()
+        # Populate the peers list if the peer information is available, otherwise keep the peers we have
         if "peers" in self.current_download:
+            self.window().download_peers_list.clear()
             for peer in self.current_download["peers"]:
                 item = QTreeWidgetItem(self.window().download_peers_list)
                 DownloadsDetailsTabWidget.update_peer_row(item, peer)
+        elif new_download:
+            self.window().download_peers_list.clear()
 
     def on_right_click_file_item(self, pos):
         num_selected = len(self.window().download_files_list.selectedItems())
@@ -28,6 +28,8 @@ class DownloadsPage(QWidget):
         self.filter = DOWNLOADS_FILTER_ALL
         self.download_widgets = {}  # key: infohash, value: QTreeWidgetItem
         self.downloads = None
+        self.downloads_by_infohash = {}  # key: infohash, value: the last received state of the download
+        self.downloads_version = 0  # The version of the last received downloads, we only request changes since then
         self.downloads_timer = QTimer()
         self.downloads_timeout_timer = QTimer()
         self.selected_item = None
@@ -86,9 +88,11 @@ class DownloadsPage(QWidget):
         self.downloads_timeout_timer.stop()
 
     def load_downloads(self):
-        url = "downloads?get_pieces=1"
+        # Peers are not part of the versioned summary, so the peers tab needs the full list to show idle downloads
         if self.window().download_details_widget.currentIndex() == 3:
-            url = "downloads?get_peers=1&get_pieces=1"
+            url = "downloads?get_pieces=1&get_peers=1"
+        else:
+            url = "downloads?get_pieces=1&since=%d" % self.downloads_version
 
         self.downloads_request_mgr.generate_request_id()
         self.downloads_request_mgr.perform_request(url, self.on_received_downloads)
@@ -97,12 +101,20 @@ class DownloadsPage(QWidget):
         if not downloads:
             return  # This might happen when closing Tribler
 
+        # We only receive the downloads that changed since the previous request, unless we get a full list
+        if downloads.get("full", True):
+            self.downloads_by_infohash = {}
+        for infohash in downloads.get("removed", []):
+            self.downloads_by_infohash.pop(infohash, None)
+        for download in downloads["downloads"]:
+            self.downloads_by_infohash[download["infohash"]] = download
+        self.downloads_version = downloads.get("version", 0)
+
         total_download = 0
         total_upload = 0
-        self.received_downloads.emit(downloads)
-        self.downloads = downloads
+        self.downloads = {"downloads": self.downloads_by_infohash.values()}
+        self.received_downloads.emit(self.downloads)
 
-        download_infohashes = set()
         for download in downloads["downloads"]:
             if download["infohash"] in self.download_widgets:
                 item = self.download_widgets[download["infohash"]]
@@ -117,20 +129,19 @@ class DownloadsPage(QWidget):
             if video_infohash != "" and download["infohash"] == video_infohash:
                 self.window().video_player_page.update_with_download_info(download)
 
-            total_download += download["speed_down"]
-            total_upload += download["speed_up"]
-
-            download_infohashes.add(download["infohash"])
-
             if self.window().download_details_widget.current_download is not None and \
                     self.window().download_details_widget.current_download["infohash"] == download["infohash"]:
                 self.window().download_details_widget.current_download = download
                 self.window().download_details_widget.update_pages()
 
+        for download in self.downloads_by_infohash.itervalues():
+            total_download += download["speed_down"]
+            total_upload += download["speed_up"]
+
         # Check whether there are download that should be removed
         toremove = set()
         for infohash, item in self.download_widgets.iteritems():
-            if infohash not in download_infohashes:
+            if infohash not in self.downloads_by_infohash:
                 index = self.window().downloads_list.indexOfTopLevelItem(item)
                 toremove.add((infohash, index))
 
@@ -92,6 +92,7 @@ class Options(usage.Options):
         ["dispersy", "d", -1, 'Dispersy port', check_dispersy_port],
         ["crawl", "c", None, 'Enable crawler and use the keypair specified in the given filename', check_crawler_keypair],
         ["tunnelapi", "j", 0, 'Enable JSON api, which will run on the provided port number', check_json_port],
+        ["dataplane", "w", 0, 'Number of worker processes that forward the data packets of relays and exits', int],
     ]
 
 
@@ -114,6 +115,7 @@ class TunnelRootEndpoint(resource.Resource):
         self.tunnel = tunnel
         self.putChild("history", TunnelHistoryEndpoint(self.tunnel))
         self.putChild("stats", TunnelStatsEndpoint(self.tunnel))
+        self.putChild("dns", TunnelDNSStatsEndpoint(self.tunnel))
 
 
 class TunnelStatsEndpoint(resource.Resource):
@@ -128,6 +130,18 @@ class TunnelStatsEndpoint(resource.Resource):
         return json.dumps(self.tunnel.get_stats())
 
 
+class TunnelDNSStatsEndpoint(resource.Resource):
+    """
+    This endpoint is responsible for handling requests for the statistics of the DNS cache of the exit sockets.
+    """
+    def __init__(self, tunnel):
+        resource.Resource.__init__(self)
+        self.tunnel = tunnel
+
+    def render_GET(self, request):
+        return json.dumps(self.tunnel.get_dns_stats())
+
+
 class TunnelHistoryEndpoint(resource.Resource):
     """
     This endpoint is responsible for handling tunnel history requests.
@@ -295,6 +309,9 @@ class Tunnel(object):
     def get_stats(self):
         return [round(f, 2) for f in self.current_stats]
 
+    def get_dns_stats(self):
+        return self.community.dns_cache.get_stats() if self.community else {}
+
 
 class LineHandler(LineReceiver):
     delimiter = os.linesep
@@ -442,6 +459,10 @@ class TunnelHelperServiceMaker(object):
         else:
             logger.info("Trustchain disabled")
 
+        settings.dataplane_workers = options["dataplane"]
+        if settings.dataplane_workers:
+            logger.info("Forwarding data packets using %d worker processes", settings.dataplane_workers)
+
         tunnel = Tunnel(settings, crawl_keypair_filename, dispersy_port)
         StandardIO(LineHandler(tunnel))
 